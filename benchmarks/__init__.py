@@ -0,0 +1,6 @@
+"""
+Offline benchmarks for pman, which use the simulated backend
+(:mod:`pman.simulatedmgr`). Run individual benchmarks with e.g.
+
+    python -m benchmarks.bench_compute_mgr_pool
+"""
@@ -0,0 +1,167 @@
+"""
+Latency of ``GET /api/v1/<jid>/`` under many concurrent clients, when the
+Flask app is served by a server with a fixed number of threads (like a
+gunicorn gthread worker) compared to the ASGI app served by uvicorn.
+
+Both apps use the simulated backend, of which every call takes
+``CALL_LATENCY_MS`` on average (``SIM_API_LATENCY``). The Flask app blocks
+its thread while waiting, the ASGI app does not (like the asynchronous
+clients of :mod:`pman.asyncmgr`).
+The clients run in this process, so on a machine with few CPUs the results
+are bounded by the CPU time of the clients and the server.
+
+    python -m benchmarks.bench_asgi_p99 [CLIENTS] [CALL_LATENCY_MS] [THREADS]
+"""
+import asyncio
+import multiprocessing
+import random
+import socket
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, make_server
+
+import httpx
+
+from benchmarks.common import configure_offline_env, simulated_manager
+
+REQUESTS_PER_CLIENT = 10
+
+
+class PooledWSGIServer(WSGIServer):
+    """
+    Handles requests in a fixed number of threads.
+    """
+    request_queue_size = 2048
+    threads = 20
+
+    def server_activate(self):
+        super().server_activate()
+        self.pool = ThreadPoolExecutor(max_workers=self.threads)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def serve_wsgi(port: int, call_latency: float, threads: int):
+    configure_offline_env()
+    from pman.app import create_app
+
+    app = create_app(compute_mgr=simulated_manager(SIM_API_LATENCY=call_latency))
+    PooledWSGIServer.threads = threads
+    make_server('127.0.0.1', port, app, server_class=PooledWSGIServer,
+                handler_class=QuietHandler).serve_forever()
+
+
+def serve_asgi(port: int, call_latency: float):
+    configure_offline_env()
+    import uvicorn
+    from pman.app import create_asgi_app
+    from pman.asyncmgr import AsyncManager
+
+    class AsyncSimulatedManager(AsyncManager):
+        """
+        Waits for the latency of the simulated backend without blocking,
+        then calls it without latency.
+        """
+        async def call(self):
+            await asyncio.sleep(random.expovariate(1 / call_latency) if call_latency else 0)
+
+        async def get_job(self, name):
+            await self.call()
+            return self.sync_mgr.get_job(name)
+
+        async def get_job_info(self, job):
+            await self.call()
+            return self.sync_mgr.get_job_info(job)
+
+        async def get_job_logs(self, job, tail):
+            await self.call()
+            return self.sync_mgr.get_job_logs(job, tail)
+
+    app = create_asgi_app(compute_mgr=simulated_manager())
+    app.state.async_mgr = AsyncSimulatedManager(app.state.async_mgr.sync_mgr)
+    uvicorn.run(app, host='127.0.0.1', port=port, log_level='warning', backlog=2048)
+
+
+async def measure(url: str, clients: int) -> List[float]:
+    """
+    Make ``REQUESTS_PER_CLIENT`` requests from each of ``clients`` concurrent clients.
+
+    :return: the latency of every request, in seconds
+    """
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=0)
+    async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+        async def run_client() -> List[float]:
+            latencies = []
+            for _ in range(REQUESTS_PER_CLIENT):
+                start = time.perf_counter()
+                res = await client.get(url)
+                res.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+            return latencies
+
+        results = await asyncio.gather(*(run_client() for _ in range(clients)))
+    return [latency for latencies in results for latency in latencies]
+
+
+def wait_until_up(port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f'http://127.0.0.1:{port}/api/v1/').status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.1)
+    raise TimeoutError(f'server on port {port} did not start')
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    call_latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 50.0) / 1000
+    threads = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+    print(f'{clients} clients, {REQUESTS_PER_CLIENT} requests each, '
+          f'backend call latency: {call_latency * 1000:.1f}ms')
+    servers = ((f'Flask ({threads} threads)', serve_wsgi, (call_latency, threads)),
+               ('ASGI (uvicorn)', serve_asgi, (call_latency,)))
+    for label, target, args in servers:
+        port = free_port()
+        server = multiprocessing.Process(target=target, args=(port, *args), daemon=True)
+        server.start()
+        try:
+            wait_until_up(port)
+            latencies = asyncio.run(measure(f'http://127.0.0.1:{port}/api/v1/chris-jid-1/',
+                                            clients))
+        finally:
+            server.terminate()
+            server.join()
+        percentiles = statistics.quantiles(latencies, n=100)
+        print(f'{label:>20}: p50 {percentiles[49] * 1000:8.1f}ms  '
+              f'p99 {percentiles[98] * 1000:8.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Requests per second of ``GET /api/v1/<jid>/`` when the compute manager
+is created once per process (current behavior) compared to once per
+request (the previous behavior).
+
+    python -m benchmarks.bench_compute_mgr_pool [SETUP_LATENCY_MS]
+"""
+import sys
+import time
+
+from flask import current_app
+
+from benchmarks.common import configure_offline_env, requests_per_second, simulated_config
+from pman.simulatedmgr import SimulatedManager
+
+
+class SlowSetupManager(SimulatedManager):
+    """
+    A simulated backend which takes ``setup_latency`` seconds to create, emulating
+    the cost of creating a backend client (loading configuration, connecting and
+    negotiating TLS).
+    """
+
+    def __init__(self, config_dict: dict, setup_latency: float):
+        super().__init__(config_dict)
+        time.sleep(setup_latency)
+
+
+def main():
+    configure_offline_env()
+    from pman.app import create_app
+
+    setup_latency = (float(sys.argv[1]) if len(sys.argv) > 1 else 5.0) / 1000
+    config = simulated_config()
+
+    def new_mgr():
+        return SlowSetupManager(config, setup_latency)
+
+    per_request_app = create_app(compute_mgr=new_mgr())
+
+    @per_request_app.before_request
+    def recreate_compute_mgr():
+        current_app.extensions['compute_mgr'] = new_mgr()
+
+    pooled_app = create_app(compute_mgr=new_mgr())
+
+    print(f'client setup latency: {setup_latency * 1000:.1f}ms')
+    for label, app in (('per-request manager', per_request_app),
+                       ('pooled manager', pooled_app)):
+        client = app.test_client()
+        rate = requests_per_second(lambda: client.get('/api/v1/chris-jid-1/'))
+        print(f'{label:>20}: {rate:8.1f} req/s')
+
+
+if __name__ == '__main__':
+    main()
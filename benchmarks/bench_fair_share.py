@@ -0,0 +1,120 @@
+"""
+Simulated waiting time of the jobs of small users while a bulk user has a
+500-subject pipeline queued, when queued jobs are dispatched in order
+compared to by fair share (:class:`pman.fairshare.FairShare`).
+
+The compute environment and the jobs are simulated: jobs are dispatched
+in the same way as by :class:`pman.dispatch.Dispatcher`, the next job waits
+until it fits in the capacity left.
+
+    python -m benchmarks.bench_fair_share [BULK_JOBS] [SMALL_USERS] [SEED]
+"""
+import heapq
+import random
+import statistics
+import sys
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional
+
+from pman.abstractmgr import ResourceCapacity
+from pman.fairshare import FairShare
+
+CAPACITY: ResourceCapacity = {'cpu_limit': 16000, 'memory_limit': 65536, 'gpu_limit': 0}
+DURATION = 3600.0
+"""Seconds during which small users submit jobs."""
+
+
+@dataclass
+class SimJob:
+    user: str
+    submitted: float
+    cpu_limit: int
+    memory_limit: int
+    duration: float
+    started: Optional[float] = None
+
+
+def make_jobs(bulk_jobs: int, small_users: int, seed: int) -> List[SimJob]:
+    rng = random.Random(seed)
+    jobs = [SimJob('bulk', 0.0, 1000, 2048, rng.uniform(60, 180)) for _ in range(bulk_jobs)]
+    for i in range(small_users):
+        t = rng.expovariate(1 / 300)
+        while t < DURATION:
+            jobs.append(SimJob(f'small-{i}', t, 1000, 1024, rng.uniform(30, 120)))
+            t += rng.expovariate(1 / 300)
+    return sorted(jobs, key=lambda j: j.submitted)
+
+
+def simulate(jobs: List[SimJob], fair_share: Optional[FairShare]) -> None:
+    """
+    Set the start time of every job.
+    """
+    events = [(job.submitted, i, 'submit', job) for i, job in enumerate(jobs)]
+    heapq.heapify(events)
+    seq = len(jobs)
+    queues: Dict[str, Deque[SimJob]] = defaultdict(deque)
+    usage: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    used = defaultdict(int)
+
+    def fits(job: SimJob) -> bool:
+        return (used['cpu_limit'] + job.cpu_limit <= CAPACITY['cpu_limit']
+                and used['memory_limit'] + job.memory_limit <= CAPACITY['memory_limit'])
+
+    def next_job() -> Optional[SimJob]:
+        waiting = {u: q[0].submitted for u, q in queues.items() if q}
+        if not waiting:
+            return None
+        if fair_share is None:
+            user = min(waiting, key=waiting.get)
+        else:
+            users = fair_share.order(waiting, usage, CAPACITY)
+            if not users:
+                return None
+            user = users[0]
+        return queues[user][0]
+
+    while events:
+        now, _, kind, job = heapq.heappop(events)
+        if kind == 'submit':
+            queues[job.user].append(job)
+        else:
+            for r in ('cpu_limit', 'memory_limit'):
+                used[r] -= getattr(job, r)
+                usage[job.user][r] -= getattr(job, r)
+            usage[job.user]['jobs'] -= 1
+        while (job := next_job()) is not None and fits(job):
+            queues[job.user].popleft()
+            job.started = now
+            for r in ('cpu_limit', 'memory_limit'):
+                used[r] += getattr(job, r)
+                usage[job.user][r] += getattr(job, r)
+            usage[job.user]['jobs'] += 1
+            seq += 1
+            heapq.heappush(events, (now + job.duration, seq, 'finish', job))
+
+
+def summarize(label: str, jobs: List[SimJob]):
+    small = [j.started - j.submitted for j in jobs if j.user != 'bulk']
+    bulk_done = max(j.started + j.duration for j in jobs if j.user == 'bulk')
+    percentiles = statistics.quantiles(small, n=100)
+    print(f'{label:>12}: small users wait p50 {percentiles[49]:7.1f}s  '
+          f'p95 {percentiles[94]:7.1f}s  max {max(small):7.1f}s  '
+          f'| bulk pipeline done after {bulk_done:7.1f}s')
+
+
+def main():
+    bulk_jobs = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    small_users = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+
+    print(f'{bulk_jobs} bulk jobs, {small_users} small users, '
+          f'capacity: {CAPACITY["cpu_limit"] // 1000} CPUs')
+    for label, fair_share in (('in order', None), ('fair share', FairShare())):
+        jobs = make_jobs(bulk_jobs, small_users, seed)
+        simulate(jobs, fair_share)
+        summarize(label, jobs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Measure the start of a worker process for every backend: the time taken to
+import :mod:`pman.app` and the module of the backend, the resident memory
+afterwards, and the slowest imports reported by ``python -X importtime``::
+
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --only docker --top 30
+
+Every measurement is made in a new interpreter. The results are saved as JSON,
+named after the current commit, next to the results of :mod:`benchmarks.bench_suite`.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from typing import List, Optional
+
+from benchmarks.bench_suite import RESULTS_DIR, current_commit
+from pman.backends import BACKENDS
+
+_IMPORTTIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+_CHILD = """
+import json, resource, sys, time
+start = time.perf_counter()
+import pman.app
+from pman.backends import manager_class
+manager_class(sys.argv[1])
+print(json.dumps({
+    'elapsed': time.perf_counter() - start,
+    'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'packages': sorted(m for m in sys.modules if '.' not in m and not m.startswith('_')),
+}))
+"""
+
+
+def measure_backend(container_env: str, repeat: int, top: int) -> dict:
+    """
+    Start ``repeat`` interpreters which import the app and the backend.
+
+    :return: median import time, maximum RSS, and the ``top`` slowest imports of the last run
+    """
+    times, rss = [], []
+    for _ in range(repeat):
+        res = subprocess.run([sys.executable, '-X', 'importtime', '-c', _CHILD, container_env],
+                             capture_output=True, text=True, check=True)
+        child = json.loads(res.stdout)
+        times.append(child['elapsed'])
+        rss.append(child['max_rss_kb'])
+    imports = []
+    for line in res.stderr.splitlines():
+        m = _IMPORTTIME.match(line)
+        if m:
+            imports.append({'module': m.group(4), 'self_us': int(m.group(1)),
+                            'cumulative_us': int(m.group(2)), 'depth': len(m.group(3)) // 2})
+    top_level = [i for i in imports if i['depth'] == 0]
+    return {
+        'import_ms': round(statistics.median(times) * 1000, 1),
+        'importtime_total_ms': round(sum(i['cumulative_us'] for i in top_level) / 1000, 1),
+        # kilobytes on Linux
+        'max_rss_kb': max(rss),
+        'modules': len(imports),
+        'packages': child['packages'],
+        'slowest': sorted(imports, key=lambda i: i['cumulative_us'], reverse=True)[:top],
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Measure the start of pman worker processes')
+    parser.add_argument('--only', action='append', choices=sorted(BACKENDS),
+                        help='measure only this CONTAINER_ENV (repeatable)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='interpreters started for every backend (default: 5)')
+    parser.add_argument('--top', type=int, default=15,
+                        help='number of slowest imports recorded (default: 15)')
+    parser.add_argument('--output', help='JSON file of results '
+                                         '(default: benchmarks/results/startup-<commit>.json)')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for container_env in args.only or sorted(BACKENDS):
+        r = results[container_env] = measure_backend(container_env, args.repeat, args.top)
+        print(f'{container_env:>12}: {r["import_ms"]:8.1f}ms  {r["max_rss_kb"] / 1024:6.1f}MiB RSS  '
+              f'{r["modules"]:5d} modules')
+    commit = current_commit()
+    output = args.output or os.path.join(RESULTS_DIR, f'startup-{commit or "unknown"}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'commit': commit, 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                   'results': results}, f, indent=2)
+    print(f'results saved to {output}')
+
+
+if __name__ == '__main__':
+    main()
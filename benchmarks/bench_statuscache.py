@@ -0,0 +1,147 @@
+"""
+Compare the number of backend calls caused by polling the status of jobs,
+with every worker process calling the backend (the default) and with the
+status cache shared by the worker processes (``STATUS_CACHE=yes``)::
+
+    python -m benchmarks.bench_statuscache --workers 8 --clients 32 --jobs 200
+
+The worker processes of a gunicorn server are emulated by apps in this
+process, with their own simulated backend (all counting calls to the same
+jobs) and status refresher, sharing a temporary ``STATE_DB``. Clients poll
+``GET /api/v1/<jid>/?logs=false`` of random jobs on the workers in turn.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from benchmarks.common import configure_offline_env, simulated_config
+from pman.abstractmgr import JobInfo, JobName, JobStatus
+from pman.simulatedmgr import SimulatedJob, SimulatedManager
+
+
+class CountingManager(SimulatedManager):
+    """
+    A simulated backend which counts the calls made to it by every backend
+    sharing ``counts``.
+    """
+
+    def __init__(self, config: dict, counts: Counter, lock: threading.Lock):
+        super().__init__(config)
+        self.__counts = counts
+        self.__lock = lock
+
+    def __count(self, method: str):
+        with self.__lock:
+            self.__counts[method] += 1
+
+    def get_job(self, name: JobName) -> SimulatedJob:
+        self.__count('get_job')
+        return super().get_job(name)
+
+    def get_job_info(self, job: SimulatedJob) -> JobInfo:
+        self.__count('get_job_info')
+        return super().get_job_info(job)
+
+    def get_jobs_info(self, names) -> Dict[JobName, JobInfo]:
+        self.__count('get_jobs_info')
+        return super().get_jobs_info(names)
+
+    def list_job_statuses(self) -> Dict[JobName, JobStatus]:
+        self.__count('list_job_statuses')
+        return super().list_job_statuses()
+
+
+def run(shared: bool, opts: argparse.Namespace) -> dict:
+    """
+    Poll the jobs for ``opts.duration`` seconds.
+
+    :param shared: whether the status cache is on
+    :return: the number of requests and of backend calls
+    """
+    from pman.app import create_app
+
+    counts, lock = Counter(), threading.Lock()
+    jobs = [JobName(f'chris-jid-{i}') for i in range(opts.jobs)]
+    with tempfile.TemporaryDirectory() as tmp:
+        state_db = os.path.join(tmp, 'pman.db')
+        backend_config = simulated_config(state_db, jobs, SIM_API_LATENCY=opts.call_latency)
+        config = {'TESTING': True, 'METRICS': False, 'STATUS_CACHE': shared,
+                  'STATE_DB': state_db,
+                  'STATUS_CACHE_MAX_AGE': opts.max_age,
+                  'STATUS_CACHE_REFRESH_SECONDS': opts.refresh}
+        apps = [create_app(config, CountingManager(backend_config, counts, lock))
+                for _ in range(opts.workers)]
+        requests = Counter()
+        stop_at = time.monotonic() + opts.duration
+
+        def poll(i: int):
+            rng = random.Random(i)
+            clients = [app.test_client() for app in apps]
+            n = 0
+            while time.monotonic() < stop_at:
+                client = clients[(i + n) % len(clients)]
+                client.get(f'/api/v1/{rng.choice(jobs)}/?logs=false')
+                n += 1
+                time.sleep(opts.poll_interval)
+            with lock:
+                requests['GET'] += n
+
+        threads = [threading.Thread(target=poll, args=(i,)) for i in range(opts.clients)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for app in apps:
+            if 'status_refresher' in app.extensions:
+                app.extensions['status_refresher'].stop()
+    calls = sum(counts.values())
+    return {
+        'requests': requests['GET'],
+        'backend_calls': calls,
+        'calls_per_request': round(calls / requests['GET'], 3) if requests['GET'] else None,
+        'calls_per_second': round(calls / opts.duration, 1),
+        'by_method': dict(sorted(counts.items())),
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Compare backend calls with and without '
+                                                 'the shared status cache')
+    parser.add_argument('--workers', type=int, default=8, help='worker processes (default: 8)')
+    parser.add_argument('--clients', type=int, default=32,
+                        help='concurrent polling clients (default: 32)')
+    parser.add_argument('--jobs', type=int, default=200, help='jobs in the backend (default: 200)')
+    parser.add_argument('--duration', type=float, default=5.0,
+                        help='seconds of polling in each mode (default: 5)')
+    parser.add_argument('--poll-interval', type=float, default=0.01,
+                        help='seconds between the requests of a client (default: 0.01)')
+    parser.add_argument('--call-latency', type=float, default=0.001,
+                        help='mean seconds taken by every backend call, SIM_API_LATENCY '
+                             '(default: 0.001)')
+    parser.add_argument('--max-age', type=float, default=5.0,
+                        help='STATUS_CACHE_MAX_AGE (default: 5)')
+    parser.add_argument('--refresh', type=float, default=2.0,
+                        help='STATUS_CACHE_REFRESH_SECONDS (default: 2)')
+    parser.add_argument('--output', help='JSON file of results')
+    opts = parser.parse_args(argv)
+    configure_offline_env()
+
+    results = {}
+    for mode, shared in (('per_worker', False), ('shared_cache', True)):
+        r = results[mode] = run(shared, opts)
+        print(f'{mode:>12}: {r["requests"]:7d} requests  {r["backend_calls"]:7d} backend calls  '
+              f'({r["calls_per_request"]} per request, {r["calls_per_second"]}/s)  '
+              f'{r["by_method"]}')
+    if opts.output:
+        with open(opts.output, 'w') as f:
+            json.dump({'options': vars(opts), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
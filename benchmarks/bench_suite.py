@@ -0,0 +1,282 @@
+"""
+Benchmarks of the hot paths of handling requests and scheduling jobs,
+which run offline with the simulated backend.
+
+Every benchmark calls an operation repeatedly for a few seconds, and
+reports its throughput and the distribution of its latency. The results
+are saved as JSON, named after the current commit, so that they can be
+compared with the results of another commit::
+
+    python -m benchmarks.bench_suite
+    git checkout other-branch
+    python -m benchmarks.bench_suite --compare benchmarks/results/<commit>.json
+
+Options: ``--only NAME`` (repeatable), ``--duration SECONDS``, ``--output PATH``,
+``--compare PATH`` and ``--threshold PERCENT``: the exit status is 1 if the
+median latency of a benchmark regressed by more than the threshold.
+"""
+import argparse
+import inspect
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+from unittest.mock import patch
+
+from benchmarks.common import configure_offline_env, simulated_manager
+
+MIN_ITERATIONS = 20
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+Operation = Callable[[], object]
+
+
+@dataclass
+class Benchmark:
+    name: str
+    setup: Callable[[], Operation]
+    """Prepares the benchmark and returns the operation to measure."""
+    description: str
+
+
+BENCHMARKS: Dict[str, Benchmark] = {}
+
+
+def benchmark(name: str):
+    """
+    Register a function which prepares a benchmark, its docstring describes it.
+    """
+    def register(setup: Callable[[], Operation]):
+        BENCHMARKS[name] = Benchmark(name, setup, inspect.getdoc(setup) or '')
+        return setup
+    return register
+
+
+JOB = {
+    'jid': 'chris-jid-1',
+    'args': ['--dir', '/share/incoming'],
+    'auid': 'cube',
+    'number_of_workers': '1',
+    'cpu_limit': '1000',
+    'memory_limit': '200',
+    'gpu_limit': '0',
+    'image': 'fnndsc/pl-simplefsapp',
+    'entrypoint': ['simplefsapp'],
+    'type': 'fs',
+    'input_dir': 'key-chris-jid-1/incoming',
+    'output_dir': 'key-chris-jid-1/outgoing',
+}
+
+
+def flask_client():
+    configure_offline_env()
+    from pman.app import create_app
+    return create_app(compute_mgr=simulated_manager()).test_client()
+
+
+@benchmark('api.joblist.post')
+def bench_post_job() -> Operation:
+    """
+    POST /api/v1/ of a new job through the Flask test client (JobListResource.post).
+    """
+    client = flask_client()
+    jids = itertools.count(2)
+
+    def post():
+        jid = f'chris-jid-{next(jids)}'
+        client.post('/api/v1/', json={**JOB, 'jid': jid, 'input_dir': f'key-{jid}/incoming',
+                                      'output_dir': f'key-{jid}/outgoing'})
+    return post
+
+
+@benchmark('api.job.get')
+def bench_get_job() -> Operation:
+    """
+    GET /api/v1/<jid>/ with logs through the Flask test client (JobResource.get).
+    """
+    client = flask_client()
+    return lambda: client.get('/api/v1/chris-jid-1/')
+
+
+@benchmark('kubernetes.create_job')
+def bench_kubernetes_create_job() -> Operation:
+    """
+    KubernetesManager.create_job: construction of the V1Job of a plugin instance.
+    """
+    from pman.kubernetesmgr import KubernetesManager
+
+    config = {'JOB_NAMESPACE': 'chris', 'VOLUME_NAME': 'storebase',
+              'JOB_LABELS': {'org.chrisproject/role': 'plugin-instance'},
+              'NODE_SELECTOR': {'kubernetes.io/arch': 'amd64'},
+              'IMAGE_PULL_SECRETS': ['registry-credentials']}
+    with patch('kubernetes.config.load_incluster_config'):
+        mgr = KubernetesManager(config)
+    resources = {'number_of_workers': 1, 'cpu_limit': 1000, 'memory_limit': 2000,
+                 'gpu_limit': 0}
+    env = [f'VAR_{i}=value-{i}' for i in range(8)]
+    mounts = {'inputdir_source': 'key-chris-jid-1/incoming', 'inputdir_target': '/share/incoming',
+              'outputdir_source': 'key-chris-jid-1/outgoing', 'outputdir_target': '/share/outgoing'}
+    command = ['simpledsapp', '--saveinputmeta', '/share/incoming', '/share/outgoing']
+    return lambda: mgr.create_job('fnndsc/pl-simpledsapp', command, 'chris-jid-1',
+                                  resources, env, 1001, 0, mounts)
+
+
+@benchmark('slurm.wdl_roundtrip')
+def bench_wdl_roundtrip() -> Operation:
+    """
+    SlurmJob.to_wdl followed by SlurmJob.from_wdl.
+    """
+    from pman.cromwell.slurm.wdl import SlurmJob
+    from tests.cromwell.examples.metadata import job_running
+
+    return lambda: SlurmJob.from_wdl(job_running.to_wdl())
+
+
+@benchmark('cromwell.metadata')
+def bench_metadata() -> Operation:
+    """
+    Deserialization of every WorkflowMetadataResponse of tests/cromwell/examples/metadata.py.
+    """
+    from serde.json import from_json
+    from pman.cromwell.models import WorkflowMetadataResponse
+    from tests.cromwell.examples import metadata
+
+    responses = [v for k, v in vars(metadata).items() if k.startswith('response_')]
+
+    def deserialize_all():
+        for response in responses:
+            from_json(WorkflowMetadataResponse, response)
+    return deserialize_all
+
+
+@benchmark('localize_path_args')
+def bench_localize_path_args() -> Operation:
+    """
+    localize_path_args on a list of 400 arguments, a quarter of which are path flags.
+    """
+    from pman.handlers import localize_path_args
+
+    args = []
+    for i in range(100):
+        args += [f'--path{i}', f'chris/uploads/file{i}', f'--opt{i}', str(i)]
+    flags = {f'--path{i}' for i in range(100)}
+    return lambda: localize_path_args(args, flags, '/share/incoming')
+
+
+def measure(operation: Operation, duration: float) -> dict:
+    """
+    Call ``operation`` for ``duration`` seconds, after warming it up.
+
+    :return: throughput, and latency percentiles in microseconds
+    """
+    for _ in range(min(MIN_ITERATIONS, 5)):
+        operation()
+    latencies: List[float] = []
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration or len(latencies) < MIN_ITERATIONS:
+        t = time.perf_counter()
+        operation()
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+    percentiles = statistics.quantiles(latencies, n=100)
+    return {
+        'iterations': len(latencies),
+        'ops_per_second': round(len(latencies) / elapsed, 1),
+        'mean_us': round(statistics.fmean(latencies) * 1e6, 2),
+        'min_us': round(min(latencies) * 1e6, 2),
+        'p50_us': round(percentiles[49] * 1e6, 2),
+        'p95_us': round(percentiles[94] * 1e6, 2),
+        'p99_us': round(percentiles[98] * 1e6, 2),
+    }
+
+
+def current_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True, cwd=os.path.dirname(__file__)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names: List[str], duration: float) -> dict:
+    results = {}
+    for name in names:
+        operation = BENCHMARKS[name].setup()
+        results[name] = measure(operation, duration)
+        r = results[name]
+        print(f'{name:>24}: {r["ops_per_second"]:10.1f} ops/s  p50 {r["p50_us"]:10.1f}us  '
+              f'p99 {r["p99_us"]:10.1f}us')
+    return {
+        'commit': current_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'duration': duration,
+        'results': results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> List[str]:
+    """
+    Print the change of the median latency of every benchmark.
+
+    :return: names of the benchmarks which regressed by more than ``threshold`` percent
+    """
+    regressed = []
+    print(f'\ncompared to {baseline.get("commit")} ({baseline.get("timestamp")}):')
+    for name, result in current['results'].items():
+        if name not in baseline.get('results', {}):
+            continue
+        before = baseline['results'][name]['p50_us']
+        change = (result['p50_us'] - before) / before * 100 if before else 0.0
+        flag = ''
+        if change > threshold:
+            regressed.append(name)
+            flag = '  REGRESSION'
+        print(f'{name:>24}: p50 {before:10.1f}us -> {result["p50_us"]:10.1f}us '
+              f'({change:+6.1f}%){flag}')
+    return regressed
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Run the pman benchmarks')
+    parser.add_argument('--only', action='append', choices=sorted(BENCHMARKS),
+                        help='run only this benchmark (repeatable)')
+    parser.add_argument('--duration', type=float, default=2.0,
+                        help='seconds to run each benchmark (default: 2)')
+    parser.add_argument('--output', help='JSON file of results '
+                                         '(default: benchmarks/results/<commit>.json)')
+    parser.add_argument('--compare', metavar='BASELINE', help='JSON file of earlier results')
+    parser.add_argument('--threshold', type=float, default=20.0,
+                        help='percentage of median latency regression which fails --compare')
+    parser.add_argument('--list', action='store_true', help='list the benchmarks')
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for bench in BENCHMARKS.values():
+            print(f'{bench.name:>24}: {bench.description}')
+        return
+
+    results = run(args.only or list(BENCHMARKS), args.duration)
+    output = args.output or os.path.join(RESULTS_DIR, f'{results["commit"] or "unknown"}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'results saved to {output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
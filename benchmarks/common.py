@@ -0,0 +1,77 @@
+"""
+Helpers shared by the benchmarks.
+"""
+import atexit
+import logging
+import os
+import shutil
+import tempfile
+import time
+from typing import Callable, Iterable, Optional
+
+from pman.abstractmgr import Image, JobName, ManagerException
+from pman.simulatedmgr import SimulatedManager
+
+
+def configure_offline_env():
+    """
+    Set the environment variables needed to create the app without a real backend.
+    """
+    os.environ.setdefault('APPLICATION_MODE', 'dev')
+    os.environ.setdefault('STORAGE_TYPE', 'host')
+    os.environ.setdefault('STOREBASE', tempfile.gettempdir())
+    logging.disable(logging.WARNING)
+
+
+SIMULATED_JOBS = ('chris-jid-1',)
+"""Jobs which are running in the backends of :func:`simulated_config`."""
+
+
+def simulated_config(state_db: Optional[str] = None, jobs: Iterable[str] = SIMULATED_JOBS,
+                     **settings) -> dict:
+    """
+    The configuration of a :class:`SimulatedManager` in which ``jobs`` are
+    running for the duration of a benchmark. Every backend created with the
+    same ``STATE_DB`` knows the same jobs.
+
+    :param state_db: path of the ``STATE_DB``, by default a temporary file
+                     deleted when the benchmark exits
+    :param settings: ``SIM_*`` settings, e.g. ``SIM_API_LATENCY`` for the mean
+                     seconds taken by every backend call
+    """
+    if state_db is None:
+        tmp = tempfile.mkdtemp(prefix='pman-benchmark-')
+        atexit.register(shutil.rmtree, tmp, ignore_errors=True)
+        state_db = os.path.join(tmp, 'pman.db')
+    config = {'STATE_DB': state_db, 'SIM_QUEUE_DELAY': 0.0, 'SIM_RUN_TIME': 86400.0,
+              'SIM_RUN_TIME_SIGMA': 0.0, 'SIM_FAILURE_RATE': 0.0, 'SIM_OOM_RATE': 0.0,
+              'SIM_SEED': 0, **settings}
+    # the jobs are created without the cost of backend calls
+    backend = SimulatedManager({**config, 'SIM_API_LATENCY': 0.0})
+    for name in jobs:
+        try:
+            backend.schedule_job(Image('fnndsc/pl-simpledsapp'),
+                                 ['simpledsapp', '/share/incoming', '/share/outgoing'],
+                                 JobName(name), {}, [], None, None, {})
+        except ManagerException:
+            pass  # created by an earlier call
+    return config
+
+
+def simulated_manager(**kwargs) -> SimulatedManager:
+    """
+    A :class:`SimulatedManager` configured by :func:`simulated_config`.
+    """
+    return SimulatedManager(simulated_config(**kwargs))
+
+
+def requests_per_second(do_request: Callable[[], None], duration: float = 2.0) -> float:
+    """
+    Call ``do_request`` repeatedly for ``duration`` seconds and return its rate.
+    """
+    count = 0
+    start = time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < duration:
+        do_request()
+        count += 1
+    return count / elapsed
@@ -1,11 +1,16 @@
 import os
-from pman.app import create_app
+import sys
 
 
 def main():
     """
-    Run pman in development mode.
+    Run pman in development mode, or ``pman controller`` (see :mod:`pman.controller`).
     """
+    if sys.argv[1:2] == ['controller']:
+        from pman.controller import main as controller_main
+        return controller_main(sys.argv[2:])
+
+    from pman.app import create_app
     if 'APPLICATION_MODE' not in os.environ:
         os.environ['APPLICATION_MODE'] = 'dev'
     app = create_app()
@@ -1,8 +1,12 @@
 from abc import ABC, abstractmethod
-from typing import Generic, TypeVar, NewType, Optional, TypedDict, AnyStr, List
+from typing import (Generic, TypeVar, NewType, Optional, TypedDict, AnyStr, List,
+                    Collection, Dict, Iterator, TYPE_CHECKING)
 from dataclasses import dataclass
 from enum import Enum
 
+if TYPE_CHECKING:
+    from .longpoll import ChangeNotifier
+
 
 class ManagerException(Exception):
     def __init__(self, msg, **kwargs):
@@ -46,6 +50,17 @@ class JobInfo:
     status: JobStatus
 
 
+@dataclass(frozen=True)
+class JobLogs:
+    logs: AnyStr
+    """Log lines which come after the cursor, without timestamps."""
+    next_cursor: Optional[str]
+    """
+    Opaque value to pass as the cursor to get the logs which come after these,
+    or ``None`` if incremental fetching is not supported by the backend.
+    """
+
+
 class ResourcesDict(TypedDict):
     number_of_workers: int
     """
@@ -71,6 +86,16 @@ class ResourcesDict(TypedDict):
     """
 
 
+class ResourceCapacity(TypedDict, total=False):
+    """
+    Resources available to jobs, in the units of :class:`ResourcesDict`.
+    Resources which are left out are not limited.
+    """
+    cpu_limit: int
+    memory_limit: int
+    gpu_limit: int
+
+
 class MountsDict(TypedDict):
     inputdir_source: str
     """
@@ -95,6 +120,21 @@ class AbstractManager(ABC, Generic[J]):
     An ``AbstractManager`` is an API to a service which can schedule
     (and eventually run) *ChRIS* plugin instances, and maintains persistent
     information about previously scheduled plugin instances.
+
+    One instance is created per worker process and shared by all the
+    requests it handles, so implementations must be thread-safe.
+    """
+
+    log_api_calls: int = 1
+    """
+    Number of requests to the backend made by :meth:`get_job_logs`, used to
+    count how many requests were saved when a client did not ask for logs.
+    """
+
+    change_notifier: Optional['ChangeNotifier'] = None
+    """
+    Notified with the name of a job whenever the backend reports a change to it.
+    ``None`` if the backend is not watched, in which case jobs must be polled.
     """
 
     def __init__(self, config_dict: dict = None):
@@ -129,6 +169,38 @@ class AbstractManager(ABC, Generic[J]):
         """
         ...
 
+    def get_job_logs_since(self, job: J, cursor: Optional[str], tail: int) -> JobLogs:
+        """
+        Get the logs (combined stdout+stderr) from a previously scheduled job object
+        which come after a cursor, so that clients only receive new log lines.
+
+        The default implementation returns the same as :meth:`get_job_logs`
+        and no cursor.
+
+        :param job: the job which to get the logs for
+        :param cursor: ``next_cursor`` from the previous call, or ``None`` to start from the beginning
+        :param tail: maximum number of lines to read when there is no cursor. With a cursor,
+                     every line after it is read, so that no line is skipped.
+        :raises ValueError: if the cursor is invalid
+        """
+        return JobLogs(logs=self.get_job_logs(job, tail), next_cursor=None)
+
+    def stream_job_logs(self, job: J, tail: Optional[int] = None,
+                        follow: bool = False) -> Iterator[bytes]:
+        """
+        Stream the logs (combined stdout+stderr) from a previously scheduled job object.
+
+        The default implementation produces the result of :meth:`get_job_logs`
+        as a single chunk and does not support ``follow``. Backends should
+        override it to stream the logs without buffering them.
+
+        :param job: the job which to get the logs for
+        :param tail: how many lines to read from the end of the logs, or ``None`` for all logs
+        :param follow: keep streaming new logs until the job is done
+        """
+        logs = self.get_job_logs(job, tail)
+        yield logs if isinstance(logs, bytes) else logs.encode('utf-8')
+
     @abstractmethod
     def get_job_info(self, job: J) -> JobInfo:
         """
@@ -142,3 +214,49 @@ class AbstractManager(ABC, Generic[J]):
         Remove a previously scheduled job.
         """
         ...
+
+    def get_stats(self) -> dict:
+        """
+        Backend-specific operational metrics, e.g. about caches.
+        """
+        return {}
+
+    def get_jobs_info(self, names: Collection[JobName]) -> Dict[JobName, JobInfo]:
+        """
+        Get the info of many previously scheduled jobs at once.
+
+        Jobs which are not found are left out of the returned dict.
+
+        The default implementation calls :meth:`get_job` and :meth:`get_job_info`
+        for every job. Backends should override it to make a single list request.
+        """
+        infos = {}
+        for name in names:
+            try:
+                job = self.get_job(name)
+            except ManagerException as e:
+                if e.status_code == 404:
+                    continue
+                raise
+            infos[name] = self.get_job_info(job)
+        return infos
+
+    def list_job_statuses(self) -> Dict[JobName, JobStatus]:
+        """
+        Get the status of the jobs created by pman using as few requests as possible,
+        for detecting changes by polling.
+
+        Backends may leave out jobs which are finished. When a job disappears,
+        its final state is read using :meth:`get_job` and :meth:`get_job_info`.
+
+        :raises NotImplementedError: if the backend cannot list its jobs
+        """
+        raise NotImplementedError(f'{type(self).__name__} cannot list jobs')
+
+    def get_capacity(self) -> ResourceCapacity:
+        """
+        Get the total resources of the compute environment, for admission control.
+
+        :raises NotImplementedError: if the backend cannot tell its capacity
+        """
+        raise NotImplementedError(f'{type(self).__name__} cannot tell its capacity')
@@ -0,0 +1,226 @@
+"""
+Admission control: jobs are submitted to the compute backend only if the
+resources they request fit in what is left of its capacity, so that a
+burst of jobs does not oversubscribe a Docker host or flood Kubernetes
+with pods which cannot be scheduled.
+
+The resources of jobs are reserved in a ledger (a table of the ``STATE_DB``
+SQLite database) shared by every worker process. A reservation is released
+when its job is seen to be finished, when the job is deleted, or when the
+ledger is reconciled with the backend because a job did not fit.
+"""
+import logging
+import threading
+import time
+from enum import Enum
+from typing import Collection, Dict, Optional
+
+from .abstractmgr import (AbstractManager, ManagerException, JobInfo, JobName, JobStatus,
+                          ResourcesDict, ResourceCapacity)
+from .statedb import StateDB
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS admission_reservations (
+    jid TEXT PRIMARY KEY,
+    cpu_limit INTEGER NOT NULL,
+    memory_limit INTEGER NOT NULL,
+    gpu_limit INTEGER NOT NULL,
+    created REAL NOT NULL,
+    auid TEXT NOT NULL DEFAULT ''
+);
+"""
+
+RESOURCES = ('cpu_limit', 'memory_limit', 'gpu_limit')
+
+FINISHED = frozenset((JobStatus.finishedSuccessfully, JobStatus.finishedWithError))
+
+RECONCILE_GRACE_SECONDS = 60
+"""Reservations younger than this are kept when reconciling, because their job may be
+being submitted."""
+
+
+class Reservation(Enum):
+    """
+    The result of :meth:`AdmissionController.reserve`, which is true unless
+    the job was rejected.
+    """
+    rejected = 'rejected'
+    """The job does not fit right now."""
+    reserved = 'reserved'
+    """The resources of the job were reserved."""
+    existing = 'existing'
+    """The resources of the job were already reserved, e.g. by an earlier request."""
+
+    def __bool__(self):
+        return self is not Reservation.rejected
+
+
+def requested_resources(resources_dict: ResourcesDict) -> Dict[str, int]:
+    """
+    The total resources of a job: the limits of :class:`ResourcesDict` are per worker.
+    """
+    workers = max(resources_dict.get('number_of_workers', 1), 1)
+    return {r: resources_dict.get(r, 0) * workers for r in RESOURCES}
+
+
+class AdmissionController:
+    """
+    Reserves the resources of jobs against the capacity of the compute backend.
+
+    :param path: path of the SQLite database file
+    :param compute_mgr: the compute backend, from which the capacity is discovered
+                        and against which reservations are reconciled
+    :param capacity: capacity which overrides what is discovered from the backend
+    :param reconcile_interval: minimum seconds between reconciliations by this process
+    """
+
+    def __init__(self, path: str, compute_mgr: AbstractManager,
+                 capacity: Optional[ResourceCapacity] = None, reconcile_interval: float = 10.0):
+        self.__db = StateDB(path, _SCHEMA)
+        self.__db.add_column('admission_reservations', 'auid', "TEXT NOT NULL DEFAULT ''")
+        self.__compute_mgr = compute_mgr
+        self.__configured = {r: v for r, v in (capacity or {}).items() if v is not None}
+        self.__discovered: Optional[ResourceCapacity] = None
+        self.__reconcile_interval = reconcile_interval
+        self.__last_reconcile = 0.0
+        self.__lock = threading.Lock()
+
+    @property
+    def capacity(self) -> ResourceCapacity:
+        """
+        The capacity of the backend, discovered the first time it is needed.
+        """
+        with self.__lock:
+            if self.__discovered is None and self.__configured.keys() != set(RESOURCES):
+                try:
+                    self.__discovered = self.__compute_mgr.get_capacity()
+                except NotImplementedError:
+                    self.__discovered = {}
+                except Exception as e:
+                    logger.error('Error getting the capacity of the backend: %s', str(e))
+                    return self.__configured
+            return {**(self.__discovered or {}), **self.__configured}
+
+    def reserve(self, jid: JobName, resources_dict: ResourcesDict,
+                auid: str = '') -> Reservation:
+        """
+        Reserve the resources of a job, if they fit in the headroom.
+        Reserving again for the same job has no effect.
+
+        :param auid: the user who submitted the job
+        :return: :attr:`Reservation.rejected` (which is false) if the job does not fit right now
+        :raises ManagerException: (400) if the job is larger than the capacity
+        """
+        requested = requested_resources(resources_dict)
+        capacity = self.capacity
+        if too_large := [r for r, v in capacity.items() if requested[r] > v]:
+            raise ManagerException(
+                f'Job requests more resources than the capacity of the compute environment: '
+                + ', '.join(f'{r}={requested[r]} > {capacity[r]}' for r in too_large),
+                status_code=400
+            )
+        reservation = self.__try_reserve(jid, requested, capacity, auid)
+        if not reservation and self.reconcile():
+            return self.__try_reserve(jid, requested, capacity, auid)
+        return reservation
+
+    def __try_reserve(self, jid: JobName, requested: Dict[str, int],
+                      capacity: ResourceCapacity, auid: str) -> Reservation:
+        conn = self.__db.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if conn.execute('SELECT 1 FROM admission_reservations WHERE jid = ?',
+                            (jid,)).fetchone() is not None:
+                return Reservation.existing
+            reserved = self.__reserved(conn)
+            if any(reserved[r] + requested[r] > v for r, v in capacity.items()):
+                return Reservation.rejected
+            conn.execute(
+                'INSERT INTO admission_reservations '
+                '(jid, cpu_limit, memory_limit, gpu_limit, created, auid) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (jid, *(requested[r] for r in RESOURCES), time.time(), auid)
+            )
+            return Reservation.reserved
+        finally:
+            conn.execute('COMMIT')
+
+    @staticmethod
+    def __reserved(conn) -> Dict[str, int]:
+        row = conn.execute(
+            'SELECT COUNT(*) AS jobs, '
+            + ', '.join(f'COALESCE(SUM({r}), 0) AS {r}' for r in RESOURCES)
+            + ' FROM admission_reservations'
+        ).fetchone()
+        return dict(row)
+
+    def usage_by_user(self) -> Dict[str, Dict[str, int]]:
+        """
+        Get the resources reserved by the jobs of every user, and their number of ``jobs``.
+        """
+        rows = self.__db.connect().execute(
+            'SELECT auid, COUNT(*) AS jobs, '
+            + ', '.join(f'SUM({r}) AS {r}' for r in RESOURCES)
+            + ' FROM admission_reservations GROUP BY auid'
+        ).fetchall()
+        return {row['auid']: {k: row[k] for k in row.keys() if k != 'auid'} for row in rows}
+
+    def release(self, jid: JobName):
+        self.__db.connect().execute('DELETE FROM admission_reservations WHERE jid = ?', (jid,))
+
+    def release_finished(self, infos: Dict[JobName, JobInfo]):
+        """
+        Release the reservations of the jobs which are finished.
+        """
+        finished = [name for name, info in infos.items() if info.status in FINISHED]
+        if finished:
+            self.__release_many(finished)
+
+    def __release_many(self, jids: Collection[JobName]):
+        self.__db.execute_in('DELETE FROM admission_reservations WHERE jid IN ({})', jids)
+
+    def reconcile(self) -> bool:
+        """
+        Release the reservations of jobs which are finished or gone from the backend,
+        unless it was done less than ``reconcile_interval`` seconds ago.
+
+        :return: ``True`` if reservations were released
+        """
+        with self.__lock:
+            now = time.monotonic()
+            if now - self.__last_reconcile < self.__reconcile_interval:
+                return False
+            self.__last_reconcile = now
+        rows = self.__db.connect().execute(
+            'SELECT jid FROM admission_reservations WHERE created < ?',
+            (time.time() - RECONCILE_GRACE_SECONDS,)
+        ).fetchall()
+        jids = [JobName(row['jid']) for row in rows]
+        if not jids:
+            return False
+        try:
+            infos = self.__compute_mgr.get_jobs_info(jids)
+        except ManagerException as e:
+            logger.error('Error reconciling reservations with the backend: %s', str(e))
+            return False
+        released = [jid for jid in jids if jid not in infos or infos[jid].status in FINISHED]
+        if released:
+            logger.info(f'Releasing the reservations of {len(released)} finished jobs')
+            self.__release_many(released)
+        return bool(released)
+
+    def stats(self) -> dict:
+        """
+        The capacity, the reserved resources and the headroom,
+        for ``GET /api/v1/``. Resources which are not limited are left out.
+        """
+        capacity = self.capacity
+        reserved = self.__reserved(self.__db.connect())
+        return {
+            'capacity': capacity,
+            'reserved': {r: reserved[r] for r in RESOURCES},
+            'headroom': {r: v - reserved[r] for r, v in capacity.items()},
+            'jobs': reserved['jobs'],
+        }
@@ -0,0 +1,92 @@
+"""
+Asynchronous Cromwell API client for the ASGI app, using ``httpx``.
+"""
+import asyncio
+import json
+from typing import Collection, Dict, List, Optional
+
+import httpx
+from serde.json import from_json
+
+from .abstractmgr import JobName, JobInfo
+from .asyncmgr import AsyncManager
+from .cromwell.models import WorkflowId, WorkflowQueryResponse, WorkflowMetadataResponse
+from .cromwellmgr import CromwellManager, CromwellException
+
+
+class AsyncCromwellManager(AsyncManager[WorkflowId]):
+    """
+    Queries workflows and reads their metadata using ``httpx``.
+
+    https://cromwell.readthedocs.io/en/stable/api/RESTAPI/
+    """
+
+    def __init__(self, sync_mgr: CromwellManager, max_threads: int = 32):
+        super().__init__(sync_mgr, max_threads)
+        self.__url = sync_mgr.config['CROMWELL_URL']
+        self.__http: Optional[httpx.AsyncClient] = None
+
+    @property
+    def __client(self) -> httpx.AsyncClient:
+        # created in the event loop of the ASGI server
+        if self.__http is None:
+            self.__http = httpx.AsyncClient(base_url=self.__url)
+        return self.__http
+
+    async def query(self, params: List[Dict[str, str]]) -> WorkflowQueryResponse:
+        """
+        https://cromwell.readthedocs.io/en/stable/api/RESTAPI/#get-workflows-matching-some-criteria
+        """
+        res = await self.__client.post('/api/workflows/v1/query', json=params)
+        res.raise_for_status()
+        return from_json(WorkflowQueryResponse, res.text)
+
+    async def metadata(self, uuid: WorkflowId) -> Optional[WorkflowMetadataResponse]:
+        res = await self.__client.get(f'/api/workflows/v1/{uuid}/metadata',
+                                      params={'expandSubWorkflows': json.dumps(False)})
+        if res.status_code == 404:
+            return None
+        res.raise_for_status()
+        return from_json(WorkflowMetadataResponse, res.text)
+
+    async def get_job(self, name: JobName) -> WorkflowId:
+        res = await self.query([{'label': f'{CromwellManager.PMAN_CROMWELL_LABEL}:{name}'}])
+        if res.totalResultsCount < 1:
+            raise CromwellException(f'No job found for name="{name}"', status_code=404)
+        # most recent first
+        return res.results[0].id
+
+    async def get_job_info(self, job: WorkflowId) -> JobInfo:
+        info = CromwellManager.info_from_metadata(await self.metadata(job))
+        if info is None:
+            raise CromwellException(f'Info not available for WorkflowId={job}', status_code=404)
+        return info
+
+    async def get_jobs_info(self, names: Collection[JobName]) -> Dict[JobName, JobInfo]:
+        """
+        Same as :meth:`CromwellManager.get_jobs_info`: a single query, then the
+        metadata of every job, which are requested concurrently.
+        """
+        if not names:
+            return {}
+        label = CromwellManager.PMAN_CROMWELL_LABEL
+        res = await self.query([{'labelor': f'{label}:{name}'} for name in names]
+                               + [{'additionalQueryResultFields': 'labels'}])
+        workflows = {}
+        for result in res.results:
+            name = (result.labels or {}).get(label)
+            if name is not None and name not in workflows:
+                workflows[name] = result.id
+        found = [name for name in names if name in workflows]
+        metadata = await asyncio.gather(*(self.metadata(workflows[name]) for name in found))
+        infos = {}
+        for name, res in zip(found, metadata):
+            info = CromwellManager.info_from_metadata(res)
+            if info is not None:
+                infos[name] = info
+        return infos
+
+    async def aclose(self):
+        if self.__http is not None:
+            await self.__http.aclose()
+        await super().aclose()
@@ -0,0 +1,107 @@
+"""
+Asynchronous Docker Engine or Podman API client for the ASGI app, using ``aiodocker``.
+"""
+import json
+from typing import AnyStr, Collection, Dict, Optional
+
+import aiodocker
+from docker.models.containers import Container
+
+from .abstractmgr import JobName, JobInfo, ManagerException
+from .asyncmgr import AsyncManager
+from .dockermgr import DockerManager, _list_filters
+
+
+class AsyncDockerManager(AsyncManager[Container]):
+    """
+    Gets containers and their logs using ``aiodocker``. Containers are
+    returned as ``docker`` objects, so that they work with the methods
+    of :class:`DockerManager` which are run in threads.
+    """
+
+    def __init__(self, sync_mgr: DockerManager, max_threads: int = 32):
+        super().__init__(sync_mgr, max_threads)
+        self.__client: Optional[aiodocker.Docker] = None
+
+    @property
+    def __docker(self) -> aiodocker.Docker:
+        # created in the event loop of the ASGI server
+        if self.__client is None:
+            self.__client = aiodocker.Docker()
+        return self.__client
+
+    async def get_job(self, name: JobName) -> Container:
+        cache = self.sync_mgr.state_cache
+        seq = None
+        if cache is not None:
+            attrs = cache.get(name)
+            if attrs is not None:
+                return self.sync_mgr.container_from_attrs(attrs)
+            seq = cache.sequence()
+        try:
+            attrs = await self.__docker.containers.container(name).show()
+        except aiodocker.DockerError as e:
+            raise _to_manager_exception(e)
+        if cache is not None:
+            cache.put(attrs, seq)
+        return self.sync_mgr.container_from_attrs(attrs)
+
+    async def get_job_logs(self, job: Container, tail: int) -> AnyStr:
+        try:
+            lines = await self.__docker.containers.container(job.id).log(
+                stdout=True, stderr=True, tail=tail
+            )
+        except aiodocker.DockerError as e:
+            raise _to_manager_exception(e)
+        return ''.join(lines)
+
+    async def get_job_info(self, job: Container) -> JobInfo:
+        # no request is needed
+        return self.sync_mgr.get_job_info(job)
+
+    async def get_jobs_info(self, names: Collection[JobName]) -> Dict[JobName, JobInfo]:
+        """
+        Same as :meth:`DockerManager.get_jobs_info`, with a single container list request
+        and an inspection of every container whose state changed.
+        """
+        wanted = set(names)
+        filters = _list_filters(self.sync_mgr.job_labels, wanted)
+        try:
+            # aiodocker returns the list entries as they are, which is the same as sparse=True
+            containers = await self.__docker.containers.list(all='true', filters=json.dumps(filters))
+        except aiodocker.DockerError as e:
+            raise _to_manager_exception(e)
+
+        inspected = self.sync_mgr.inspected
+        infos = {}
+        for c in containers:
+            summary = c._container
+            name = JobName(summary['Names'][0].lstrip('/'))
+            if name not in wanted:
+                continue
+            info = inspected.get(summary['Id'], summary['State'])
+            if info is None:
+                attrs = self.sync_mgr.cached_attrs(name, summary['State'])
+                if attrs is None:
+                    try:
+                        attrs = await self.__docker.containers.container(summary['Id']).show()
+                    except aiodocker.DockerError as e:
+                        if e.status == 404:
+                            continue
+                        raise _to_manager_exception(e)
+                info = self.sync_mgr.get_job_info(self.sync_mgr.container_from_attrs(attrs))
+                inspected.put(summary['Id'], attrs['State']['Status'], info)
+            infos[name] = info
+        inspected.forget_removed({c._container['Id'] for c in containers},
+                                 None if self.sync_mgr.job_labels else wanted)
+        return infos
+
+    async def aclose(self):
+        if self.__client is not None:
+            await self.__client.close()
+        await super().aclose()
+
+
+def _to_manager_exception(e: aiodocker.DockerError) -> ManagerException:
+    status_code = 503 if e.status == 500 else e.status
+    return ManagerException(str(e), status_code=status_code)
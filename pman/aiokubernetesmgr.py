@@ -0,0 +1,108 @@
+"""
+Asynchronous Kubernetes API client for the ASGI app, using ``kubernetes_asyncio``.
+"""
+import asyncio
+from typing import AnyStr, Collection, Dict, Optional
+
+from kubernetes_asyncio import client as k_client
+from kubernetes_asyncio import config as k_config
+from kubernetes_asyncio.client.rest import ApiException
+
+from .abstractmgr import JobName, JobInfo, ManagerException
+from .asyncmgr import AsyncManager
+from .kubernetesmgr import KubernetesManager
+
+
+class AsyncKubernetesManager(AsyncManager):
+    """
+    Gets jobs, pods and logs using ``kubernetes_asyncio``, or from the
+    informer of the :class:`KubernetesManager` when it is enabled.
+
+    Objects of ``kubernetes_asyncio`` have the same attributes as the ones
+    of ``kubernetes``, so they work with the methods of :class:`KubernetesManager`.
+    """
+
+    def __init__(self, sync_mgr: KubernetesManager, max_threads: int = 32):
+        super().__init__(sync_mgr, max_threads)
+        self.__namespace = sync_mgr.config.get('JOB_NAMESPACE')
+        labels = sync_mgr.config.get('JOB_LABELS')
+        self.__label_selector = ','.join(f'{k}={v}' for k, v in labels.items()) if labels else None
+        self.__configuration = k_client.Configuration()
+        k_config.load_incluster_config(client_configuration=self.__configuration)
+        self.__api_client: Optional[k_client.ApiClient] = None
+
+    @property
+    def __api(self) -> k_client.ApiClient:
+        # created in the event loop of the ASGI server
+        if self.__api_client is None:
+            self.__api_client = k_client.ApiClient(self.__configuration)
+        return self.__api_client
+
+    async def get_job(self, name: JobName):
+        informer = self.sync_mgr.informer
+        if informer is not None and informer.has_synced():
+            job = informer.get_job(name)
+            if job is not None:
+                return job
+        try:
+            return await k_client.BatchV1Api(self.__api).read_namespaced_job(name, self.__namespace)
+        except ApiException as e:
+            raise _to_manager_exception(e)
+
+    async def get_job_info(self, job) -> JobInfo:
+        # no request is needed
+        return self.sync_mgr.get_job_info(job)
+
+    async def get_job_logs(self, job, tail: int) -> AnyStr:
+        """
+        Same as :meth:`KubernetesManager.get_job_logs`, but the logs of all pods are read concurrently.
+        """
+        pods = await self.get_job_pods(job.metadata.name)
+        logs = await asyncio.gather(*(self.get_pod_log(pod.metadata.name, tail) for pod in pods))
+        return self.sync_mgr.combine_pod_logs(pods, logs)
+
+    async def get_job_pods(self, name: str) -> list:
+        informer = self.sync_mgr.informer
+        if informer is not None and informer.has_synced() and informer.get_job(name) is not None:
+            return informer.get_job_pods(name)
+        try:
+            res = await k_client.CoreV1Api(self.__api).list_namespaced_pod(
+                self.__namespace, label_selector='job-name=' + name
+            )
+        except ApiException as e:
+            raise _to_manager_exception(e)
+        return res.items
+
+    async def get_pod_log(self, pod_name: str, tail: int) -> str:
+        try:
+            return await k_client.CoreV1Api(self.__api).read_namespaced_pod_log(
+                name=pod_name, namespace=self.__namespace, tail_lines=tail
+            )
+        except ApiException as e:
+            return self.sync_mgr.pod_log_error_message(pod_name, e)
+
+    async def get_jobs_info(self, names: Collection[JobName]) -> Dict[JobName, JobInfo]:
+        """
+        Same as :meth:`KubernetesManager.get_jobs_info`, with a single job list request.
+        """
+        try:
+            jobs = await k_client.BatchV1Api(self.__api).list_namespaced_job(
+                self.__namespace, label_selector=self.__label_selector
+            )
+        except ApiException as e:
+            raise _to_manager_exception(e)
+        wanted = set(names)
+        return {
+            JobName(job.metadata.name): self.sync_mgr.get_job_info(job)
+            for job in jobs.items if job.metadata.name in wanted
+        }
+
+    async def aclose(self):
+        if self.__api_client is not None:
+            await self.__api_client.close()
+        await super().aclose()
+
+
+def _to_manager_exception(e: ApiException) -> ManagerException:
+    status_code = 503 if e.status == 500 else e.status
+    return ManagerException(str(e), status_code=status_code)
@@ -1,28 +1,313 @@
 
 import os
+import threading
+import time
+from typing import Optional
 
-from flask import Flask
+from flask import Flask, Response, g, request, jsonify
 from flask_restful import Api
+from flask_restful.representations.json import output_json
 
+from .abstractmgr import AbstractManager
+from .admission import AdmissionController
+from .coalesce import COALESCED_METHODS, SingleFlight, coalesce_manager
 from .config import DevConfig, ProdConfig
-from pman.resources import JobListResource, JobResource
+from .dispatch import DispatchQueue, Dispatcher
+from .events import EventLog, ChangeDetector
+from .fairshare import FairShare
+from .handlers import JobsApi
+from .metrics import HTTP_LATENCY, MetricsExporter, count, instrument_manager
+from .profiling import RequestProfiler
+from .registry import JobRegistry
+from .controller import ControllerHeartbeat
+from .leases import FileLease
+from .logarchive import LogArchive, LogArchiver
+from .stats import Counters
+from .statuscache import StatusCache, StatusRefresher
+from .tracing import Tracer, create_tracer, trace_manager
+from pman.resources import (JobListResource, JobResource, JobBatchResource, JobLogsResource,
+                            JobEventsResource, get_compute_mgr)
 
 
-def create_app(config_dict=None):
+def load_config(config_dict=None) -> dict:
+    """
+    Read the configuration from the environment.
+
+    :param config_dict: overrides for the configuration read from the environment
+    """
     app_mode = os.environ.get("APPLICATION_MODE", default="production")
     if app_mode == 'production':
         config_obj = ProdConfig()
     else:
         config_obj = DevConfig()
+    config = {key: getattr(config_obj, key) for key in dir(config_obj) if key.isupper()}
+    config.update(config_dict or {})
+    return config
+
+
+def create_extensions(config: dict, compute_mgr: AbstractManager,
+                      background: Optional[bool] = None) -> dict:
+    """
+    Create the state which is shared by every request handled by an app:
+    the compute manager, counters, limits and background threads.
+
+    :param background: whether to start the background threads (dispatch of queued jobs,
+                       refresh of the status cache, archive of logs), by default unless ``CONTROLLER=yes``,
+                       in which case they run in ``pman controller``
+    """
+    if background is None:
+        background = not config.get('CONTROLLER')
+    if config.get('METRICS'):
+        instrument_manager(compute_mgr, config.get('CONTAINER_ENV'))
+
+    # spans of calls to the compute manager include the time measured for metrics
+    tracer = create_tracer(config, compute_mgr) if config.get('TRACING') else None
+
+    # the counters of a worker process, which are summed up over every worker by the metrics
+    counters = Counters(on_inc=count if config.get('METRICS') else None)
+    flight = None
+    if config.get('COALESCE'):
+        # merged calls are neither measured nor traced, they make no call to the backend
+        flight = SingleFlight(counters, ttl=config.get('COALESCE_TTL', 0.0))
+        coalesce_manager(compute_mgr, flight)
+
+    extensions = {
+        'compute_mgr': compute_mgr,
+        'counters': counters,
+        # each long-polling request occupies a thread of the worker while it waits
+        'long_poll_slots': threading.BoundedSemaphore(config.get('LONG_POLL_MAX_WAITERS', 16)),
+        # changes are detected once the first client connects to the events stream,
+        # by only one of the worker processes which share the event log
+        'change_detector': ChangeDetector(
+            compute_mgr, EventLog(config['STATE_DB'], size=config.get('EVENTS_BUFFER_SIZE', 1000)),
+            poll_interval=config.get('EVENTS_POLL_SECONDS', 5),
+            lease=FileLease(f'{config["STATE_DB"]}.events.lock')
+        ),
+        'events_slots': threading.BoundedSemaphore(config.get('EVENTS_MAX_CLIENTS', 4)),
+    }
+
+    if tracer is not None:
+        extensions['tracer'] = tracer
+    if flight is not None:
+        extensions['coalesce'] = flight
+    if config.get('PMAN_PROFILE'):
+        extensions['profiler'] = RequestProfiler(config['PROFILE_DIR'],
+                                                 config.get('PROFILE_SAMPLE_RATE', 0.0),
+                                                 config.get('PROFILE_MAX_FILES', 100))
+    if config.get('METRICS'):
+        extensions['metrics'] = MetricsExporter(
+            compute_mgr, jobs_max_age=config.get('METRICS_JOBS_MAX_AGE', 15)
+        )
+
+    if config.get('STATUS_CACHE'):
+        cache = StatusCache(config['STATE_DB'], max_age=config.get('STATUS_CACHE_MAX_AGE', 5.0))
+        extensions['status_cache'] = cache
+        interval = config.get('STATUS_CACHE_REFRESH_SECONDS', 2.0)
+        if interval > 0:
+            refresher = StatusRefresher(cache, compute_mgr,
+                                        FileLease(f'{config["STATE_DB"]}.status.lock'),
+                                        interval=interval)
+            if background:
+                refresher.start()
+            extensions['status_refresher'] = refresher
+
+    if config.get('JOB_REGISTRY'):
+        extensions['job_registry'] = JobRegistry(
+            config['STATE_DB'], retention=config.get('JOB_REGISTRY_RETENTION_DAYS', 0) * 86400
+        )
+
+    if config.get('LOG_ARCHIVE'):
+        archive = LogArchive(config['STATE_DB'], directory=config.get('LOG_ARCHIVE_DIR'))
+        extensions['log_archive'] = archive
+        archiver = LogArchiver(archive, compute_mgr,
+                               FileLease(f'{config["STATE_DB"]}.archive.lock'),
+                               interval=config.get('LOG_ARCHIVE_INTERVAL_SECONDS', 30.0))
+        if background:
+            archiver.start()
+        extensions['log_archiver'] = archiver
 
+    admission = None
+    if config.get('ADMISSION_CONTROL'):
+        admission = AdmissionController(config['STATE_DB'], compute_mgr, capacity={
+            'cpu_limit': config.get('ADMISSION_CPU_LIMIT'),
+            'memory_limit': config.get('ADMISSION_MEMORY_LIMIT'),
+            'gpu_limit': config.get('ADMISSION_GPU_LIMIT'),
+        })
+        extensions['admission'] = admission
+
+    if config.get('DISPATCH_QUEUE'):
+        queue = DispatchQueue(config['STATE_DB'],
+                              lease_seconds=config.get('DISPATCH_LEASE_SECONDS', 600),
+                              failed_retention=config.get('DISPATCH_FAILED_RETENTION_DAYS', 7)
+                              * 86400)
+        fair_share = None
+        if config.get('FAIR_SHARE'):
+            fair_share = FairShare(config.get('FAIR_SHARE_WEIGHTS'),
+                                   max_jobs_per_user=config.get('FAIR_SHARE_MAX_JOBS_PER_USER'))
+        dispatcher = Dispatcher(queue, compute_mgr, workers=config.get('DISPATCH_WORKERS', 4),
+                                admission=admission, fair_share=fair_share)
+        if background:
+            dispatcher.start()
+        extensions['dispatcher'] = dispatcher
+
+    if config.get('CONTROLLER'):
+        extensions['controller'] = ControllerHeartbeat(config['STATE_DB'])
+
+    extensions['jobs_api'] = JobsApi(config, extensions)
+    return extensions
+
+
+def create_app(config_dict=None, compute_mgr: Optional[AbstractManager] = None):
+    """
+    Create the pman Flask app.
+
+    A single compute manager is created here and shared by every request
+    handled by the app, so that backend clients (and their connection pools)
+    live as long as the worker process.
+
+    :param config_dict: overrides for the configuration read from the environment
+    :param compute_mgr: use this compute manager instead of creating one from ``CONTAINER_ENV``
+    """
     app = Flask(__name__)
-    app.config.from_object(config_obj)
-    app.config.update(config_dict or {})
+    app.config.update(load_config(config_dict))
+
+    if compute_mgr is None:
+        compute_mgr = get_compute_mgr(app.config.get('CONTAINER_ENV'), app.config)
+    app.extensions.update(create_extensions(app.config, compute_mgr))
 
     api = Api(app, prefix='/api/v1/')
 
     # url mappings
     api.add_resource(JobListResource, '/', endpoint='api.joblist')
+    api.add_resource(JobBatchResource, '/batch/', endpoint='api.jobbatch')
+    api.add_resource(JobEventsResource, '/events', endpoint='api.events')
     api.add_resource(JobResource, '/<string:job_id>/', endpoint='api.job')
+    api.add_resource(JobLogsResource, '/<string:job_id>/logs', endpoint='api.joblogs')
+
+    if 'metrics' in app.extensions:
+        add_metrics(app, app.extensions['metrics'])
+    if 'tracer' in app.extensions:
+        add_tracing(app, api, app.extensions['tracer'])
+    if 'profiler' in app.extensions:
+        add_profiling(app, app.extensions['profiler'])
 
     return app
+
+
+def add_metrics(app: Flask, exporter: MetricsExporter):
+    """
+    Measure the latency of requests, and expose metrics at ``GET /metrics``.
+    """
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def observe_latency(response):
+        if 'request_start' in g:
+            HTTP_LATENCY.labels(request.endpoint or 'none', request.method,
+                                str(response.status_code)
+                                ).observe(time.perf_counter() - g.request_start)
+        return response
+
+    def metrics():
+        body, content_type = exporter.generate()
+        return Response(body, content_type=content_type)
+
+    app.add_url_rule('/metrics', 'metrics', metrics)
+
+
+def add_tracing(app: Flask, api: Api, tracer: Tracer):
+    """
+    Trace every request, and the encoding of its JSON response.
+    """
+    @app.before_request
+    def start_span():
+        span = tracer.start(f'{request.method} {request.endpoint}', kind='server',
+                            traceparent=request.headers.get('traceparent'),
+                            **{'http.method': request.method, 'http.path': request.path})
+        if job_id := (request.view_args or {}).get('job_id'):
+            span.attributes['job_id'] = job_id
+        g.trace_span = span
+        g.trace_token = tracer.activate(span)
+
+    @app.after_request
+    def add_response_attributes(response):
+        if 'trace_span' in g:
+            g.trace_span.attributes['http.status_code'] = response.status_code
+            if response.content_length is not None:
+                g.trace_span.attributes['payload_size'] = response.content_length
+        return response
+
+    @app.teardown_request
+    def finish_span(e):
+        if 'trace_span' in g:
+            tracer.finish(g.pop('trace_span'), g.pop('trace_token'), e)
+
+    @api.representation('application/json')
+    def traced_output_json(data, code, headers=None):
+        with tracer.span('encode_json'):
+            return output_json(data, code, headers)
+
+
+def add_profiling(app: Flask, profiler: RequestProfiler):
+    """
+    Profile the requests chosen by ``profiler``, and show the hottest functions
+    of their profiles at ``GET /admin/profile``.
+    """
+    @app.before_request
+    def start_profile():
+        if request.endpoint != 'admin.profile' and profiler.wants(
+                request.headers.get(RequestProfiler.HEADER)):
+            g.profile = profiler.start()
+
+    @app.teardown_request
+    def stop_profile(e):
+        profile = g.pop('profile', None)
+        if profile is not None:
+            profiler.stop(profile, request.endpoint)
+
+    def profile_top():
+        try:
+            top = profiler.top(request.args.get('endpoint'),
+                               n=request.args.get('top', 30, type=int),
+                               sort=request.args.get('sort', 'cumulative'))
+        except ValueError as e:
+            return jsonify(message=str(e)), 400
+        return jsonify(endpoints=profiler.endpoints(), top=top)
+
+    app.add_url_rule('/admin/profile', 'admin.profile', profile_top)
+
+
+def create_asgi_app(config_dict=None, compute_mgr: Optional[AbstractManager] = None):
+    """
+    Create the pman ASGI app, which has the same API as :func:`create_app`
+    but waits for the compute backend without occupying threads. Run it with::
+
+        uvicorn --factory pman.app:create_asgi_app
+
+    Requires the ``async`` extra dependencies (Starlette and the asynchronous
+    client of the backend).
+
+    :param config_dict: overrides for the configuration read from the environment
+    :param compute_mgr: use this compute manager instead of creating one from ``CONTAINER_ENV``
+    """
+    from .asgi import create_starlette_app
+    from .asyncmgr import create_async_manager
+
+    config = load_config(config_dict)
+    if compute_mgr is None:
+        compute_mgr = get_compute_mgr(config.get('CONTAINER_ENV'), config)
+    extensions = create_extensions(config, compute_mgr)
+    async_mgr = create_async_manager(compute_mgr, config)
+    if config.get('METRICS'):
+        # calls run in the thread pool are measured by the instrumented compute_mgr
+        instrument_manager(async_mgr, config.get('CONTAINER_ENV'), async_mgr.native_methods())
+    if 'tracer' in extensions:
+        trace_manager(async_mgr, extensions['tracer'], config.get('CONTAINER_ENV'),
+                      async_mgr.native_methods())
+    if 'coalesce' in extensions:
+        # calls run in the thread pool are coalesced by compute_mgr
+        coalesce_manager(async_mgr, extensions['coalesce'],
+                         [m for m in async_mgr.native_methods() if m in COALESCED_METHODS])
+    return create_starlette_app(config, extensions, async_mgr)
@@ -0,0 +1,304 @@
+"""
+The pman API as an ASGI app, for asynchronous servers such as uvicorn::
+
+    uvicorn --factory pman.app:create_asgi_app
+
+It has the same routes and responses as the Flask app of :func:`pman.app.create_app`,
+and shares its request parsers and the handlers of :mod:`pman.handlers`. Requests
+for the status and logs of jobs wait for the compute backend without occupying
+a thread, using the asynchronous clients of :func:`pman.asyncmgr.create_async_manager`.
+"""
+import copy
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Mapping
+
+from flask_restful import reqparse
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from .abstractmgr import ManagerException, JobStatus
+from .asyncmgr import AsyncManager
+from .handlers import Steps, T, run_async
+from .longpoll import async_wait_for_status_change
+from .metrics import HTTP_LATENCY
+from .tracing import Tracer
+from .resources import parser, job_parser, logs_parser, batch_parser, sse_stream
+
+logger = logging.getLogger(__name__)
+
+
+def create_starlette_app(config: dict, extensions: dict, async_mgr: AsyncManager) -> Starlette:
+    """
+    Create the ASGI app. Use :func:`pman.app.create_asgi_app` instead.
+
+    :param config: the configuration
+    :param extensions: the shared state created by :func:`pman.app.create_extensions`
+    :param async_mgr: the asynchronous client of the compute manager in ``extensions``
+    """
+    @asynccontextmanager
+    async def lifespan(app: Starlette):
+        yield
+        await async_mgr.aclose()
+
+    route_middleware = []
+    if 'tracer' in extensions:
+        route_middleware.append(Middleware(TracingMiddleware, tracer=extensions['tracer']))
+
+    # routes are named like the endpoints of the Flask app
+    routes = [
+        Route(path, endpoint, methods=[method], name=name, middleware=route_middleware)
+        for path, endpoint, method, name in (
+            ('/api/v1/', get_job_list, 'GET', 'api.joblist'),
+            ('/api/v1/', post_job_list, 'POST', 'api.joblist'),
+            ('/api/v1/batch/', post_job_batch, 'POST', 'api.jobbatch'),
+            ('/api/v1/events', get_events, 'GET', 'api.events'),
+            ('/api/v1/{job_id}/', get_job, 'GET', 'api.job'),
+            ('/api/v1/{job_id}/', delete_job, 'DELETE', 'api.job'),
+            ('/api/v1/{job_id}/logs', get_job_logs, 'GET', 'api.joblogs'),
+        )
+    ]
+    middleware = []
+    if 'metrics' in extensions:
+        routes.append(Route('/metrics', get_metrics, methods=['GET'], name='metrics'))
+        middleware.append(Middleware(MetricsMiddleware))
+
+    app = Starlette(
+        routes=routes,
+        middleware=middleware,
+        exception_handlers={
+            HTTPException: handle_http_exception,
+            ManagerException: handle_manager_exception,
+        },
+        lifespan=lifespan,
+    )
+    app.state.config = config
+    app.state.extensions = extensions
+    app.state.async_mgr = async_mgr
+    app.state.jobs_api = extensions['jobs_api']
+    # waiting requests are coroutines, they do not occupy the threads counted by LONG_POLL_MAX_WAITERS
+    app.state.long_poll_slots = threading.BoundedSemaphore(config.get('ASYNC_LONG_POLL_MAX_WAITERS', 1000))
+    return app
+
+
+class MetricsMiddleware:
+    """
+    Measures the latency of requests, until the response starts, by route.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+
+        async def send_measured(message):
+            if message['type'] == 'http.response.start':
+                route = scope.get('route')
+                HTTP_LATENCY.labels(route.name if route is not None else 'none', scope['method'],
+                                    str(message['status'])
+                                    ).observe(time.perf_counter() - start)
+            await send(message)
+
+        await self.app(scope, receive, send_measured)
+
+
+class TracingMiddleware:
+    """
+    Traces requests to a route, like :func:`pman.app.add_tracing`.
+    """
+
+    def __init__(self, app, tracer: Tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        headers = Headers(scope=scope)
+        span = self.tracer.start(f'{scope["method"]} {scope["route"].name}', kind='server',
+                                 traceparent=headers.get('traceparent'),
+                                 **{'http.method': scope['method'], 'http.path': scope['path']})
+        if job_id := scope.get('path_params', {}).get('job_id'):
+            span.attributes['job_id'] = job_id
+
+        async def send_traced(message):
+            if message['type'] == 'http.response.start':
+                span.attributes['http.status_code'] = message['status']
+                response_headers = Headers(raw=message.get('headers', []))
+                if (length := response_headers.get('content-length')) is not None:
+                    span.attributes['payload_size'] = int(length)
+            await send(message)
+
+        token = self.tracer.activate(span)
+        try:
+            await self.app(scope, receive, send_traced)
+        except BaseException as e:
+            self.tracer.finish(span, token, e)
+            raise
+        self.tracer.finish(span, token)
+
+
+async def get_metrics(request: Request) -> Response:
+    exporter = request.app.state.extensions['metrics']
+    body, content_type = await request.app.state.async_mgr.run_sync(exporter.generate)
+    return Response(body, headers={'Content-Type': content_type})
+
+
+def abort(status_code: int, message):
+    """
+    Same as :func:`flask_restful.abort`.
+    """
+    raise HTTPException(status_code, detail=message)
+
+
+async def handle_http_exception(request: Request, e: HTTPException) -> JSONResponse:
+    return JSONResponse({'message': e.detail}, status_code=e.status_code)
+
+
+async def handle_manager_exception(request: Request, e: ManagerException) -> JSONResponse:
+    return JSONResponse({'message': str(e)}, status_code=e.status_code or 500)
+
+
+def parse_args(req_parser: reqparse.RequestParser, values: Mapping) -> reqparse.Namespace:
+    """
+    Parse request arguments as specified by a Flask-RESTful request parser,
+    so that both apps validate requests the same way.
+
+    :param req_parser: one of the parsers of :mod:`pman.resources`
+    :param values: the JSON body or the query parameters of the request
+    """
+    if not isinstance(values, Mapping):
+        abort(400, 'The request body must be a JSON object')
+    namespace = reqparse.Namespace()
+    errors = {}
+    for arg in req_parser.args:
+        if arg.name not in values:
+            if arg.required:
+                errors[arg.name] = 'Missing required parameter in the JSON body ' \
+                                   'or the post body or the query string'
+            else:
+                namespace[arg.dest or arg.name] = copy.deepcopy(arg.default)
+            continue
+        try:
+            value = arg.convert(values[arg.name], '=')
+        except Exception as e:
+            errors[arg.name] = str(e)
+            continue
+        if arg.choices and value not in arg.choices:
+            errors[arg.name] = f'{value} is not a valid choice'
+            continue
+        namespace[arg.dest or arg.name] = value
+    if errors:
+        first = next(iter(errors.items()))
+        abort(400, errors if req_parser.bundle_errors else dict([first]))
+    return namespace
+
+
+async def handle(request: Request, steps: Steps[T]) -> T:
+    """
+    Run a handler of :mod:`pman.handlers`, see :func:`pman.handlers.run_async`.
+    Its :class:`ManagerException` is turned into a response by :func:`handle_manager_exception`.
+    """
+    return await run_async(steps, request.app.state.async_mgr)
+
+
+async def read_json(request: Request):
+    try:
+        return await request.json()
+    except ValueError:
+        abort(400, 'The request body must be JSON')
+
+
+async def get_job_list(request: Request) -> JSONResponse:
+    jobs_api = request.app.state.jobs_api
+    jids = request.query_params.get('jids')
+    if jids is not None:
+        return JSONResponse(await handle(request, jobs_api.get_jobs_status(jids.split(','))))
+    return JSONResponse(await handle(request, jobs_api.index()))
+
+
+async def post_job_list(request: Request) -> JSONResponse:
+    args = parse_args(parser, await read_json(request))
+    jobs_api = request.app.state.jobs_api
+    body, status_code, headers = await handle(request, jobs_api.create_job(args))
+    return JSONResponse(body, status_code=status_code, headers=headers)
+
+
+async def post_job_batch(request: Request) -> JSONResponse:
+    args = parse_args(batch_parser, await read_json(request))
+    jobs_api = request.app.state.jobs_api
+    return JSONResponse(await handle(request, jobs_api.get_jobs_status(args.jids)))
+
+
+async def get_job(request: Request) -> JSONResponse:
+    """
+    Same as :meth:`pman.resources.JobResource.get`, except that while waiting
+    for the status to change, the job is polled even if the backend notifies changes.
+    """
+    jobs_api = request.app.state.jobs_api
+    args = parse_args(job_parser, request.query_params)
+    job_id = request.path_params['job_id'].lstrip('/')
+    if args.wait:
+        last_seen = None if args.status is None else JobStatus(args.status)
+        slots = request.app.state.long_poll_slots
+        timeout = jobs_api.start_long_poll(job_id, args.wait, slots)
+        if timeout is not None:
+            try:
+                await async_wait_for_status_change(
+                    lambda: handle(request, jobs_api.job_info(job_id)), last_seen, timeout
+                )
+            finally:
+                jobs_api.end_long_poll(slots)
+    cursor = request.query_params.get('cursor')
+    return JSONResponse(await handle(request, jobs_api.get_job(job_id, args, cursor)))
+
+
+async def delete_job(request: Request) -> Response:
+    job_id = request.path_params['job_id'].lstrip('/')
+    await handle(request, request.app.state.jobs_api.delete_job(job_id))
+    return Response(status_code=204)
+
+
+async def get_job_logs(request: Request) -> Response:
+    """
+    Same as :class:`pman.resources.JobLogsResource`. The logs are read in a
+    thread, for as long as the response lasts.
+    """
+    args = parse_args(logs_parser, request.query_params)
+    job_id = request.path_params['job_id'].lstrip('/')
+    jobs_api = request.app.state.jobs_api
+    logs = await handle(request, jobs_api.get_job_logs(job_id, args.tail, args.follow))
+    if isinstance(logs, (bytes, str)):
+        return Response(logs, media_type='text/plain')
+    return StreamingResponse(logs, media_type='text/plain')
+
+
+async def get_events(request: Request) -> StreamingResponse:
+    """
+    Same as :class:`pman.resources.JobEventsResource`. Each client occupies a
+    thread, which waits for events.
+    """
+    state = request.app.state
+    detector = state.extensions['change_detector']
+    try:
+        await state.async_mgr.run_sync(detector.start)
+    except NotImplementedError as e:
+        abort(501, str(e))
+    slots = state.extensions['events_slots']
+    if not slots.acquire(blocking=False):
+        abort(503, 'Too many clients of the events stream')
+    last_id = request.headers.get('Last-Event-ID') or request.query_params.get('last_event_id')
+    keepalive = state.config.get('EVENTS_KEEPALIVE_SECONDS', 15)
+    return StreamingResponse(sse_stream(detector.event_log, last_id, keepalive),
+                             media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+                             background=BackgroundTask(slots.release))
@@ -0,0 +1,128 @@
+"""
+Asynchronous counterpart of :class:`pman.abstractmgr.AbstractManager`, for the ASGI app.
+
+:class:`AsyncManager` runs the methods of a (synchronous) compute manager
+in a thread pool. Subclasses override the methods which are called the most
+(the ones used to get the status and logs of jobs) with implementations
+which use an asynchronous client library, so that they do not occupy a thread.
+"""
+import asyncio
+import contextvars
+import functools
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from typing import Generic, List, Optional, AnyStr, Collection, Dict, Iterator
+
+from .abstractmgr import (AbstractManager, J, Image, JobName, ResourcesDict, MountsDict,
+                          JobInfo, JobLogs, ManagerException)
+from .backends import async_manager_class
+
+
+class AsyncManager(Generic[J]):
+    """
+    Calls the methods of a compute manager in a thread pool.
+
+    :param sync_mgr: the compute manager
+    :param max_threads: maximum number of concurrent calls to ``sync_mgr``
+    """
+
+    def __init__(self, sync_mgr: AbstractManager[J], max_threads: int = 32):
+        self.sync_mgr = sync_mgr
+        self.__executor = ThreadPoolExecutor(max_workers=max_threads,
+                                             thread_name_prefix='async-manager')
+
+    async def run_sync(self, func, *args, **kwargs):
+        """
+        Call a blocking function in the thread pool.
+        """
+        loop = asyncio.get_running_loop()
+        # like asyncio.to_thread, so that e.g. the current span is known in the thread
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self.__executor,
+                                          functools.partial(context.run, func, *args, **kwargs))
+
+    @property
+    def log_api_calls(self) -> int:
+        return self.sync_mgr.log_api_calls
+
+    async def schedule_job(self, image: Image, command: List[str], name: JobName,
+                           resources_dict: ResourcesDict, env: List[str],
+                           uid: Optional[int], gid: Optional[int],
+                           mounts_dict: MountsDict) -> J:
+        return await self.run_sync(self.sync_mgr.schedule_job, image, command, name,
+                                   resources_dict, env, uid, gid, mounts_dict)
+
+    async def get_job(self, name: JobName) -> J:
+        return await self.run_sync(self.sync_mgr.get_job, name)
+
+    async def get_job_logs(self, job: J, tail: int) -> AnyStr:
+        return await self.run_sync(self.sync_mgr.get_job_logs, job, tail)
+
+    async def get_job_logs_since(self, job: J, cursor: Optional[str], tail: int) -> JobLogs:
+        return await self.run_sync(self.sync_mgr.get_job_logs_since, job, cursor, tail)
+
+    def stream_job_logs(self, job: J, tail: Optional[int] = None,
+                        follow: bool = False) -> Iterator[bytes]:
+        """
+        A blocking iterator, which the ASGI server iterates in a thread.
+        """
+        return self.sync_mgr.stream_job_logs(job, tail, follow)
+
+    async def get_job_info(self, job: J) -> JobInfo:
+        return await self.run_sync(self.sync_mgr.get_job_info, job)
+
+    async def get_jobs_info(self, names: Collection[JobName]) -> Dict[JobName, JobInfo]:
+        return await self.run_sync(self.sync_mgr.get_jobs_info, names)
+
+    async def remove_job(self, job: J):
+        return await self.run_sync(self.sync_mgr.remove_job, job)
+
+    def get_stats(self) -> dict:
+        return self.sync_mgr.get_stats()
+
+    async def aclose(self):
+        """
+        Close the clients of the backend.
+        """
+        self.__executor.shutdown(wait=False)
+
+    @classmethod
+    def native_methods(cls) -> List[str]:
+        """
+        Names of the methods which a subclass overrides with an asynchronous client,
+        instead of calling ``sync_mgr`` in the thread pool.
+        """
+        return [name for name, value in vars(AsyncManager).items()
+                if inspect.iscoroutinefunction(value) and name != 'aclose'
+                and getattr(cls, name) is not value]
+
+
+async def gather_jobs_info(mgr: AsyncManager, names: Collection[JobName]) -> Dict[JobName, JobInfo]:
+    """
+    Get the info of many jobs concurrently, leaving out the jobs which are not found.
+    """
+    async def get_info(name: JobName) -> Optional[JobInfo]:
+        try:
+            return await mgr.get_job_info(await mgr.get_job(name))
+        except ManagerException as e:
+            if e.status_code == 404:
+                return None
+            raise
+
+    infos = await asyncio.gather(*(get_info(name) for name in names))
+    return {name: info for name, info in zip(names, infos) if info is not None}
+
+
+def create_async_manager(compute_mgr: AbstractManager, config: dict) -> AsyncManager:
+    """
+    Wrap a compute manager with the asynchronous client of its backend,
+    or a thread pool if there is none.
+
+    The asynchronous client libraries are optional dependencies, imported here.
+    """
+    max_threads = config.get('ASYNC_MAX_THREADS', 32)
+    if config.get('ASYNC_BACKEND_CLIENTS', True):
+        cls = async_manager_class(compute_mgr)
+        if cls is not None:
+            return cls(compute_mgr, max_threads)
+    return AsyncManager(compute_mgr, max_threads)
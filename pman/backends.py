@@ -0,0 +1,60 @@
+"""
+Registry of compute backends, by ``CONTAINER_ENV``.
+
+The module of a backend is imported only when it is used, so that a process
+does not import the client libraries of the other backends (``kubernetes``,
+``openshift``, ``cromwell_tools``, ``jinja2``, ``pyserde``, ``docker``), which
+would slow the start of every worker process and cost memory.
+"""
+import importlib
+from typing import Dict, Optional, Type
+
+from .abstractmgr import AbstractManager
+
+BACKENDS: Dict[str, str] = {
+    'docker': 'pman.dockermgr:DockerManager',
+    'podman': 'pman.dockermgr:DockerManager',
+    'swarm': 'pman.swarmmgr:SwarmManager',
+    'kubernetes': 'pman.kubernetesmgr:KubernetesManager',
+    'openshift': 'pman.openshiftmgr:OpenShiftManager',
+    'cromwell': 'pman.cromwellmgr:CromwellManager',
+    'simulated': 'pman.simulatedmgr:SimulatedManager',
+}
+"""``module:class`` of the compute manager of every ``CONTAINER_ENV``."""
+
+ASYNC_BACKENDS: Dict[str, str] = {
+    'pman.dockermgr:DockerManager': 'pman.aiodockermgr:AsyncDockerManager',
+    'pman.kubernetesmgr:KubernetesManager': 'pman.aiokubernetesmgr:AsyncKubernetesManager',
+    'pman.cromwellmgr:CromwellManager': 'pman.aiocromwellmgr:AsyncCromwellManager',
+}
+"""``module:class`` of the asynchronous client of a compute manager, by ``module:class``."""
+
+
+def load(path: str) -> type:
+    """
+    Import a class given as ``module:class``.
+    """
+    module_name, _, class_name = path.partition(':')
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def manager_class(container_env: Optional[str]) -> Optional[Type[AbstractManager]]:
+    """
+    The compute manager of a ``CONTAINER_ENV``, or ``None`` if it is unknown.
+    """
+    path = BACKENDS.get(container_env)
+    return load(path) if path else None
+
+
+def async_manager_class(compute_mgr: AbstractManager) -> Optional[type]:
+    """
+    The asynchronous client of a compute manager (or of its base class),
+    or ``None`` if there is none.
+
+    Classes are compared by name, so that no backend is imported to check.
+    """
+    for cls in type(compute_mgr).__mro__:
+        path = ASYNC_BACKENDS.get(f'{cls.__module__}:{cls.__qualname__}')
+        if path:
+            return load(path)
+    return None
@@ -0,0 +1,179 @@
+"""
+Coalescing of identical concurrent reads from the compute backend (``COALESCE``).
+
+When the same job is polled by several clients at the same time (retries of
+CUBE, several tabs of the UI), the concurrent calls to the same read method
+of the compute manager, with the same arguments, share a single call to the
+backend and its result or exception ("single flight").
+
+With ``COALESCE_TTL``, the result of a call is also reused by the calls made
+less than ``ttl`` seconds after it returned.
+
+The counters ``coalesce_merged`` (calls which waited for an identical call in
+flight) and ``coalesce_hits`` (calls served by a result within the TTL) are
+reported by ``GET /api/v1/``.
+"""
+import asyncio
+import functools
+import inspect
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Collection, Dict, Hashable, Optional, Tuple
+
+from .stats import Counters
+
+COALESCED_METHODS = ('get_job', 'get_job_info', 'get_job_logs', 'get_job_logs_since')
+
+
+@dataclass
+class _Call:
+    args: tuple
+    """Arguments of the call, kept so that the IDs in its key are not reused."""
+    done: threading.Event = field(default_factory=threading.Event)
+    finished: float = 0.0
+    result: Any = None
+    error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Calls which share the result of an identical call in flight, or which returned
+    less than ``ttl`` seconds ago.
+
+    :param counters: where to count merged calls and hits
+    :param ttl: seconds for which results are reused, 0 to only merge concurrent calls
+    :param clock: function which returns the current time, for tests
+    """
+
+    def __init__(self, counters: Counters, ttl: float = 0.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.counters = counters
+        self.ttl = ttl
+        self.clock = clock
+        self.__calls: Dict[Hashable, _Call] = {}
+        self.__futures: Dict[Hashable, Tuple[asyncio.Future, tuple]] = {}
+        self.__lock = threading.Lock()
+        self.__last_prune = 0.0
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__calls) + len(self.__futures)
+
+    def call(self, key: Hashable, func: Callable, *args, **kwargs):
+        """
+        Call ``func``, unless an identical call (by ``key``) is in flight or recent.
+        """
+        with self.__lock:
+            self.__prune()
+            call = self.__calls.get(key)
+            if call is not None and call.done.is_set() and self.__expired(call):
+                call = None
+            if call is None:
+                call = self.__calls[key] = _Call(args)
+                leader = True
+            else:
+                leader = False
+                self.counters.inc('coalesce_hits' if call.done.is_set() else 'coalesce_merged')
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            call.finished = self.clock()
+            with self.__lock:
+                if (call.error is not None or self.ttl <= 0) and self.__calls.get(key) is call:
+                    del self.__calls[key]
+            call.done.set()
+        return call.result
+
+    async def call_async(self, key: Hashable, func: Callable, *args, **kwargs):
+        """
+        Same as :meth:`call`, for a coroutine function.
+        Results of coroutines are not reused after they returned.
+        """
+        with self.__lock:
+            entry = self.__futures.get(key)
+        if entry is not None:
+            self.counters.inc('coalesce_merged')
+            # shielded, so that a cancelled waiter does not cancel the call of the others
+            return await asyncio.shield(entry[0])
+        future = asyncio.get_running_loop().create_future()
+        with self.__lock:
+            self.__futures[key] = (future, args)
+        try:
+            result = await func(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            # retrieved, in case there are no waiters
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.__lock:
+                del self.__futures[key]
+
+    def __expired(self, call: _Call) -> bool:
+        return self.clock() - call.finished > self.ttl
+
+    def __prune(self):
+        if self.ttl <= 0 or self.clock() - self.__last_prune < self.ttl:
+            return
+        self.__last_prune = self.clock()
+        expired = [key for key, call in self.__calls.items()
+                   if call.done.is_set() and self.__expired(call)]
+        for key in expired:
+            del self.__calls[key]
+
+
+def coalesce_manager(mgr, flight: SingleFlight, methods: Collection[str] = COALESCED_METHODS):
+    """
+    Coalesce the calls to the read methods of a compute manager, which may be asynchronous.
+
+    The methods of the instance are replaced, so the manager keeps its type.
+    """
+    for name in methods:
+        method = getattr(mgr, name, None)
+        if method is None or getattr(method, '__coalesced__', False):
+            continue
+        setattr(mgr, name, _coalesce(method, flight, name))
+    return mgr
+
+
+def _coalesce(method: Callable, flight: SingleFlight, name: str) -> Callable:
+    if inspect.iscoroutinefunction(method):
+        @functools.wraps(method)
+        async def coalesced(*args, **kwargs):
+            return await flight.call_async(_key(name, args, kwargs), method, *args, **kwargs)
+    else:
+        @functools.wraps(method)
+        def coalesced(*args, **kwargs):
+            return flight.call(_key(name, args, kwargs), method, *args, **kwargs)
+    coalesced.__coalesced__ = True
+    return coalesced
+
+
+def _key(name: str, args: tuple, kwargs: dict) -> Hashable:
+    return (name, tuple(_key_part(a) for a in args),
+            tuple(sorted((k, _key_part(v)) for k, v in kwargs.items())))
+
+
+def _key_part(value) -> Hashable:
+    """
+    The value itself if it is hashable, otherwise its identity: job handles
+    which are not hashable (e.g. Kubernetes models) are the same object for
+    callers which shared the call to ``get_job``.
+    """
+    try:
+        hash(value)
+    except TypeError:
+        return 'id', id(value)
+    return value
@@ -6,7 +6,6 @@ from environs import Env
 from importlib.metadata import Distribution
 
 from pman.memsize import Memsize
-from pman._helpers import get_storebase_from_docker
 
 pkg = Distribution.from_name(__package__)
 
@@ -42,10 +41,79 @@ class Config:
 
         self.REMOVE_JOBS = env.bool('REMOVE_JOBS', True)
 
+        self.DISPATCH_QUEUE = env.bool('DISPATCH_QUEUE', False)
+        self.STATE_DB = env('STATE_DB', '/tmp/pman.db')
+        self.DISPATCH_WORKERS = env.int('DISPATCH_WORKERS', 4)
+        self.DISPATCH_LEASE_SECONDS = env.int('DISPATCH_LEASE_SECONDS', 600)
+        self.DISPATCH_FAILED_RETENTION_DAYS = env.float('DISPATCH_FAILED_RETENTION_DAYS', 7.0)
+
+        self.LONG_POLL_MAX_SECONDS = env.int('LONG_POLL_MAX_SECONDS', 30)
+        self.LONG_POLL_MAX_WAITERS = env.int('LONG_POLL_MAX_WAITERS', 16)
+
+        self.EVENTS_BUFFER_SIZE = env.int('EVENTS_BUFFER_SIZE', 1000)
+        self.EVENTS_POLL_SECONDS = env.int('EVENTS_POLL_SECONDS', 5)
+        self.EVENTS_MAX_CLIENTS = env.int('EVENTS_MAX_CLIENTS', 4)
+
+        self.COALESCE = env.bool('COALESCE', False)
+        self.COALESCE_TTL = env.float('COALESCE_TTL', 0.0)
+
+        self.STATUS_CACHE = env.bool('STATUS_CACHE', False)
+        self.STATUS_CACHE_MAX_AGE = env.float('STATUS_CACHE_MAX_AGE', 5.0)
+        self.STATUS_CACHE_REFRESH_SECONDS = env.float('STATUS_CACHE_REFRESH_SECONDS', 2.0)
+
+        self.JOB_REGISTRY = env.bool('JOB_REGISTRY', False)
+        self.JOB_REGISTRY_RETENTION_DAYS = env.float('JOB_REGISTRY_RETENTION_DAYS', 0.0)
+
+        self.LOG_ARCHIVE = env.bool('LOG_ARCHIVE', False)
+        self.LOG_ARCHIVE_DIR = env('LOG_ARCHIVE_DIR', None)
+        self.LOG_ARCHIVE_INTERVAL_SECONDS = env.float('LOG_ARCHIVE_INTERVAL_SECONDS', 30.0)
+
+        self.CONTROLLER = env.bool('CONTROLLER', False)
+        self.CONTROLLER_LEASE = env('CONTROLLER_LEASE', 'file')
+        self.CONTROLLER_LEASE_FILE = env('CONTROLLER_LEASE_FILE', None)
+        self.CONTROLLER_LEASE_NAME = env('CONTROLLER_LEASE_NAME', None)
+        self.CONTROLLER_LEASE_NAMESPACE = env('CONTROLLER_LEASE_NAMESPACE', None)
+        self.CONTROLLER_LEASE_SECONDS = env.int('CONTROLLER_LEASE_SECONDS', 15)
+        self.CONTROLLER_RENEW_SECONDS = env.float('CONTROLLER_RENEW_SECONDS', 2.0)
+        self.CONTROLLER_RECONCILE_SECONDS = env.float('CONTROLLER_RECONCILE_SECONDS', 30.0)
+        if self.CONTROLLER_LEASE not in ('file', 'kubernetes'):
+            raise ValueError('CONTROLLER_LEASE must be "file" or "kubernetes"')
+
+        self.ADMISSION_CONTROL = env.bool('ADMISSION_CONTROL', False)
+        self.ADMISSION_CPU_LIMIT = env.int('ADMISSION_CPU_LIMIT', None)
+        self.ADMISSION_MEMORY_LIMIT = env.int('ADMISSION_MEMORY_LIMIT', None)
+        self.ADMISSION_GPU_LIMIT = env.int('ADMISSION_GPU_LIMIT', None)
+        self.ADMISSION_RETRY_AFTER = env.int('ADMISSION_RETRY_AFTER', 30)
+
+        self.FAIR_SHARE = env.bool('FAIR_SHARE', False)
+        self.FAIR_SHARE_WEIGHTS = env.dict('FAIR_SHARE_WEIGHTS', {}, subcast_values=float)
+        self.FAIR_SHARE_MAX_JOBS_PER_USER = env.int('FAIR_SHARE_MAX_JOBS_PER_USER', None)
+        if self.FAIR_SHARE and not (self.DISPATCH_QUEUE and self.ADMISSION_CONTROL):
+            raise ValueError('FAIR_SHARE requires DISPATCH_QUEUE=yes and ADMISSION_CONTROL=yes')
+
+        self.METRICS = env.bool('METRICS', True)
+        self.METRICS_JOBS_MAX_AGE = env.int('METRICS_JOBS_MAX_AGE', 15)
+
+        self.TRACING = env.bool('TRACING', False)
+        self.TRACING_EXPORTER = env('TRACING_EXPORTER', 'log')
+        self.TRACING_FILE = env('TRACING_FILE', '/tmp/pman-spans.jsonl')
+        self.TRACING_OTLP_ENDPOINT = env('TRACING_OTLP_ENDPOINT', 'http://localhost:4318')
+        self.TRACING_SERVICE_NAME = env('TRACING_SERVICE_NAME', 'pman')
+
+        self.PMAN_PROFILE = env.bool('PMAN_PROFILE', False)
+        self.PROFILE_DIR = env('PROFILE_DIR', '/tmp/pman-profiles')
+        self.PROFILE_SAMPLE_RATE = env.float('PROFILE_SAMPLE_RATE', 0.0)
+        self.PROFILE_MAX_FILES = env.int('PROFILE_MAX_FILES', 100)
+
+        self.ASYNC_MAX_THREADS = env.int('ASYNC_MAX_THREADS', 32)
+        self.ASYNC_BACKEND_CLIENTS = env.bool('ASYNC_BACKEND_CLIENTS', True)
+        self.ASYNC_LONG_POLL_MAX_WAITERS = env.int('ASYNC_LONG_POLL_MAX_WAITERS', 1000)
+
         if self.STORAGE_TYPE == 'host':
             self.STOREBASE = env('STOREBASE')
 
         if self.STORAGE_TYPE == 'docker_local_volume':
+            from pman._helpers import get_storebase_from_docker
             pfcon_selector = env('PFCON_SELECTOR', 'org.chrisproject.role=pfcon')
             self.STOREBASE = get_storebase_from_docker(pfcon_selector, self.VOLUME_NAME)
 
@@ -53,6 +121,11 @@ class Config:
             if not self.VOLUME_NAME:
                 raise ValueError('VOLUME_NAME must be given because STORAGE_TYPE=kubernetes_pvc')
 
+        # the output directories of jobs are only accessible to pman with STORAGE_TYPE=host
+        if self.LOG_ARCHIVE and self.STORAGE_TYPE != 'host' and not self.LOG_ARCHIVE_DIR:
+            raise ValueError('LOG_ARCHIVE_DIR must be given because LOG_ARCHIVE=yes '
+                             f'and STORAGE_TYPE={self.STORAGE_TYPE}')
+
         if self.CONTAINER_ENV == 'swarm':
             docker_host = env('DOCKER_HOST', '')
             if docker_host:
@@ -69,16 +142,30 @@ class Config:
             self.NODE_SELECTOR = env.dict('NODE_SELECTOR', {})
             image_pull_secrets = env('IMAGE_PULL_SECRETS', '')
             self.IMAGE_PULL_SECRETS = None if not image_pull_secrets else image_pull_secrets.split(',')
+            self.KUBERNETES_INFORMER = env.bool('KUBERNETES_INFORMER', False)
+            self.INFORMER_RESYNC_SECONDS = env.int('INFORMER_RESYNC_SECONDS', 300)
 
         if self.CONTAINER_ENV == 'cromwell':
             self.CROMWELL_URL = env('CROMWELL_URL')
             self.TIMELIMIT_MINUTES = env.int('TIMELIMIT_MINUTES')
 
+        if self.CONTAINER_ENV == 'simulated':
+            self.SIM_QUEUE_DELAY = env.float('SIM_QUEUE_DELAY', 2.0)
+            self.SIM_RUN_TIME = env.float('SIM_RUN_TIME', 30.0)
+            self.SIM_RUN_TIME_SIGMA = env.float('SIM_RUN_TIME_SIGMA', 0.5)
+            self.SIM_FAILURE_RATE = env.float('SIM_FAILURE_RATE', 0.05)
+            self.SIM_OOM_RATE = env.float('SIM_OOM_RATE', 0.01)
+            self.SIM_LOG_BYTES_PER_SECOND = env.float('SIM_LOG_BYTES_PER_SECOND', 200.0)
+            self.SIM_API_LATENCY = env.float('SIM_API_LATENCY', 0.0)
+            self.SIM_CPU_LIMIT = env.int('SIM_CPU_LIMIT', None)
+            self.SIM_MEMORY_LIMIT = env.int('SIM_MEMORY_LIMIT', None)
+            self.SIM_GPU_LIMIT = env.int('SIM_GPU_LIMIT', None)
+            self.SIM_SEED = env.int('SIM_SEED', None)
+
         if self.CONTAINER_ENV == 'docker':
-            # nothing needs to be done!
             # In the above config code for swarm, docker env variables are intercepted pointlessly.
             # To configure Docker Engine/Podman, use the standard env variables for the Docker client.
-            pass
+            self.DOCKER_EVENTS_CACHE = env.bool('DOCKER_EVENTS_CACHE', False)
 
         self.env = env
 
@@ -0,0 +1,260 @@
+"""
+``pman controller`` runs the background work of pman in a process of its own,
+instead of in every worker process of the server::
+
+    CONTROLLER=yes pman controller
+
+With ``CONTROLLER=yes``, the worker processes do not start background threads,
+and coordinate with the controller through the state kept in ``STATE_DB``:
+
+- jobs queued by the workers (``DISPATCH_QUEUE``) are submitted by the controller
+- the status cache read by the workers (``STATUS_CACHE``) is refreshed by the controller
+- the reservations of admission control (``ADMISSION_CONTROL``) are reconciled
+  with the backend by the controller
+- the logs of finished jobs are archived (``LOG_ARCHIVE``) by the controller
+
+The controller works only while it holds a lease (``CONTROLLER_LEASE``), so
+that several controllers can run, while only one does the work and the others
+wait to take over. The lease is a lock file next to ``STATE_DB`` for processes
+on the same host, or a Kubernetes Lease object. Since every replica of pman
+has its own ``STATE_DB`` unless it is on shared storage, the Lease object is
+named after the replica, unless ``CONTROLLER_LEASE_NAME`` is set to elect one
+controller among the replicas which share their ``STATE_DB``.
+
+If the controller loses its lease, or fails to renew it until it expires, it
+stops and exits with status 1.
+
+The controller writes a heartbeat to ``STATE_DB``, which is shown by ``GET /api/v1/``.
+"""
+import argparse
+import json
+import logging
+import signal
+import sys
+import threading
+import time
+from typing import Callable, List, Optional, Protocol, Tuple
+
+from .statedb import StateDB
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS controller_heartbeat (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    identity TEXT NOT NULL,
+    tasks TEXT NOT NULL,
+    beat REAL NOT NULL
+);
+"""
+
+
+class Task(Protocol):
+    def start(self): ...
+
+    def stop(self): ...
+
+
+class Lease(Protocol):
+    @property
+    def held(self) -> bool: ...
+
+    def try_acquire(self) -> bool: ...
+
+    def release(self): ...
+
+
+class Loop:
+    """
+    A task which calls a function every ``interval`` seconds, in a thread.
+    """
+
+    def __init__(self, name: str, interval: float, func: Callable[[], object]):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.__stopped = threading.Event()
+        self.__thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__stopped.set()
+
+    def run(self):
+        while not self.__stopped.is_set():
+            try:
+                self.func()
+            except Exception as e:
+                logger.exception(f'Error in {self.name}: {str(e)}')
+            self.__stopped.wait(self.interval)
+
+
+class ControllerHeartbeat:
+    """
+    The last sign of life of the controller, in the ``STATE_DB`` SQLite database.
+
+    :param path: path of the SQLite database file
+    :param clock: function which returns the current time, for tests
+    """
+
+    def __init__(self, path: str, clock: Callable[[], float] = time.time):
+        self.__db = StateDB(path, _SCHEMA)
+        self.__clock = clock
+
+    def beat(self, identity: str, tasks: List[str]):
+        self.__db.connect().execute(
+            'INSERT OR REPLACE INTO controller_heartbeat (id, identity, tasks, beat) '
+            'VALUES (1, ?, ?, ?)', (identity, json.dumps(tasks), self.__clock())
+        )
+
+    def status(self) -> Optional[dict]:
+        """
+        The identity and tasks of the controller, and the seconds since its heartbeat,
+        or ``None`` if no controller ever ran.
+        """
+        row = self.__db.connect().execute('SELECT * FROM controller_heartbeat').fetchone()
+        if row is None:
+            return None
+        return {
+            'identity': row['identity'],
+            'tasks': json.loads(row['tasks']),
+            'seconds_since_heartbeat': round(self.__clock() - row['beat'], 3),
+        }
+
+
+class Controller:
+    """
+    Runs tasks while it holds a lease.
+
+    :param lease: the lease which elects the controller
+    :param tasks: the tasks, by name, started once the lease is taken
+    :param heartbeat: where to write the heartbeat
+    :param identity: identity of this controller, shown in the heartbeat
+    :param renew_interval: seconds between renewals of the lease, and attempts to take it
+    :param lease_seconds: seconds after its last renewal until which the lease is
+                          considered held, when it cannot be renewed because of errors
+    """
+
+    def __init__(self, lease: Lease, tasks: List[Tuple[str, Task]],
+                 heartbeat: ControllerHeartbeat, identity: str, renew_interval: float = 2.0,
+                 lease_seconds: float = 15.0):
+        self.lease = lease
+        self.tasks = tasks
+        self.heartbeat = heartbeat
+        self.identity = identity
+        self.renew_interval = renew_interval
+        self.lease_seconds = lease_seconds
+        self.leading = False
+        self.__stopped = threading.Event()
+
+    def stop(self):
+        self.__stopped.set()
+
+    def run(self) -> int:
+        """
+        Take the lease, run the tasks, and renew the lease until :meth:`stop` is called.
+
+        :return: exit status, 1 if the lease was lost
+        """
+        renewed = 0.0
+        try:
+            while not self.__stopped.is_set():
+                attempted = time.monotonic()
+                try:
+                    held = self.lease.try_acquire()
+                    if held:
+                        renewed = attempted
+                except Exception as e:
+                    logger.exception(f'Error renewing the lease: {str(e)}')
+                    # until it expires, the lease cannot be taken by another controller
+                    held = self.leading and time.monotonic() - renewed < self.lease_seconds
+                if held and not self.leading:
+                    logger.info(f'Took the lease, running: {", ".join(self.task_names)}')
+                    self.leading = True
+                    for _, task in self.tasks:
+                        task.start()
+                elif not held and self.leading:
+                    logger.error('Lost the lease, stopping')
+                    return 1
+                if held:
+                    self.heartbeat.beat(self.identity, self.task_names)
+                self.__stopped.wait(self.renew_interval)
+            return 0
+        finally:
+            if self.leading:
+                for _, task in self.tasks:
+                    task.stop()
+            self.lease.release()
+
+    @property
+    def task_names(self) -> List[str]:
+        return [name for name, _ in self.tasks]
+
+
+def create_lease(config: dict) -> Lease:
+    from .leases import FileLease, KubernetesLease, default_identity, replica_lease_name
+
+    kind = config.get('CONTROLLER_LEASE', 'file')
+    if kind == 'file':
+        return FileLease(config.get('CONTROLLER_LEASE_FILE')
+                         or f'{config["STATE_DB"]}.controller.lock')
+    if kind == 'kubernetes':
+        return KubernetesLease(config.get('CONTROLLER_LEASE_NAME') or replica_lease_name(),
+                               config.get('CONTROLLER_LEASE_NAMESPACE')
+                               or config.get('JOB_NAMESPACE', 'default'),
+                               identity=default_identity(),
+                               duration=config.get('CONTROLLER_LEASE_SECONDS', 15))
+    raise ValueError(f'Unknown CONTROLLER_LEASE: {kind}')
+
+
+def create_controller(config: dict, compute_mgr=None, lease: Optional[Lease] = None) -> Controller:
+    """
+    Create the controller of the background work enabled by the configuration.
+
+    :param compute_mgr: use this compute manager instead of creating one from ``CONTAINER_ENV``
+    :param lease: use this lease instead of creating one from ``CONTROLLER_LEASE``
+    """
+    from .app import create_extensions
+    from .leases import default_identity
+    from .resources import get_compute_mgr
+
+    if compute_mgr is None:
+        compute_mgr = get_compute_mgr(config.get('CONTAINER_ENV'), config)
+    extensions = create_extensions(config, compute_mgr, background=False)
+    tasks: List[Tuple[str, Task]] = []
+    if 'dispatcher' in extensions:
+        tasks.append(('dispatch', extensions['dispatcher']))
+    if 'status_refresher' in extensions:
+        refresher = extensions['status_refresher']
+        tasks.append(('status-cache', Loop('status-cache', refresher.interval, refresher.refresh)))
+    if 'log_archiver' in extensions:
+        archiver = extensions['log_archiver']
+        tasks.append(('log-archive',
+                      Loop('log-archive', archiver.interval, archiver.archive_finished)))
+    if 'admission' in extensions:
+        admission = extensions['admission']
+        tasks.append(('admission-reconcile',
+                      Loop('admission-reconcile', config.get('CONTROLLER_RECONCILE_SECONDS', 30),
+                           admission.reconcile)))
+    return Controller(lease or create_lease(config), tasks, ControllerHeartbeat(config['STATE_DB']),
+                      default_identity(), config.get('CONTROLLER_RENEW_SECONDS', 2.0),
+                      config.get('CONTROLLER_LEASE_SECONDS', 15))
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog='pman controller',
+                                     description='Run the background work of pman')
+    parser.parse_args(argv)
+
+    from .app import load_config
+    config = load_config({'CONTROLLER': True})
+    controller = create_controller(config)
+    if not controller.tasks:
+        logger.warning('Nothing to do: none of DISPATCH_QUEUE, STATUS_CACHE, LOG_ARCHIVE '
+                       'and ADMISSION_CONTROL is enabled')
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: controller.stop())
+    sys.exit(controller.run())
@@ -1,7 +1,7 @@
 import io
 import json
 from dataclasses import dataclass
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 from .models import (
     WorkflowId, StrWdl,
     WorkflowIdAndStatus, WorkflowQueryResponse, WorkflowMetadataResponse
@@ -48,10 +48,27 @@ class CromwellClient:
         res.raise_for_status()
         return from_json(WorkflowIdAndStatus, res.text)
 
-    def query(self, label: Optional[Dict[str, str]] = None) -> WorkflowQueryResponse:
+    def query(self, label: Optional[Dict[str, str]] = None,
+              labelor: Optional[List[str]] = None,
+              additional_fields: Optional[List[str]] = None,
+              status: Optional[List[str]] = None) -> WorkflowQueryResponse:
+        """
+        https://cromwell.readthedocs.io/en/stable/api/RESTAPI/#get-workflows-matching-some-criteria
+
+        :param label: workflows must have all of these labels
+        :param labelor: workflows must have any of these labels, each in the form ``key:value``
+        :param additional_fields: e.g. ``['labels']``
+        :param status: workflows must have any of these statuses
+        """
         query_dict = {}
         if label:
             query_dict['label'] = label
+        if labelor:
+            query_dict['labelor'] = labelor
+        if additional_fields:
+            query_dict['additionalQueryResultFields'] = additional_fields
+        if status:
+            query_dict['status'] = status
         res = CromwellAPI.query(query_dict=query_dict,
                                 auth=self.auth, raise_for_status=True)
         return from_json(WorkflowQueryResponse, res.text)
@@ -59,6 +59,8 @@ class WorkflowQueryResult:
     start: Optional[TimeStamp]
     status: WorkflowStatus
     submission: Optional[TimeStamp]
+    # only present if requested using additionalQueryResultFields
+    labels: Optional[Dict[str, str]]
 
 
 @deserialize
@@ -9,7 +9,7 @@ TODO: get_job_logs and remove_job
 import json
 import logging
 import time
-from typing import Optional, List
+from typing import Optional, List, Collection, Dict
 from .abstractmgr import (AbstractManager, ManagerException, JobStatus, JobInfo, Image,
                           JobName, TimeStamp, ResourcesDict, MountsDict)
 from .cromwell.models import (
@@ -31,6 +31,9 @@ STATUS_MAP = {
     WorkflowStatus.Failed: JobStatus.finishedWithError
 }
 
+ACTIVE_STATUSES = (WorkflowStatus.OnHold, WorkflowStatus.Submitted,
+                   WorkflowStatus.Running, WorkflowStatus.Aborting)
+
 logger = logging.getLogger(__name__)
 
 
@@ -141,13 +144,19 @@ class CromwellManager(AbstractManager[WorkflowId]):
         """
         Get job info from Cromwell metadata if available.
         """
-        res = self.__client.metadata(uuid)
+        return self.info_from_metadata(self.__client.metadata(uuid))
+
+    @classmethod
+    def info_from_metadata(cls, res: Optional[WorkflowMetadataResponse]) -> Optional[JobInfo]:
+        """
+        Get job info from the metadata of a workflow, if Cromwell has processed it enough.
+        """
         if res is None:
             return None
-        if self.__is_complete_call(res):
-            return self.__info_from_complete_call(res)
+        if cls.__is_complete_call(res):
+            return cls.__info_from_complete_call(res)
         if res.submittedFiles is not None:
-            return self.__info_from_early_submission(res)
+            return cls.__info_from_early_submission(res)
         return None
 
     @staticmethod
@@ -202,6 +211,51 @@ class CromwellManager(AbstractManager[WorkflowId]):
             status=JobStatus.notstarted
         )
 
+    def get_jobs_info(self, names: Collection[JobName]) -> Dict[JobName, JobInfo]:
+        """
+        Find many jobs using a single query, then get each job's info from its metadata.
+
+        Cromwell's query response does not include the image nor command of workflows,
+        so a metadata request per job is still needed.
+        """
+        if not names:
+            return {}
+        res = self.__client.query(
+            labelor=[f'{self.PMAN_CROMWELL_LABEL}:{name}' for name in names],
+            additional_fields=['labels']
+        )
+        workflows = {}
+        for result in res.results:
+            name = (result.labels or {}).get(self.PMAN_CROMWELL_LABEL)
+            # results are most recent first, same as in __query_by_name
+            if name is not None and name not in workflows:
+                workflows[name] = result.id
+        infos = {}
+        for name in names:
+            if name not in workflows:
+                continue
+            info = self._check_job_info(workflows[name])
+            if info is not None:
+                infos[name] = info
+        return infos
+
+    def list_job_statuses(self) -> Dict[JobName, JobStatus]:
+        """
+        List the workflows which are not finished using a single query.
+
+        Finished workflows are left out, otherwise the result would grow forever.
+        """
+        res = self.__client.query(
+            status=[s.value for s in ACTIVE_STATUSES],
+            additional_fields=['labels']
+        )
+        statuses = {}
+        for result in res.results:
+            name = (result.labels or {}).get(self.PMAN_CROMWELL_LABEL)
+            if name is not None and name not in statuses:
+                statuses[JobName(name)] = STATUS_MAP[result.status]
+        return statuses
+
     def __query_by_name(self, name: JobName) -> Optional[WorkflowQueryResult]:
         """
         Get a single job by name.
@@ -0,0 +1,355 @@
+"""
+Asynchronous job submission: jobs are recorded in a durable local queue
+(an SQLite database) and submitted to the compute backend by a pool of
+background threads, so that ``POST /api/v1/`` does not wait for the backend.
+
+The queue may be shared by every worker process of the server. Jobs are
+claimed atomically, and a claim expires after ``lease_seconds`` so that jobs
+claimed by a process which died are dispatched again.
+
+Jobs which could not be submitted are kept, so that their error is reported,
+until they are submitted again or ``failed_retention`` seconds after they were
+queued.
+"""
+import json
+import logging
+import os
+import shlex
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from .abstractmgr import (AbstractManager, ManagerException, JobInfo, JobName, JobStatus,
+                          Image, TimeStamp)
+from .fairshare import FairShare
+from .statedb import StateDB
+
+if TYPE_CHECKING:
+    from .admission import AdmissionController
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dispatch_queue (
+    jid TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    request TEXT NOT NULL,
+    created REAL NOT NULL,
+    claimed_by TEXT,
+    claimed_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    auid TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS dispatch_queue_state ON dispatch_queue (state, created);
+"""
+
+QUEUED = 'queued'
+DISPATCHING = 'dispatching'
+FAILED = 'failed'
+
+
+@dataclass(frozen=True)
+class QueuedJob:
+    jid: JobName
+    state: str
+    request: dict
+    """Keyword arguments for :meth:`AbstractManager.schedule_job`."""
+    attempts: int
+    error: Optional[str]
+    auid: str = ''
+
+    def to_job_info(self) -> JobInfo:
+        """
+        The status of a job which was not submitted to the backend yet.
+        """
+        if self.state == FAILED:
+            status, message = JobStatus.finishedWithError, self.error
+        else:
+            status, message = JobStatus.notstarted, self.state
+        return JobInfo(name=self.jid, image=Image(self.request['image']),
+                       cmd=shlex.join(self.request['command']), timestamp=TimeStamp(''),
+                       message=message, status=status)
+
+
+class DispatchQueue:
+    """
+    Jobs waiting to be submitted to the compute backend.
+
+    :param path: path of the SQLite database file
+    :param lease_seconds: how long a job may stay claimed before it is dispatched again
+    :param failed_retention: seconds after which jobs which failed to be submitted are
+                             forgotten, counted from when they were queued, 0 to keep them
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 600, failed_retention: float = 0.0):
+        self.__db = StateDB(path, _SCHEMA)
+        self.__db.add_column('dispatch_queue', 'auid', "TEXT NOT NULL DEFAULT ''")
+        self.__lease_seconds = lease_seconds
+        self.__failed_retention = failed_retention
+        self.__owner = f'{os.getpid()}'
+
+    def __connect(self) -> sqlite3.Connection:
+        return self.__db.connect()
+
+    def enqueue(self, jid: JobName, request: dict, auid: str = '') -> QueuedJob:
+        """
+        Queue a job. A job with the same name which failed to be submitted is replaced.
+
+        :param auid: the user who submitted the job
+        :raises ManagerException: (409) if a job with the same name is already queued
+        """
+        cur = self.__connect().execute(
+            'INSERT INTO dispatch_queue (jid, state, request, created, auid) '
+            'VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT (jid) DO UPDATE SET state = excluded.state, request = excluded.request, '
+            'created = excluded.created, auid = excluded.auid, claimed_by = NULL, '
+            'claimed_at = NULL, attempts = 0, error = NULL WHERE state = ?',
+            (jid, QUEUED, json.dumps(request), time.time(), auid, FAILED)
+        )
+        if cur.rowcount == 0:
+            raise ManagerException(f'job "{jid}" already exists', status_code=409)
+        return QueuedJob(jid=jid, state=QUEUED, request=request, attempts=0, error=None,
+                         auid=auid)
+
+    def get(self, jid: JobName) -> Optional[QueuedJob]:
+        row = self.__connect().execute(
+            'SELECT * FROM dispatch_queue WHERE jid = ?', (jid,)
+        ).fetchone()
+        return None if row is None else _to_queued_job(row)
+
+    def get_many(self, jids: List[JobName]) -> Dict[JobName, QueuedJob]:
+        rows = self.__db.select_in('SELECT * FROM dispatch_queue WHERE jid IN ({})', jids)
+        return {row['jid']: _to_queued_job(row) for row in rows}
+
+    def claim(self, auid: Optional[str] = None) -> Optional[QueuedJob]:
+        """
+        Take the oldest job which is waiting to be dispatched, if any.
+
+        :param auid: only take a job of this user
+        """
+        now = time.time()
+        row = self.__connect().execute(
+            f"""
+            UPDATE dispatch_queue
+            SET state = ?, claimed_by = ?, claimed_at = ?, attempts = attempts + 1
+            WHERE jid = (
+                SELECT jid FROM dispatch_queue
+                WHERE (state = ? OR (state = ? AND claimed_at < ?))
+                {'' if auid is None else 'AND auid = ?'}
+                ORDER BY created LIMIT 1
+            )
+            RETURNING *
+            """,
+            (DISPATCHING, self.__owner, now, QUEUED, DISPATCHING, now - self.__lease_seconds,
+             *(() if auid is None else (auid,)))
+        ).fetchone()
+        return None if row is None else _to_queued_job(row)
+
+    def waiting(self) -> Dict[str, Tuple[int, float]]:
+        """
+        Get the users with jobs waiting to be dispatched.
+
+        :return: the number of waiting jobs of every user, and when their oldest job was queued
+        """
+        rows = self.__connect().execute(
+            'SELECT auid, COUNT(*) AS n, MIN(created) AS oldest FROM dispatch_queue '
+            'WHERE state = ? OR (state = ? AND claimed_at < ?) GROUP BY auid',
+            (QUEUED, DISPATCHING, time.time() - self.__lease_seconds)
+        ).fetchall()
+        return {row['auid']: (row['n'], row['oldest']) for row in rows}
+
+    def unclaim(self, jid: JobName):
+        """
+        Put back a claimed job which cannot be dispatched yet, without counting the attempt.
+        """
+        self.__connect().execute(
+            'UPDATE dispatch_queue SET state = ?, claimed_by = NULL, claimed_at = NULL, '
+            'attempts = attempts - 1 WHERE jid = ? AND state = ?', (QUEUED, jid, DISPATCHING)
+        )
+
+    def complete(self, jid: JobName):
+        """
+        Forget a job which was submitted to the backend.
+        """
+        self.__connect().execute('DELETE FROM dispatch_queue WHERE jid = ?', (jid,))
+
+    def fail(self, jid: JobName, error: str):
+        """
+        Keep a job which could not be submitted, so that its error is reported by status requests.
+        """
+        self.__connect().execute(
+            'UPDATE dispatch_queue SET state = ?, error = ? WHERE jid = ?', (FAILED, error, jid)
+        )
+        if self.__failed_retention > 0:
+            self.purge_failed()
+
+    def purge_failed(self) -> int:
+        """
+        Forget the jobs which failed to be submitted and were queued more than
+        ``failed_retention`` seconds ago.
+
+        :return: number of forgotten jobs
+        """
+        cur = self.__connect().execute(
+            'DELETE FROM dispatch_queue WHERE state = ? AND created < ?',
+            (FAILED, time.time() - self.__failed_retention)
+        )
+        return cur.rowcount
+
+    def remove(self, jid: JobName) -> bool:
+        """
+        Remove a job which is not being dispatched.
+
+        :return: ``True`` if the job was removed
+        """
+        cur = self.__connect().execute(
+            'DELETE FROM dispatch_queue WHERE jid = ? AND state != ?', (jid, DISPATCHING)
+        )
+        return cur.rowcount > 0
+
+    def stats(self) -> dict:
+        rows = self.__connect().execute(
+            'SELECT state, COUNT(*) AS n FROM dispatch_queue GROUP BY state'
+        ).fetchall()
+        counts = {QUEUED: 0, DISPATCHING: 0, FAILED: 0}
+        counts.update({row['state']: row['n'] for row in rows})
+        return counts
+
+
+class Dispatcher:
+    """
+    A pool of threads which submit the jobs of a :class:`DispatchQueue` to the compute backend.
+
+    :param queue: the queue of jobs to submit
+    :param compute_mgr: the compute backend
+    :param workers: number of threads
+    :param poll_interval: seconds between checks of the queue when it is empty,
+                          for jobs which were enqueued by other processes
+    :param admission: if given, jobs are dispatched in order once their resources fit
+    :param fair_share: if given, jobs are dispatched by fair share between users instead
+                       of in order. Requires ``admission``, which tracks the resources
+                       used by every user.
+    """
+
+    def __init__(self, queue: DispatchQueue, compute_mgr: AbstractManager,
+                 workers: int = 4, poll_interval: float = 1.0,
+                 admission: Optional['AdmissionController'] = None,
+                 fair_share: Optional[FairShare] = None):
+        if fair_share is not None and admission is None:
+            raise ValueError('fair share scheduling requires admission control')
+        self.queue = queue
+        self.fair_share = fair_share
+        self.__compute_mgr = compute_mgr
+        self.__admission = admission
+        self.__workers = workers
+        self.__poll_interval = poll_interval
+        self.__wakeup = threading.Event()
+        self.__stopped = threading.Event()
+        self.__threads: List[threading.Thread] = []
+
+    def start(self):
+        for i in range(self.__workers):
+            t = threading.Thread(target=self.run, name=f'dispatcher-{i}', daemon=True)
+            t.start()
+            self.__threads.append(t)
+
+    def stop(self):
+        self.__stopped.set()
+        self.__wakeup.set()
+
+    def notify(self):
+        """
+        Wake up the threads after a job was enqueued.
+        """
+        self.__wakeup.set()
+
+    def run(self):
+        while not self.__stopped.is_set():
+            try:
+                dispatched = self.dispatch_one()
+            except Exception as e:
+                logger.exception('Error dispatching jobs: %s', str(e))
+                dispatched = False
+            if not dispatched:
+                self.__wakeup.wait(self.__poll_interval)
+                self.__wakeup.clear()
+
+    def dispatch_one(self) -> bool:
+        """
+        Submit the oldest queued job to the backend.
+
+        :return: ``False`` if there was no job to submit, or if it does not fit yet
+        """
+        job = self.__claim()
+        if job is None:
+            return False
+        if self.__admission is not None:
+            try:
+                admitted = self.__admission.reserve(job.jid, job.request['resources_dict'],
+                                                    job.auid)
+            except ManagerException as e:
+                logger.error(f'Job {job.jid} cannot be admitted, detail: {str(e)}')
+                self.queue.fail(job.jid, str(e))
+                return True
+            if not admitted:
+                # the job keeps its place in the queue, so that large jobs are not starved
+                self.queue.unclaim(job.jid)
+                return False
+        logger.info(f'Dispatching job {job.jid} (attempt {job.attempts})')
+        try:
+            self.__compute_mgr.schedule_job(**job.request)
+        except ManagerException as e:
+            if e.status_code == 409:
+                # submitted by an earlier attempt which did not complete, or by an
+                # earlier request: the status of the existing job is reported
+                logger.warning(f'Job {job.jid} already exists on the backend, '
+                               'it is not submitted again')
+                self.queue.complete(job.jid)
+                return True
+            logger.error(f'Error while dispatching job {job.jid}, detail: {str(e)}')
+            self.queue.fail(job.jid, str(e))
+            if self.__admission is not None:
+                self.__admission.release(job.jid)
+            return True
+        self.queue.complete(job.jid)
+        logger.info(f'Successfully dispatched job {job.jid}')
+        return True
+
+    def __claim(self) -> Optional[QueuedJob]:
+        """
+        Claim the oldest job, or with fair share, the oldest job of the user
+        with the lowest dominant share who is not at their limit of jobs.
+        """
+        if self.fair_share is None:
+            return self.queue.claim()
+        waiting = self.queue.waiting()
+        if not waiting:
+            return None
+        usage = self.__admission.usage_by_user()
+        users = self.fair_share.order({u: oldest for u, (_, oldest) in waiting.items()},
+                                      usage, self.__admission.capacity)
+        if len(users) < len(waiting):
+            # users at their limit may have jobs which finished without anyone seeing it
+            self.__admission.reconcile()
+        for auid in users:
+            job = self.queue.claim(auid)
+            if job is not None:
+                return job
+        return None
+
+    def fair_share_stats(self) -> Dict[str, dict]:
+        """
+        The queued and dispatched jobs of every user, for ``GET /api/v1/``.
+        """
+        waiting = {u: n for u, (n, _) in self.queue.waiting().items()}
+        return self.fair_share.stats(waiting, self.__admission.usage_by_user(),
+                                     self.__admission.capacity)
+
+
+def _to_queued_job(row: sqlite3.Row) -> QueuedJob:
+    return QueuedJob(jid=JobName(row['jid']), state=row['state'],
+                     request=json.loads(row['request']), attempts=row['attempts'],
+                     error=row['error'], auid=row['auid'])
@@ -0,0 +1,208 @@
+"""
+A cache of container inspection data, kept up-to-date by the Docker events stream.
+
+https://docs.docker.com/engine/api/v1.42/#tag/System/operation/SystemEvents
+"""
+import copy
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from docker import DockerClient
+
+logger = logging.getLogger(__name__)
+
+
+class ContainerStateCache:
+    """
+    Remembers the inspection data (``attrs``) of containers by name, and
+    applies the ``State`` changes from Docker events to them.
+
+    Containers are only cached while the events stream is connected. After
+    the stream is (re)connected, all entries are dropped because events may
+    have been missed in the meantime, so they will be inspected again.
+
+    :param client: Docker client
+    :param labels: only follow containers with these labels, i.e. ``JOB_LABELS``
+    """
+
+    def __init__(self, client: DockerClient, labels: Optional[Dict[str, str]] = None):
+        self.__client = client
+        self.__filters = {'type': 'container'}
+        if labels:
+            self.__filters['label'] = [f'{k}={v}' for k, v in labels.items()]
+
+        self.__attrs: Dict[str, dict] = {}
+        self.__last_event_seq: Dict[str, int] = {}
+        self.__seq = 0
+        self.__lock = threading.Lock()
+        self.__connected = threading.Event()
+        self.__stopped = threading.Event()
+        self.__stream = None
+        self.__was_connected = False
+        self.__thread: Optional[threading.Thread] = None
+        self.__listeners: List[Callable[[str], None]] = []
+
+        self.hits = 0
+        self.misses = 0
+        self.events = 0
+        self.reconnects = 0
+        self.__last_event: Optional[float] = None
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.run, name='docker-events', daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__stopped.set()
+        if self.__stream is not None:
+            self.__stream.close()
+
+    def add_listener(self, listener: Callable[[str], None]):
+        """
+        Call ``listener`` with the name of a container after each of its events is handled.
+        """
+        self.__listeners.append(listener)
+
+    def is_connected(self) -> bool:
+        return self.__connected.is_set()
+
+    def wait_for_connection(self, timeout: Optional[float] = None) -> bool:
+        return self.__connected.wait(timeout)
+
+    def run(self):
+        """
+        Follow the events stream until :meth:`stop` is called, reconnecting on errors.
+        """
+        backoff = 1
+        while not self.__stopped.is_set():
+            try:
+                self.__stream = self.__client.events(decode=True, filters=self.__filters)
+                self.__on_connect()
+                for event in self.__stream:
+                    self.handle(event)
+                    backoff = 1
+            except Exception as e:
+                if self.__stopped.is_set():
+                    break
+                logger.error('Docker events stream error: %s', str(e))
+            finally:
+                self.__connected.clear()
+            self.__stopped.wait(backoff)
+            backoff = min(backoff * 2, 60)
+
+    def __on_connect(self):
+        with self.__lock:
+            if self.__was_connected:
+                self.reconnects += 1
+            self.__was_connected = True
+            self.__attrs.clear()
+            self.__last_event_seq.clear()
+        self.__connected.set()
+
+    def get(self, name: str) -> Optional[dict]:
+        """
+        Get the inspection data of a container, or ``None`` if it needs to be inspected.
+        """
+        with self.__lock:
+            attrs = self.__attrs.get(name)
+            if attrs is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return copy.deepcopy(attrs)
+
+    def sequence(self) -> int:
+        """
+        A number which changes whenever an event is handled.
+        Take it before inspecting a container and give it to :meth:`put`.
+        """
+        return self.__seq
+
+    def put(self, attrs: dict, seq: Optional[int] = None):
+        """
+        Cache the inspection data of a container.
+
+        :param attrs: container inspection data
+        :param seq: value of :meth:`sequence` from before the container was inspected.
+                    If an event for the container was handled since then,
+                    the (outdated) data is not cached.
+        """
+        name = attrs['Name'].lstrip('/')
+        with self.__lock:
+            if not self.__connected.is_set():
+                return
+            if seq is not None and self.__last_event_seq.get(name, -1) > seq:
+                return
+            self.__attrs[name] = copy.deepcopy(attrs)
+
+    def remove(self, name: str):
+        with self.__lock:
+            self.__attrs.pop(name, None)
+
+    def handle(self, event: dict):
+        """
+        Apply a container event to the cached state of its container.
+        """
+        action = event.get('Action') or event.get('status')
+        name = event.get('Actor', {}).get('Attributes', {}).get('name')
+        if name is None:
+            return
+        timestamp = _format_time_nano(event.get('timeNano'), event.get('time'))
+        self.__apply(action, name, event, timestamp)
+        for listener in self.__listeners:
+            listener(name)
+
+    def __apply(self, action: str, name: str, event: dict, timestamp: str):
+        with self.__lock:
+            self.__seq += 1
+            self.__last_event_seq[name] = self.__seq
+            self.events += 1
+            self.__last_event = time.monotonic()
+
+            if action == 'destroy':
+                self.__attrs.pop(name, None)
+                self.__last_event_seq.pop(name, None)
+                return
+            attrs = self.__attrs.get(name)
+            if attrs is None:
+                return
+            state = attrs['State']
+            if action == 'start':
+                state.update(Status='running', Running=True, Paused=False, StartedAt=timestamp)
+            elif action == 'die':
+                state.update(Status='exited', Running=False, Paused=False, FinishedAt=timestamp,
+                             ExitCode=int(event['Actor']['Attributes'].get('exitCode', -1)))
+            elif action == 'oom':
+                state['OOMKilled'] = True
+            elif action == 'pause':
+                state.update(Status='paused', Paused=True)
+            elif action == 'unpause':
+                state.update(Status='running', Paused=False)
+
+    def stats(self) -> dict:
+        with self.__lock:
+            count = len(self.__attrs)
+        return {
+            'connected': self.is_connected(),
+            'containers': count,
+            'hits': self.hits,
+            'misses': self.misses,
+            'events': self.events,
+            'reconnects': self.reconnects,
+            'seconds_since_event': (None if self.__last_event is None
+                                    else round(time.monotonic() - self.__last_event, 3)),
+        }
+
+
+def _format_time_nano(time_nano: Optional[int], time_s: Optional[int]) -> str:
+    """
+    Format an event's time like the timestamps of ``State`` in container inspection data.
+    """
+    if time_nano is None:
+        time_nano = (time_s or 0) * 1_000_000_000
+    seconds, nanos = divmod(int(time_nano), 1_000_000_000)
+    dt = datetime.fromtimestamp(seconds, tz=timezone.utc)
+    return dt.strftime('%Y-%m-%dT%H:%M:%S') + f'.{nanos:09d}Z'
@@ -1,12 +1,17 @@
+import re
 import shlex
-from typing import List, Optional, AnyStr
+from typing import List, Optional, AnyStr, Collection, Dict, Iterator, Tuple
 
 from docker import DockerClient
 from docker.types import DeviceRequest
 from docker.models.containers import Container
 
 from pman.abstractmgr import (AbstractManager, Image, JobName, ResourcesDict,
-                              MountsDict, JobInfo, TimeStamp, ManagerException, JobStatus)
+                              MountsDict, JobInfo, TimeStamp, ManagerException, JobStatus,
+                              JobLogs, ResourceCapacity)
+from pman.docker_events import ContainerStateCache
+from pman.logcursor import filter_after, cursor_seconds
+from pman.longpoll import ChangeNotifier
 import docker
 
 
@@ -14,7 +19,8 @@ class DockerManager(AbstractManager[Container]):
     """
     Interface between pman and Docker Engine or Podman API.
     """
-    def __init__(self, config_dict=None, docker_client: DockerClient = None):
+    def __init__(self, config_dict=None, docker_client: DockerClient = None,
+                 state_cache: Optional[ContainerStateCache] = None):
         super().__init__(config_dict)
 
         # these should be part of the AbstractManager.schedule_job signature,
@@ -27,6 +33,17 @@ class DockerManager(AbstractManager[Container]):
         else:
             self.__docker = docker.from_env()
 
+        # when the cache is enabled, containers are inspected only once,
+        # then their state is updated by Docker events.
+        self.state_cache = state_cache
+        if self.state_cache is None and config_dict.get('DOCKER_EVENTS_CACHE'):
+            self.state_cache = ContainerStateCache(self.__docker, self.job_labels)
+            self.state_cache.start()
+        if self.state_cache is not None:
+            self.change_notifier = ChangeNotifier()
+            self.state_cache.add_listener(self.change_notifier.notify)
+        self.inspected = InspectedInfos()
+
     def schedule_job(self, image: Image, command: List[str], name: JobName,
                      resources_dict: ResourcesDict, env: List[str], uid: Optional[int],
                      gid: Optional[int], mounts_dict: MountsDict) -> Container:
@@ -67,7 +84,7 @@ class DockerManager(AbstractManager[Container]):
         if (s := self.config.get('SHM_SIZE')) is not None:
             shm_size['shm_size'] = s.as_mb()
 
-        return self.__docker.containers.run(
+        container = self.__docker.containers.run(
             image=image,
             command=command,
             name=name,
@@ -80,16 +97,51 @@ class DockerManager(AbstractManager[Container]):
             **shm_size,
             **volumes
         )
+        if self.state_cache is not None:
+            self.state_cache.put(container.attrs)
+        return container
 
     def get_job(self, name: JobName) -> Container:
+        if self.state_cache is not None:
+            attrs = self.state_cache.get(name)
+            if attrs is not None:
+                return self.container_from_attrs(attrs)
+            seq = self.state_cache.sequence()
         try:
-            return self.__docker.containers.get(name)
+            container = self.__docker.containers.get(name)
         except docker.errors.NotFound as e:
             raise ManagerException(str(e), status_code=404)
+        if self.state_cache is not None:
+            self.state_cache.put(container.attrs, seq)
+        return container
+
+    def container_from_attrs(self, attrs: dict) -> Container:
+        """
+        Create a container object from its inspection data, e.g. from the cache
+        or from an asynchronous client.
+        """
+        return self.__docker.containers.prepare_model(attrs)
 
     def get_job_logs(self, job: Container, tail: int) -> AnyStr:
         return job.logs(stdout=True, stderr=True, tail=tail)
 
+    def get_job_logs_since(self, job: Container, cursor: Optional[str], tail: int) -> JobLogs:
+        if cursor is None:
+            logs = job.logs(stdout=True, stderr=True, timestamps=True, tail=tail)
+        else:
+            logs = job.logs(stdout=True, stderr=True, timestamps=True, tail='all',
+                            since=cursor_seconds(cursor))
+        return JobLogs(*filter_after([logs], cursor))
+
+    def stream_job_logs(self, job: Container, tail: Optional[int] = None,
+                        follow: bool = False) -> Iterator[bytes]:
+        stream = job.logs(stdout=True, stderr=True, stream=True, follow=follow,
+                          tail='all' if tail is None else tail)
+        try:
+            yield from stream
+        finally:
+            stream.close()
+
     def get_job_info(self, job: Container) -> JobInfo:
         return JobInfo(
             name=JobName(job.name),
@@ -102,6 +154,119 @@ class DockerManager(AbstractManager[Container]):
 
     def remove_job(self, job: Container):
         job.remove(force=True)
+        if self.state_cache is not None:
+            self.state_cache.remove(job.name)
+
+    def get_stats(self) -> dict:
+        if self.state_cache is None:
+            return {}
+        return {'events_cache': self.state_cache.stats()}
+
+    def get_jobs_info(self, names: Collection[JobName]) -> Dict[JobName, JobInfo]:
+        """
+        Get the info of many jobs using a single (sparse) container list request.
+
+        The container list does not include the command, the times of start
+        and completion nor the exit code, so a container is inspected (or read
+        from the events cache) when its state changes, see :class:`InspectedInfos`.
+        """
+        wanted = set(names)
+        filters = _list_filters(self.job_labels, wanted)
+        containers = self.__docker.containers.list(all=True, filters=filters, sparse=True)
+
+        infos = {}
+        for c in containers:
+            name = JobName(c.attrs['Names'][0].lstrip('/'))
+            if name not in wanted:
+                continue
+            info = self.inspected.get(c.id, c.attrs['State'])
+            if info is None:
+                attrs = self.cached_attrs(name, c.attrs['State'])
+                if attrs is not None:
+                    c = self.container_from_attrs(attrs)
+                else:
+                    try:
+                        c.reload()
+                    except docker.errors.NotFound:
+                        continue
+                info = self.inspected.put(c.id, c.attrs['State']['Status'], self.get_job_info(c))
+            infos[name] = info
+        self.inspected.forget_removed({c.id for c in containers},
+                                      None if self.job_labels else wanted)
+        return infos
+
+    def cached_attrs(self, name: JobName, state: str) -> Optional[dict]:
+        """
+        The inspection data of a container from the events cache, if it is in the given state.
+        """
+        if self.state_cache is None:
+            return None
+        attrs = self.state_cache.get(name)
+        if attrs is None or attrs['State']['Status'] != state:
+            return None
+        return attrs
+
+    def list_job_statuses(self) -> Dict[JobName, JobStatus]:
+        """
+        List the containers with the ``JOB_LABELS`` using a single (sparse) container list request.
+        """
+        filters = {}
+        if self.job_labels:
+            filters['label'] = [f'{k}={v}' for k, v in self.job_labels.items()]
+        containers = self.__docker.containers.list(all=True, filters=filters, sparse=True)
+        return {
+            JobName(c.attrs['Names'][0].lstrip('/')): _get_status_from_summary(c.attrs)
+            for c in containers
+        }
+
+    def get_capacity(self) -> ResourceCapacity:
+        """
+        The CPUs and memory of the Docker host. GPUs are not reported by Docker.
+        """
+        info = self.__docker.info()
+        return {'cpu_limit': info['NCPU'] * 1000, 'memory_limit': info['MemTotal'] // 2 ** 20}
+
+
+class InspectedInfos:
+    """
+    The info of the containers inspected by :meth:`DockerManager.get_jobs_info`,
+    which is reused while the container list shows the same state, so that
+    every container is inspected once per change of state.
+    """
+
+    def __init__(self):
+        self.__infos: Dict[str, Tuple[str, JobInfo]] = {}
+
+    def get(self, container_id: str, state: str) -> Optional[JobInfo]:
+        entry = self.__infos.get(container_id)
+        if entry is None or entry[0] != state:
+            return None
+        return entry[1]
+
+    def put(self, container_id: str, state: str, info: JobInfo) -> JobInfo:
+        self.__infos[container_id] = (state, info)
+        return info
+
+    def forget_removed(self, listed: Collection[str], names: Optional[Collection[JobName]]):
+        """
+        Forget the containers which were removed.
+
+        :param listed: IDs of the listed containers
+        :param names: names of the containers which were listed, or ``None`` if all were
+        """
+        for container_id, (_, info) in list(self.__infos.items()):
+            if container_id not in listed and (names is None or info.name in names):
+                self.__infos.pop(container_id, None)
+
+    def __len__(self):
+        return len(self.__infos)
+
+
+def _list_filters(job_labels: Optional[Dict[str, str]], names: Collection[JobName]) -> dict:
+    if job_labels:
+        return {'label': [f'{k}={v}' for k, v in job_labels.items()]}
+    # the name filter is a regular expression
+    return {'name': [f'^/?{re.escape(name)}$' for name in names]}
 
 
 def _get_timestamp_from(c: Container) -> TimeStamp:
@@ -111,6 +276,26 @@ def _get_timestamp_from(c: Container) -> TimeStamp:
     return state['StartedAt']
 
 
+_EXIT_CODE_RE = re.compile(r'^Exited \((\d+)\)')
+
+
+def _get_status_from_summary(summary: dict) -> JobStatus:
+    # see https://docs.docker.com/engine/api/v1.42/#tag/Container/operation/ContainerList
+    state = summary['State']
+    if state in ('running', 'paused', 'restarting'):
+        return JobStatus.started
+    if state == 'created':
+        return JobStatus.notstarted
+    if state == 'dead':
+        return JobStatus.finishedWithError
+    if state == 'exited':
+        # the exit code is only found in the human-readable status, e.g. "Exited (0) 2 minutes ago"
+        m = _EXIT_CODE_RE.match(summary.get('Status', ''))
+        if m is not None:
+            return JobStatus.finishedSuccessfully if m.group(1) == '0' else JobStatus.finishedWithError
+    return JobStatus.undefined
+
+
 def _get_status_from(c: Container) -> JobStatus:
     # see https://docs.docker.com/engine/api/v1.42/#tag/Container/operation/ContainerInspect
     state = c.attrs['State']
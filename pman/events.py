@@ -0,0 +1,284 @@
+"""
+A feed of job status transitions, for ``GET /api/v1/events``.
+
+A :class:`ChangeDetector` finds the jobs whose status changed, either by
+listening to the backend's :class:`pman.longpoll.ChangeNotifier` (Docker
+events, Kubernetes watch) or by polling :meth:`AbstractManager.list_job_statuses`
+(Swarm tasks, Cromwell queries). Transitions are kept in the bounded
+:class:`EventLog` in the ``STATE_DB``, from which clients can resume using
+``Last-Event-ID`` whichever worker process serves them.
+
+Changes are detected by a single process: the holder of a
+:class:`pman.leases.FileLease` next to the ``STATE_DB``. The other processes
+only read the event log, and take over if the holder exits.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from .abstractmgr import AbstractManager, ManagerException, JobInfo, JobName, JobStatus
+from .leases import FileLease
+from .statedb import StateDB
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS job_event (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_event_epoch (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    epoch TEXT NOT NULL
+);
+"""
+
+
+@dataclass(frozen=True)
+class Event:
+    id: str
+    data: dict
+
+
+class EventLog:
+    """
+    The last ``size`` events, in the ``STATE_DB`` SQLite database which is
+    shared by every worker process.
+
+    Event IDs are ``<epoch>-<sequence number>``, where the epoch is unique to
+    the database, so that a client can resume from any worker process, and IDs
+    from another database (or from before it was deleted) are recognized as such.
+
+    :param path: path of the database file
+    :param size: number of events which are kept
+    :param poll_interval: seconds between reads of the database while waiting
+                          for events published by another process
+    """
+
+    def __init__(self, path: str, size: int = 1000, poll_interval: float = 0.5):
+        self.__db = StateDB(path, _SCHEMA)
+        self.__db.connect().execute('INSERT OR IGNORE INTO job_event_epoch (id, epoch) VALUES (1, ?)',
+                                    (uuid.uuid4().hex[:8],))
+        self.epoch = self.__db.connect().execute(
+            'SELECT epoch FROM job_event_epoch WHERE id = 1').fetchone()['epoch']
+        self.size = size
+        self.poll_interval = poll_interval
+        self.__cond = threading.Condition()
+
+    def publish(self, data: dict) -> Event:
+        conn = self.__db.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            seq = conn.execute('INSERT INTO job_event (data) VALUES (?)', (json.dumps(data),)).lastrowid
+            conn.execute('DELETE FROM job_event WHERE seq <= ?', (seq - self.size,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        with self.__cond:
+            self.__cond.notify_all()
+        return Event(id=f'{self.epoch}-{seq}', data=data)
+
+    def last_id(self) -> str:
+        return f'{self.epoch}-{self.__last_seq()}'
+
+    def since(self, last_id: Optional[str]) -> Tuple[List[Event], bool]:
+        """
+        Get the events after ``last_id``.
+
+        :return: the events, and ``False`` if events were missed because
+                 ``last_id`` is unknown or too old for the buffer
+        """
+        seq = self.__parse(last_id)
+        conn = self.__db.connect()
+        # a consistent view of the events and of the sequence
+        conn.execute('BEGIN')
+        try:
+            last = self.__last_seq()
+            if seq is None or seq > last:
+                return [], False
+            rows = conn.execute('SELECT seq, data FROM job_event WHERE seq > ? ORDER BY seq',
+                                (seq,)).fetchall()
+            oldest = conn.execute('SELECT MIN(seq) AS seq FROM job_event').fetchone()['seq']
+        finally:
+            conn.execute('COMMIT')
+        events = [Event(id=f'{self.epoch}-{row["seq"]}', data=json.loads(row['data'])) for row in rows]
+        return events, seq >= (last + 1 if oldest is None else oldest) - 1
+
+    def wait(self, last_id: str, timeout: float) -> bool:
+        """
+        Wait for an event after ``last_id``.
+
+        :return: ``False`` if the timeout expired
+        """
+        seq = self.__parse(last_id)
+        deadline = time.monotonic() + timeout
+        while seq is not None and self.__last_seq() <= seq:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            # woken up early by events of this process
+            with self.__cond:
+                self.__cond.wait(min(remaining, self.poll_interval))
+        return True
+
+    def __last_seq(self) -> int:
+        row = self.__db.connect().execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = 'job_event'").fetchone()
+        return 0 if row is None else row['seq']
+
+    def __parse(self, event_id: Optional[str]) -> Optional[int]:
+        if not event_id:
+            return None
+        epoch, _, seq = event_id.partition('-')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+
+class ChangeDetector:
+    """
+    Publishes an event whenever the status of a job changes.
+
+    :param compute_mgr: the compute backend
+    :param event_log: where to publish events
+    :param poll_interval: seconds between polls, for backends which are not watched,
+                          and between attempts to take the lease
+    :param lease: the lease which elects the detecting process, if there are several
+    """
+
+    def __init__(self, compute_mgr: AbstractManager, event_log: EventLog,
+                 poll_interval: float = 5.0, lease: Optional[FileLease] = None):
+        self.__compute_mgr = compute_mgr
+        self.event_log = event_log
+        self.lease = lease
+        self.__poll_interval = poll_interval
+        # statuses from the last poll, and the last published status of each job
+        self.__listed: Dict[JobName, JobStatus] = {}
+        self.__published: Dict[JobName, JobStatus] = {}
+        self.__synced = False
+        self.__changed: 'queue.Queue[Optional[JobName]]' = queue.Queue()
+        self.__stopped = threading.Event()
+        self.__thread: Optional[threading.Thread] = None
+        self.__lock = threading.Lock()
+
+    @property
+    def watched(self) -> bool:
+        """
+        Whether changes are notified by the backend, as opposed to polled.
+        """
+        return self.__compute_mgr.change_notifier is not None
+
+    def start(self):
+        """
+        Start detecting changes, if not started yet.
+
+        :raises NotImplementedError: if the backend can neither be watched nor polled
+        """
+        with self.__lock:
+            if self.__thread is not None:
+                return
+            try:
+                self.sync()
+            except NotImplementedError:
+                raise
+            except Exception as e:
+                logger.error('Error listing jobs, will try again: %s', str(e))
+            if self.watched:
+                self.__compute_mgr.change_notifier.add_listener(self.__changed.put)
+            self.__thread = threading.Thread(target=self.run, name='change-detector', daemon=True)
+            self.__thread.start()
+
+    def stop(self):
+        self.__stopped.set()
+        self.__changed.put(None)
+        if self.__thread is not None:
+            self.__thread.join()
+        if self.lease is not None:
+            self.lease.release()
+
+    def run(self):
+        while not self.__stopped.is_set():
+            try:
+                if self.lease is not None and not self.lease.try_acquire():
+                    # another process publishes the changes, start over once it exits
+                    self.__synced = False
+                    self.__stopped.wait(self.__poll_interval)
+                    self.__discard_notifications()
+                elif not self.__synced:
+                    self.sync()
+                elif self.watched:
+                    self.process_notifications()
+                else:
+                    self.poll()
+                    self.__stopped.wait(self.__poll_interval)
+            except Exception as e:
+                logger.exception('Error detecting job changes: %s', str(e))
+                self.__stopped.wait(self.__poll_interval)
+
+    def sync(self):
+        """
+        Get the current status of every job, which is not published.
+        """
+        self.__listed = self.__compute_mgr.list_job_statuses()
+        self.__published = dict(self.__listed)
+        self.__synced = True
+
+    def process_notifications(self, timeout: Optional[float] = None):
+        """
+        Check the jobs which the backend reported as changed.
+        """
+        names = {self.__changed.get(timeout=timeout)}
+        while not self.__changed.empty():
+            names.add(self.__changed.get_nowait())
+        names.discard(None)
+        for name in names:
+            self.check(name)
+
+    def __discard_notifications(self):
+        while not self.__changed.empty():
+            self.__changed.get_nowait()
+
+    def poll(self):
+        """
+        List the jobs of the backend, and check the jobs whose status changed or which disappeared.
+        """
+        listed = self.__compute_mgr.list_job_statuses()
+        for name, status in listed.items():
+            if self.__listed.get(name) != status:
+                self.check(name)
+        for name in self.__listed.keys() - listed.keys():
+            self.check(name)
+            self.__published.pop(name, None)
+        self.__listed = listed
+
+    def check(self, name: JobName):
+        """
+        Read the job, and publish an event if its status changed.
+        """
+        try:
+            job = self.__compute_mgr.get_job(name)
+            info = self.__compute_mgr.get_job_info(job)
+        except ManagerException as e:
+            if e.status_code != 404:
+                raise
+            self.__published.pop(name, None)
+            return
+        if self.__published.get(name) == info.status:
+            return
+        self.__published[name] = info.status
+        self.event_log.publish(serialize_event(name, info))
+
+
+def serialize_event(name: JobName, info: JobInfo) -> dict:
+    return {
+        'jid': name,
+        'status': info.status.value,
+        'message': info.message,
+        'timestamp': info.timestamp,
+    }
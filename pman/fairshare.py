@@ -0,0 +1,81 @@
+"""
+Fair sharing of the compute environment between users (the ``auid`` of jobs).
+
+Queued jobs are dispatched by Dominant Resource Fairness: the next job is
+the oldest job of the user whose *dominant share* is the lowest, where the
+dominant share of a user is the largest fraction of the capacity (of CPU,
+memory or GPUs) used by their jobs, divided by the user's weight.
+
+Ghodsi et al., "Dominant Resource Fairness: Fair Allocation of Multiple
+Resource Types", NSDI 2011.
+"""
+from typing import Dict, List, Mapping, Optional
+
+from .abstractmgr import ResourceCapacity
+
+Usage = Mapping[str, int]
+"""Resources used by a user (keys of :class:`ResourceCapacity`) and their number of ``jobs``."""
+
+
+class FairShare:
+    """
+    Orders users by weighted dominant share.
+
+    :param weights: weight of each user, users which are not listed have the default weight
+    :param default_weight: weight of the users which are not in ``weights``
+    :param max_jobs_per_user: maximum number of dispatched jobs of a user which are not finished
+    """
+
+    def __init__(self, weights: Optional[Mapping[str, float]] = None,
+                 default_weight: float = 1.0, max_jobs_per_user: Optional[int] = None):
+        self.__weights = dict(weights or {})
+        self.__default_weight = default_weight
+        self.max_jobs_per_user = max_jobs_per_user
+
+    def weight(self, user: str) -> float:
+        return self.__weights.get(user, self.__default_weight)
+
+    def dominant_share(self, usage: Usage, capacity: ResourceCapacity) -> float:
+        """
+        The largest fraction of the capacity used by a user, not weighted.
+        If no resource is limited, the number of jobs is used instead.
+        """
+        shares = [usage.get(r, 0) / v for r, v in capacity.items() if v > 0]
+        if not shares:
+            return float(usage.get('jobs', 0))
+        return max(shares)
+
+    def is_capped(self, usage: Usage) -> bool:
+        return self.max_jobs_per_user is not None and usage.get('jobs', 0) >= self.max_jobs_per_user
+
+    def order(self, waiting: Mapping[str, float], usage: Mapping[str, Usage],
+              capacity: ResourceCapacity) -> List[str]:
+        """
+        Order the users with waiting jobs by who should be served next,
+        leaving out users who reached ``max_jobs_per_user``.
+
+        :param waiting: users with waiting jobs, and the time their oldest job was submitted
+        :param usage: resources used by the dispatched jobs of every user
+        :param capacity: capacity of the compute environment
+        """
+        eligible = [u for u in waiting if not self.is_capped(usage.get(u, {}))]
+        return sorted(eligible, key=lambda u: (
+            self.dominant_share(usage.get(u, {}), capacity) / self.weight(u), waiting[u]
+        ))
+
+    def stats(self, waiting: Mapping[str, int], usage: Mapping[str, Usage],
+              capacity: ResourceCapacity) -> Dict[str, dict]:
+        """
+        The queued and dispatched jobs and the dominant share of every user, for ``GET /api/v1/``.
+
+        :param waiting: number of queued jobs of every user
+        """
+        return {
+            user: {
+                'queued': waiting.get(user, 0),
+                'jobs': usage.get(user, {}).get('jobs', 0),
+                'dominant_share': round(self.dominant_share(usage.get(user, {}), capacity), 4),
+                'weight': self.weight(user),
+            }
+            for user in sorted(waiting.keys() | usage.keys())
+        }
@@ -0,0 +1,25 @@
+"""
+Configuration of gunicorn, for the metrics of every worker process to be
+aggregated (see :mod:`pman.metrics`)::
+
+    PROMETHEUS_MULTIPROC_DIR=/tmp/pman-metrics \
+        gunicorn --config python:pman.gunicorn_conf pman.wsgi:application
+"""
+import os
+import shutil
+
+
+def on_starting(server):
+    """
+    Remove the metrics of a previous run.
+    """
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
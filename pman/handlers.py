@@ -0,0 +1,690 @@
+"""
+The handling of the requests of the pman API, shared by the Flask resources of
+:mod:`pman.resources` and the ASGI app of :mod:`pman.asgi`, which only parse
+requests and build responses.
+
+Handlers are generators which yield the blocking calls they make, and receive
+their results (or their exceptions) back::
+
+    job = yield Call('get_job', name)
+    queued = yield Run(dispatcher.queue.get, name)
+
+A :class:`Call` is a call to a method of the compute manager, and a :class:`Run`
+is a call to a function which blocks, e.g. one which queries the ``STATE_DB``.
+The Flask app makes both in the request thread with :func:`run`. The ASGI app,
+with :func:`run_async`, awaits the asynchronous client of the backend and runs
+the others in its thread pool.
+
+Errors are raised as :class:`ManagerException`, which both apps turn into
+``{"message": ...}`` responses with its status code.
+"""
+import logging
+import os
+import threading
+from typing import (Any, Callable, Collection, Dict, Generator, Iterator, List, Literal,
+                    Mapping, Optional, Tuple, TypeVar, Union)
+
+from .abstractmgr import AbstractManager, ManagerException, JobInfo, JobName
+from .admission import AdmissionController, FINISHED, Reservation
+from .asyncmgr import AsyncManager
+from .container_user import ContainerUser
+from .dispatch import Dispatcher
+from .logarchive import LogArchive
+from .metrics import LOG_BYTES, count_log_bytes
+from .registry import FinishedJob, JobRegistry
+from .statuscache import StatusCache
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class Call:
+    """
+    A call to a method of the compute manager.
+    """
+
+    def __init__(self, method: str, *args, **kwargs):
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+
+
+class Run:
+    """
+    A call to a blocking function.
+    """
+
+    def __init__(self, func: Callable, *args, **kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+
+
+Steps = Generator[Union[Call, Run], Any, T]
+"""A handler which returns a ``T``."""
+
+
+def run(steps: Steps[T], compute_mgr: AbstractManager) -> T:
+    """
+    Make the calls of a handler in the current thread.
+    """
+    result, error = None, None
+    while True:
+        try:
+            step = steps.send(result) if error is None else steps.throw(error)
+        except StopIteration as e:
+            return e.value
+        result, error = None, None
+        try:
+            if isinstance(step, Call):
+                result = getattr(compute_mgr, step.method)(*step.args, **step.kwargs)
+            else:
+                result = step.func(*step.args, **step.kwargs)
+        except Exception as e:
+            error = e
+
+
+async def run_async(steps: Steps[T], async_mgr: AsyncManager) -> T:
+    """
+    Make the calls of a handler without blocking the event loop.
+    """
+    result, error = None, None
+    while True:
+        try:
+            step = steps.send(result) if error is None else steps.throw(error)
+        except StopIteration as e:
+            return e.value
+        result, error = None, None
+        try:
+            if isinstance(step, Call):
+                result = await getattr(async_mgr, step.method)(*step.args, **step.kwargs)
+            else:
+                result = await async_mgr.run_sync(step.func, *step.args, **step.kwargs)
+        except Exception as e:
+            error = e
+
+
+JOB_FIELDS = frozenset(('jid', 'image', 'cmd', 'status', 'message', 'timestamp', 'logs',
+                        'next_cursor'))
+"""Fields which can be selected by ``GET /api/v1/<jid>/?fields=...``"""
+
+Logs = Union[bytes, str, Iterator[bytes]]
+"""Logs which were read, or which are streamed as they are read."""
+
+
+class JobsApi:
+    """
+    The handlers of the pman API.
+
+    :param config: the configuration
+    :param extensions: the shared state created by :func:`pman.app.create_extensions`
+    """
+
+    def __init__(self, config: Mapping, extensions: dict):
+        self.config = config
+        self.extensions = extensions
+        self.user = ContainerUser.parse(config.get('CONTAINER_USER'))
+
+    @property
+    def container_env(self) -> str:
+        return self.config.get('CONTAINER_ENV')
+
+    @property
+    def compute_mgr(self) -> AbstractManager:
+        return self.extensions['compute_mgr']
+
+    @property
+    def dispatcher(self) -> Optional[Dispatcher]:
+        return self.extensions.get('dispatcher')
+
+    @property
+    def status_cache(self) -> Optional[StatusCache]:
+        return self.extensions.get('status_cache')
+
+    @property
+    def admission(self) -> Optional[AdmissionController]:
+        return self.extensions.get('admission')
+
+    @property
+    def job_registry(self) -> Optional[JobRegistry]:
+        return self.extensions.get('job_registry')
+
+    @property
+    def log_archive(self) -> Optional[LogArchive]:
+        return self.extensions.get('log_archive')
+
+    def index(self) -> Steps[dict]:
+        """
+        ``GET /api/v1/``
+        """
+        # the counters are those of the worker process which handles the request
+        stats = {**self.compute_mgr.get_stats(),
+                 'counters': self.extensions['counters'].snapshot(),
+                 'counters_worker': os.getpid()}
+        dispatcher = self.dispatcher
+        if dispatcher is not None:
+            stats['dispatch_queue'] = yield Run(dispatcher.queue.stats)
+            if dispatcher.fair_share is not None:
+                stats['fair_share'] = yield Run(dispatcher.fair_share_stats)
+        if self.admission is not None:
+            stats['admission'] = yield Run(self.admission.stats)
+        if self.status_cache is not None:
+            stats['status_cache'] = yield Run(self.status_cache.stats)
+        if self.job_registry is not None:
+            stats['job_registry'] = yield Run(self.job_registry.stats)
+        if self.log_archive is not None:
+            stats['log_archive'] = yield Run(self.log_archive.stats)
+        controller = self.extensions.get('controller')
+        if controller is not None:
+            stats['controller'] = yield Run(controller.status)
+        return {
+            'server_version': self.config.get('SERVER_VERSION'),
+            'container_env': self.container_env,
+            'storage_type': self.config.get('STORAGE_TYPE'),
+            'stats': stats
+        }
+
+    def create_job(self, args) -> Steps[Tuple[dict, int, Dict[str, str]]]:
+        """
+        ``POST /api/v1/``
+
+        :param args: arguments parsed by :data:`pman.resources.parser`
+        :return: the body, status code and headers of the response
+        """
+        request = build_schedule_request(args, self.config, self.user)
+        job_id = request['name']
+
+        dispatcher = self.dispatcher
+        if dispatcher is not None:
+            logger.info(f'Queueing job {job_id} for the {self.container_env} cluster')
+            queued = yield Run(dispatcher.queue.enqueue, JobName(job_id), request, args.auid)
+            yield from self.job_created(job_id, request)
+            dispatcher.notify()
+            return {**serialize_job_info(job_id, queued.to_job_info()), 'logs': ''}, 202, {}
+
+        admission = self.admission
+        if admission is not None:
+            reservation = yield Run(admission.reserve, job_id, request['resources_dict'],
+                                    args.auid)
+            if not reservation:
+                logger.warning(f'Not enough resources in the {self.container_env} cluster '
+                               f'for job {job_id}, rejecting it')
+                self.extensions['counters'].inc('admission_rejected')
+                retry_after = self.config.get('ADMISSION_RETRY_AFTER', 30)
+                return ({'message': f'Not enough resources for job {job_id}, try again later'},
+                        429, {'Retry-After': str(retry_after)})
+
+        logger.info(f'Scheduling job {job_id} on the {self.container_env} cluster')
+        try:
+            job = yield Call('schedule_job', **request)
+        except ManagerException as e:
+            logger.error(f'Error from {self.container_env} while scheduling job '
+                         f'{job_id}, detail: {str(e)}')
+            # on conflict, a reservation made for the existing job is kept
+            if admission is not None and not (e.status_code == 409
+                                              and reservation is Reservation.existing):
+                yield Run(admission.release, job_id)
+            raise
+        job_info = yield Call('get_job_info', job)
+        logger.info(f'Successful job {job_id} schedule response from '
+                    f'{self.container_env}: {job_info}')
+        yield from self.cache_job_info(job_id, job_info)
+        yield from self.job_created(job_id, request)
+        return {**serialize_job_info(job_id, job_info), 'logs': ''}, 201, {}
+
+    def get_job(self, job_id: str, args, cursor: Optional[str] = None) -> Steps[dict]:
+        """
+        ``GET /api/v1/<jid>/``
+
+        :param args: arguments parsed by :data:`pman.resources.job_parser`
+        :param cursor: with a cursor, only the logs which come after it are returned
+        """
+        fields = parse_fields(args.fields)
+        get_logs = args.logs and (fields is None or 'logs' in fields)
+        name = JobName(job_id)
+        tail = self.config.get('JOB_LOGS_TAIL')
+
+        job_info = yield from self.queued_job_info(job_id)
+        if job_info is not None:
+            body = serialize_job_info(job_id, job_info)
+            if get_logs:
+                body['logs'] = ''
+                if cursor is not None:
+                    body['next_cursor'] = cursor or None
+            return select_fields(body, fields)
+
+        finished = yield from self.finished_job(job_id)
+        if finished is not None:
+            # the stored tail of the logs is returned, whatever the cursor
+            self.extensions['counters'].inc('job_registry_hits')
+            body = serialize_job_info(job_id, finished.info)
+            if get_logs:
+                body['logs'] = yield from self.registry_logs(job_id, finished)
+                if cursor is not None:
+                    body['next_cursor'] = None
+            return select_fields(body, fields)
+
+        job_info = yield from self.cached_job_info(job_id)
+        job = None
+        if job_info is None:
+            logger.info(f'Getting job {job_id} status from the {self.container_env} cluster')
+            job = yield Call('get_job', name)
+            job_info = yield Call('get_job_info', job)
+            logger.info(f'Successful job {job_id} status response from '
+                        f'{self.container_env}: {job_info}')
+            yield from self.cache_job_info(job_id, job_info)
+        yield from self.release_finished_jobs({name: job_info})
+        archived_logs = None
+        if get_logs and cursor is None and job_info.status in FINISHED:
+            archived_logs = yield from self.read_archived_logs(job_id, tail)
+        if get_logs and job is None and archived_logs is None:
+            job = yield Call('get_job', name)
+
+        if not get_logs:
+            job_logs = None
+            next_cursor = {}
+            counters = self.extensions['counters']
+            counters.inc('log_fetches_skipped')
+            counters.inc('backend_calls_saved', self.compute_mgr.log_api_calls)
+        elif cursor is None:
+            job_logs = archived_logs
+            if job_logs is None:
+                job_logs = yield Call('get_job_logs', job, tail)
+            next_cursor = {}
+        else:
+            try:
+                res = yield Call('get_job_logs_since', job, cursor or None, tail)
+            except ValueError as e:
+                raise ManagerException(str(e), status_code=400)
+            job_logs = res.logs
+            next_cursor = {'next_cursor': res.next_cursor}
+        if isinstance(job_logs, bytes):
+            LOG_BYTES.labels('api.job').inc(len(job_logs))
+            job_logs = job_logs.decode(encoding='utf-8', errors='replace')
+        elif job_logs:
+            LOG_BYTES.labels('api.job').inc(len(job_logs.encode('utf-8')))
+
+        registry = self.job_registry
+        if registry is not None and job_info.status in FINISHED:
+            # without the tail of the logs, they are recorded when first requested
+            tail_logs = job_logs if get_logs and cursor is None else None
+            yield Run(registry.record, name, job_info, tail_logs)
+
+        body = serialize_job_info(job_id, job_info)
+        if get_logs:
+            body = {**body, 'logs': job_logs, **next_cursor}
+        return select_fields(body, fields)
+
+    def job_info(self, job_id: str) -> Steps[JobInfo]:
+        """
+        Get the status of a job, e.g. while waiting for it to change.
+        """
+        job_info = yield from self.queued_job_info(job_id)
+        if job_info is not None:
+            return job_info
+        finished = yield from self.finished_job(job_id)
+        if finished is not None:
+            return finished.info
+        job_info = yield from self.cached_job_info(job_id)
+        if job_info is not None:
+            return job_info
+        job = yield Call('get_job', JobName(job_id))
+        job_info = yield Call('get_job_info', job)
+        yield from self.cache_job_info(job_id, job_info)
+        return job_info
+
+    def start_long_poll(self, job_id: str, wait: int,
+                        slots: Optional[threading.BoundedSemaphore] = None) -> Optional[float]:
+        """
+        Take a slot for a request which waits for the status of a job to change.
+        Every slot which was taken must be released with :meth:`end_long_poll`.
+
+        :param wait: how long the client asked to wait
+        :param slots: the slots to take from, by default the ``LONG_POLL_MAX_WAITERS``
+                      threads of a worker process
+        :return: how long to wait, or ``None`` if too many requests are waiting already
+        """
+        counters = self.extensions['counters']
+        if slots is None:
+            slots = self.extensions['long_poll_slots']
+        if not slots.acquire(blocking=False):
+            logger.warning(f'Too many long-polling requests, not waiting for job {job_id}')
+            counters.inc('long_polls_rejected')
+            return None
+        counters.inc('long_polls')
+        return min(wait, self.config.get('LONG_POLL_MAX_SECONDS', 30))
+
+    def end_long_poll(self, slots: Optional[threading.BoundedSemaphore] = None):
+        if slots is None:
+            slots = self.extensions['long_poll_slots']
+        slots.release()
+
+    def delete_job(self, job_id: str) -> Steps[None]:
+        """
+        ``DELETE /api/v1/<jid>/``
+        """
+        if not self.config.get('REMOVE_JOBS'):
+            logger.info(f'Deletion request for job {job_id}, '
+                        'doing nothing because config.REMOVE_JOBS=no')
+            return
+
+        name = JobName(job_id)
+        dispatcher = self.dispatcher
+        if dispatcher is not None and (yield Run(dispatcher.queue.get, name)) is not None:
+            if not (yield Run(dispatcher.queue.remove, name)):
+                raise ManagerException(f'Job {job_id} is being submitted, try again later',
+                                       status_code=409)
+            logger.info(f'Removed job {job_id} from the dispatch queue')
+            return
+
+        logger.info(f'Deleting job {job_id} from {self.container_env}')
+        try:
+            job = yield Call('get_job', name)
+        except ManagerException as e:
+            if e.status_code == 404 and (yield from self.finished_job(job_id)) is not None:
+                logger.info(f'Job {job_id} was already removed from {self.container_env}')
+                return
+            raise
+        yield from self.archive_logs(job_id, job)
+        finished = yield from self.finished_job(job_id)
+        if finished is not None:
+            yield from self.registry_logs(job_id, finished, job)
+        yield Call('remove_job', job)  # remove job from compute cluster
+        if self.status_cache is not None:
+            yield Run(self.status_cache.remove, name)
+        if self.admission is not None:
+            yield Run(self.admission.release, name)
+        logger.info(f'Successfully removed job {job_id} from {self.container_env}')
+
+    def get_job_logs(self, job_id: str, tail: Optional[int], follow: bool) -> Steps[Logs]:
+        """
+        ``GET /api/v1/<jid>/logs``
+
+        Logs are streamed as they are read from the compute, so with ``follow``
+        the response lasts as long as the job is running.
+        """
+        if (yield from self.queued_job_info(job_id)) is not None:
+            return b''
+        if self.log_archive is not None:
+            chunks = yield Run(self.log_archive.read, JobName(job_id), tail)
+            if chunks is not None:
+                logger.info(f'Reading archived logs of job {job_id} (tail={tail})')
+                return count_log_bytes('api.joblogs', chunks)
+        try:
+            job = yield Call('get_job', JobName(job_id))
+        except ManagerException as e:
+            finished = (yield from self.finished_job(job_id)) if e.status_code == 404 else None
+            if finished is None:
+                raise
+            # removed from the backend, only the tail of its logs was kept
+            return finished.logs
+        logger.info(f'Streaming logs of job {job_id} (tail={tail}, follow={follow})')
+        chunks = yield Run(self.compute_mgr.stream_job_logs, job, tail, follow)
+        return count_log_bytes('api.joblogs', chunks)
+
+    def get_jobs_status(self, jids: List[str]) -> Steps[dict]:
+        """
+        ``GET /api/v1/?jids=...`` and ``POST /api/v1/batch/``
+
+        Get the status of many jobs using a single batch request to the compute manager.
+        """
+        job_ids = [JobName(jid.lstrip('/')) for jid in jids if jid.strip('/')]
+        infos = {}
+        dispatcher = self.dispatcher
+        if dispatcher is not None:
+            queued = yield Run(dispatcher.queue.get_many, job_ids)
+            infos.update({jid: job.to_job_info() for jid, job in queued.items()})
+        registry = self.job_registry
+        if registry is not None:
+            infos.update((yield Run(registry.get_many,
+                                    [job_id for job_id in job_ids if job_id not in infos])))
+        submitted = [job_id for job_id in job_ids if job_id not in infos]
+        logger.info(f'Getting status of {len(submitted)} jobs from the '
+                    f'{self.container_env} cluster')
+        cache = self.status_cache
+        if submitted and cache is not None:
+            cached = yield Run(cache.get_many, submitted)
+            infos.update(cached)
+            submitted = [job_id for job_id in submitted if job_id not in cached]
+        if submitted:
+            fetched = yield Call('get_jobs_info', submitted)
+            if cache is not None:
+                yield Run(cache.put, fetched)
+            infos.update(fetched)
+            yield from self.release_finished_jobs(infos)
+        return {
+            'jobs': [serialize_job_info(job_id, infos[job_id]) for job_id in job_ids
+                     if job_id in infos],
+            'not_found': [job_id for job_id in job_ids if job_id not in infos]
+        }
+
+    def queued_job_info(self, job_id: str) -> Steps[Optional[JobInfo]]:
+        """
+        Get the status of a job which is waiting in the dispatch queue,
+        or ``None`` if it was already submitted to the backend.
+        """
+        if self.dispatcher is None:
+            return None
+        queued = yield Run(self.dispatcher.queue.get, JobName(job_id))
+        return None if queued is None else queued.to_job_info()
+
+    def cached_job_info(self, job_id: str) -> Steps[Optional[JobInfo]]:
+        """
+        Get the status of a job from the status cache, or ``None`` if it is not
+        cached, too old, or the cache is off.
+        """
+        if self.status_cache is None:
+            return None
+        return (yield Run(self.status_cache.get, JobName(job_id)))
+
+    def cache_job_info(self, job_id: str, job_info: JobInfo) -> Steps[None]:
+        if self.status_cache is not None:
+            yield Run(self.status_cache.put, {JobName(job_id): job_info})
+
+    def finished_job(self, job_id: str) -> Steps[Optional[FinishedJob]]:
+        """
+        Get a job from the registry of finished jobs, or ``None`` if it is not
+        finished, was not seen to be finished yet, or the registry is off.
+        """
+        if self.job_registry is None:
+            return None
+        return (yield Run(self.job_registry.get, JobName(job_id)))
+
+    def registry_logs(self, job_id: str, finished: FinishedJob, job=None) -> Steps[str]:
+        """
+        Get the tail of the logs of a job from the registry of finished jobs.
+        If the job was recorded without them, they are read from the log
+        archive or the backend, and recorded.
+
+        :param job: the job, if it was already gotten from the backend
+        """
+        if finished.logs is not None:
+            return finished.logs
+        tail = self.config.get('JOB_LOGS_TAIL')
+        logs = yield from self.read_archived_logs(job_id, tail)
+        if logs is None:
+            try:
+                if job is None:
+                    job = yield Call('get_job', JobName(job_id))
+                logs = yield Call('get_job_logs', job, tail)
+            except ManagerException as e:
+                if e.status_code != 404:
+                    raise
+                logger.warning(f'The logs of job {job_id} are lost, it was removed '
+                               f'from {self.container_env}')
+                return ''
+        if isinstance(logs, bytes):
+            logs = logs.decode(encoding='utf-8', errors='replace')
+        yield Run(self.job_registry.record_logs, JobName(job_id), logs)
+        return logs
+
+    def job_created(self, job_id: str, request: dict) -> Steps[None]:
+        """
+        Forget the finished job with the same name as a new job, if any, and
+        decide where the logs of the new job are archived, if the log archive is on.
+
+        :param request: arguments of :meth:`AbstractManager.schedule_job` for the job
+        """
+        if self.job_registry is not None:
+            yield Run(self.job_registry.remove, JobName(job_id))
+        if self.log_archive is not None:
+            outputdir_source = None
+            if self.config.get('STORAGE_TYPE') == 'host':
+                outputdir_source = request['mounts_dict']['outputdir_source']
+            yield Run(self.log_archive.register, JobName(job_id), outputdir_source)
+
+    def read_archived_logs(self, job_id: str, tail: Optional[int]) -> Steps[Optional[bytes]]:
+        """
+        Get the last ``tail`` lines of the archived logs of a job, or ``None`` if
+        they were not archived or the log archive is off.
+        """
+        archive = self.log_archive
+        if archive is None:
+            return None
+
+        def read() -> Optional[bytes]:
+            chunks = archive.read(JobName(job_id), tail)
+            return None if chunks is None else b''.join(chunks)
+        return (yield Run(read))
+
+    def archive_logs(self, job_id: str, job) -> Steps[None]:
+        """
+        Archive the logs of a job which is about to be removed from the backend,
+        if the log archive is on and they were not archived yet.
+        """
+        archive = self.log_archive
+        if archive is None or not (yield Run(archive.unarchived, [JobName(job_id)])):
+            return
+        try:
+            chunks = yield Run(self.compute_mgr.stream_job_logs, job)
+            yield Run(archive.write, JobName(job_id), chunks)
+        except Exception as e:
+            logger.exception(f'Error archiving the logs of job {job_id}: {str(e)}')
+
+    def release_finished_jobs(self, infos: Dict[JobName, JobInfo]) -> Steps[None]:
+        """
+        Release the resources reserved for jobs which were seen to be finished.
+        """
+        if self.admission is not None and any(i.status in FINISHED for i in infos.values()):
+            yield Run(self.admission.release_finished, infos)
+
+
+def parse_fields(fields: Optional[str]) -> Optional[frozenset]:
+    """
+    Parse the ``fields`` argument of ``GET /api/v1/<jid>/``.
+
+    :return: the selected fields, or ``None`` for all fields
+    :raises ManagerException: (400) if a field is unknown
+    """
+    if fields is None:
+        return None
+    selected = frozenset(f.strip() for f in fields.split(',') if f.strip())
+    if unknown := selected - JOB_FIELDS:
+        raise ManagerException(f'Unknown fields: {", ".join(sorted(unknown))}', status_code=400)
+    return selected
+
+
+def select_fields(body: dict, fields: Optional[frozenset]) -> dict:
+    if fields is None:
+        return body
+    return {k: v for k, v in body.items() if k in fields}
+
+
+def serialize_job_info(job_id: str, job_info: JobInfo) -> dict:
+    return {
+        'jid': job_id,
+        'image': job_info.image,
+        'cmd': job_info.cmd,
+        'status': job_info.status.value,
+        'message': job_info.message,
+        'timestamp': job_info.timestamp,
+    }
+
+
+APP_CONTAINER_INPUTDIR = '/share/incoming'
+"""Mounting point for the input dir in the app's container."""
+APP_CONTAINER_OUTPUTDIR = '/share/outgoing'
+"""Mounting point for the output dir in the app's container."""
+
+
+def build_schedule_request(args, config, user: ContainerUser) -> dict:
+    """
+    Validate the arguments of a job creation request, and build the arguments
+    of :meth:`AbstractManager.schedule_job` from them.
+
+    :param args: arguments parsed by :data:`pman.resources.parser`
+    :param config: the app's configuration
+    :param user: the user for job containers
+    :raises ManagerException: (400) if the arguments are invalid
+    """
+    if len(args.entrypoint) == 0:
+        raise ManagerException('"entrypoint" cannot be empty', status_code=400)
+
+    for s in args.env:
+        if len(s.split('=', 1)) != 2:
+            raise ManagerException('"env" must be a list of "key=value" strings', status_code=400)
+
+    env = list(args.env)
+    if config.get('ENABLE_HOME_WORKAROUND'):
+        env.append('HOME=/tmp')
+
+    job_id = args.jid.lstrip('/')
+
+    cmd = build_app_cmd(args.args, args.args_path_flags, args.entrypoint, args.type)
+
+    resources_dict = {'number_of_workers': args.number_of_workers,
+                      'cpu_limit': args.cpu_limit,
+                      'memory_limit': args.memory_limit,
+                      'gpu_limit': args.gpu_limit,
+                      }
+    mounts_dict = {'inputdir_source': '',
+                   'inputdir_target': APP_CONTAINER_INPUTDIR,
+                   'outputdir_source': '',
+                   'outputdir_target': APP_CONTAINER_OUTPUTDIR
+                   }
+    input_dir = args.input_dir.strip('/')
+    output_dir = args.output_dir.strip('/')
+
+    # hmm, probably unnecessarily relying on invariant that
+    # STORAGETYPE matches enum value -> STOREBASE is valid and should be used
+    # Perhaps we should instead simply check STOREBASE only?
+    storage_type = config.get('STORAGE_TYPE')
+    if storage_type in ('host', 'docker_local_volume'):
+        storebase = config.get('STOREBASE')
+        mounts_dict['inputdir_source'] = os.path.join(storebase, input_dir)
+        mounts_dict['outputdir_source'] = os.path.join(storebase, output_dir)
+    elif storage_type == 'kubernetes_pvc':
+        mounts_dict['inputdir_source'] = input_dir
+        mounts_dict['outputdir_source'] = output_dir
+
+    return {'image': args.image, 'command': cmd, 'name': JobName(job_id),
+            'resources_dict': resources_dict, 'env': env,
+            'uid': user.get_uid(), 'gid': user.get_gid(),
+            'mounts_dict': mounts_dict}
+
+
+def build_app_cmd(
+        args: List[str],
+        args_path_flags: Collection[str],
+        entrypoint: List[str],
+        plugin_type: Literal['ds', 'fs', 'ts']
+) -> List[str]:
+    cmd = entrypoint + localize_path_args(args, args_path_flags, APP_CONTAINER_INPUTDIR)
+    if plugin_type == 'ds':
+        cmd.append(APP_CONTAINER_INPUTDIR)
+    cmd.append(APP_CONTAINER_OUTPUTDIR)
+    return cmd
+
+
+def localize_path_args(args: List[str], path_flags: Collection[str], input_dir: str) -> List[str]:
+    """
+    Replace the strings following path flags with the input directory.
+
+    https://github.com/FNNDSC/CHRIS_docs/blob/7ac85e9ae1070947e6e2cda62747b427028229b0/SPEC.adoc#path-arguments
+    """
+    if len(args) == 0:
+        return args
+    if args[0] in path_flags:
+        return [args[0], input_dir] + localize_path_args(args[2:], path_flags, input_dir)
+    return args[0:1] + localize_path_args(args[1:], path_flags, input_dir)
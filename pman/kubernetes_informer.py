@@ -0,0 +1,279 @@
+"""
+An in-memory cache of the Jobs and Pods created by pman, kept up-to-date by
+watching the Kubernetes API server (the "list-watch" pattern of an informer).
+
+https://kubernetes.io/docs/reference/using-api/api-concepts/#efficient-detection-of-changes
+"""
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set
+
+from kubernetes import watch
+from kubernetes.client import V1Job, V1Pod
+from kubernetes.client.rest import ApiException
+
+logger = logging.getLogger(__name__)
+
+HTTP_STATUS_GONE = 410
+
+
+class Reflector:
+    """
+    Keeps a local copy of every object of one kind, by listing them and then
+    watching for changes starting from the ``resourceVersion`` of the list.
+
+    When the watch expires or the API server reports that the ``resourceVersion``
+    is too old (410 Gone), all objects are listed again.
+
+    :param kind: name of the kind of objects, for logging
+    :param list_func: a ``list_namespaced_*`` method of a Kubernetes API client
+    :param namespace: namespace of the objects
+    :param label_selector: only cache objects which match this selector
+    :param on_change: called with ``(old, new)`` whenever an object is added,
+                      modified or deleted, where ``old`` or ``new`` may be ``None``
+    :param watch_factory: creates :class:`kubernetes.watch.Watch` objects
+    :param resync_period: seconds until a watch is closed and all objects are listed again
+    """
+
+    def __init__(self, kind: str, list_func: Callable, namespace: str,
+                 label_selector: Optional[str],
+                 on_change: Optional[Callable[[object, object], None]] = None,
+                 watch_factory: Callable[[], watch.Watch] = watch.Watch,
+                 resync_period: int = 300):
+        self.kind = kind
+        self.__list_func = list_func
+        self.__namespace = namespace
+        self.__label_selector = label_selector
+        self.__on_change = on_change or (lambda old, new: None)
+        self.__watch_factory = watch_factory
+        self.__resync_period = resync_period
+
+        self.__objects: Dict[str, object] = {}
+        self.__lock = threading.Lock()
+        self.__stopped = threading.Event()
+        self.__synced = threading.Event()
+        self.__watch: Optional[watch.Watch] = None
+
+        self.resource_version: Optional[str] = None
+        self.lists = 0
+        self.events = 0
+        self.__last_list: Optional[float] = None
+        self.__last_event: Optional[float] = None
+
+    def get(self, name: str):
+        with self.__lock:
+            return self.__objects.get(name)
+
+    def has_synced(self) -> bool:
+        return self.__synced.is_set()
+
+    def wait_for_sync(self, timeout: Optional[float] = None) -> bool:
+        return self.__synced.wait(timeout)
+
+    def stop(self):
+        self.__stopped.set()
+        if self.__watch is not None:
+            self.__watch.stop()
+
+    def run(self):
+        """
+        List and watch until :meth:`stop` is called.
+        """
+        backoff = 1
+        while not self.__stopped.is_set():
+            try:
+                self.list()
+                self.watch()
+                backoff = 1
+            except ApiException as e:
+                if e.status == HTTP_STATUS_GONE:
+                    logger.info('%s watch expired at resourceVersion=%s, listing again',
+                                self.kind, self.resource_version)
+                    continue
+                logger.error('Error watching %s: %s', self.kind, str(e))
+                self.__stopped.wait(backoff)
+                backoff = min(backoff * 2, 60)
+            except Exception as e:
+                logger.exception('Error watching %s: %s', self.kind, str(e))
+                self.__stopped.wait(backoff)
+                backoff = min(backoff * 2, 60)
+
+    def list(self):
+        """
+        Replace all cached objects by the result of a list request.
+        """
+        res = self.__list_func(self.__namespace, label_selector=self.__label_selector)
+        objects = {obj.metadata.name: obj for obj in res.items}
+        with self.__lock:
+            old_objects = self.__objects
+            self.__objects = objects
+        for name in old_objects.keys() - objects.keys():
+            self.__on_change(old_objects[name], None)
+        for name, obj in objects.items():
+            old = old_objects.get(name)
+            if old is None or old.metadata.resource_version != obj.metadata.resource_version:
+                self.__on_change(old, obj)
+        self.resource_version = res.metadata.resource_version
+        self.lists += 1
+        self.__last_list = time.monotonic()
+        self.__synced.set()
+
+    def watch(self):
+        """
+        Apply changes to the cached objects as they happen, until the watch times out.
+        """
+        self.__watch = self.__watch_factory()
+        stream = self.__watch.stream(self.__list_func, self.__namespace,
+                                     label_selector=self.__label_selector,
+                                     resource_version=self.resource_version,
+                                     timeout_seconds=self.__resync_period,
+                                     allow_watch_bookmarks=True)
+        for event in stream:
+            if self.__stopped.is_set():
+                break
+            self.__handle(event)
+
+    def __handle(self, event: dict):
+        event_type = event['type']
+        obj = event['object']
+        if event_type == 'ERROR':
+            # only happens when the watch is not using a typed list_func
+            raise ApiException(status=obj.get('code'), reason=obj.get('message'))
+        if event_type == 'BOOKMARK':
+            self.resource_version = event['raw_object']['metadata']['resourceVersion']
+            return
+
+        name = obj.metadata.name
+        with self.__lock:
+            old = self.__objects.get(name)
+            if event_type == 'DELETED':
+                self.__objects.pop(name, None)
+            else:
+                self.__objects[name] = obj
+        self.__on_change(old, None if event_type == 'DELETED' else obj)
+        self.resource_version = obj.metadata.resource_version
+        self.events += 1
+        self.__last_event = time.monotonic()
+
+    def stats(self) -> dict:
+        """
+        Staleness metrics: how long ago the cache was last updated, and
+        how many list requests and watch events it took so far.
+        """
+        now = time.monotonic()
+        updates = [t for t in (self.__last_list, self.__last_event) if t is not None]
+        with self.__lock:
+            count = len(self.__objects)
+        return {
+            'synced': self.has_synced(),
+            'objects': count,
+            'resource_version': self.resource_version,
+            'lists': self.lists,
+            'events': self.events,
+            'seconds_since_list': _age(now, self.__last_list),
+            'seconds_since_event': _age(now, self.__last_event),
+            'seconds_since_update': _age(now, max(updates) if updates else None),
+        }
+
+
+class KubernetesInformer:
+    """
+    Cache of the Jobs and Pods in a namespace, indexed by job name.
+
+    :param batch_client: used to list and watch Jobs
+    :param core_client: used to list and watch Pods
+    :param namespace: the ``JOB_NAMESPACE``
+    :param labels: the ``JOB_LABELS``, which are applied to the Jobs and Pods created by pman
+    """
+
+    def __init__(self, batch_client, core_client, namespace: str,
+                 labels: Optional[Dict[str, str]] = None,
+                 watch_factory: Callable[[], watch.Watch] = watch.Watch,
+                 resync_period: int = 300):
+        label_pairs = [f'{k}={v}' for k, v in (labels or {}).items()]
+        self.__pods_by_job: Dict[str, Set[str]] = {}
+        self.__index_lock = threading.Lock()
+        self.__listeners: List[Callable[[str], None]] = []
+
+        self.jobs = Reflector(
+            'jobs', batch_client.list_namespaced_job, namespace,
+            label_selector=','.join(label_pairs) or None,
+            on_change=self.__on_job_change,
+            watch_factory=watch_factory, resync_period=resync_period
+        )
+        self.pods = Reflector(
+            'pods', core_client.list_namespaced_pod, namespace,
+            # pods created by a Job have the label job-name
+            label_selector=','.join(['job-name'] + label_pairs),
+            on_change=self.__on_pod_change,
+            watch_factory=watch_factory, resync_period=resync_period
+        )
+        self.__threads: List[threading.Thread] = []
+
+    def add_listener(self, listener: Callable[[str], None]):
+        """
+        Call ``listener`` with the name of a job whenever the job or one of its pods changes.
+        """
+        self.__listeners.append(listener)
+
+    def start(self):
+        for reflector in (self.jobs, self.pods):
+            t = threading.Thread(target=reflector.run, name=f'informer-{reflector.kind}',
+                                 daemon=True)
+            t.start()
+            self.__threads.append(t)
+
+    def stop(self):
+        self.jobs.stop()
+        self.pods.stop()
+
+    def has_synced(self) -> bool:
+        return self.jobs.has_synced() and self.pods.has_synced()
+
+    def wait_for_sync(self, timeout: Optional[float] = None) -> bool:
+        return self.jobs.wait_for_sync(timeout) and self.pods.wait_for_sync(timeout)
+
+    def get_job(self, name: str) -> Optional[V1Job]:
+        return self.jobs.get(name)
+
+    def get_job_pods(self, name: str) -> List[V1Pod]:
+        with self.__index_lock:
+            pod_names = list(self.__pods_by_job.get(name, ()))
+        pods = (self.pods.get(pod_name) for pod_name in pod_names)
+        return sorted((pod for pod in pods if pod is not None),
+                      key=lambda pod: pod.metadata.name)
+
+    def stats(self) -> dict:
+        return {'jobs': self.jobs.stats(), 'pods': self.pods.stats()}
+
+    def __on_job_change(self, old: Optional[V1Job], new: Optional[V1Job]):
+        self.__notify((new or old).metadata.name)
+
+    def __on_pod_change(self, old: Optional[V1Pod], new: Optional[V1Pod]):
+        pod = new or old
+        job_name = _job_name_of(pod)
+        if job_name is None:
+            return
+        with self.__index_lock:
+            if new is None:
+                pod_names = self.__pods_by_job.get(job_name, set())
+                pod_names.discard(pod.metadata.name)
+                if not pod_names:
+                    self.__pods_by_job.pop(job_name, None)
+            else:
+                self.__pods_by_job.setdefault(job_name, set()).add(pod.metadata.name)
+        self.__notify(job_name)
+
+    def __notify(self, job_name: str):
+        for listener in self.__listeners:
+            listener(job_name)
+
+
+def _job_name_of(pod: V1Pod) -> Optional[str]:
+    labels = pod.metadata.labels or {}
+    return labels.get('job-name')
+
+
+def _age(now: float, t: Optional[float]) -> Optional[float]:
+    return None if t is None else round(now - t, 3)
@@ -3,7 +3,9 @@ Kubernetes cluster manager module that provides functionality to schedule jobs a
 as manage their state in the cluster.
 """
 import json
-from typing import AnyStr, Optional
+import math
+import time
+from typing import AnyStr, Optional, Collection, Dict, Iterator, Iterable, List
 import logging
 
 from kubernetes import client as k_client
@@ -12,11 +14,21 @@ from kubernetes.client import V1Pod
 from kubernetes.client.models.v1_job import V1Job
 from kubernetes.client.models.v1_local_object_reference import V1LocalObjectReference
 from kubernetes.client.rest import ApiException
+from kubernetes.utils import parse_quantity
 from .abstractmgr import (AbstractManager, ManagerException, JobInfo, JobStatus,
-                          TimeStamp, JobName)
+                          TimeStamp, JobName, JobLogs, ResourceCapacity)
+from .logcursor import filter_after, cursor_seconds
+from .kubernetes_informer import KubernetesInformer
+from .longpoll import ChangeNotifier
 
 logger = logging.getLogger(__name__)
 
+LOG_CHUNK_SIZE = 16384
+"""Maximum size of chunks read when streaming logs."""
+
+CLOCK_SKEW_SECONDS = 5
+"""Extra seconds of logs to read with ``since_seconds``, in case pman's clock is ahead."""
+
 
 def str_to_v1_local_object_reference(image_pull_secret: str):
     return V1LocalObjectReference(name=image_pull_secret)
@@ -24,13 +36,31 @@ def str_to_v1_local_object_reference(image_pull_secret: str):
 
 class KubernetesManager(AbstractManager[V1Job]):
 
-    def __init__(self, config_dict=None):
+    def __init__(self, config_dict=None, informer: Optional[KubernetesInformer] = None):
         super().__init__(config_dict)
 
         k_config.load_incluster_config()
         self.kube_client = k_client.CoreV1Api()
         self.kube_v1_batch_client = k_client.BatchV1Api()
 
+        # when the informer is enabled, jobs and pods are read from its cache
+        # instead of the API server (except for cache misses).
+        self.informer = informer
+        if self.informer is None and self.config.get('KUBERNETES_INFORMER'):
+            self.informer = KubernetesInformer(
+                self.kube_v1_batch_client, self.kube_client,
+                namespace=self.config.get('JOB_NAMESPACE'),
+                labels=self.config.get('JOB_LABELS'),
+                resync_period=self.config.get('INFORMER_RESYNC_SECONDS')
+            )
+            self.informer.start()
+        if self.informer is not None:
+            self.change_notifier = ChangeNotifier()
+            self.informer.add_listener(self.change_notifier.notify)
+
+        # list of pods (unless cached) + log of one pod
+        self.log_api_calls = 1 if self.informer is not None else 2
+
     def schedule_job(self, image, command, name, resources_dict, env, uid, gid,
                      mounts_dict) -> V1Job:
         """
@@ -45,6 +75,12 @@ class KubernetesManager(AbstractManager[V1Job]):
         """
         Get a previously scheduled job object.
         """
+        if self.informer is not None and self.informer.has_synced():
+            job = self.informer.get_job(name)
+            if job is not None:
+                return job
+            # cache miss: the job might have been created very recently
+
         job_namespace = self.config.get('JOB_NAMESPACE')
         try:
             job = self.kube_v1_batch_client.read_namespaced_job(name, job_namespace)
@@ -56,20 +92,62 @@ class KubernetesManager(AbstractManager[V1Job]):
     def get_job_logs(self, job: V1Job, tail: int) -> AnyStr:
         # TODO: Think of a better way to abstract out logs in case of multiple pods running parallelly
 
-        logs = ''
-        pods = self.get_job_pods(job.metadata.name)
-        for pod_item in pods.items:
-            pod_name = pod_item.metadata.name
-            logs += self.get_pod_log(pod_name, tail)
+        pods = self.get_job_pods(job.metadata.name).items
+        return self.combine_pod_logs(
+            pods, (self.get_pod_log(pod_item.metadata.name, tail) for pod_item in pods)
+        )
+
+    def combine_pod_logs(self, pods: Iterable[V1Pod], logs: Iterable[str]) -> str:
+        """
+        Concatenate the logs of the pods of a job.
+
+        :param pods: pods of a job
+        :param logs: the log of each pod, which may be produced lazily
+        """
+        combined = ''
+        for pod_item, log in zip(pods, logs):
+            combined += log
 
             # Bad: if job dies to OOMKilled, add the reason of death to the logs,
             # and return immediately.
             term_reason = self.__get_termination_reason(pod_item)
             if term_reason is not None:
                 if term_reason != 'Completed':
-                    logs += f'\n{term_reason}'
-                return logs
-        return logs
+                    combined += f'\n{term_reason}'
+                return combined
+        return combined
+
+    def get_job_logs_since(self, job: V1Job, cursor: Optional[str], tail: int) -> JobLogs:
+        """
+        Get the new log lines of every pod of a job.
+
+        Unlike :meth:`get_job_logs`, the termination reason of pods is not appended.
+        """
+        since_seconds = None
+        if cursor is not None:
+            elapsed = time.time() - cursor_seconds(cursor)
+            since_seconds = max(1, math.ceil(elapsed) + CLOCK_SKEW_SECONDS)
+            tail = None  # every line after the cursor
+        pods = self.get_job_pods(job.metadata.name)
+        logs = []
+        for pod_item in pods.items:
+            log = self.get_pod_log(pod_item.metadata.name, tail, timestamps=True,
+                                   since_seconds=since_seconds)
+            logs.append(log if not log or log.endswith('\n') else log + '\n')
+        return JobLogs(*filter_after((log.encode('utf-8') for log in logs), cursor))
+
+    def stream_job_logs(self, job: V1Job, tail: Optional[int] = None,
+                        follow: bool = False) -> Iterator[bytes]:
+        pods = self.get_job_pods(job.metadata.name)
+        for pod_item in pods.items:
+            yield from self.stream_pod_log(pod_item.metadata.name, tail, follow)
+
+            # same as get_job_logs
+            term_reason = self.__get_termination_reason(pod_item)
+            if term_reason is not None:
+                if term_reason != 'Completed':
+                    yield f'\n{term_reason}'.encode('utf-8')
+                return
 
     @staticmethod
     def __get_termination_reason(pod: V1Pod) -> Optional[str]:
@@ -126,6 +204,89 @@ class KubernetesManager(AbstractManager[V1Job]):
             status=status
         )
 
+    def get_jobs_info(self, names: Collection[JobName]) -> Dict[JobName, JobInfo]:
+        """
+        Get the info of many jobs from the informer cache, or using a single job
+        list request selected by ``JOB_LABELS``.
+
+        Jobs created by older versions of pman do not have the ``JOB_LABELS``,
+        so the jobs which are not found that way are read one by one.
+        """
+        wanted = set(names)
+        if self.informer is not None and self.informer.has_synced():
+            jobs = {name: self.informer.get_job(name) for name in wanted}
+            jobs = {name: job for name, job in jobs.items() if job is not None}
+        else:
+            jobs = {job.metadata.name: job for job in self.__list_jobs()
+                    if job.metadata.name in wanted}
+        jobs.update(self.__read_jobs(wanted - jobs.keys()))
+        return {JobName(name): self.get_job_info(job) for name, job in jobs.items()}
+
+    def list_job_statuses(self) -> Dict[JobName, JobStatus]:
+        """
+        List the jobs with the ``JOB_LABELS`` using a single job list request.
+
+        Jobs created by older versions of pman do not have the ``JOB_LABELS``,
+        but their pods do: they are found by listing pods, and read one by one.
+        """
+        jobs = {job.metadata.name: job for job in self.__list_jobs()}
+        selector = self.__label_selector()
+        if selector is not None:
+            job_namespace = self.config.get('JOB_NAMESPACE')
+            pods = self.__list(self.kube_client.list_namespaced_pod, job_namespace,
+                               label_selector=f'job-name,{selector}')
+            unlabeled = {pod.metadata.labels['job-name'] for pod in pods} - jobs.keys()
+            jobs.update(self.__read_jobs(unlabeled))
+        return {JobName(name): self.get_job_info(job).status for name, job in jobs.items()}
+
+    def get_capacity(self) -> ResourceCapacity:
+        """
+        The total allocatable CPUs, memory and GPUs of the schedulable nodes.
+        """
+        cpu = memory = gpu = 0
+        for node in self.__list(self.kube_client.list_node):
+            if node.spec.unschedulable:
+                continue
+            allocatable = node.status.allocatable or {}
+            cpu += parse_quantity(allocatable.get('cpu', 0))
+            memory += parse_quantity(allocatable.get('memory', 0))
+            gpu += parse_quantity(allocatable.get('nvidia.com/gpu', 0))
+        return {'cpu_limit': int(cpu * 1000), 'memory_limit': int(memory // 2 ** 20),
+                'gpu_limit': int(gpu)}
+
+    def __label_selector(self) -> Optional[str]:
+        labels_config = self.config.get('JOB_LABELS')
+        return ','.join(f'{k}={v}' for k, v in labels_config.items()) if labels_config else None
+
+    def __list_jobs(self) -> List[V1Job]:
+        return self.__list(self.kube_v1_batch_client.list_namespaced_job,
+                           self.config.get('JOB_NAMESPACE'),
+                           label_selector=self.__label_selector())
+
+    def __read_jobs(self, names: Collection[str]) -> Dict[str, V1Job]:
+        """
+        Read jobs one by one, skipping those which do not exist.
+        """
+        jobs = {}
+        for name in names:
+            try:
+                jobs[name] = self.get_job(name)
+            except ManagerException as e:
+                if e.status_code != 404:
+                    raise
+        return jobs
+
+    @staticmethod
+    def __list(list_func, *args, **kwargs) -> list:
+        """
+        Call a list function of the Kubernetes API, and get the listed items.
+        """
+        try:
+            return list_func(*args, **kwargs).items
+        except ApiException as e:
+            status_code = 503 if e.status == 500 else e.status
+            raise ManagerException(str(e), status_code=status_code)
+
     def remove_job(self, job):
         """
         Remove a previously scheduled job.
@@ -260,7 +421,8 @@ class KubernetesManager(AbstractManager[V1Job]):
         job = k_client.V1Job(
             api_version='batch/v1',
             kind='Job',
-            metadata=k_client.V1ObjectMeta(name=name),
+            # job labels are the same as the pod labels, so that get_jobs_info can select by them
+            metadata=k_client.V1ObjectMeta(name=name, labels=labels_config or None),
             spec=spec)
         return job
 
@@ -281,26 +443,64 @@ class KubernetesManager(AbstractManager[V1Job]):
         """
         Returns all the pods created as part of job.
         """
+        if (self.informer is not None and self.informer.has_synced()
+                and self.informer.get_job(name) is not None):
+            return k_client.V1PodList(items=self.informer.get_job_pods(name))
+
         job_namespace = self.config.get('JOB_NAMESPACE')
         return self.kube_client.list_namespaced_pod(job_namespace,
                                                     label_selector='job-name='+name)
 
-    def get_pod_log(self, pod_name: str, tail: int) -> AnyStr:
+    def get_stats(self) -> dict:
+        if self.informer is None:
+            return {}
+        return {'informer': self.informer.stats()}
+
+    def get_pod_log(self, pod_name: str, tail: int, timestamps: bool = False,
+                    since_seconds: Optional[int] = None) -> AnyStr:
         job_namespace = self.config.get('JOB_NAMESPACE')
         try:
             log = self.kube_client.read_namespaced_pod_log(
                 name=pod_name,
                 namespace=job_namespace,
-                tail_lines=tail
+                tail_lines=tail,
+                timestamps=timestamps,
+                since_seconds=since_seconds
             )
         except ApiException as e:
-            if self.__is_container_creating_error(e):
-                log = json.loads(e.body)['message']
-            else:
-                log = 'Error: check pman logs.'
-                logger.error('Exception getting logs for pod="%s": %s', pod_name, str(e))
+            log = self.pod_log_error_message(pod_name, e)
         return log
 
+    def stream_pod_log(self, pod_name: str, tail: Optional[int], follow: bool) -> Iterator[bytes]:
+        """
+        Stream a pod's log as it is received from the API server.
+        """
+        job_namespace = self.config.get('JOB_NAMESPACE')
+        try:
+            res = self.kube_client.read_namespaced_pod_log(
+                name=pod_name,
+                namespace=job_namespace,
+                tail_lines=tail,
+                follow=follow,
+                _preload_content=False
+            )
+        except ApiException as e:
+            yield self.pod_log_error_message(pod_name, e).encode('utf-8')
+            return
+        try:
+            yield from res.stream(LOG_CHUNK_SIZE)
+        finally:
+            res.release_conn()
+
+    def pod_log_error_message(self, pod_name: str, e: ApiException) -> str:
+        """
+        Get the message to show instead of the log of a pod which could not be read.
+        """
+        if self.__is_container_creating_error(e):
+            return json.loads(e.body)['message']
+        logger.error('Exception getting logs for pod="%s": %s', pod_name, str(e))
+        return 'Error: check pman logs.'
+
     @staticmethod
     def __is_container_creating_error(e: ApiException) -> bool:
         return (
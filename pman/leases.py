@@ -0,0 +1,181 @@
+"""
+Leases which elect a single process to do background work, among the worker
+processes of a server or among the replicas of pman.
+
+:class:`FileLease` is an exclusive :func:`fcntl.flock` on a file, for processes
+on the same host. :class:`KubernetesLease` is a ``coordination.k8s.io/v1``
+Lease object, for replicas in a Kubernetes cluster.
+"""
+import fcntl
+import logging
+import os
+import re
+import socket
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def default_identity() -> str:
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+def replica_lease_name(prefix: str = 'pman-controller') -> str:
+    """
+    A name of Lease object for this replica only, after its host name (the name of its pod).
+    """
+    host = re.sub(r'[^a-z0-9.-]+', '-', socket.gethostname().lower()).strip('-.')
+    return f'{prefix}-{host}'[:253].rstrip('-.')
+
+
+class FileLease:
+    """
+    An exclusive lock on a file, released by the operating system when its holder exits.
+
+    :param path: path of the lock file, created if it does not exist
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.__file = None
+
+    @property
+    def held(self) -> bool:
+        return self.__file is not None
+
+    def try_acquire(self) -> bool:
+        """
+        Take the lease if no other process holds it, or keep it.
+
+        :return: whether this process holds the lease
+        """
+        if self.__file is not None:
+            return True
+        f = open(self.path, 'a')
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return False
+        self.__file = f
+        return True
+
+    def release(self):
+        if self.__file is not None:
+            # closing the file releases the lock
+            self.__file.close()
+            self.__file = None
+
+
+class KubernetesLease:
+    """
+    A Lease object, which is held by the replica which renewed it less than
+    ``duration`` seconds ago. Concurrent updates are rejected by the API server,
+    because they are made with the ``resourceVersion`` which was read.
+
+    :param name: name of the Lease object
+    :param namespace: namespace of the Lease object
+    :param identity: identity of this replica, by default its host name and PID
+    :param duration: seconds after its last renewal when the lease may be taken by another replica
+    """
+
+    def __init__(self, name: str, namespace: str, identity: Optional[str] = None,
+                 duration: int = 15):
+        from kubernetes import client, config as k_config
+        from kubernetes.config import ConfigException
+
+        try:
+            k_config.load_incluster_config()
+        except ConfigException:
+            k_config.load_kube_config()
+        self.__client = client
+        self.__api = client.CoordinationV1Api()
+        self.name = name
+        self.namespace = namespace
+        self.identity = identity or default_identity()
+        self.duration = duration
+        self.__held = False
+
+    @property
+    def held(self) -> bool:
+        return self.__held
+
+    def try_acquire(self) -> bool:
+        """
+        Take the lease if it is free or expired, or renew it.
+
+        :return: whether this replica holds the lease
+        """
+        from kubernetes.client.rest import ApiException
+
+        now = datetime.now(timezone.utc)
+        try:
+            lease = self.__api.read_namespaced_lease(self.name, self.namespace)
+        except ApiException as e:
+            if e.status != 404:
+                raise
+            self.__held = self.__create(now)
+            return self.__held
+        spec = lease.spec
+        if spec.holder_identity != self.identity and not _expired(spec, now):
+            self.__held = False
+            return False
+        if spec.holder_identity != self.identity:
+            logger.info(f'Taking the lease {self.name} from {spec.holder_identity}')
+            spec.lease_transitions = (spec.lease_transitions or 0) + 1
+            spec.acquire_time = now
+        spec.holder_identity = self.identity
+        spec.lease_duration_seconds = self.duration
+        spec.renew_time = now
+        try:
+            self.__api.replace_namespaced_lease(self.name, self.namespace, lease)
+        except ApiException as e:
+            if e.status != 409:
+                raise
+            # updated by another replica since it was read
+            self.__held = False
+            return False
+        self.__held = True
+        return True
+
+    def __create(self, now: datetime) -> bool:
+        from kubernetes.client.rest import ApiException
+
+        client = self.__client
+        body = client.V1Lease(
+            metadata=client.V1ObjectMeta(name=self.name, namespace=self.namespace),
+            spec=client.V1LeaseSpec(holder_identity=self.identity,
+                                    lease_duration_seconds=self.duration,
+                                    acquire_time=now, renew_time=now, lease_transitions=0)
+        )
+        try:
+            self.__api.create_namespaced_lease(self.namespace, body)
+        except ApiException as e:
+            if e.status != 409:
+                raise
+            return False
+        return True
+
+    def release(self):
+        """
+        Give up the lease, so that another replica can take it without waiting for it to expire.
+        """
+        if not self.__held:
+            return
+        self.__held = False
+        from kubernetes.client.rest import ApiException
+        try:
+            lease = self.__api.read_namespaced_lease(self.name, self.namespace)
+            if lease.spec.holder_identity == self.identity:
+                lease.spec.holder_identity = None
+                self.__api.replace_namespaced_lease(self.name, self.namespace, lease)
+        except ApiException as e:
+            logger.warning(f'Could not release the lease {self.name}: {str(e)}')
+
+
+def _expired(spec, now: datetime) -> bool:
+    if not spec.holder_identity or spec.renew_time is None:
+        return True
+    duration = timedelta(seconds=spec.lease_duration_seconds or 0)
+    return spec.renew_time + duration < now
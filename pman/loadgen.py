@@ -0,0 +1,314 @@
+"""
+Load generator which drives a running pman like CUBE does::
+
+    pman-loadgen http://localhost:5010 --clients 50 --ramp 30 --duration 300
+
+Every virtual client submits a burst of jobs of the plugin types ``ds``, ``fs``
+and ``ts``, polls each job until it is finished, deletes it, and starts again.
+Clients are started one after the other over ``--ramp`` seconds.
+
+Requests can be recorded (``--record``) as JSON Lines, one request per line::
+
+    {"t": 1.25, "method": "POST", "path": "/api/v1/", "json": {...}}
+
+where ``t`` is seconds since the start, and replayed with the same timing
+(``--replay``, faster with ``--speed``).
+
+Throughput, error rate and latency percentiles are reported by kind of request.
+Pair with ``CONTAINER_ENV=simulated`` to load-test without running containers.
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, TextIO
+
+import requests
+
+FINISHED = frozenset(('finishedSuccessfully', 'finishedWithError', 'undefined'))
+
+
+class Stats:
+    """
+    Latencies and errors of requests, by kind of request.
+    """
+
+    def __init__(self):
+        self.__latencies: Dict[str, List[float]] = defaultdict(list)
+        self.__errors: Dict[str, int] = defaultdict(int)
+        self.__lock = threading.Lock()
+
+    def record(self, kind: str, latency: float, ok: bool):
+        with self.__lock:
+            self.__latencies[kind].append(latency)
+            if not ok:
+                self.__errors[kind] += 1
+
+    def summary(self, elapsed: float) -> dict:
+        with self.__lock:
+            kinds = {kind: self.__summarize(latencies, self.__errors[kind], elapsed)
+                     for kind, latencies in sorted(self.__latencies.items())}
+            everything = [latency for latencies in self.__latencies.values()
+                          for latency in latencies]
+            total = self.__summarize(everything, sum(self.__errors.values()), elapsed)
+        return {'elapsed': round(elapsed, 3), 'total': total, 'by_kind': kinds}
+
+    @staticmethod
+    def __summarize(latencies: List[float], errors: int, elapsed: float) -> dict:
+        n = len(latencies)
+        summary = {
+            'requests': n,
+            'errors': errors,
+            'error_rate': round(errors / n, 4) if n else 0.0,
+            'throughput': round(n / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+        if n >= 2:
+            percentiles = statistics.quantiles(latencies, n=100)
+            summary.update({f'p{p}_ms': round(percentiles[p - 1] * 1000, 2) for p in (50, 95, 99)})
+        elif n == 1:
+            summary.update({f'p{p}_ms': round(latencies[0] * 1000, 2) for p in (50, 95, 99)})
+        return summary
+
+
+class Recorder:
+    """
+    Writes requests as JSON Lines, for :func:`replay`.
+    """
+
+    def __init__(self, f: TextIO, start: float):
+        self.__f = f
+        self.__start = start
+        self.__lock = threading.Lock()
+
+    def write(self, method: str, path: str, body: Optional[dict]):
+        line = {'t': round(time.monotonic() - self.__start, 4), 'method': method, 'path': path}
+        if body is not None:
+            line['json'] = body
+        with self.__lock:
+            self.__f.write(json.dumps(line) + '\n')
+
+
+class Client:
+    """
+    Makes requests to pman, measuring them.
+    """
+
+    def __init__(self, url: str, stats: Stats, timeout: float,
+                 recorder: Optional[Recorder] = None):
+        self.url = url.rstrip('/')
+        self.stats = stats
+        self.timeout = timeout
+        self.recorder = recorder
+        self.__local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        # a session (and its connections) per thread
+        session = getattr(self.__local, 'session', None)
+        if session is None:
+            session = self.__local.session = requests.Session()
+        return session
+
+    def request(self, kind: str, method: str, path: str,
+                body: Optional[dict] = None) -> Optional[requests.Response]:
+        """
+        :param kind: label of the request in the report
+        :return: the response, or ``None`` if the request failed without a response
+        """
+        if self.recorder is not None:
+            self.recorder.write(method, path, body)
+        start = time.perf_counter()
+        try:
+            res = self.session.request(method, self.url + path, json=body, timeout=self.timeout)
+        except requests.RequestException:
+            self.stats.record(kind, time.perf_counter() - start, ok=False)
+            return None
+        self.stats.record(kind, time.perf_counter() - start, ok=res.status_code < 400)
+        return res
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """
+    Parse weights of plugin types, e.g. ``ds=0.7,fs=0.2,ts=0.1``.
+    """
+    mix = {}
+    for item in value.split(','):
+        plugin_type, _, weight = item.partition('=')
+        if plugin_type not in ('ds', 'fs', 'ts'):
+            raise argparse.ArgumentTypeError(f'unknown plugin type: {plugin_type}')
+        try:
+            mix[plugin_type] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f'invalid weight: {item}')
+    return mix
+
+
+def make_job(jid: str, plugin_type: str) -> dict:
+    """
+    The body of ``POST /api/v1/`` sent by CUBE for a plugin instance.
+    """
+    job = {
+        'jid': jid,
+        'args': ['--saveinputmeta', '--saveoutputmeta'],
+        'auid': 'loadgen',
+        'number_of_workers': 1,
+        'cpu_limit': 1000,
+        'memory_limit': 300,
+        'gpu_limit': 0,
+        'image': f'fnndsc/pl-simple{plugin_type}app',
+        'entrypoint': [f'simple{plugin_type}app'],
+        'type': plugin_type,
+        'input_dir': f'home/loadgen/feeds/{jid}/incoming',
+        'output_dir': f'home/loadgen/feeds/{jid}/outgoing',
+    }
+    if plugin_type == 'ts':
+        job['args'] += ['--plugininstances', 'home/loadgen/feeds/a,home/loadgen/feeds/b']
+        job['args_path_flags'] = ['--plugininstances']
+    return job
+
+
+def run_virtual_client(client: Client, opts: argparse.Namespace, rng: random.Random,
+                       stop_at: float):
+    """
+    Submit bursts of jobs, poll them until they are finished and delete them,
+    until ``stop_at``.
+    """
+    types, weights = zip(*opts.mix.items())
+    while time.monotonic() < stop_at:
+        pending = []
+        for _ in range(opts.burst):
+            jid = f'{opts.prefix}-{uuid.uuid4().hex[:12]}'
+            res = client.request('POST', 'POST', '/api/v1/',
+                                 make_job(jid, rng.choices(types, weights)[0]))
+            if res is not None and res.status_code in (201, 202):
+                pending.append(jid)
+        query = '' if opts.poll_logs else '?logs=false'
+        while pending and time.monotonic() < stop_at:
+            time.sleep(opts.poll_interval * rng.uniform(0.5, 1.5))
+            for jid in list(pending):
+                res = client.request('GET', 'GET', f'/api/v1/{jid}/{query}')
+                if res is None:
+                    continue
+                if res.status_code == 404:
+                    pending.remove(jid)
+                elif res.status_code == 200 and res.json().get('status') in FINISHED:
+                    client.request('DELETE', 'DELETE', f'/api/v1/{jid}/')
+                    pending.remove(jid)
+        time.sleep(opts.think_time * rng.uniform(0.5, 1.5))
+
+
+def generate(client: Client, opts: argparse.Namespace) -> float:
+    """
+    Run ``opts.clients`` virtual clients for ``opts.duration`` seconds.
+
+    :return: the elapsed seconds
+    """
+    start = time.monotonic()
+    stop_at = start + opts.duration
+    rng = random.Random(opts.seed)
+    threads = []
+    for i in range(opts.clients):
+        delay = start + opts.ramp * i / opts.clients - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        if time.monotonic() >= stop_at:
+            break
+        thread = threading.Thread(target=run_virtual_client, name=f'loadgen-{i}', daemon=True,
+                                  args=(client, opts, random.Random(rng.random()), stop_at))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    return time.monotonic() - start
+
+
+def replay(client: Client, f: TextIO, opts: argparse.Namespace) -> float:
+    """
+    Make the requests recorded in a JSON Lines file, at the recorded times
+    divided by ``opts.speed``, by up to ``opts.clients`` concurrent requests.
+
+    :return: the elapsed seconds
+    """
+    events = sorted((json.loads(line) for line in f if line.strip()), key=lambda e: e['t'])
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=opts.clients) as executor:
+        for event in events:
+            delay = start + event['t'] / opts.speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            method = event['method'].upper()
+            executor.submit(client.request, method, method, event['path'],
+                            event.get('json', event.get('body')))
+    return time.monotonic() - start
+
+
+def print_report(summary: dict, out: TextIO = sys.stdout):
+    print(f'{summary["elapsed"]:.1f}s', file=out)
+    rows = [*summary['by_kind'].items(), ('total', summary['total'])]
+    for kind, s in rows:
+        latency = '  '.join(f'{p} {s[f"{p}_ms"]:8.1f}ms' for p in ('p50', 'p95', 'p99')
+                            if f'{p}_ms' in s)
+        print(f'{kind:>8}: {s["requests"]:7d} requests  {s["throughput"]:8.1f}/s  '
+              f'errors {s["error_rate"] * 100:5.1f}%  {latency}', file=out)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog='pman-loadgen',
+                                     description='Drive a running pman like CUBE does')
+    parser.add_argument('url', help='URL of pman, e.g. http://localhost:5010')
+    parser.add_argument('--clients', type=int, default=10,
+                        help='number of concurrent virtual clients (default: 10)')
+    parser.add_argument('--ramp', type=float, default=0.0,
+                        help='seconds over which clients are started (default: 0)')
+    parser.add_argument('--duration', type=float, default=60.0,
+                        help='seconds of load (default: 60)')
+    parser.add_argument('--burst', type=int, default=5,
+                        help='jobs submitted at once by a client (default: 5)')
+    parser.add_argument('--mix', type=parse_mix, default={'ds': 0.7, 'fs': 0.2, 'ts': 0.1},
+                        help='weights of plugin types (default: ds=0.7,fs=0.2,ts=0.1)')
+    parser.add_argument('--poll-interval', type=float, default=5.0,
+                        help='mean seconds between polls of a job (default: 5)')
+    parser.add_argument('--no-logs', dest='poll_logs', action='store_false',
+                        help='poll the status of jobs without their logs')
+    parser.add_argument('--think-time', type=float, default=1.0,
+                        help='mean seconds between bursts of a client (default: 1)')
+    parser.add_argument('--prefix', default='loadgen', help='prefix of job IDs')
+    parser.add_argument('--seed', type=int, default=None, help='seed of random choices')
+    parser.add_argument('--timeout', type=float, default=30.0,
+                        help='seconds before a request fails (default: 30)')
+    parser.add_argument('--record', metavar='FILE', help='record the requests to a JSONL file')
+    parser.add_argument('--replay', metavar='FILE', help='replay the requests of a JSONL file')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='speed of replay relative to the recording (default: 1)')
+    parser.add_argument('--output', metavar='FILE', help='write the report as JSON')
+    opts = parser.parse_args(argv)
+
+    stats = Stats()
+    record_file = open(opts.record, 'w') if opts.record else None
+    try:
+        recorder = Recorder(record_file, time.monotonic()) if record_file else None
+        client = Client(opts.url, stats, opts.timeout, recorder)
+        if opts.replay:
+            with open(opts.replay) as f:
+                elapsed = replay(client, f, opts)
+        else:
+            elapsed = generate(client, opts)
+    finally:
+        if record_file is not None:
+            record_file.close()
+
+    summary = stats.summary(elapsed)
+    print_report(summary)
+    if opts.output:
+        with open(opts.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
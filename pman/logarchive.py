@@ -0,0 +1,308 @@
+"""
+An archive of the logs of finished jobs (``LOG_ARCHIVE``), so that their logs
+are kept after the job is removed from the backend, and served without
+calling the backend.
+
+The full logs of a job are written to a file in ``LOG_ARCHIVE_DIR`` or, with
+``STORAGE_TYPE=host``, next to its output directory (e.g.
+``{STOREBASE}/key-chris-jid-1/chris-jid-1.log.gz`` for the output directory
+``key-chris-jid-1/outgoing``). With other storage types, the output directories
+are not accessible to pman, so ``LOG_ARCHIVE_DIR`` is required.
+
+The file is a gzip file (which ``zcat`` reads) made of independently compressed
+blocks of about ``block_size`` bytes of logs, which end at a line break. The
+position and number of lines of every block are written to a small index
+(``.idx``) next to it, so that the tail of the logs is read by decompressing
+only the last blocks, however long the logs are.
+
+A :class:`LogArchiver` runs in every process, but only the one holding a
+:class:`pman.leases.FileLease` archives the logs of the jobs which finished.
+With ``CONTROLLER=yes``, they are archived by ``pman controller`` instead.
+"""
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import BinaryIO, Callable, Iterable, Iterator, List, Optional
+
+from .abstractmgr import AbstractManager, JobName
+from .admission import FINISHED
+from .leases import FileLease
+from .statedb import StateDB
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS log_archive (
+    jid TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    archived REAL,
+    size INTEGER,
+    compressed_size INTEGER
+);
+"""
+
+BLOCK_SIZE = 1 << 20
+"""Bytes of logs per compressed block."""
+
+
+@dataclass(frozen=True)
+class Block:
+    offset: int
+    """Position of the compressed block in the file."""
+    length: int
+    """Size of the compressed block."""
+    size: int
+    """Bytes of logs in the block."""
+    lines: int
+    """Line breaks in the block."""
+
+
+def index_path(path: str) -> str:
+    return path + '.idx'
+
+
+def write_archive(path: str, chunks: Iterable[bytes], block_size: int = BLOCK_SIZE) -> List[Block]:
+    """
+    Compress logs to an archive file and its index. Both files are replaced
+    once they are completely written.
+
+    :return: the blocks of the archive
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    # the same logs may be archived by two processes at once, e.g. while a job is deleted
+    tmp = f'.{os.getpid()}-{threading.get_ident()}.tmp'
+    blocks: List[Block] = []
+    with open(path + tmp, 'wb') as f:
+        pending = bytearray()
+        for chunk in chunks:
+            pending += chunk
+            while len(pending) >= block_size:
+                end = pending.rfind(b'\n', 0, block_size) + 1 or block_size
+                blocks.append(_write_block(f, bytes(pending[:end])))
+                del pending[:end]
+        if pending or not blocks:
+            blocks.append(_write_block(f, bytes(pending)))
+    with open(index_path(path) + tmp, 'w') as f:
+        json.dump({'blocks': [[b.offset, b.length, b.size, b.lines] for b in blocks]}, f)
+    os.replace(path + tmp, path)
+    os.replace(index_path(path) + tmp, index_path(path))
+    return blocks
+
+
+def read_index(path: str) -> Optional[List[Block]]:
+    """
+    The blocks of an archive, or ``None`` if it does not exist.
+    """
+    try:
+        with open(index_path(path)) as f:
+            index = json.load(f)
+    except FileNotFoundError:
+        return None
+    return [Block(*b) for b in index['blocks']]
+
+
+def read_archive(path: str, tail: Optional[int] = None) -> Optional[Iterator[bytes]]:
+    """
+    Read the logs of an archive.
+
+    :param tail: how many lines to read from the end of the logs, or ``None`` for all logs
+    :return: the logs, block by block, or ``None`` if the archive does not exist
+    """
+    blocks = read_index(path)
+    if blocks is None:
+        return None
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    if tail is None:
+        return _read_blocks(f, blocks)
+    return _read_tail(f, blocks, tail)
+
+
+def _write_block(f: BinaryIO, data: bytes) -> Block:
+    offset = f.tell()
+    f.write(gzip.compress(data, mtime=0))
+    return Block(offset=offset, length=f.tell() - offset, size=len(data),
+                 lines=data.count(b'\n'))
+
+
+def _read_block(f: BinaryIO, block: Block) -> bytes:
+    f.seek(block.offset)
+    return gzip.decompress(f.read(block.length))
+
+
+def _read_blocks(f: BinaryIO, blocks: List[Block]) -> Iterator[bytes]:
+    with f:
+        for block in blocks:
+            yield _read_block(f, block)
+
+
+def _read_tail(f: BinaryIO, blocks: List[Block], tail: int) -> Iterator[bytes]:
+    with f:
+        if tail <= 0:
+            return
+        # the last line may not end with a line break, so one more is needed
+        first, lines = len(blocks), 0
+        while first > 0 and lines <= tail:
+            first -= 1
+            lines += blocks[first].lines
+        data = b''.join(_read_block(f, block) for block in blocks[first:])
+        yield b''.join(data.splitlines(keepends=True)[-tail:])
+
+
+class LogArchive:
+    """
+    The archives of the logs of jobs, and where they are, shared by every
+    process using the same database.
+
+    :param path: path of the SQLite database file
+    :param directory: directory of the archives, by default next to the output directory of jobs
+    :param block_size: bytes of logs per compressed block
+    :param clock: function which returns the current time, for tests
+    """
+
+    def __init__(self, path: str, directory: Optional[str] = None,
+                 block_size: int = BLOCK_SIZE, clock: Callable[[], float] = time.time):
+        self.__db = StateDB(path, _SCHEMA)
+        self.directory = directory
+        self.block_size = block_size
+        self.clock = clock
+
+    def register(self, jid: JobName, outputdir_source: Optional[str] = None):
+        """
+        Decide where the logs of a new job are archived, forgetting the
+        archive of a previous job with the same name.
+
+        :param outputdir_source: output directory of the job, as mounted by its container,
+                                 if it is accessible to pman
+        """
+        if self.directory is not None:
+            path = os.path.join(self.directory, f'{jid}.log.gz')
+        elif outputdir_source:
+            path = os.path.join(os.path.dirname(outputdir_source.rstrip('/')), f'{jid}.log.gz')
+        else:
+            return
+        self.__db.connect().execute(
+            'INSERT OR REPLACE INTO log_archive (jid, path) VALUES (?, ?)', (jid, path)
+        )
+
+    def unarchived(self, jids: Iterable[JobName]) -> List[JobName]:
+        """
+        The jobs which were registered and whose logs were not archived yet.
+        """
+        rows = self.__db.select_in(
+            'SELECT jid FROM log_archive WHERE archived IS NULL AND jid IN ({})', jids
+        )
+        return [JobName(row['jid']) for row in rows]
+
+    def write(self, jid: JobName, chunks: Iterable[bytes]) -> bool:
+        """
+        Archive the logs of a job.
+
+        :return: whether the job was registered
+        """
+        path = self.__path(jid, archived=False)
+        if path is None:
+            return False
+        blocks = write_archive(path, chunks, self.block_size)
+        self.__db.connect().execute(
+            'UPDATE log_archive SET archived = ?, size = ?, compressed_size = ? WHERE jid = ?',
+            (self.clock(), sum(b.size for b in blocks), sum(b.length for b in blocks), jid)
+        )
+        return True
+
+    def read(self, jid: JobName, tail: Optional[int] = None) -> Optional[Iterator[bytes]]:
+        """
+        Read the archived logs of a job, see :func:`read_archive`.
+
+        :return: the logs, or ``None`` if they were not archived or the archive was deleted
+        """
+        path = self.__path(jid, archived=True)
+        return None if path is None else read_archive(path, tail)
+
+    def stats(self) -> dict:
+        row = self.__db.connect().execute(
+            'SELECT COUNT(*) AS jobs, COALESCE(SUM(size), 0) AS size, '
+            'COALESCE(SUM(compressed_size), 0) AS compressed_size '
+            'FROM log_archive WHERE archived IS NOT NULL'
+        ).fetchone()
+        return {'jobs': row['jobs'], 'size': row['size'],
+                'compressed_size': row['compressed_size']}
+
+    def __path(self, jid: JobName, archived: bool) -> Optional[str]:
+        row = self.__db.connect().execute(
+            'SELECT path FROM log_archive WHERE jid = ? AND archived IS '
+            + ('NOT NULL' if archived else 'NULL'), (jid,)
+        ).fetchone()
+        return None if row is None else row['path']
+
+
+class LogArchiver:
+    """
+    Archives the logs of the jobs which finished, if this process holds the lease.
+
+    :param archive: the archive
+    :param compute_mgr: the compute backend
+    :param lease: the lease which elects the archiving process
+    :param interval: seconds between looking for finished jobs, and between attempts
+                     to take the lease
+    """
+
+    def __init__(self, archive: LogArchive, compute_mgr: AbstractManager, lease: FileLease,
+                 interval: float = 30.0):
+        self.archive = archive
+        self.lease = lease
+        self.interval = interval
+        self.__compute_mgr = compute_mgr
+        self.__stopped = threading.Event()
+        self.__thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.run, name='log-archiver', daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__stopped.set()
+        if self.__thread is not None:
+            self.__thread.join()
+        self.lease.release()
+
+    def run(self):
+        while not self.__stopped.is_set():
+            try:
+                if self.lease.try_acquire():
+                    self.archive_finished()
+            except NotImplementedError as e:
+                logger.error('The logs of jobs cannot be archived: %s', str(e))
+                self.lease.release()
+                return
+            except Exception as e:
+                logger.exception('Error archiving logs: %s', str(e))
+            self.__stopped.wait(self.interval)
+
+    def archive_finished(self) -> int:
+        """
+        Archive the logs of the jobs of the backend which finished since the last call.
+
+        :return: number of archived jobs
+        """
+        statuses = self.__compute_mgr.list_job_statuses()
+        finished = [jid for jid, status in statuses.items() if status in FINISHED]
+        archived = 0
+        for jid in self.archive.unarchived(finished):
+            if self.__stopped.is_set():
+                break
+            try:
+                job = self.__compute_mgr.get_job(jid)
+                self.archive.write(jid, self.__compute_mgr.stream_job_logs(job))
+            except Exception as e:
+                logger.exception(f'Error archiving the logs of job {jid}: {str(e)}')
+                continue
+            logger.info(f'Archived the logs of job {jid}')
+            archived += 1
+        return archived
@@ -0,0 +1,86 @@
+"""
+Cursors for fetching only the logs which a client has not seen yet.
+
+A cursor is an opaque string for clients. Internally, it is the time of the
+last log line which was sent, in nanoseconds since the epoch. Logs are read
+from the backend with timestamps, and lines which are not after the cursor
+are dropped.
+"""
+import base64
+import binascii
+import re
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional, Tuple
+
+_PREFIX = 'ts:'
+
+_TIMESTAMP_RE = re.compile(
+    rb'^(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})(?:\.(\d{1,9}))?(Z|[+-]\d{2}:\d{2}) ?'
+)
+
+
+def encode_cursor(nanos: int) -> str:
+    return base64.urlsafe_b64encode(f'{_PREFIX}{nanos}'.encode('ascii')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> int:
+    """
+    :return: the time of the cursor in nanoseconds since the epoch
+    :raises ValueError: if the cursor was not created by :func:`encode_cursor`
+    """
+    try:
+        value = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('ascii')
+    except (binascii.Error, UnicodeError):
+        raise ValueError(f'Invalid cursor: {cursor}')
+    if not value.startswith(_PREFIX) or not value[len(_PREFIX):].isdigit():
+        raise ValueError(f'Invalid cursor: {cursor}')
+    return int(value[len(_PREFIX):])
+
+
+def cursor_seconds(cursor: str) -> float:
+    """
+    Get the time of a cursor in seconds since the epoch, rounded down to the microsecond.
+    """
+    return (decode_cursor(cursor) // 1000) / 1_000_000
+
+
+def split_timestamp(line: bytes) -> Tuple[Optional[int], bytes]:
+    """
+    Split a log line which starts with an RFC 3339 timestamp, as produced by
+    Docker and Kubernetes with ``timestamps=True``.
+
+    :return: the time in nanoseconds since the epoch (or ``None`` if the line
+             does not start with a timestamp) and the rest of the line
+    """
+    m = _TIMESTAMP_RE.match(line)
+    if m is None:
+        return None, line
+    seconds, fraction, zone = m.groups()
+    tz = timezone.utc if zone == b'Z' else datetime.strptime(zone.decode(), '%z').tzinfo
+    dt = datetime.strptime(seconds.decode(), '%Y-%m-%dT%H:%M:%S').replace(tzinfo=tz)
+    nanos = int(dt.timestamp()) * 1_000_000_000 + int((fraction or b'0').ljust(9, b'0'))
+    return nanos, line[m.end():]
+
+
+def filter_after(logs: Iterable[bytes], cursor: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    """
+    Remove the timestamps from log lines and drop the lines which are not after the cursor.
+
+    :param logs: chunks of timestamped logs
+    :param cursor: the cursor from the previous call, or ``None`` to keep all lines
+    :return: the new log lines and the cursor to use next time
+    """
+    after = decode_cursor(cursor) if cursor else None
+    last = after
+    lines: List[bytes] = []
+    for line in b''.join(logs).splitlines(keepends=True):
+        nanos, text = split_timestamp(line)
+        if nanos is None:
+            lines.append(text)
+            continue
+        if after is not None and nanos <= after:
+            continue
+        lines.append(text)
+        last = nanos if last is None else max(last, nanos)
+    next_cursor = None if last is None else encode_cursor(last)
+    return b''.join(lines), next_cursor
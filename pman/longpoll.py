@@ -0,0 +1,172 @@
+"""
+Long-polling of job status: wait until the status of a job differs from
+the status last seen by the client.
+
+Backends which watch the compute cluster (the Docker events cache, the
+Kubernetes informer) wake up waiting requests through a
+:class:`ChangeNotifier`. Other backends are polled with a backoff.
+"""
+import asyncio
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from .abstractmgr import JobInfo, JobStatus
+
+
+class ChangeNotifier:
+    """
+    Wakes up the threads which wait for changes to a job.
+
+    To not miss changes, :meth:`subscribe` to a job *before* reading its
+    state, then wait for it to change::
+
+        with notifier.subscribe(name) as subscription:
+            info = read_job(name)
+            subscription.wait(timeout)
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        # versions are only counted for the jobs which someone is subscribed to
+        self._versions: Dict[str, int] = {}
+        self._subscribers: Dict[str, int] = {}
+        self.__listeners: List[Callable[[str], None]] = []
+
+    def add_listener(self, listener: Callable[[str], None]):
+        """
+        Call ``listener`` with the name of every job which changes.
+        """
+        self.__listeners.append(listener)
+
+    def subscribe(self, name: str) -> 'Subscription':
+        return Subscription(self, name)
+
+    def notify(self, name: str):
+        with self._cond:
+            if name in self._subscribers:
+                self._versions[name] += 1
+                self._cond.notify_all()
+        for listener in self.__listeners:
+            listener(name)
+
+    def waiting(self) -> int:
+        """
+        Number of subscriptions.
+        """
+        with self._cond:
+            return sum(self._subscribers.values())
+
+
+class Subscription:
+    """
+    Changes of a job since the subscription was created, or since the last :meth:`wait`.
+    """
+
+    def __init__(self, notifier: ChangeNotifier, name: str):
+        self.__notifier = notifier
+        self.__name = name
+        with notifier._cond:
+            notifier._subscribers[name] = notifier._subscribers.get(name, 0) + 1
+            notifier._versions.setdefault(name, 0)
+            self.__version = notifier._versions[name]
+
+    def wait(self, timeout: float) -> bool:
+        """
+        :return: ``True`` if the job changed, ``False`` if the timeout expired
+        """
+        n = self.__notifier
+        with n._cond:
+            changed = n._cond.wait_for(lambda: n._versions[self.__name] != self.__version,
+                                       timeout)
+            self.__version = n._versions[self.__name]
+            return changed
+
+    def close(self):
+        n = self.__notifier
+        with n._cond:
+            n._subscribers[self.__name] -= 1
+            if n._subscribers[self.__name] == 0:
+                del n._subscribers[self.__name]
+                del n._versions[self.__name]
+
+    def __enter__(self) -> 'Subscription':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def wait_for_status_change(get_info: Callable[[], JobInfo], name: str,
+                           last_seen: Optional[JobStatus], timeout: float,
+                           notifier: Optional[ChangeNotifier] = None,
+                           min_interval: float = 0.5, max_interval: float = 10.0) -> JobInfo:
+    """
+    Wait until the status of a job is different from ``last_seen``.
+
+    :param get_info: reads the current state of the job
+    :param name: name of the job
+    :param last_seen: status last seen by the client, or ``None`` to wait
+                      for the status to change from what it is now
+    :param timeout: maximum number of seconds to wait
+    :param notifier: wakes up the wait when the job changes. Without it, the job
+                     is read again after ``min_interval`` seconds, doubling
+                     the interval each time up to ``max_interval`` seconds.
+                     With it, the job is still read again every ``max_interval``
+                     seconds in case a change was missed.
+    :return: the state of the job when it changed, or when the timeout expired
+    """
+    if notifier is None:
+        return _poll(get_info, last_seen, timeout, min_interval, max_interval)
+    deadline = time.monotonic() + timeout
+    with notifier.subscribe(name) as subscription:
+        while True:
+            info = get_info()
+            if last_seen is None:
+                last_seen = info.status
+            elif info.status != last_seen:
+                return info
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return info
+            subscription.wait(min(remaining, max_interval))
+
+
+def _poll(get_info: Callable[[], JobInfo], last_seen: Optional[JobStatus], timeout: float,
+          min_interval: float, max_interval: float) -> JobInfo:
+    deadline = time.monotonic() + timeout
+    interval = min_interval
+    while True:
+        info = get_info()
+        if last_seen is None:
+            last_seen = info.status
+        elif info.status != last_seen:
+            return info
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return info
+        time.sleep(min(remaining, interval))
+        interval = min(interval * 2, max_interval)
+
+
+async def async_wait_for_status_change(get_info: Callable[[], Awaitable[JobInfo]],
+                                       last_seen: Optional[JobStatus], timeout: float,
+                                       min_interval: float = 0.5,
+                                       max_interval: float = 10.0) -> JobInfo:
+    """
+    Same as :func:`wait_for_status_change` without a notifier, for the ASGI app.
+    Waiting does not occupy a thread.
+    """
+    deadline = time.monotonic() + timeout
+    interval = min_interval
+    while True:
+        info = await get_info()
+        if last_seen is None:
+            last_seen = info.status
+        elif info.status != last_seen:
+            return info
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return info
+        await asyncio.sleep(min(remaining, interval))
+        interval = min(interval * 2, max_interval)
@@ -0,0 +1,204 @@
+"""
+Prometheus metrics, exposed by ``GET /metrics``.
+
+Calls to the compute manager are measured by wrapping the methods of the
+manager instance (:func:`instrument_manager`), so that every backend is covered.
+
+With gunicorn, set ``PROMETHEUS_MULTIPROC_DIR`` so that every worker process
+writes its metrics to files in that directory, which are aggregated when
+metrics are scraped. See :mod:`pman.gunicorn_conf`. The directory is created
+if it does not exist, so that other processes, e.g. ``pman controller``, can
+run with the same environment.
+"""
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+from typing import Callable, Collection, Dict, Iterable, Iterator, Optional, Tuple
+
+from prometheus_client import (CollectorRegistry, Counter, Histogram, REGISTRY,
+                               CONTENT_TYPE_LATEST, generate_latest, multiprocess)
+from prometheus_client.core import GaugeMetricFamily
+
+from .abstractmgr import AbstractManager, ManagerException, JobName, JobStatus
+
+logger = logging.getLogger(__name__)
+
+
+def ensure_multiproc_dir():
+    """
+    Create the directory of ``PROMETHEUS_MULTIPROC_DIR``, to which the metrics
+    are written, if it is set.
+    """
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        os.makedirs(path, exist_ok=True)
+
+
+ensure_multiproc_dir()
+
+BACKEND_METHODS = ('schedule_job', 'get_job', 'get_job_info', 'get_job_logs', 'remove_job',
+                   'get_job_logs_since', 'get_jobs_info', 'list_job_statuses')
+"""Methods of :class:`AbstractManager` which are measured."""
+
+BACKEND_CALLS = Counter(
+    'pman_backend_calls_total', 'Calls to the compute manager',
+    ['backend', 'method', 'outcome']
+)
+BACKEND_LATENCY = Histogram(
+    'pman_backend_call_duration_seconds', 'Duration of calls to the compute manager',
+    ['backend', 'method', 'outcome']
+)
+HTTP_LATENCY = Histogram(
+    'pman_http_request_duration_seconds',
+    'Duration of HTTP requests until the response starts, by resource',
+    ['endpoint', 'method', 'status']
+)
+LOG_BYTES = Counter(
+    'pman_log_bytes_served_total', 'Bytes of job logs sent to clients', ['endpoint']
+)
+COUNTS = Counter(
+    'pman_counts_total', 'The counters of GET /api/v1/, of every worker process', ['counter']
+)
+
+
+def outcome_of(e: Optional[BaseException]) -> str:
+    """
+    ``ok``, the HTTP status code of a :class:`ManagerException`, or ``error``.
+    """
+    if e is None:
+        return 'ok'
+    if isinstance(e, NotImplementedError):
+        return 'unsupported'
+    if isinstance(e, ManagerException) and e.status_code:
+        return str(e.status_code)
+    return 'error'
+
+
+def instrument_manager(mgr, backend: str, methods: Collection[str] = BACKEND_METHODS):
+    """
+    Measure the calls to the methods of a compute manager, which may be asynchronous.
+
+    The methods of the instance are replaced, so the manager keeps its type.
+    """
+    for name in methods:
+        method = getattr(mgr, name, None)
+        if method is None or getattr(method, '__instrumented__', False):
+            continue
+        setattr(mgr, name, _measure(method, backend, name))
+    return mgr
+
+
+def _measure(method: Callable, backend: str, name: str) -> Callable:
+    def observe(start: float, e: Optional[BaseException]):
+        outcome = outcome_of(e)
+        BACKEND_CALLS.labels(backend, name, outcome).inc()
+        BACKEND_LATENCY.labels(backend, name, outcome).observe(time.perf_counter() - start)
+
+    if inspect.iscoroutinefunction(method):
+        @functools.wraps(method)
+        async def measured(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = await method(*args, **kwargs)
+            except Exception as e:
+                observe(start, e)
+                raise
+            observe(start, None)
+            return result
+    else:
+        @functools.wraps(method)
+        def measured(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            except Exception as e:
+                observe(start, e)
+                raise
+            observe(start, None)
+            return result
+    measured.__instrumented__ = True
+    return measured
+
+
+def count(name: str, n: int = 1):
+    """
+    Count in the metric of a counter of :class:`pman.stats.Counters`.
+    """
+    COUNTS.labels(name).inc(n)
+
+
+def count_log_bytes(endpoint: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Count the bytes of streamed logs as they are sent.
+    """
+    counter = LOG_BYTES.labels(endpoint)
+    for chunk in chunks:
+        counter.inc(len(chunk))
+        yield chunk
+
+
+class JobStatusCollector:
+    """
+    Reports the number of jobs of the compute environment by status, as listed
+    by :meth:`AbstractManager.list_job_statuses` when metrics are scraped.
+
+    :param compute_mgr: the compute backend
+    :param max_age: seconds during which the list of jobs is reused between scrapes
+    """
+
+    def __init__(self, compute_mgr: AbstractManager, max_age: float = 15.0):
+        self.__compute_mgr = compute_mgr
+        self.__max_age = max_age
+        self.__listed: Optional[Tuple[float, Dict[JobName, JobStatus]]] = None
+        self.__lock = threading.Lock()
+
+    def collect(self):
+        statuses = self.__list()
+        if statuses is None:
+            return
+        counts = {status: 0 for status in JobStatus}
+        for status in statuses.values():
+            counts[status] += 1
+        family = GaugeMetricFamily('pman_jobs', 'Jobs of the compute environment by status',
+                                   labels=['status'])
+        for status, n in counts.items():
+            family.add_metric([status.value], n)
+        yield family
+
+    def __list(self) -> Optional[Dict[JobName, JobStatus]]:
+        with self.__lock:
+            if self.__listed is not None and time.monotonic() - self.__listed[0] < self.__max_age:
+                return self.__listed[1]
+            try:
+                statuses = self.__compute_mgr.list_job_statuses()
+            except NotImplementedError:
+                return None
+            except Exception as e:
+                logger.error('Error listing jobs for metrics: %s', str(e))
+                return None
+            self.__listed = (time.monotonic(), statuses)
+            return statuses
+
+
+class MetricsExporter:
+    """
+    Produces the response of ``GET /metrics``.
+    """
+
+    def __init__(self, compute_mgr: AbstractManager, jobs_max_age: float = 15.0):
+        self.__jobs = CollectorRegistry()
+        self.__jobs.register(JobStatusCollector(compute_mgr, jobs_max_age))
+
+    def generate(self) -> Tuple[bytes, str]:
+        """
+        :return: the metrics in the Prometheus text format, and its content type
+        """
+        if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return generate_latest(registry) + generate_latest(self.__jobs), CONTENT_TYPE_LATEST
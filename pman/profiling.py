@@ -0,0 +1,160 @@
+"""
+On-demand profiling of requests with :mod:`cProfile`, enabled by ``PMAN_PROFILE``.
+
+A request is profiled if it has the header ``X-Pman-Profile: 1``, or at random
+with the probability ``PROFILE_SAMPLE_RATE``. The profile of every request is
+written to a ``.pstats`` file named after its endpoint, in ``PROFILE_DIR``,
+which can be shared by the worker processes. ``GET /admin/profile`` returns
+the hottest functions of the aggregated profiles.
+
+Only one request is profiled at a time by each worker process, so that the
+profiles of concurrent requests (in other threads) are not mixed up.
+"""
+import cProfile
+import glob
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SORT_KEYS = ('cumulative', 'tottime', 'ncalls')
+
+_UNSAFE = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+class RequestProfiler:
+    """
+    Profiles requests and aggregates their profiles.
+
+    :param directory: where ``.pstats`` files are written
+    :param sample_rate: probability of profiling a request without the header
+    :param max_files: number of files kept for every endpoint, older files are deleted
+    """
+
+    HEADER = 'X-Pman-Profile'
+
+    def __init__(self, directory: str, sample_rate: float = 0.0, max_files: int = 100):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.max_files = max_files
+        self.__lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def wants(self, header: Optional[str]) -> bool:
+        """
+        Whether a request should be profiled, given the value of its ``X-Pman-Profile`` header.
+        """
+        if header is not None:
+            return header.strip().lower() in ('1', 'true', 'yes')
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self) -> Optional[cProfile.Profile]:
+        """
+        Start profiling the current thread.
+
+        :return: ``None`` if another request is being profiled
+        """
+        if not self.__lock.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiler is active, e.g. a debugger
+            self.__lock.release()
+            return None
+        return profile
+
+    def stop(self, profile: cProfile.Profile, endpoint: str) -> str:
+        """
+        Stop profiling and write the profile.
+
+        :return: path of the ``.pstats`` file
+        """
+        try:
+            profile.disable()
+        finally:
+            self.__lock.release()
+        name = _UNSAFE.sub('_', endpoint or 'none')
+        path = os.path.join(self.directory,
+                            f'{name}.{time.time_ns()}.{os.getpid()}.pstats')
+        # renamed when complete, for other processes not to read a partial file
+        profile.dump_stats(path + '.tmp')
+        os.replace(path + '.tmp', path)
+        logger.info(f'Wrote profile of a request to {endpoint} to {path}')
+        self.__prune(name)
+        return path
+
+    def __prune(self, name: str):
+        files = sorted(self.__files(name), key=_mtime)
+        for path in files[:max(len(files) - self.max_files, 0)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def __files(self, name: Optional[str] = None) -> List[str]:
+        paths = glob.glob(os.path.join(self.directory, f'{name or "*"}.*.pstats'))
+        return [path for path in paths if name is None or _endpoint_of(path) == name]
+
+    def endpoints(self) -> Dict[str, int]:
+        """
+        The number of profiles of every endpoint.
+        """
+        counts: Dict[str, int] = {}
+        for path in self.__files():
+            name = _endpoint_of(path)
+            counts[name] = counts.get(name, 0) + 1
+        return counts
+
+    def top(self, endpoint: Optional[str] = None, n: int = 30,
+            sort: str = 'cumulative') -> List[dict]:
+        """
+        The ``n`` hottest functions of the profiles of an endpoint, or of every endpoint.
+
+        :param sort: one of :data:`SORT_KEYS`
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(f'sort must be one of: {", ".join(SORT_KEYS)}')
+        files = self.__files(_UNSAFE.sub('_', endpoint) if endpoint else None)
+        stats = None
+        for path in files:
+            try:
+                if stats is None:
+                    stats = pstats.Stats(path)
+                else:
+                    stats.add(path)
+            except (OSError, EOFError, TypeError, ValueError) as e:
+                # deleted by another process, or still being written
+                logger.warning(f'Skipping profile {path}: {str(e)}')
+        if stats is None:
+            return []
+        rows = [
+            {
+                'function': f'{filename}:{line}({func})',
+                'ncalls': nc,
+                'primitive_calls': cc,
+                'tottime': round(tt, 6),
+                'cumulative': round(ct, 6),
+            }
+            for (filename, line, func), (cc, nc, tt, ct, _) in stats.stats.items()
+        ]
+        rows.sort(key=lambda row: row[sort], reverse=True)
+        return rows[:n]
+
+
+def _endpoint_of(path: str) -> str:
+    return os.path.basename(path).rsplit('.', 3)[0]
+
+
+def _mtime(path: str) -> float:
+    try:
+        return os.path.getmtime(path)
+    except FileNotFoundError:
+        return 0.0
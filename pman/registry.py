@@ -0,0 +1,141 @@
+"""
+A registry of finished jobs (``JOB_REGISTRY``), so that the status and logs of
+jobs which finished are served without calling the backend, even after the
+job was removed from the backend (by ``DELETE /api/v1/<jid>/`` with
+``REMOVE_JOBS=yes``, or by the TTL of finished Kubernetes jobs).
+
+Once a job is finished, its :class:`JobInfo` does not change anymore. It is
+recorded the first time a request sees that the job is finished, in a table of
+the ``STATE_DB`` SQLite database which is shared by every worker process. The
+tail of its logs is recorded with it if the request read them, else the first
+time they are requested, or before the job is removed from the backend.
+
+Records older than ``retention`` seconds are deleted, if it is set.
+"""
+import time
+from dataclasses import dataclass
+from typing import Callable, Collection, Dict, Optional
+
+from .abstractmgr import JobInfo, JobName
+from .admission import FINISHED
+from .statedb import StateDB, job_info_from
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS finished_job (
+    jid TEXT PRIMARY KEY,
+    image TEXT NOT NULL,
+    cmd TEXT NOT NULL,
+    status TEXT NOT NULL,
+    message TEXT,
+    timestamp TEXT,
+    logs TEXT,
+    recorded REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS finished_job_recorded ON finished_job (recorded);
+"""
+
+
+_PRUNE_INTERVAL = 3600.0
+"""Minimum seconds between deletions of old records."""
+
+
+@dataclass(frozen=True)
+class FinishedJob:
+    info: JobInfo
+    logs: Optional[str]
+    """
+    Tail of the logs of the job, as returned by ``GET /api/v1/<jid>/``,
+    or ``None`` if they were not recorded yet.
+    """
+
+
+class JobRegistry:
+    """
+    The info and logs of finished jobs, shared by every process using the same database.
+
+    :param path: path of the SQLite database file
+    :param retention: seconds for which records are kept, 0 to keep them forever
+    :param clock: function which returns the current time, for tests
+    """
+
+    def __init__(self, path: str, retention: float = 0.0,
+                 clock: Callable[[], float] = time.time):
+        self.__db = StateDB(path, _SCHEMA)
+        self.retention = retention
+        self.clock = clock
+        self.__last_prune = 0.0
+
+    def get(self, jid: JobName) -> Optional[FinishedJob]:
+        """
+        The info and logs of a job, or ``None`` if it was not recorded.
+        """
+        row = self.__db.connect().execute(
+            'SELECT * FROM finished_job WHERE jid = ?', (jid,)
+        ).fetchone()
+        if row is None:
+            return None
+        return FinishedJob(info=job_info_from(row), logs=row['logs'])
+
+    def get_many(self, jids: Collection[JobName]) -> Dict[JobName, JobInfo]:
+        """
+        The info of the jobs which were recorded.
+        """
+        rows = self.__db.select_in(
+            'SELECT jid, image, cmd, status, message, timestamp FROM finished_job '
+            'WHERE jid IN ({})', jids
+        )
+        return {JobName(row['jid']): job_info_from(row) for row in rows}
+
+    def record(self, jid: JobName, info: JobInfo, logs: Optional[str] = None):
+        """
+        Record a finished job. A job which was already recorded is not changed.
+
+        :param logs: tail of the logs of the job, ``None`` to record them later
+                     with :meth:`record_logs`
+
+        :raises ValueError: if the job is not finished
+        """
+        if info.status not in FINISHED:
+            raise ValueError(f'Job {jid} is not finished: {info.status.value}')
+        now = self.clock()
+        self.__db.connect().execute(
+            'INSERT INTO finished_job (jid, image, cmd, status, message, timestamp, logs, '
+            'recorded) VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (jid) DO NOTHING',
+            (jid, info.image, info.cmd, info.status.value, info.message, info.timestamp,
+             logs, now)
+        )
+        if self.retention > 0 and now - self.__last_prune >= _PRUNE_INTERVAL:
+            self.__last_prune = now
+            self.prune()
+
+    def record_logs(self, jid: JobName, logs: str):
+        """
+        Record the tail of the logs of a job which was recorded without them.
+        """
+        self.__db.connect().execute(
+            'UPDATE finished_job SET logs = ? WHERE jid = ? AND logs IS NULL', (logs, jid)
+        )
+
+    def remove(self, jid: JobName):
+        """
+        Forget a job, e.g. because a new job was created with the same name.
+        """
+        self.__db.connect().execute('DELETE FROM finished_job WHERE jid = ?', (jid,))
+
+    def prune(self) -> int:
+        """
+        Delete the records older than ``retention`` seconds.
+
+        :return: number of deleted records
+        """
+        cursor = self.__db.connect().execute('DELETE FROM finished_job WHERE recorded < ?',
+                                             (self.clock() - self.retention,))
+        return cursor.rowcount
+
+    def stats(self) -> dict:
+        row = self.__db.connect().execute(
+            'SELECT COUNT(*) AS entries, COALESCE(SUM(LENGTH(logs)), 0) AS log_chars '
+            'FROM finished_job'
+        ).fetchone()
+        return {'entries': row['entries'], 'log_chars': row['log_chars']}
+
@@ -1,18 +1,17 @@
 
-import os
+import json
 import logging
-from typing import List, Collection, Literal
+from typing import Optional, Iterator
 
-from flask import current_app as app
-from flask_restful import reqparse, abort, Resource
+from flask import current_app as app, request, Response, stream_with_context
+from flask_restful import reqparse, abort, Resource, inputs
 
-from .abstractmgr import ManagerException
-from .container_user import ContainerUser
-from .dockermgr import DockerManager
-from .openshiftmgr import OpenShiftManager
-from .kubernetesmgr import KubernetesManager
-from .swarmmgr import SwarmManager
-from .cromwellmgr import CromwellManager
+from .abstractmgr import AbstractManager, ManagerException, JobStatus
+from .events import EventLog
+# localize_path_args is used by clients of this module since before the handlers were shared
+from .handlers import JobsApi, Steps, T, run, localize_path_args  # noqa: F401
+from .longpoll import wait_for_status_change
+from .backends import manager_class
 
 
 logger = logging.getLogger(__name__)
@@ -36,191 +35,178 @@ parser.add_argument('env', dest='env', type=list, location='json', default=[])
 parser.add_argument('input_dir', dest='input_dir', required=True)
 parser.add_argument('output_dir', dest='output_dir', required=True)
 
+job_parser = reqparse.RequestParser()
+job_parser.add_argument('logs', dest='logs', type=inputs.boolean, location='args', default=True)
+job_parser.add_argument('fields', dest='fields', location='args', default=None)
+job_parser.add_argument('wait', dest='wait', type=inputs.natural, location='args', default=0)
+job_parser.add_argument('status', dest='status', location='args', default=None,
+                        choices=[s.value for s in JobStatus])
 
-def get_compute_mgr(container_env):
-    compute_mgr = None
-    if container_env == 'docker' or container_env == 'podman':
-        compute_mgr = DockerManager(app.config)
-    elif container_env == 'swarm':
-        compute_mgr = SwarmManager(app.config)
-    elif container_env == 'kubernetes':
-        compute_mgr = KubernetesManager(app.config)
-    elif container_env == 'openshift':
-        compute_mgr = OpenShiftManager()
-    elif container_env == 'cromwell':
-        compute_mgr = CromwellManager(app.config)
-    return compute_mgr
+logs_parser = reqparse.RequestParser()
+logs_parser.add_argument('follow', dest='follow', type=inputs.boolean, location='args',
+                         default=False)
+logs_parser.add_argument('tail', dest='tail', type=inputs.natural, location='args',
+                         default=None)
 
+batch_parser = reqparse.RequestParser()
+batch_parser.add_argument('jids', dest='jids', type=list, location='json', required=True)
 
-class JobListResource(Resource):
+
+def get_compute_mgr(container_env, config) -> AbstractManager:
     """
-    Resource representing the list of jobs scheduled on the compute.
+    Create the compute manager for the given ``CONTAINER_ENV``.
+
+    This is called once per process by :func:`pman.app.create_app`. Resources
+    must use :func:`shared_compute_mgr` instead of creating their own manager.
+    Only the module of the configured backend is imported, see :mod:`pman.backends`.
     """
+    cls = manager_class(container_env)
+    if cls is None:
+        return None
+    if container_env == 'openshift':
+        return cls()
+    return cls(config)
 
-    def __init__(self):
-        super(JobListResource, self).__init__()
 
-        # mounting points for the input and outputdir in the app's container!
-        self.str_app_container_inputdir = '/share/incoming'
-        self.str_app_container_outputdir = '/share/outgoing'
+def shared_compute_mgr() -> AbstractManager:
+    """
+    Get the long-lived compute manager of the current app.
+    """
+    return app.extensions['compute_mgr']
 
-        self.container_env = app.config.get('CONTAINER_ENV')
 
-        self.user = ContainerUser.parse(app.config.get('CONTAINER_USER'))
+def shared_jobs_api() -> JobsApi:
+    """
+    Get the handlers of the API requests of the current app.
+    """
+    return app.extensions['jobs_api']
+
+
+def handle(steps: Steps[T]) -> T:
+    """
+    Run a handler of :mod:`pman.handlers` in the request thread,
+    aborting the request if it raises a :class:`ManagerException`.
+    """
+    try:
+        return run(steps, shared_compute_mgr())
+    except ManagerException as e:
+        abort(e.status_code or 500, message=str(e))
+
+
+class JobListResource(Resource):
+    """
+    Resource representing the list of jobs scheduled on the compute.
+    """
 
     def get(self):
-        return {
-            'server_version': app.config.get('SERVER_VERSION'),
-            'container_env': app.config.get('CONTAINER_ENV'),
-            'storage_type': app.config.get('STORAGE_TYPE')
-        }
+        jids = request.args.get('jids')
+        if jids is not None:
+            return handle(shared_jobs_api().get_jobs_status(jids.split(',')))
+        return handle(shared_jobs_api().index())
 
     def post(self):
         args = parser.parse_args()
-
-        if len(args.entrypoint) == 0:
-            abort(400, message='"entrypoint" cannot be empty')
-
-        for s in args.env:
-            if len(s.split('=', 1)) != 2:
-                abort(400, message='"env" must be a list of "key=value" strings')
-
-        if app.config.get('ENABLE_HOME_WORKAROUND'):
-            args.env.append('HOME=/tmp')
-
-        job_id = args.jid.lstrip('/')
-
-        cmd = self.build_app_cmd(args.args, args.args_path_flags, args.entrypoint, args.type)
-
-        resources_dict = {'number_of_workers': args.number_of_workers,
-                          'cpu_limit': args.cpu_limit,
-                          'memory_limit': args.memory_limit,
-                          'gpu_limit': args.gpu_limit,
-                          }
-        mounts_dict = {'inputdir_source': '',
-                       'inputdir_target': self.str_app_container_inputdir,
-                       'outputdir_source': '',
-                       'outputdir_target': self.str_app_container_outputdir
-                       }
-        input_dir = args.input_dir.strip('/')
-        output_dir = args.output_dir.strip('/')
-
-        # hmm, probably unnecessarily relying on invariant that
-        # STORAGETYPE matches enum value -> STOREBASE is valid and should be used
-        # Perhaps we should instead simply check STOREBASE only?
-        storage_type = app.config.get('STORAGE_TYPE')
-        if storage_type in ('host', 'docker_local_volume'):
-            storebase = app.config.get('STOREBASE')
-            mounts_dict['inputdir_source'] = os.path.join(storebase, input_dir)
-            mounts_dict['outputdir_source'] = os.path.join(storebase, output_dir)
-        elif storage_type == 'kubernetes_pvc':
-            mounts_dict['inputdir_source'] = input_dir
-            mounts_dict['outputdir_source'] = output_dir
-
-        logger.info(f'Scheduling job {job_id} on the {self.container_env} cluster')
-
-        compute_mgr = get_compute_mgr(self.container_env)
-        try:
-            job = compute_mgr.schedule_job(args.image, cmd, job_id, resources_dict,
-                                           args.env, self.user.get_uid(),
-                                           self.user.get_gid(), mounts_dict)
-        except ManagerException as e:
-            logger.error(f'Error from {self.container_env} while scheduling job '
-                         f'{job_id}, detail: {str(e)}')
-            abort(e.status_code, message=str(e))
-
-        job_info = compute_mgr.get_job_info(job)
-        logger.info(f'Successful job {job_id} schedule response from '
-                    f'{self.container_env}: {job_info}')
-        job_logs = ''
-
-        return {
-            'jid': job_id,
-            'image': job_info.image,
-            'cmd': job_info.cmd,
-            'status': job_info.status.value,
-            'message': job_info.message,
-            'timestamp': job_info.timestamp,
-            'logs': job_logs
-        }, 201
-
-    def build_app_cmd(
-            self,
-            args: List[str],
-            args_path_flags: Collection[str],
-            entrypoint: List[str],
-            plugin_type: Literal['ds', 'fs', 'ts']
-    ) -> List[str]:
-        cmd = entrypoint + localize_path_args(args, args_path_flags, self.str_app_container_inputdir)
-        if plugin_type == 'ds':
-            cmd.append(self.str_app_container_inputdir)
-        cmd.append(self.str_app_container_outputdir)
-        return cmd
+        return handle(shared_jobs_api().create_job(args))
 
 
 class JobResource(Resource):
     """
     Resource representing a single job scheduled on the compute.
     """
-    def __init__(self):
-        super(JobResource, self).__init__()
-
-        self.container_env = app.config.get('CONTAINER_ENV')
-        self.compute_mgr = get_compute_mgr(self.container_env)
-        self.job_logs_tail = app.config.get('JOB_LOGS_TAIL')
 
     def get(self, job_id):
+        args = job_parser.parse_args()
         job_id = job_id.lstrip('/')
-
-        logger.info(f'Getting job {job_id} status from the {self.container_env} '
-                    f'cluster')
-        try:
-            job = self.compute_mgr.get_job(job_id)
-        except ManagerException as e:
-            abort(e.status_code, message=str(e))
-        job_info = self.compute_mgr.get_job_info(job)
-        logger.info(f'Successful job {job_id} status response from '
-                    f'{self.container_env}: {job_info}')
-        job_logs = self.compute_mgr.get_job_logs(job, self.job_logs_tail)
-        if isinstance(job_logs, bytes):
-            job_logs = job_logs.decode(encoding='utf-8', errors='replace')
-
-        return {
-            'jid': job_id,
-            'image': job_info.image,
-            'cmd': job_info.cmd,
-            'status': job_info.status.value,
-            'message': job_info.message,
-            'timestamp': job_info.timestamp,
-            'logs': job_logs
-        }
+        jobs_api = shared_jobs_api()
+        # with ?wait=N&status=S, respond when the status is no longer S, or after N seconds
+        if args.wait:
+            last_seen = None if args.status is None else JobStatus(args.status)
+            timeout = jobs_api.start_long_poll(job_id, args.wait)
+            if timeout is not None:
+                try:
+                    wait_for_status_change(lambda: handle(jobs_api.job_info(job_id)), job_id,
+                                           last_seen, timeout,
+                                           notifier=shared_compute_mgr().change_notifier)
+                finally:
+                    jobs_api.end_long_poll()
+        # with ?cursor=..., only the logs which come after the cursor are returned
+        return handle(jobs_api.get_job(job_id, args, request.args.get('cursor')))
 
     def delete(self, job_id):
-        if not app.config.get('REMOVE_JOBS'):
-            logger.info(f'Deletion request for job {job_id}, '
-                        'doing nothing because config.REMOVE_JOBS=no')
-            return '', 204
+        handle(shared_jobs_api().delete_job(job_id.lstrip('/')))
+        return '', 204
 
-        job_id = job_id.lstrip('/')
 
-        logger.info(f'Deleting job {job_id} from {self.container_env}')
-        try:
-            job = self.compute_mgr.get_job(job_id)
-        except ManagerException as e:
-            abort(e.status_code, message=str(e))
-        self.compute_mgr.remove_job(job)  # remove job from compute cluster
-        logger.info(f'Successfully removed job {job_id} from {self.container_env}')
-        return '', 204
+class JobLogsResource(Resource):
+    """
+    Resource representing the logs of a single job scheduled on the compute.
+
+    Logs are streamed as they are read from the compute, so with ``?follow=true``
+    the response lasts as long as the job is running.
+    """
+
+    def get(self, job_id):
+        args = logs_parser.parse_args()
+        logs = handle(shared_jobs_api().get_job_logs(job_id.lstrip('/'), args.tail, args.follow))
+        if isinstance(logs, (bytes, str)):
+            return Response(logs, mimetype='text/plain')
+        return Response(stream_with_context(logs), mimetype='text/plain')
 
 
-def localize_path_args(args: List[str], path_flags: Collection[str], input_dir: str) -> List[str]:
+class JobEventsResource(Resource):
     """
-    Replace the strings following path flags with the input directory.
+    Resource representing the status transitions of all jobs, as server-sent events.
 
-    https://github.com/FNNDSC/CHRIS_docs/blob/7ac85e9ae1070947e6e2cda62747b427028229b0/SPEC.adoc#path-arguments
+    Clients which reconnect with the ``Last-Event-ID`` header receive the
+    events they missed, if they are still in the buffer. Otherwise, they
+    receive a ``reset`` event, after which they should get the status of
+    their jobs again.
     """
-    if len(args) == 0:
-        return args
-    if args[0] in path_flags:
-        return [args[0], input_dir] + localize_path_args(args[2:], path_flags, input_dir)
-    return args[0:1] + localize_path_args(args[1:], path_flags, input_dir)
+
+    def get(self):
+        detector = app.extensions['change_detector']
+        try:
+            detector.start()
+        except NotImplementedError as e:
+            abort(501, message=str(e))
+        slots = app.extensions['events_slots']
+        if not slots.acquire(blocking=False):
+            abort(503, message='Too many clients of the events stream')
+        last_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        keepalive = app.config.get('EVENTS_KEEPALIVE_SECONDS', 15)
+        res = Response(stream_with_context(sse_stream(detector.event_log, last_id, keepalive)),
+                       mimetype='text/event-stream',
+                       headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        res.call_on_close(slots.release)
+        return res
+
+
+def sse_stream(event_log: EventLog, last_id: Optional[str], keepalive: float) -> Iterator[str]:
+    """
+    Produce the events of ``event_log`` after ``last_id`` in the server-sent events format.
+
+    https://html.spec.whatwg.org/multipage/server-sent-events.html
+    """
+    cursor = last_id or event_log.last_id()
+    while True:
+        events, complete = event_log.since(cursor)
+        if not complete:
+            cursor = event_log.last_id()
+            yield f'id: {cursor}\nevent: reset\ndata: {{}}\n\n'
+            continue
+        for event in events:
+            yield f'id: {event.id}\ndata: {json.dumps(event.data)}\n\n'
+            cursor = event.id
+        if not event_log.wait(cursor, keepalive):
+            yield ': keepalive\n\n'
+
+
+class JobBatchResource(Resource):
+    """
+    Resource representing the status of many jobs, for when there are too many
+    job IDs to fit in the query string of ``GET /api/v1/?jids=...``.
+    """
+
+    def post(self):
+        args = batch_parser.parse_args()
+        return handle(shared_jobs_api().get_jobs_status(args.jids))
@@ -0,0 +1,263 @@
+"""
+A simulated compute backend (``CONTAINER_ENV=simulated``), for load-testing
+pman and CUBE together without running any containers.
+
+Jobs are not run: when a job is scheduled, how long it waits in the queue,
+how long it runs, whether it fails and how fast it logs are drawn from the
+distributions given by the ``SIM_*`` configuration, and its status and logs
+are computed from the time elapsed since. Calls to the backend take
+``SIM_API_LATENCY`` seconds on average.
+
+Jobs are kept in a table of the ``STATE_DB`` SQLite database, so that they
+are shared by every worker process of the server.
+"""
+import logging
+import math
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import AnyStr, Collection, Dict, Iterator, List, Optional
+
+from .abstractmgr import (AbstractManager, ManagerException, JobInfo, JobLogs, JobName,
+                          JobStatus, Image, TimeStamp, ResourcesDict, MountsDict,
+                          ResourceCapacity)
+from .statedb import StateDB
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS simulated_jobs (
+    name TEXT PRIMARY KEY,
+    image TEXT NOT NULL,
+    cmd TEXT NOT NULL,
+    submitted REAL NOT NULL,
+    queue_delay REAL NOT NULL,
+    run_time REAL NOT NULL,
+    outcome TEXT NOT NULL,
+    log_rate REAL NOT NULL
+);
+"""
+
+LINE_BYTES = 80
+"""Size of a simulated line of logs, including the newline."""
+
+
+@dataclass(frozen=True)
+class SimulatedJob:
+    name: JobName
+    image: Image
+    cmd: str
+    submitted: float
+    queue_delay: float
+    """Seconds between the submission of the job and its start."""
+    run_time: float
+    outcome: str
+    """``success``, ``error`` or ``oom``"""
+    log_rate: float
+    """Bytes of logs per second of running."""
+
+    @property
+    def started(self) -> float:
+        return self.submitted + self.queue_delay
+
+    @property
+    def finished(self) -> float:
+        return self.started + self.run_time
+
+    def status(self, now: float) -> JobStatus:
+        if now < self.started:
+            return JobStatus.notstarted
+        if now < self.finished:
+            return JobStatus.started
+        if self.outcome == 'success':
+            return JobStatus.finishedSuccessfully
+        return JobStatus.finishedWithError
+
+    def log_lines(self, now: float) -> int:
+        """
+        Number of lines logged by ``now``.
+        """
+        running = min(now, self.finished) - self.started
+        if running <= 0:
+            return 0
+        return int(running * self.log_rate / LINE_BYTES) + 1
+
+    def log_line(self, i: int) -> bytes:
+        if i == 0:
+            line = f'{self.cmd}'
+        else:
+            line = f'{self.name} step {i}: simulated output'
+        return line[:LINE_BYTES - 1].ljust(LINE_BYTES - 1).encode() + b'\n'
+
+    def logs(self, start: int, end: int) -> bytes:
+        return b''.join(self.log_line(i) for i in range(start, end))
+
+
+class SimulatedManager(AbstractManager[SimulatedJob]):
+    """
+    :param config_dict: the configuration, with ``STATE_DB`` and the ``SIM_*`` settings
+    :param clock: function which returns the current time, for tests
+    """
+
+    def __init__(self, config_dict=None, clock=time.time):
+        super().__init__(config_dict)
+        config = config_dict or {}
+        self.__db = StateDB(config.get('STATE_DB', '/tmp/pman.db'), _SCHEMA)
+        self.__clock = clock
+        self.queue_delay = config.get('SIM_QUEUE_DELAY', 2.0)
+        self.run_time = config.get('SIM_RUN_TIME', 30.0)
+        self.run_time_sigma = config.get('SIM_RUN_TIME_SIGMA', 0.5)
+        self.failure_rate = config.get('SIM_FAILURE_RATE', 0.05)
+        self.oom_rate = config.get('SIM_OOM_RATE', 0.01)
+        self.log_rate = config.get('SIM_LOG_BYTES_PER_SECOND', 200.0)
+        self.api_latency = config.get('SIM_API_LATENCY', 0.0)
+        self.capacity: ResourceCapacity = {
+            r: v for r, v in (('cpu_limit', config.get('SIM_CPU_LIMIT')),
+                              ('memory_limit', config.get('SIM_MEMORY_LIMIT')),
+                              ('gpu_limit', config.get('SIM_GPU_LIMIT')))
+            if v is not None
+        }
+        seed = config.get('SIM_SEED')
+        self.__rng = random.Random(seed)
+        self.__rng_lock = threading.Lock()
+
+    def __call(self):
+        if self.api_latency > 0:
+            with self.__rng_lock:
+                latency = self.__rng.expovariate(1 / self.api_latency)
+            time.sleep(latency)
+
+    def __draw(self) -> dict:
+        with self.__rng_lock:
+            rng = self.__rng
+            # lognormal distribution of which the mean is run_time
+            mu = math.log(self.run_time) - self.run_time_sigma ** 2 / 2 if self.run_time > 0 else 0
+            p = rng.random()
+            if p < self.oom_rate:
+                outcome = 'oom'
+            elif p < self.oom_rate + self.failure_rate:
+                outcome = 'error'
+            else:
+                outcome = 'success'
+            return {
+                'queue_delay': rng.expovariate(1 / self.queue_delay) if self.queue_delay > 0 else 0.0,
+                'run_time': rng.lognormvariate(mu, self.run_time_sigma) if self.run_time > 0 else 0.0,
+                'outcome': outcome,
+                'log_rate': self.log_rate,
+            }
+
+    def schedule_job(self, image: Image, command: List[str], name: JobName,
+                     resources_dict: ResourcesDict, env: List[str],
+                     uid: Optional[int], gid: Optional[int],
+                     mounts_dict: MountsDict) -> SimulatedJob:
+        self.__call()
+        job = SimulatedJob(name=name, image=image, cmd=' '.join(command),
+                           submitted=self.__clock(), **self.__draw())
+        conn = self.__db.connect()
+        cursor = conn.execute(
+            'INSERT OR IGNORE INTO simulated_jobs '
+            '(name, image, cmd, submitted, queue_delay, run_time, outcome, log_rate) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (job.name, job.image, job.cmd, job.submitted, job.queue_delay, job.run_time,
+             job.outcome, job.log_rate)
+        )
+        if cursor.rowcount == 0:
+            raise ManagerException(f'Job {name} already exists', status_code=409)
+        return job
+
+    def get_job(self, name: JobName) -> SimulatedJob:
+        self.__call()
+        row = self.__db.connect().execute('SELECT * FROM simulated_jobs WHERE name = ?',
+                                          (name,)).fetchone()
+        if row is None:
+            raise ManagerException(f'Could not find job {name}', status_code=404)
+        return _job_from(row)
+
+    def get_job_logs(self, job: SimulatedJob, tail: int) -> AnyStr:
+        self.__call()
+        end = job.log_lines(self.__clock())
+        start = max(end - tail, 0) if tail else 0
+        return job.logs(start, end)
+
+    def get_job_logs_since(self, job: SimulatedJob, cursor: Optional[str], tail: int) -> JobLogs:
+        """
+        The cursor is the number of lines already read.
+        """
+        self.__call()
+        try:
+            start = int(cursor) if cursor else 0
+        except ValueError:
+            raise ValueError(f'Invalid cursor: {cursor}')
+        end = job.log_lines(self.__clock())
+        if tail and not cursor:
+            start = max(start, end - tail)
+        return JobLogs(logs=job.logs(min(start, end), end), next_cursor=str(end))
+
+    def stream_job_logs(self, job: SimulatedJob, tail: Optional[int] = None,
+                        follow: bool = False) -> Iterator[bytes]:
+        self.__call()
+        end = job.log_lines(self.__clock())
+        start = max(end - tail, 0) if tail else 0
+        yield job.logs(start, end)
+        while follow and self.__clock() < job.finished:
+            time.sleep(min(1.0, max(job.finished - self.__clock(), 0)))
+            start, end = end, job.log_lines(self.__clock())
+            if end > start:
+                yield job.logs(start, end)
+
+    def get_job_info(self, job: SimulatedJob) -> JobInfo:
+        self.__call()
+        return _info_of(job, self.__clock())
+
+    def remove_job(self, job: SimulatedJob):
+        self.__call()
+        self.__db.connect().execute('DELETE FROM simulated_jobs WHERE name = ?', (job.name,))
+
+    def get_jobs_info(self, names: Collection[JobName]) -> Dict[JobName, JobInfo]:
+        self.__call()
+        now = self.__clock()
+        rows = self.__db.select_in('SELECT * FROM simulated_jobs WHERE name IN ({})', names)
+        jobs = [_job_from(row) for row in rows]
+        return {job.name: _info_of(job, now) for job in jobs}
+
+    def list_job_statuses(self) -> Dict[JobName, JobStatus]:
+        self.__call()
+        now = self.__clock()
+        rows = self.__db.connect().execute('SELECT * FROM simulated_jobs').fetchall()
+        return {JobName(row['name']): _job_from(row).status(now) for row in rows}
+
+    def get_capacity(self) -> ResourceCapacity:
+        return dict(self.capacity)
+
+    def get_stats(self) -> dict:
+        row = self.__db.connect().execute('SELECT COUNT(*) AS jobs FROM simulated_jobs').fetchone()
+        return {'simulated_jobs': row['jobs']}
+
+
+def _job_from(row) -> SimulatedJob:
+    return SimulatedJob(name=JobName(row['name']), image=Image(row['image']), cmd=row['cmd'],
+                        submitted=row['submitted'], queue_delay=row['queue_delay'],
+                        run_time=row['run_time'], outcome=row['outcome'],
+                        log_rate=row['log_rate'])
+
+
+_MESSAGES = {
+    'success': 'finished',
+    'error': 'Error: exit code 1',
+    'oom': 'OOMKilled',
+}
+
+
+def _info_of(job: SimulatedJob, now: float) -> JobInfo:
+    status = job.status(now)
+    if status == JobStatus.notstarted:
+        message, timestamp = 'pending', ''
+    elif status == JobStatus.started:
+        message, timestamp = 'running', ''
+    else:
+        message = _MESSAGES[job.outcome]
+        timestamp = datetime.fromtimestamp(job.finished, timezone.utc).isoformat()
+    return JobInfo(name=job.name, image=job.image, cmd=job.cmd,
+                   timestamp=TimeStamp(timestamp), message=message, status=status)
@@ -0,0 +1,88 @@
+"""
+The SQLite database at ``STATE_DB``, where state which is shared by every
+worker process of the server is kept.
+"""
+import sqlite3
+import threading
+from typing import Collection, Iterator, Sequence
+
+from .abstractmgr import JobInfo, JobName, JobStatus, Image, TimeStamp
+
+CHUNK = 500
+"""Maximum number of values of an ``IN (...)`` query, below the limit of SQLite parameters."""
+
+
+class StateDB:
+    """
+    Thread-local connections to an SQLite database in WAL mode.
+
+    Connections are in autocommit mode: statements which must be atomic
+    together are wrapped in ``BEGIN IMMEDIATE`` ... ``COMMIT``.
+
+    :param path: path of the database file
+    :param schema: SQL script which creates the tables, if they do not exist
+    """
+
+    def __init__(self, path: str, schema: str):
+        self.path = path
+        self.__local = threading.local()
+        self.connect().executescript(schema)
+
+    def add_column(self, table: str, column: str, definition: str):
+        """
+        Add a column to a table created by an older version of pman, if it does not have it.
+        """
+        conn = self.connect()
+        columns = {row['name'] for row in conn.execute(f'PRAGMA table_info({table})')}
+        if column not in columns:
+            try:
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+            except sqlite3.OperationalError:
+                # added by another process in the meantime
+                pass
+
+    def connect(self) -> sqlite3.Connection:
+        conn = getattr(self.__local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.row_factory = sqlite3.Row
+            self.__local.conn = conn
+        return conn
+
+    def select_in(self, query: str, values: Collection,
+                  params: Sequence = ()) -> Iterator[sqlite3.Row]:
+        """
+        Run a query for every chunk of at most :data:`CHUNK` values, e.g.
+        ``select_in('SELECT * FROM job_status WHERE jid IN ({})', jids)``.
+
+        :param query: the query, with ``{}`` in place of the placeholders of the values
+        :param params: parameters of the query which come before the values
+        :return: the rows selected by every query
+        """
+        values = list(values)
+        conn = self.connect()
+        for i in range(0, len(values), CHUNK):
+            chunk = values[i:i + CHUNK]
+            yield from conn.execute(query.format(','.join('?' * len(chunk))), (*params, *chunk))
+
+    def execute_in(self, query: str, values: Collection, params: Sequence = ()):
+        """
+        Like :meth:`select_in`, for statements which return no rows, e.g.
+        ``execute_in('DELETE FROM job_status WHERE jid IN ({})', jids)``.
+        """
+        values = list(values)
+        conn = self.connect()
+        for i in range(0, len(values), CHUNK):
+            chunk = values[i:i + CHUNK]
+            conn.execute(query.format(','.join('?' * len(chunk))), (*params, *chunk))
+
+
+def job_info_from(row: sqlite3.Row) -> JobInfo:
+    """
+    The :class:`JobInfo` of a row with the columns ``jid``, ``image``, ``cmd``,
+    ``status``, ``message`` and ``timestamp``.
+    """
+    return JobInfo(name=JobName(row['jid']), image=Image(row['image']), cmd=row['cmd'],
+                   timestamp=TimeStamp(row['timestamp']), message=row['message'],
+                   status=JobStatus(row['status']))
@@ -0,0 +1,36 @@
+"""
+Counters for measuring what pman does, reported by ``GET /api/v1/``.
+
+The counters are those of a worker process. Their totals over every worker
+process are the metric ``pman_counts_total`` of ``GET /metrics``.
+"""
+import threading
+from collections import Counter
+from typing import Callable, Dict, Optional
+
+
+class Counters:
+    """
+    Named counters which can be incremented by many threads.
+
+    :param on_inc: also called with the name and the increment, e.g. to count in a metric
+    """
+
+    def __init__(self, on_inc: Optional[Callable[[str, int], None]] = None):
+        self.__counts = Counter()
+        self.__lock = threading.Lock()
+        self.__on_inc = on_inc
+
+    def inc(self, name: str, n: int = 1):
+        with self.__lock:
+            self.__counts[name] += n
+        if self.__on_inc is not None:
+            self.__on_inc(name, n)
+
+    def get(self, name: str) -> int:
+        with self.__lock:
+            return self.__counts[name]
+
+    def snapshot(self) -> Dict[str, int]:
+        with self.__lock:
+            return dict(self.__counts)
@@ -0,0 +1,204 @@
+"""
+A cache of the status of jobs which is shared by every worker process of the
+server (``STATUS_CACHE``), so that the polling of CUBE does not cause calls to
+the backend from every worker process.
+
+The cache is a table of the ``STATE_DB`` SQLite database, of the
+:class:`JobInfo` of every job and the time when it was fetched. Requests are
+served from the cache if the info of their job was fetched at most
+``max_age`` seconds ago, otherwise the backend is called and the cache updated.
+
+A :class:`StatusRefresher` runs in every process, but only the one holding a
+:class:`pman.leases.FileLease` refreshes the cache, by listing every job of
+the backend every ``interval`` seconds. The lock is released by the operating
+system when its holder exits, then another process takes over. With
+``CONTROLLER=yes``, the cache is refreshed by ``pman controller`` instead.
+"""
+import logging
+import threading
+import time
+from typing import Callable, Collection, Dict, Optional
+
+from .abstractmgr import AbstractManager, JobInfo, JobName
+from .leases import FileLease
+from .statedb import StateDB, job_info_from
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS job_status (
+    jid TEXT PRIMARY KEY,
+    image TEXT NOT NULL,
+    cmd TEXT NOT NULL,
+    status TEXT NOT NULL,
+    message TEXT,
+    timestamp TEXT,
+    fetched REAL NOT NULL
+);
+"""
+
+
+class StatusCache:
+    """
+    The info of jobs, shared by every process using the same database.
+
+    :param path: path of the SQLite database file
+    :param max_age: seconds for which the info of a job is served from the cache
+    :param clock: function which returns the current time, for tests
+    """
+
+    def __init__(self, path: str, max_age: float = 5.0, clock: Callable[[], float] = time.time):
+        self.__db = StateDB(path, _SCHEMA)
+        self.max_age = max_age
+        self.clock = clock
+
+    def get(self, jid: JobName) -> Optional[JobInfo]:
+        """
+        The info of a job, or ``None`` if it is not cached or too old.
+        """
+        return self.get_many([jid]).get(jid)
+
+    def get_many(self, jids: Collection[JobName]) -> Dict[JobName, JobInfo]:
+        """
+        The info of the jobs which are cached and recent enough.
+        """
+        rows = self.__db.select_in('SELECT * FROM job_status WHERE fetched >= ? AND jid IN ({})',
+                                   jids, (self.clock() - self.max_age,))
+        return {JobName(row['jid']): job_info_from(row) for row in rows}
+
+    def put(self, infos: Dict[JobName, JobInfo], fetched: Optional[float] = None):
+        """
+        Cache the info of jobs, which was fetched from the backend at ``fetched`` (default: now).
+
+        The info of a job which was fetched more recently is kept.
+        """
+        if not infos:
+            return
+        fetched = self.clock() if fetched is None else fetched
+        self.__db.connect().executemany(
+            'INSERT INTO job_status (jid, image, cmd, status, message, timestamp, fetched) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (jid) DO UPDATE SET image = excluded.image, cmd = excluded.cmd, '
+            'status = excluded.status, message = excluded.message, '
+            'timestamp = excluded.timestamp, fetched = excluded.fetched '
+            'WHERE excluded.fetched >= job_status.fetched',
+            [(jid, info.image, info.cmd, info.status.value, info.message, info.timestamp, fetched)
+             for jid, info in infos.items()]
+        )
+
+    def replace_all(self, infos: Dict[JobName, JobInfo], fetched: float):
+        """
+        Cache the info of every job of the backend, listed at ``fetched``,
+        and forget the jobs which were not listed.
+
+        Jobs cached after ``fetched`` (e.g. by a request which scheduled a
+        job in the meantime) are not forgotten.
+        """
+        conn = self.__db.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            self.put(infos, fetched)
+            cached = [row['jid'] for row in
+                      conn.execute('SELECT jid FROM job_status WHERE fetched < ?', (fetched,))]
+            gone = [(jid,) for jid in cached if jid not in infos]
+            conn.executemany('DELETE FROM job_status WHERE jid = ?', gone)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def remove(self, jid: JobName):
+        self.__db.connect().execute('DELETE FROM job_status WHERE jid = ?', (jid,))
+
+    def stats(self) -> dict:
+        row = self.__db.connect().execute(
+            'SELECT COUNT(*) AS entries, MIN(fetched) AS oldest FROM job_status'
+        ).fetchone()
+        oldest = row['oldest']
+        return {
+            'entries': row['entries'],
+            'oldest_seconds': None if oldest is None else round(self.clock() - oldest, 3),
+        }
+
+
+class StatusRefresher:
+    """
+    Refreshes a :class:`StatusCache` from the backend, if this process holds the lease.
+
+    :param cache: the cache
+    :param compute_mgr: the compute backend
+    :param lease: the lease which elects the refreshing process
+    :param interval: seconds between refreshes, and between attempts to take the lease
+    """
+
+    def __init__(self, cache: StatusCache, compute_mgr: AbstractManager, lease: FileLease,
+                 interval: float = 2.0):
+        self.cache = cache
+        self.lease = lease
+        self.interval = interval
+        self.__compute_mgr = compute_mgr
+        self.__stopped = threading.Event()
+        self.__thread: Optional[threading.Thread] = None
+
+    @property
+    def leader(self) -> bool:
+        """
+        Whether this process refreshes the cache.
+        """
+        return self.lease.held
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.run, name='status-refresher', daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__stopped.set()
+        if self.__thread is not None:
+            self.__thread.join()
+        self.lease.release()
+
+    def run(self):
+        while not self.__stopped.is_set():
+            try:
+                if self.lease.held or self.__acquire():
+                    self.refresh()
+            except NotImplementedError as e:
+                logger.error('The status cache cannot be refreshed: %s', str(e))
+                self.lease.release()
+                return
+            except Exception as e:
+                logger.exception('Error refreshing the status cache: %s', str(e))
+            self.__stopped.wait(self.interval)
+
+    def __acquire(self) -> bool:
+        if not self.lease.try_acquire():
+            return False
+        logger.info('Refreshing the status cache from this process')
+        return True
+
+    def refresh(self):
+        """
+        List every job of the backend, and cache their info.
+        """
+        fetched = self.cache.clock()
+        names = list(self.__compute_mgr.list_job_statuses())
+        infos = self.__compute_mgr.get_jobs_info(names) if names else {}
+        self.cache.replace_all(infos, fetched)
+
+
+def get_jobs_info_cached(cache: Optional[StatusCache], compute_mgr: AbstractManager,
+                         names: Collection[JobName]) -> Dict[JobName, JobInfo]:
+    """
+    Same as :meth:`AbstractManager.get_jobs_info`, for the jobs which are not
+    in the cache (if any), and caching their info.
+    """
+    if cache is None:
+        return compute_mgr.get_jobs_info(names)
+    infos = cache.get_many(names)
+    missing = [name for name in names if name not in infos]
+    if missing:
+        fetched = compute_mgr.get_jobs_info(missing)
+        cache.put(fetched)
+        infos.update(fetched)
+    return infos
+
@@ -2,16 +2,19 @@
 Swarm cluster manager module that provides functionality to schedule
 jobs (short-lived services) as well as manage their state in the cluster.
 """
-from typing import AnyStr, Sequence, Iterable
+from typing import AnyStr, Sequence, Iterable, Collection, Dict, Optional, Iterator
 
 import docker
 from docker.models.services import Service
 from .abstractmgr import (AbstractManager, ManagerException, JobStatus, JobInfo, Image,
-                          TimeStamp, JobName)
+                          TimeStamp, JobName, JobLogs, ResourceCapacity)
+from .logcursor import filter_after, cursor_seconds
 
 
 class SwarmManager(AbstractManager[Service]):
 
+    log_api_calls = 2  # Service.logs inspects the service to know whether it uses a TTY
+
     def __init__(self, config_dict=None):
         super().__init__(config_dict)
 
@@ -31,6 +34,7 @@ class SwarmManager(AbstractManager[Service]):
         try:
             job = self.docker_client.services.create(image, command,
                                                      name=name,
+                                                     labels=self.__job_labels(),
                                                      env=env,
                                                      mounts=mounts,
                                                      restart_policy=restart_policy,
@@ -58,11 +62,98 @@ class SwarmManager(AbstractManager[Service]):
     def get_job_logs(self, job: Service, tail: int) -> AnyStr:
         return b''.join(job.logs(stdout=True, stderr=True, tail=tail))
 
+    def get_job_logs_since(self, job: Service, cursor: Optional[str], tail: int) -> JobLogs:
+        # the swarm API only takes whole seconds
+        since = 0 if cursor is None else int(cursor_seconds(cursor))
+        logs = job.logs(stdout=True, stderr=True, timestamps=True,
+                        tail=tail if cursor is None else 'all', since=since)
+        return JobLogs(*filter_after(logs, cursor))
+
+    def stream_job_logs(self, job: Service, tail: Optional[int] = None,
+                        follow: bool = False) -> Iterator[bytes]:
+        stream = job.logs(stdout=True, stderr=True, follow=follow,
+                          tail='all' if tail is None else tail)
+        try:
+            yield from stream
+        finally:
+            stream.close()
+
     def get_job_info(self, job: Service) -> JobInfo:
         """
         Get the job's info for a previously scheduled job object.
         """
-        task = self.get_job_task(job)
+        return self.__info_from(job, self.get_job_task(job))
+
+    def get_jobs_info(self, names: Collection[JobName]) -> Dict[JobName, JobInfo]:
+        """
+        Get the info of many jobs using one service list request
+        and one task list request.
+        """
+        wanted = set(names)
+        try:
+            services = [s for s in self.docker_client.services.list(filters={'name': list(wanted)})
+                        if s.name in wanted]
+            tasks = self.docker_client.api.tasks(
+                filters={'service': [s.id for s in services]}
+            ) if services else []
+        except docker.errors.APIError as e:
+            status_code = 503 if e.response.status_code == 500 else e.response.status_code
+            raise ManagerException(str(e), status_code=status_code)
+
+        first_task = {}
+        for task in tasks:
+            first_task.setdefault(task['ServiceID'], task)
+        return {
+            JobName(s.name): self.__info_from(s, first_task.get(s.id))
+            for s in services
+        }
+
+    def list_job_statuses(self) -> Dict[JobName, JobStatus]:
+        """
+        List the services with the ``JOB_LABELS`` and their tasks using two requests.
+        """
+        labels = self.__job_labels()
+        filters = {'label': [f'{k}={v}' for k, v in labels.items()]} if labels else None
+        try:
+            services = self.docker_client.services.list(filters=filters)
+            tasks = self.docker_client.api.tasks(
+                filters={'service': [s.id for s in services]}
+            ) if services else []
+        except docker.errors.APIError as e:
+            status_code = 503 if e.response.status_code == 500 else e.response.status_code
+            raise ManagerException(str(e), status_code=status_code)
+
+        first_task = {}
+        for task in tasks:
+            first_task.setdefault(task['ServiceID'], task)
+        return {
+            JobName(s.name): self.__info_from(s, first_task.get(s.id)).status
+            for s in services
+        }
+
+    def get_capacity(self) -> ResourceCapacity:
+        """
+        The total CPUs and memory of the nodes of the swarm which are ready and active.
+        """
+        try:
+            nodes = self.docker_client.nodes.list()
+        except docker.errors.APIError as e:
+            status_code = 503 if e.response.status_code == 500 else e.response.status_code
+            raise ManagerException(str(e), status_code=status_code)
+        nano_cpus = memory_bytes = 0
+        for node in nodes:
+            if (node.attrs['Status'].get('State') != 'ready'
+                    or node.attrs['Spec'].get('Availability') != 'active'):
+                continue
+            resources = node.attrs['Description']['Resources']
+            nano_cpus += resources.get('NanoCPUs', 0)
+            memory_bytes += resources.get('MemoryBytes', 0)
+        return {'cpu_limit': nano_cpus // 10 ** 6, 'memory_limit': memory_bytes // 2 ** 20}
+
+    def __job_labels(self) -> Dict[str, str]:
+        return (self.config or {}).get('JOB_LABELS') or {}
+
+    def __info_from(self, job: Service, task: Optional[dict]) -> JobInfo:
         if not task:
             return JobInfo(
                 name=JobName(''), image=Image(''), cmd='', timestamp=TimeStamp(''),
@@ -0,0 +1,422 @@
+"""
+Tracing of requests: a span for every HTTP request, with a child span for
+every call to the compute manager and every HTTP request it makes to the
+backend (Docker Engine, Kubernetes API, Cromwell), so that it can be seen
+where the time of a slow request went.
+
+A ``traceparent`` header (W3C Trace Context) sent by the client, e.g. CUBE,
+is propagated: the span of the request joins the client's trace.
+
+Finished spans are sent to an exporter (:func:`create_exporter`): the log,
+a JSON Lines file, or an OpenTelemetry collector (OTLP/HTTP).
+"""
+import contextvars
+import functools
+import importlib
+import inspect
+import json
+import logging
+import queue
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Collection, Iterator, List, Optional, Tuple
+
+from .abstractmgr import AbstractManager, JobLogs
+from .metrics import BACKEND_METHODS
+
+logger = logging.getLogger(__name__)
+
+_current_span: contextvars.ContextVar[Optional['Span']] = contextvars.ContextVar(
+    'pman_current_span', default=None
+)
+
+_TRACEPARENT = re.compile(r'^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    kind: str
+    """``server`` for requests to pman, ``internal`` or ``client`` for calls to the backend."""
+    start: float
+    end: Optional[float] = None
+    error: Optional[str] = None
+    attributes: dict = field(default_factory=dict)
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.time()) - self.start
+
+    @property
+    def traceparent(self) -> str:
+        return f'00-{self.trace_id}-{self.span_id}-01'
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'kind': self.kind,
+            'start': self.start,
+            'duration_ms': round(self.duration * 1000, 3),
+            'error': self.error,
+            'attributes': self.attributes,
+        }
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str]]:
+    """
+    :return: the trace ID and the parent span ID of a ``traceparent`` header,
+             or ``None`` if it is missing or not valid
+    """
+    if not header:
+        return None
+    match = _TRACEPARENT.match(header.strip().lower())
+    if match is None or match.group(1) == 'ff':
+        return None
+    trace_id, parent_id = match.group(2), match.group(3)
+    if trace_id == '0' * 32 or parent_id == '0' * 16:
+        return None
+    return trace_id, parent_id
+
+
+class Tracer:
+    """
+    Creates spans, as children of the span of the current context.
+
+    :param exporter: callable which is given every finished span
+    """
+
+    def __init__(self, exporter: Callable[[Span], None]):
+        self.exporter = exporter
+
+    def start(self, name: str, kind: str = 'internal', traceparent: Optional[str] = None,
+              **attributes) -> Span:
+        """
+        Start a span, which is not made current. The parent of the span is
+        given by ``traceparent`` if it is valid, otherwise it is the current span.
+        """
+        parent = parse_traceparent(traceparent)
+        if parent is None and (span := current_span()) is not None:
+            parent = (span.trace_id, span.span_id)
+        trace_id, parent_id = parent or (secrets.token_hex(16), None)
+        return Span(name=name, trace_id=trace_id, span_id=secrets.token_hex(8),
+                    parent_id=parent_id, kind=kind, start=time.time(), attributes=attributes)
+
+    @staticmethod
+    def activate(span: Span) -> contextvars.Token:
+        return _current_span.set(span)
+
+    def finish(self, span: Span, token: Optional[contextvars.Token] = None,
+               error: Optional[BaseException] = None):
+        """
+        End a span and export it.
+
+        :param token: from :meth:`activate`, to make the previous span current again
+        """
+        span.end = time.time()
+        if error is not None and span.error is None:
+            span.error = f'{type(error).__name__}: {error}'
+        if token is not None:
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # the response was streamed from another context
+                pass
+        try:
+            self.exporter(span)
+        except Exception as e:
+            logger.error('Error exporting span: %s', str(e))
+
+    @contextmanager
+    def span(self, name: str, kind: str = 'internal', **attributes) -> Iterator[Span]:
+        """
+        A span for the duration of a ``with`` block, which is current within the block.
+        """
+        span = self.start(name, kind, **attributes)
+        token = self.activate(span)
+        try:
+            yield span
+        except BaseException as e:
+            self.finish(span, token, e)
+            raise
+        self.finish(span, token)
+
+
+def payload_size(value) -> Optional[int]:
+    """
+    The size of the logs returned by a call to the compute manager.
+    """
+    if isinstance(value, JobLogs):
+        value = value.logs
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    return None
+
+
+def trace_manager(mgr, tracer: Tracer, backend: str,
+                  methods: Collection[str] = BACKEND_METHODS):
+    """
+    Trace the calls to the methods of a compute manager, which may be asynchronous.
+
+    The methods of the instance are replaced, so the manager keeps its type.
+    """
+    for name in methods:
+        method = getattr(mgr, name, None)
+        if method is None or getattr(method, '__traced__', False):
+            continue
+        setattr(mgr, name, _traced(method, tracer, backend, name))
+    return mgr
+
+
+def _traced(method: Callable, tracer: Tracer, backend: str, name: str) -> Callable:
+    signature = inspect.signature(method)
+
+    def start(args, kwargs) -> Span:
+        try:
+            job_id = signature.bind_partial(*args, **kwargs).arguments.get('name')
+        except TypeError:
+            job_id = None
+        if not isinstance(job_id, str):
+            parent = current_span()
+            job_id = parent.attributes.get('job_id') if parent is not None else None
+        attributes = {'backend': backend}
+        if job_id:
+            attributes['job_id'] = job_id
+        return tracer.start(f'{backend}.{name}', **attributes)
+
+    def finish(span: Span, token, result, e: Optional[BaseException]):
+        if (size := payload_size(result)) is not None:
+            span.attributes['payload_size'] = size
+        tracer.finish(span, token, e)
+
+    if inspect.iscoroutinefunction(method):
+        @functools.wraps(method)
+        async def traced(*args, **kwargs):
+            span = start(args, kwargs)
+            token = tracer.activate(span)
+            try:
+                result = await method(*args, **kwargs)
+            except BaseException as e:
+                finish(span, token, None, e)
+                raise
+            finish(span, token, result, None)
+            return result
+    else:
+        @functools.wraps(method)
+        def traced(*args, **kwargs):
+            span = start(args, kwargs)
+            token = tracer.activate(span)
+            try:
+                result = method(*args, **kwargs)
+            except BaseException as e:
+                finish(span, token, None, e)
+                raise
+            finish(span, token, result, None)
+            return result
+    traced.__traced__ = True
+    return traced
+
+
+_http_tracer: Optional[Tracer] = None
+
+
+def trace_backend_http(tracer: Tracer):
+    """
+    Trace the HTTP requests made with urllib3, which is used by the clients of
+    Docker Engine, Kubernetes and Cromwell, while there is a current span.
+    Requests made outside of a span (e.g. by background threads) are not traced.
+
+    urllib3 is patched once per process, the spans go to the last ``tracer``.
+    """
+    global _http_tracer
+    from urllib3.connectionpool import HTTPConnectionPool
+
+    _http_tracer = tracer
+    urlopen = HTTPConnectionPool.urlopen
+    if getattr(urlopen, '__traced__', False):
+        return
+
+    @functools.wraps(urlopen)
+    def traced_urlopen(pool, method, url, *args, **kwargs):
+        parent = current_span()
+        tracer = _http_tracer
+        if parent is None or tracer is None:
+            return urlopen(pool, method, url, *args, **kwargs)
+        path = url.split('?', 1)[0]
+        attributes = {'http.method': method, 'http.host': pool.host or '', 'http.path': path}
+        if 'job_id' in parent.attributes:
+            attributes['job_id'] = parent.attributes['job_id']
+        with tracer.span(f'{method} {path}', kind='client', **attributes) as span:
+            response = urlopen(pool, method, url, *args, **kwargs)
+            span.attributes['http.status_code'] = response.status
+            if (length := response.headers.get('Content-Length')) is not None:
+                span.attributes['payload_size'] = int(length)
+            return response
+
+    traced_urlopen.__traced__ = True
+    HTTPConnectionPool.urlopen = traced_urlopen
+
+
+class LogExporter:
+    """
+    Logs every span as JSON, at the ``INFO`` level of the ``pman.tracing`` logger.
+    """
+
+    def __call__(self, span: Span):
+        logger.info('span %s', json.dumps(span.to_dict()))
+
+
+class JsonlExporter:
+    """
+    Appends every span as a line of JSON to a file, which can be shared by
+    the worker processes.
+    """
+
+    def __init__(self, path: str):
+        self.__path = path
+        self.__lock = threading.Lock()
+
+    def __call__(self, span: Span):
+        line = json.dumps(span.to_dict()) + '\n'
+        with self.__lock, open(self.__path, 'a') as f:
+            f.write(line)
+
+
+class OtlpExporter:
+    """
+    Sends spans to an OpenTelemetry collector with OTLP/HTTP (JSON encoding),
+    in batches, from a background thread.
+
+    :param endpoint: base URL of the collector, e.g. ``http://otel-collector:4318``
+    :param service_name: the ``service.name`` of the spans
+    :param flush_interval: maximum seconds between batches
+    """
+
+    KINDS = {'internal': 1, 'server': 2, 'client': 3}
+    MAX_QUEUED = 10000
+
+    def __init__(self, endpoint: str, service_name: str = 'pman', flush_interval: float = 5.0,
+                 batch_size: int = 512):
+        self.__url = endpoint.rstrip('/') + '/v1/traces'
+        self.__service_name = service_name
+        self.__flush_interval = flush_interval
+        self.__batch_size = batch_size
+        self.__queue: queue.Queue = queue.Queue(maxsize=self.MAX_QUEUED)
+        self.__thread: Optional[threading.Thread] = None
+        self.__lock = threading.Lock()
+
+    def __call__(self, span: Span):
+        self.__start()
+        try:
+            self.__queue.put_nowait(span)
+        except queue.Full:
+            logger.warning('Too many spans waiting to be sent, dropping span %s', span.name)
+
+    def __start(self):
+        # started lazily, in the worker process which exports spans
+        with self.__lock:
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__run, name='otlp-exporter',
+                                                 daemon=True)
+                self.__thread.start()
+
+    def __run(self):
+        while True:
+            spans = [self.__queue.get()]
+            deadline = time.monotonic() + self.__flush_interval
+            while len(spans) < self.__batch_size and (timeout := deadline - time.monotonic()) > 0:
+                try:
+                    spans.append(self.__queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                self.send(spans)
+            except Exception as e:
+                logger.error(f'Error sending {len(spans)} spans to {self.__url}: {str(e)}')
+
+    def send(self, spans: List[Span]):
+        import requests
+        res = requests.post(self.__url, json=self.encode(spans), timeout=10)
+        res.raise_for_status()
+
+    def encode(self, spans: List[Span]) -> dict:
+        """
+        The body of an OTLP/HTTP export request, in JSON.
+        """
+        return {'resourceSpans': [{
+            'resource': {'attributes': _otlp_attributes({'service.name': self.__service_name})},
+            'scopeSpans': [{
+                'scope': {'name': 'pman'},
+                'spans': [self.__encode_span(span) for span in spans],
+            }],
+        }]}
+
+    def __encode_span(self, span: Span) -> dict:
+        encoded = {
+            'traceId': span.trace_id,
+            'spanId': span.span_id,
+            'name': span.name,
+            'kind': self.KINDS.get(span.kind, 1),
+            'startTimeUnixNano': str(int(span.start * 1e9)),
+            'endTimeUnixNano': str(int((span.end or span.start) * 1e9)),
+            'attributes': _otlp_attributes(span.attributes),
+            'status': {'code': 2, 'message': span.error} if span.error else {'code': 1},
+        }
+        if span.parent_id:
+            encoded['parentSpanId'] = span.parent_id
+        return encoded
+
+
+def _otlp_attributes(attributes: dict) -> List[dict]:
+    def value(v) -> dict:
+        if isinstance(v, bool):
+            return {'boolValue': v}
+        if isinstance(v, int):
+            return {'intValue': str(v)}
+        if isinstance(v, float):
+            return {'doubleValue': v}
+        return {'stringValue': str(v)}
+    return [{'key': k, 'value': value(v)} for k, v in attributes.items()]
+
+
+def create_exporter(config: dict) -> Callable[[Span], None]:
+    """
+    Create the exporter named by ``TRACING_EXPORTER``: ``log``, ``jsonl``, ``otlp``,
+    or ``package.module:factory``, a callable which is given the configuration
+    and returns an exporter.
+    """
+    name = config.get('TRACING_EXPORTER', 'log')
+    if name == 'log':
+        return LogExporter()
+    if name == 'jsonl':
+        return JsonlExporter(config['TRACING_FILE'])
+    if name == 'otlp':
+        return OtlpExporter(config['TRACING_OTLP_ENDPOINT'],
+                            service_name=config.get('TRACING_SERVICE_NAME', 'pman'))
+    if ':' in name:
+        module, factory = name.split(':', 1)
+        return getattr(importlib.import_module(module), factory)(config)
+    raise ValueError(f'Unknown TRACING_EXPORTER: {name}')
+
+
+def create_tracer(config: dict, compute_mgr: AbstractManager) -> Tracer:
+    """
+    Create the tracer of the app, and trace the calls to the compute manager.
+    """
+    tracer = Tracer(create_exporter(config))
+    trace_manager(compute_mgr, tracer, config.get('CONTAINER_ENV'))
+    trace_backend_http(tracer)
+    return tracer
@@ -12,7 +12,12 @@ setup(
     packages         =   find_packages(),
     install_requires =   ['docker', 'openshift', 'kubernetes', 'cromwell-tools',
                           'python-keystoneclient', 'Flask', 'Flask_RESTful', 'environs',
-                          'pyserde', 'jinja2'],
+                          'pyserde', 'jinja2', 'prometheus-client'],
+    extras_require   =   {'async': ['starlette', 'uvicorn', 'aiodocker', 'kubernetes_asyncio',
+                                    'httpx'],
+                          'loadgen': ['requests']},
+    entry_points     =   {'console_scripts': ['pman = pman.__main__:main',
+                                             'pman-loadgen = pman.loadgen:main']},
     license          =   'MIT',
     zip_safe         =   False,
     python_requires  =   '>=3.10.2'
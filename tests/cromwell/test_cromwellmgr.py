@@ -2,7 +2,7 @@ import io
 import json
 import unittest
 from unittest.mock import Mock, patch, ANY, call
-from pman.abstractmgr import Image, JobName
+from pman.abstractmgr import Image, JobName, JobStatus
 from pman.cromwellmgr import CromwellManager, CromwellException, WorkflowId
 import tests.cromwell.examples.metadata as metadata_example
 import tests.cromwell.examples.query as query_example
@@ -112,6 +112,54 @@ class CromwellTestCase(unittest.TestCase):
         self.assertEqual(404, e.exception.status_code,
                          msg='Should have Exception with status_code=404 when job not found')
 
+    @patch('cromwell_tools.cromwell_api.CromwellAPI.metadata')
+    @patch('cromwell_tools.cromwell_api.CromwellAPI.query')
+    def test_get_jobs_info(self, mock_query: Mock, mock_metadata: Mock):
+        mock_query.return_value = Mock(status_code=200, text=json.dumps({
+            'results': [{
+                'id': metadata_example.workflow_uuid,
+                'name': 'ChRISJob',
+                'status': 'Running',
+                'labels': {CromwellManager.PMAN_CROMWELL_LABEL: 'example-jid-1234'}
+            }],
+            'totalResultsCount': 1
+        }))
+        mock_metadata.return_value = Mock(status_code=200, text=metadata_example.response_running)
+
+        infos = self.manager.get_jobs_info([JobName('example-jid-1234'), JobName('missing')])
+
+        self.assertDictEqual({'example-jid-1234': metadata_example.expected_running}, infos)
+        mock_query.assert_called_once_with(
+            query_dict={
+                'labelor': [f'{CromwellManager.PMAN_CROMWELL_LABEL}:example-jid-1234',
+                            f'{CromwellManager.PMAN_CROMWELL_LABEL}:missing'],
+                'additionalQueryResultFields': ['labels']
+            },
+            auth=ANY, raise_for_status=True
+        )
+        mock_metadata.assert_called_once_with(uuid=metadata_example.workflow_uuid,
+                                              auth=ANY, raise_for_status=False)
+
+    @patch('cromwell_tools.cromwell_api.CromwellAPI.query')
+    def test_list_job_statuses(self, mock_query: Mock):
+        mock_query.return_value = Mock(status_code=200, text=json.dumps({
+            'results': [{
+                'id': metadata_example.workflow_uuid,
+                'name': 'ChRISJob',
+                'status': 'Running',
+                'labels': {CromwellManager.PMAN_CROMWELL_LABEL: 'example-jid-1234'}
+            }, {
+                'id': 'not-created-by-pman',
+                'status': 'Submitted',
+                'labels': {}
+            }],
+            'totalResultsCount': 2
+        }))
+        self.assertDictEqual({'example-jid-1234': JobStatus.started},
+                             self.manager.list_job_statuses())
+        query_dict = mock_query.call_args.kwargs['query_dict']
+        self.assertEqual({'On Hold', 'Submitted', 'Running', 'Aborting'}, set(query_dict['status']))
+
     @patch_cromwell_api('abort', r'{"id": "tbh didnt actually try this one", "status": "Aborting"}')
     def test_abort(self, mock_abort: Mock):
         w = WorkflowId('remove-me')
@@ -0,0 +1,104 @@
+"""
+In-memory stand-ins for compute backends, for testing resources without a cluster,
+and helpers shared by the tests.
+"""
+import os
+import shlex
+import tempfile
+import threading
+import unittest
+from typing import List, Optional, AnyStr, Dict
+
+from pman.abstractmgr import (AbstractManager, Image, JobName, ResourcesDict, MountsDict,
+                              JobInfo, JobStatus, TimeStamp, ManagerException)
+
+
+class FakeManager(AbstractManager[JobInfo]):
+    """
+    A compute manager which remembers scheduled jobs in a dict.
+    Jobs stay in the state they were created in unless :meth:`set_status` is called.
+    """
+
+    def __init__(self, config_dict=None):
+        super().__init__(config_dict)
+        self.jobs: Dict[JobName, JobInfo] = {}
+        self.logs: Dict[JobName, bytes] = {}
+        self.calls: List[str] = []
+        self.__lock = threading.Lock()
+
+    def schedule_job(self, image: Image, command: List[str], name: JobName,
+                     resources_dict: ResourcesDict, env: List[str],
+                     uid: Optional[int], gid: Optional[int],
+                     mounts_dict: MountsDict) -> JobInfo:
+        self.calls.append('schedule_job')
+        with self.__lock:
+            if name in self.jobs:
+                raise ManagerException(f'job "{name}" already exists', status_code=409)
+            job = JobInfo(name=name, image=image, cmd=shlex.join(command),
+                          timestamp=TimeStamp(''), message='created',
+                          status=JobStatus.notstarted)
+            self.jobs[name] = job
+            self.logs[name] = b''
+        return job
+
+    def get_job(self, name: JobName) -> JobInfo:
+        self.calls.append('get_job')
+        try:
+            return self.jobs[name]
+        except KeyError:
+            raise ManagerException(f'job "{name}" not found', status_code=404)
+
+    def get_job_logs(self, job: JobInfo, tail: int) -> AnyStr:
+        self.calls.append('get_job_logs')
+        lines = self.logs[job.name].splitlines(keepends=True)
+        return b''.join(lines[-tail:] if tail else lines)
+
+    def get_job_info(self, job: JobInfo) -> JobInfo:
+        self.calls.append('get_job_info')
+        return self.jobs[job.name]
+
+    def remove_job(self, job: JobInfo):
+        self.calls.append('remove_job')
+        with self.__lock:
+            del self.jobs[job.name]
+            del self.logs[job.name]
+
+    def list_job_statuses(self) -> Dict[JobName, JobStatus]:
+        self.calls.append('list_job_statuses')
+        with self.__lock:
+            return {name: job.status for name, job in self.jobs.items()}
+
+    def set_status(self, name: JobName, status: JobStatus, message: str = '',
+                   timestamp: str = ''):
+        with self.__lock:
+            old = self.jobs[name]
+            self.jobs[name] = JobInfo(name=old.name, image=old.image, cmd=old.cmd,
+                                      timestamp=TimeStamp(timestamp),
+                                      message=message or status.value, status=status)
+
+
+class Clock:
+    """
+    A clock which only moves when the test changes ``now``.
+    """
+
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def info(name: str, status: JobStatus = JobStatus.started) -> JobInfo:
+    return JobInfo(name=JobName(name), image=Image('fnndsc/pl-simpledsapp'), cmd='simpledsapp',
+                   timestamp=TimeStamp(''), message=status.value, status=status)
+
+
+def temp_dir(test: unittest.TestCase) -> str:
+    tmp = tempfile.TemporaryDirectory()
+    test.addCleanup(tmp.cleanup)
+    return tmp.name
+
+
+def temp_db(test: unittest.TestCase) -> str:
+    return os.path.join(temp_dir(test), 'pman.db')
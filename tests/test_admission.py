@@ -0,0 +1,103 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from pman.abstractmgr import JobStatus, ManagerException
+from pman.admission import AdmissionController, Reservation, requested_resources
+from tests.fakes import FakeManager
+
+
+def make_resources(cpu_limit: int, memory_limit: int = 100, gpu_limit: int = 0,
+                   number_of_workers: int = 1) -> dict:
+    return {'number_of_workers': number_of_workers, 'cpu_limit': cpu_limit,
+            'memory_limit': memory_limit, 'gpu_limit': gpu_limit}
+
+
+class AdmissionControllerTests(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'pman.db')
+        self.compute_mgr = FakeManager()
+        self.admission = AdmissionController(self.path, self.compute_mgr,
+                                             capacity={'cpu_limit': 2000, 'memory_limit': None},
+                                             reconcile_interval=0)
+
+    def schedule(self, name: str):
+        self.compute_mgr.schedule_job('fnndsc/pl-simpledsapp', ['simpledsapp'], name,
+                                      {}, [], None, None, {})
+
+    def test_requested_resources(self):
+        self.assertEqual({'cpu_limit': 3000, 'memory_limit': 300, 'gpu_limit': 0},
+                         requested_resources(make_resources(1000, number_of_workers=3)))
+
+    def test_reserve_until_full(self):
+        self.assertIs(Reservation.reserved,
+                      self.admission.reserve('chris-jid-1', make_resources(1500)))
+        self.assertIs(Reservation.existing,
+                      self.admission.reserve('chris-jid-1', make_resources(1500)))
+        self.assertFalse(self.admission.reserve('chris-jid-2', make_resources(1000)))
+        self.assertTrue(self.admission.reserve('chris-jid-3', make_resources(500)))
+        self.assertEqual({'capacity': {'cpu_limit': 2000},
+                          'reserved': {'cpu_limit': 2000, 'memory_limit': 200, 'gpu_limit': 0},
+                          'headroom': {'cpu_limit': 0},
+                          'jobs': 2},
+                         self.admission.stats())
+
+    def test_shared_between_processes(self):
+        other = AdmissionController(self.path, self.compute_mgr, capacity={'cpu_limit': 2000})
+        self.assertTrue(self.admission.reserve('chris-jid-1', make_resources(1500)))
+        self.assertFalse(other.reserve('chris-jid-2', make_resources(1000)))
+
+    def test_larger_than_capacity(self):
+        with self.assertRaises(ManagerException) as cm:
+            self.admission.reserve('chris-jid-1', make_resources(3000))
+        self.assertEqual(400, cm.exception.status_code)
+
+    def test_release_finished(self):
+        self.schedule('chris-jid-1')
+        self.admission.reserve('chris-jid-1', make_resources(2000))
+        self.admission.release_finished(self.compute_mgr.get_jobs_info(['chris-jid-1']))
+        self.assertEqual(1, self.admission.stats()['jobs'])
+        self.compute_mgr.set_status('chris-jid-1', JobStatus.finishedSuccessfully)
+        self.admission.release_finished(self.compute_mgr.get_jobs_info(['chris-jid-1']))
+        self.assertEqual(0, self.admission.stats()['jobs'])
+
+    def test_release_many(self):
+        admission = AdmissionController(self.path, self.compute_mgr, capacity={'cpu_limit': None})
+        names = [f'chris-jid-{i}' for i in range(1200)]
+        for name in names:
+            self.schedule(name)
+            admission.reserve(name, make_resources(1000))
+            self.compute_mgr.set_status(name, JobStatus.finishedSuccessfully)
+        admission.release_finished(self.compute_mgr.get_jobs_info(names))
+        self.assertEqual(0, admission.stats()['jobs'])
+
+    def test_reconcile_when_full(self):
+        self.schedule('chris-jid-1')
+        self.schedule('chris-jid-2')
+        self.admission.reserve('chris-jid-1', make_resources(1000))
+        self.admission.reserve('chris-jid-2', make_resources(1000))
+        self.admission.reserve('chris-jid-3', make_resources(0))  # never submitted
+        self.compute_mgr.set_status('chris-jid-1', JobStatus.finishedWithError)
+
+        self.assertFalse(self.admission.reserve('chris-jid-4', make_resources(1000)))
+        with patch('pman.admission.RECONCILE_GRACE_SECONDS', 0):
+            self.assertTrue(self.admission.reserve('chris-jid-4', make_resources(1000)))
+        self.assertEqual(2, self.admission.stats()['jobs'])
+
+    def test_discovered_capacity(self):
+        with patch.object(self.compute_mgr, 'get_capacity', create=True,
+                          return_value={'cpu_limit': 4000, 'memory_limit': 1024}) as get_capacity:
+            self.assertEqual({'cpu_limit': 2000, 'memory_limit': 1024}, self.admission.capacity)
+            self.assertEqual({'cpu_limit': 2000, 'memory_limit': 1024}, self.admission.capacity)
+        get_capacity.assert_called_once()
+
+    def test_capacity_not_discoverable(self):
+        self.assertEqual({'cpu_limit': 2000}, self.admission.capacity)
+
+
+if __name__ == '__main__':
+    unittest.main()
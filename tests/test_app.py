@@ -0,0 +1,490 @@
+import logging
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from flask import url_for
+
+from pman.abstractmgr import Image, JobName, JobStatus, ManagerException
+from pman.app import create_app
+from pman.longpoll import ChangeNotifier
+from tests.fakes import FakeManager
+
+
+class AppTestCase(unittest.TestCase):
+    """
+    Base class for tests which run the app against a :class:`FakeManager`.
+    """
+
+    def setUp(self):
+        logging.disable(logging.WARNING)
+        env = patch.dict('os.environ', {'STORAGE_TYPE': 'host', 'STOREBASE': '/tmp',
+                                        'APPLICATION_MODE': 'dev'})
+        env.start()
+        self.addCleanup(env.stop)
+
+        self.compute_mgr = FakeManager()
+        self.app = create_app({'TESTING': True, **self.app_config()}, compute_mgr=self.compute_mgr)
+        self.client = self.app.test_client()
+
+    def app_config(self) -> dict:
+        return {}
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def url_for(self, endpoint: str, **kwargs) -> str:
+        with self.app.test_request_context():
+            return url_for(endpoint, **kwargs)
+
+    def post_job(self, jid: str, **kwargs):
+        data = {
+            'jid': jid,
+            'args': ['--dir', '/share/incoming'],
+            'auid': 'cube',
+            'number_of_workers': '1',
+            'cpu_limit': '1000',
+            'memory_limit': '200',
+            'gpu_limit': '0',
+            'image': 'fnndsc/pl-simplefsapp',
+            'entrypoint': ['simplefsapp'],
+            'type': 'fs',
+            'input_dir': f'key-{jid}/incoming',
+            'output_dir': f'key-{jid}/outgoing',
+            **kwargs
+        }
+        return self.client.post(self.url_for('api.joblist'), json=data)
+
+
+class SharedComputeManagerTests(AppTestCase):
+
+    def test_manager_is_shared_between_requests(self):
+        with patch('pman.resources.get_compute_mgr') as mock_get_compute_mgr:
+            self.assertEqual(201, self.post_job('chris-jid-1').status_code)
+            url = self.url_for('api.job', job_id='chris-jid-1')
+            self.assertEqual(200, self.client.get(url).status_code)
+            self.assertEqual(200, self.client.get(url).status_code)
+            mock_get_compute_mgr.assert_not_called()
+        self.assertEqual(['schedule_job', 'get_job_info',
+                          'get_job', 'get_job_info', 'get_job_logs',
+                          'get_job', 'get_job_info', 'get_job_logs'],
+                         self.compute_mgr.calls)
+
+    def test_get_missing_job(self):
+        res = self.client.get(self.url_for('api.job', job_id='does-not-exist'))
+        self.assertEqual(404, res.status_code)
+
+
+class DockerLocalVolumeTests(AppTestCase):
+
+    def app_config(self) -> dict:
+        return {'STORAGE_TYPE': 'docker_local_volume',
+                'STOREBASE': '/var/lib/docker/volumes/storebase/_data'}
+
+    def test_mounts_are_in_volume(self):
+        with patch.object(self.compute_mgr, 'schedule_job',
+                          wraps=self.compute_mgr.schedule_job) as schedule_job:
+            self.assertEqual(201, self.post_job('chris-jid-1').status_code)
+        mounts_dict = schedule_job.call_args.kwargs['mounts_dict']
+        self.assertEqual('/var/lib/docker/volumes/storebase/_data/key-chris-jid-1/incoming',
+                         mounts_dict['inputdir_source'])
+        self.assertEqual('/var/lib/docker/volumes/storebase/_data/key-chris-jid-1/outgoing',
+                         mounts_dict['outputdir_source'])
+
+
+class JobsStatusTests(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for jid in ('chris-jid-1', 'chris-jid-2'):
+            self.post_job(jid)
+        self.compute_mgr.set_status('chris-jid-2', JobStatus.finishedSuccessfully)
+
+    def test_get_jids(self):
+        res = self.client.get(self.url_for('api.joblist', jids='chris-jid-2,chris-jid-1,chris-jid-3'))
+        self.assertEqual(200, res.status_code)
+        self.assertEqual(['chris-jid-2', 'chris-jid-1'], [j['jid'] for j in res.json['jobs']])
+        self.assertEqual(['finishedSuccessfully', 'notstarted'],
+                         [j['status'] for j in res.json['jobs']])
+        self.assertEqual(['chris-jid-3'], res.json['not_found'])
+
+    def test_post_batch(self):
+        res = self.client.post(self.url_for('api.jobbatch'),
+                               json={'jids': ['chris-jid-1', 'chris-jid-2']})
+        self.assertEqual(200, res.status_code)
+        self.assertEqual(['chris-jid-1', 'chris-jid-2'], [j['jid'] for j in res.json['jobs']])
+        self.assertEqual([], res.json['not_found'])
+
+
+class StatusOnlyTests(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.post_job('chris-jid-1')
+        self.compute_mgr.calls.clear()
+
+    def test_logs_false(self):
+        res = self.client.get(self.url_for('api.job', job_id='chris-jid-1', logs='false'))
+        self.assertEqual(200, res.status_code)
+        self.assertNotIn('logs', res.json)
+        self.assertEqual('notstarted', res.json['status'])
+        self.assertNotIn('get_job_logs', self.compute_mgr.calls)
+
+        counters = self.client.get(self.url_for('api.joblist')).json['stats']['counters']
+        self.assertEqual({'log_fetches_skipped': 1, 'backend_calls_saved': 1}, counters)
+
+    def test_fields(self):
+        res = self.client.get(self.url_for('api.job', job_id='chris-jid-1', fields='jid,status'))
+        self.assertEqual({'jid': 'chris-jid-1', 'status': 'notstarted'}, res.json)
+        self.assertNotIn('get_job_logs', self.compute_mgr.calls)
+
+        res = self.client.get(self.url_for('api.job', job_id='chris-jid-1', fields='status,logs'))
+        self.assertEqual({'status': 'notstarted', 'logs': ''}, res.json)
+        self.assertIn('get_job_logs', self.compute_mgr.calls)
+
+    def test_unknown_fields(self):
+        res = self.client.get(self.url_for('api.job', job_id='chris-jid-1', fields='status,color'))
+        self.assertEqual(400, res.status_code)
+
+
+class LongPollTests(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.post_job('chris-jid-1')
+
+    def finish_later(self):
+        def finish():
+            self.compute_mgr.set_status('chris-jid-1', JobStatus.finishedSuccessfully)
+            if self.compute_mgr.change_notifier is not None:
+                self.compute_mgr.change_notifier.notify('chris-jid-1')
+        t = threading.Timer(0.1, finish)
+        t.start()
+        self.addCleanup(t.join)
+
+    def test_wait_for_change(self):
+        self.compute_mgr.change_notifier = ChangeNotifier()
+        self.finish_later()
+        res = self.client.get(self.url_for('api.job', job_id='chris-jid-1',
+                                           wait=30, status='notstarted'))
+        self.assertEqual(200, res.status_code)
+        self.assertEqual('finishedSuccessfully', res.json['status'])
+        self.assertEqual(1, self.client.get(self.url_for('api.joblist'))
+                         .json['stats']['counters']['long_polls'])
+
+    def test_wait_by_polling(self):
+        self.finish_later()
+        res = self.client.get(self.url_for('api.job', job_id='chris-jid-1',
+                                           wait=30, status='notstarted'))
+        self.assertEqual('finishedSuccessfully', res.json['status'])
+
+    def test_already_changed(self):
+        res = self.client.get(self.url_for('api.job', job_id='chris-jid-1',
+                                           wait=30, status='started'))
+        self.assertEqual('notstarted', res.json['status'])
+
+    def test_missing_job(self):
+        res = self.client.get(self.url_for('api.job', job_id='chris-jid-2',
+                                           wait=30, status='started'))
+        self.assertEqual(404, res.status_code)
+
+    def test_invalid_status(self):
+        res = self.client.get(self.url_for('api.job', job_id='chris-jid-1',
+                                           wait=30, status='running'))
+        self.assertEqual(400, res.status_code)
+
+
+class EventsTests(AppTestCase):
+
+    def app_config(self) -> dict:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        return {'EVENTS_KEEPALIVE_SECONDS': 0.01, 'STATE_DB': os.path.join(tmp.name, 'pman.db')}
+
+    def setUp(self):
+        super().setUp()
+        self.post_job('chris-jid-1')
+        self.event_log = self.app.extensions['change_detector'].event_log
+        self.addCleanup(self.app.extensions['change_detector'].stop)
+
+    def read_events(self, n: int, **kwargs) -> list:
+        res = self.client.get(self.url_for('api.events'), buffered=False, **kwargs)
+        self.assertEqual(200, res.status_code)
+        self.assertEqual('text/event-stream', res.mimetype)
+        chunks = []
+        for chunk in res.response:
+            chunks.append(chunk.decode() if isinstance(chunk, bytes) else chunk)
+            if len(chunks) == n:
+                break
+        res.close()
+        return chunks
+
+    def test_keepalive(self):
+        self.assertEqual([': keepalive\n\n'], self.read_events(1))
+
+    def test_resume(self):
+        first = self.event_log.publish({'jid': 'chris-jid-1', 'status': 'started'})
+        second = self.event_log.publish({'jid': 'chris-jid-1', 'status': 'finishedSuccessfully'})
+        chunks = self.read_events(1, headers={'Last-Event-ID': first.id})
+        self.assertEqual([f'id: {second.id}\ndata: {{"jid": "chris-jid-1", '
+                          f'"status": "finishedSuccessfully"}}\n\n'], chunks)
+
+    def test_resume_from_another_worker(self):
+        other = create_app({'TESTING': True, **self.app_config(), 'STATE_DB': self.app.config['STATE_DB']},
+                           compute_mgr=self.compute_mgr)
+        self.addCleanup(other.extensions['change_detector'].stop)
+        first = self.event_log.publish({'jid': 'chris-jid-1', 'status': 'started'})
+        second = other.extensions['change_detector'].event_log.publish(
+            {'jid': 'chris-jid-1', 'status': 'finishedSuccessfully'}
+        )
+        self.assertEqual(f'{first.id[:-1]}2', second.id)
+        chunks = self.read_events(1, headers={'Last-Event-ID': first.id})
+        self.assertTrue(chunks[0].startswith(f'id: {second.id}\n'))
+
+    def test_reset(self):
+        chunks = self.read_events(1, headers={'Last-Event-ID': 'from-another-database'})
+        self.assertTrue(chunks[0].startswith('id: '))
+        self.assertIn('event: reset', chunks[0])
+
+
+class DispatchQueueTests(AppTestCase):
+
+    def app_config(self) -> dict:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        # no threads, jobs are dispatched by calling dispatch_one()
+        return {'DISPATCH_QUEUE': True, 'DISPATCH_WORKERS': 0,
+                'STATE_DB': os.path.join(tmp.name, 'pman.db')}
+
+    def setUp(self):
+        super().setUp()
+        self.dispatcher = self.app.extensions['dispatcher']
+
+    def test_post_is_queued(self):
+        res = self.post_job('chris-jid-1')
+        self.assertEqual(202, res.status_code)
+        self.assertEqual('notstarted', res.json['status'])
+        self.assertEqual([], self.compute_mgr.calls)
+        self.assertEqual(409, self.post_job('chris-jid-1').status_code)
+
+        res = self.client.get(self.url_for('api.job', job_id='chris-jid-1'))
+        self.assertEqual(200, res.status_code)
+        self.assertEqual('notstarted', res.json['status'])
+        self.assertEqual('queued', res.json['message'])
+        self.assertEqual('', res.json['logs'])
+        self.assertEqual([], self.compute_mgr.calls)
+
+        stats = self.client.get(self.url_for('api.joblist')).json['stats']
+        self.assertEqual(1, stats['dispatch_queue']['queued'])
+
+    def test_dispatch(self):
+        self.post_job('chris-jid-1')
+        self.assertTrue(self.dispatcher.dispatch_one())
+        self.assertFalse(self.dispatcher.dispatch_one())
+        self.assertEqual(['schedule_job'], self.compute_mgr.calls)
+        job = self.compute_mgr.jobs['chris-jid-1']
+        self.assertEqual('fnndsc/pl-simplefsapp', job.image)
+        self.assertEqual('simplefsapp --dir /share/incoming /share/outgoing', job.cmd)
+
+        res = self.client.get(self.url_for('api.job', job_id='chris-jid-1'))
+        self.assertEqual('created', res.json['message'])
+        self.assertIn('get_job', self.compute_mgr.calls)
+
+    def test_jobs_status(self):
+        self.post_job('chris-jid-1')
+        self.post_job('chris-jid-2')
+        self.dispatcher.dispatch_one()
+        res = self.client.get(self.url_for('api.joblist', jids='chris-jid-1,chris-jid-2,chris-jid-3'))
+        self.assertEqual(['created', 'queued'], [j['message'] for j in res.json['jobs']])
+        self.assertEqual(['chris-jid-3'], res.json['not_found'])
+
+    def test_dispatch_error(self):
+        with patch.object(self.compute_mgr, 'schedule_job',
+                          side_effect=ManagerException('image not found', status_code=400)):
+            self.post_job('chris-jid-1')
+            self.dispatcher.dispatch_one()
+        res = self.client.get(self.url_for('api.job', job_id='chris-jid-1'))
+        self.assertEqual('finishedWithError', res.json['status'])
+        self.assertEqual('image not found', res.json['message'])
+
+    def test_job_exists_on_backend(self):
+        self.compute_mgr.schedule_job(Image('fnndsc/pl-simplefsapp'), ['simplefsapp'],
+                                      JobName('chris-jid-1'), {}, [], None, None, {})
+        self.compute_mgr.set_status(JobName('chris-jid-1'), JobStatus.finishedSuccessfully)
+        self.assertEqual(202, self.post_job('chris-jid-1').status_code)
+        self.assertTrue(self.dispatcher.dispatch_one())
+        self.assertIsNone(self.dispatcher.queue.get('chris-jid-1'))
+        # the status of the existing job is reported
+        res = self.client.get(self.url_for('api.job', job_id='chris-jid-1'))
+        self.assertEqual('finishedSuccessfully', res.json['status'])
+
+    def test_job_submitted_by_earlier_attempt(self):
+        self.post_job('chris-jid-1')
+        self.dispatcher.queue.claim()
+        # the claim of the first attempt expired
+        with patch('pman.dispatch.time.time', return_value=1e12), \
+                patch.object(self.compute_mgr, 'schedule_job',
+                             side_effect=ManagerException('already exists', status_code=409)):
+            self.assertTrue(self.dispatcher.dispatch_one())
+        self.assertIsNone(self.dispatcher.queue.get('chris-jid-1'))
+
+    def test_delete_queued(self):
+        self.post_job('chris-jid-1')
+        res = self.client.delete(self.url_for('api.job', job_id='chris-jid-1'))
+        self.assertEqual(204, res.status_code)
+        self.assertFalse(self.dispatcher.dispatch_one())
+        res = self.client.get(self.url_for('api.job', job_id='chris-jid-1'))
+        self.assertEqual(404, res.status_code)
+
+
+class AdmissionTests(AppTestCase):
+
+    def app_config(self) -> dict:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        return {'ADMISSION_CONTROL': True, 'ADMISSION_CPU_LIMIT': 1500,
+                'ADMISSION_RETRY_AFTER': 5, 'STATE_DB': os.path.join(tmp.name, 'pman.db')}
+
+    def test_reject_when_full(self):
+        self.assertEqual(201, self.post_job('chris-jid-1').status_code)
+        res = self.post_job('chris-jid-2')
+        self.assertEqual(429, res.status_code)
+        self.assertEqual('5', res.headers['Retry-After'])
+        self.assertNotIn('chris-jid-2', self.compute_mgr.jobs)
+
+        stats = self.client.get(self.url_for('api.joblist')).json['stats']
+        self.assertEqual({'cpu_limit': 500}, stats['admission']['headroom'])
+        self.assertEqual(1, stats['counters']['admission_rejected'])
+
+    def test_release_when_finished(self):
+        self.post_job('chris-jid-1')
+        self.compute_mgr.set_status('chris-jid-1', JobStatus.finishedSuccessfully)
+        self.client.get(self.url_for('api.job', job_id='chris-jid-1'))
+        self.assertEqual(201, self.post_job('chris-jid-2').status_code)
+
+    def test_release_when_deleted(self):
+        self.post_job('chris-jid-1')
+        self.client.delete(self.url_for('api.job', job_id='chris-jid-1'))
+        self.assertEqual(201, self.post_job('chris-jid-2').status_code)
+
+    def test_release_when_schedule_fails(self):
+        with patch.object(self.compute_mgr, 'schedule_job',
+                          side_effect=ManagerException('image not found', status_code=400)):
+            self.assertEqual(400, self.post_job('chris-jid-1').status_code)
+        self.assertEqual(201, self.post_job('chris-jid-2').status_code)
+
+    def test_keep_reservation_of_existing_job(self):
+        self.assertEqual(201, self.post_job('chris-jid-1').status_code)
+        self.assertEqual(409, self.post_job('chris-jid-1').status_code)
+        stats = self.client.get(self.url_for('api.joblist')).json['stats']
+        self.assertEqual(1, stats['admission']['jobs'])
+
+    def test_release_when_job_exists(self):
+        self.compute_mgr.schedule_job(Image('fnndsc/pl-simpledsapp'), ['simpledsapp'],
+                                      JobName('chris-jid-1'), {}, [], None, None, {})
+        self.assertEqual(409, self.post_job('chris-jid-1').status_code)
+        stats = self.client.get(self.url_for('api.joblist')).json['stats']
+        self.assertEqual(0, stats['admission']['jobs'])
+
+    def test_larger_than_capacity(self):
+        res = self.post_job('chris-jid-1', cpu_limit='2000')
+        self.assertEqual(400, res.status_code)
+
+
+class QueuedAdmissionTests(AppTestCase):
+
+    def app_config(self) -> dict:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        return {'ADMISSION_CONTROL': True, 'ADMISSION_CPU_LIMIT': 1500,
+                'DISPATCH_QUEUE': True, 'DISPATCH_WORKERS': 0,
+                'STATE_DB': os.path.join(tmp.name, 'pman.db')}
+
+    def test_queue_when_full(self):
+        dispatcher = self.app.extensions['dispatcher']
+        self.assertEqual(202, self.post_job('chris-jid-1').status_code)
+        self.assertEqual(202, self.post_job('chris-jid-2').status_code)
+        self.assertTrue(dispatcher.dispatch_one())
+        self.assertFalse(dispatcher.dispatch_one())
+        res = self.client.get(self.url_for('api.job', job_id='chris-jid-2'))
+        self.assertEqual('queued', res.json['message'])
+        self.assertEqual(0, dispatcher.queue.get('chris-jid-2').attempts)
+
+        self.client.delete(self.url_for('api.job', job_id='chris-jid-1'))
+        self.assertTrue(dispatcher.dispatch_one())
+        self.assertIn('chris-jid-2', self.compute_mgr.jobs)
+
+
+class FairShareTests(AppTestCase):
+
+    def app_config(self) -> dict:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        return {'ADMISSION_CONTROL': True, 'ADMISSION_CPU_LIMIT': 3000,
+                'DISPATCH_QUEUE': True, 'DISPATCH_WORKERS': 0, 'FAIR_SHARE': True,
+                'FAIR_SHARE_MAX_JOBS_PER_USER': 2,
+                'STATE_DB': os.path.join(tmp.name, 'pman.db')}
+
+    def setUp(self):
+        super().setUp()
+        self.dispatcher = self.app.extensions['dispatcher']
+
+    def dispatch_all(self) -> list:
+        self.compute_mgr.calls.clear()
+        while self.dispatcher.dispatch_one():
+            pass
+        return [name for name in self.compute_mgr.jobs]
+
+    def test_small_user_is_not_starved(self):
+        for i in range(5):
+            self.post_job(f'bulk-{i}', auid='bulk')
+        self.post_job('small-0', auid='small')
+        self.assertEqual(['bulk-0', 'small-0', 'bulk-1'], self.dispatch_all())
+
+        stats = self.client.get(self.url_for('api.joblist')).json['stats']
+        self.assertEqual({'queued': 3, 'jobs': 2, 'dominant_share': 0.6667, 'weight': 1.0},
+                         stats['fair_share']['bulk'])
+
+    def test_max_jobs_per_user(self):
+        for i in range(3):
+            self.post_job(f'bulk-{i}', auid='bulk', cpu_limit='100')
+        self.assertEqual(['bulk-0', 'bulk-1'], self.dispatch_all())
+        self.client.delete(self.url_for('api.job', job_id='bulk-0'))
+        self.assertEqual(['bulk-1', 'bulk-2'], self.dispatch_all())
+
+
+class JobLogsTests(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.post_job('chris-jid-1')
+        self.compute_mgr.logs['chris-jid-1'] = b'one\ntwo\nthree\n'
+
+    def test_stream_logs(self):
+        res = self.client.get(self.url_for('api.joblogs', job_id='chris-jid-1'))
+        self.assertEqual(200, res.status_code)
+        self.assertEqual('text/plain; charset=utf-8', res.content_type)
+        self.assertEqual(b'one\ntwo\nthree\n', res.data)
+
+    def test_stream_logs_tail(self):
+        res = self.client.get(self.url_for('api.joblogs', job_id='chris-jid-1', tail=2, follow='false'))
+        self.assertEqual(b'two\nthree\n', res.data)
+
+    def test_stream_logs_bad_tail(self):
+        res = self.client.get(self.url_for('api.joblogs', job_id='chris-jid-1', tail=-1))
+        self.assertEqual(400, res.status_code)
+
+    def test_logs_cursor_not_supported(self):
+        res = self.client.get(self.url_for('api.job', job_id='chris-jid-1', cursor=''))
+        self.assertEqual('one\ntwo\nthree\n', res.json['logs'])
+        self.assertIsNone(res.json['next_cursor'])
+
+    def test_stream_logs_not_found(self):
+        res = self.client.get(self.url_for('api.joblogs', job_id='chris-jid-2'))
+        self.assertEqual(404, res.status_code)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,206 @@
+import logging
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from pman.abstractmgr import JobStatus
+from pman.app import create_app
+from tests.fakes import FakeManager
+
+try:
+    from starlette.testclient import TestClient
+    from pman.app import create_asgi_app
+    from pman.asyncmgr import AsyncManager
+except ImportError:
+    TestClient = None
+
+
+JOB = {
+    'jid': 'chris-jid-1',
+    'args': ['--dir', '/share/incoming'],
+    'auid': 'cube',
+    'number_of_workers': '1',
+    'cpu_limit': '1000',
+    'memory_limit': '200',
+    'gpu_limit': '0',
+    'image': 'fnndsc/pl-simplefsapp',
+    'entrypoint': ['simplefsapp'],
+    'type': 'fs',
+    'input_dir': 'key-chris-jid-1/incoming',
+    'output_dir': 'key-chris-jid-1/outgoing',
+}
+
+
+@unittest.skipIf(TestClient is None, 'requires the "async" extra dependencies')
+class AsgiAppTests(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.WARNING)
+        env = patch.dict('os.environ', {'STORAGE_TYPE': 'host', 'STOREBASE': '/tmp',
+                                        'APPLICATION_MODE': 'dev'})
+        env.start()
+        self.addCleanup(env.stop)
+        self.compute_mgr = FakeManager()
+        self.app = create_asgi_app({'TESTING': True, **self.app_config()},
+                                   compute_mgr=self.compute_mgr)
+        self.client = TestClient(self.app)
+        self.client.__enter__()
+        self.addCleanup(self.client.__exit__)
+
+    def app_config(self) -> dict:
+        return {}
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_uses_thread_pool_for_backends_without_async_client(self):
+        self.assertIs(type(self.app.state.async_mgr), AsyncManager)
+
+    def test_same_responses_as_flask_app(self):
+        flask_client = create_app({'TESTING': True}, compute_mgr=FakeManager()).test_client()
+        requests = [
+            ('post', '/api/v1/', {'json': JOB}),
+            ('post', '/api/v1/', {'json': JOB}),
+            ('post', '/api/v1/', {'json': {**JOB, 'jid': 'chris-jid-2', 'entrypoint': []}}),
+            ('get', '/api/v1/chris-jid-1/', {}),
+            ('get', '/api/v1/chris-jid-1/?fields=status,logs', {}),
+            ('get', '/api/v1/chris-jid-1/?logs=false', {}),
+            ('get', '/api/v1/chris-jid-1/?fields=bogus', {}),
+            ('get', '/api/v1/?jids=chris-jid-1,does-not-exist', {}),
+            ('post', '/api/v1/batch/', {'json': {'jids': ['chris-jid-1', 'does-not-exist']}}),
+            ('get', '/api/v1/does-not-exist/', {}),
+            ('delete', '/api/v1/chris-jid-1/', {}),
+            ('get', '/api/v1/chris-jid-1/', {}),
+        ]
+        for method, url, kwargs in requests:
+            with self.subTest(method=method, url=url):
+                expected = getattr(flask_client, method)(url, **kwargs)
+                actual = getattr(self.client, method)(url, **kwargs)
+                self.assertEqual(expected.status_code, actual.status_code)
+                if expected.status_code != 204:
+                    self.assertEqual(expected.get_json(), actual.json())
+
+    def test_post_missing_arguments(self):
+        res = self.client.post('/api/v1/', json={'jid': 'chris-jid-1', 'type': 'xs'})
+        self.assertEqual(400, res.status_code)
+        message = res.json()['message']
+        self.assertIn('image', message)
+        self.assertEqual('xs is not a valid choice', message['type'])
+        self.assertNotIn('jid', message)
+
+    def test_stats(self):
+        res = self.client.get('/api/v1/')
+        self.assertEqual(200, res.status_code)
+        self.assertIn('counters', res.json()['stats'])
+
+    def test_metrics(self):
+        self.client.post('/api/v1/', json=JOB)
+        self.client.get('/api/v1/')
+        res = self.client.get('/metrics')
+        self.assertEqual(200, res.status_code)
+        self.assertIn('pman_jobs{status=', res.text)
+        self.assertIn('pman_http_request_duration_seconds_count{endpoint="api.joblist",'
+                      'method="GET",status="200"}', res.text)
+
+    def test_logs(self):
+        self.client.post('/api/v1/', json=JOB)
+        self.compute_mgr.logs['chris-jid-1'] = b'one\ntwo\n'
+        res = self.client.get('/api/v1/chris-jid-1/logs')
+        self.assertEqual(200, res.status_code)
+        self.assertEqual(b'one\ntwo\n', res.content)
+
+    def test_wait_for_status_change(self):
+        self.client.post('/api/v1/', json=JOB)
+        timer = threading.Timer(0.2, self.compute_mgr.set_status,
+                                ('chris-jid-1', JobStatus.started))
+        timer.start()
+        self.addCleanup(timer.cancel)
+        res = self.client.get('/api/v1/chris-jid-1/?wait=5&status=notstarted&logs=false')
+        self.assertEqual('started', res.json()['status'])
+        counters = self.app.state.extensions['counters']
+        self.assertEqual(1, counters.get('long_polls'))
+
+    def test_wait_without_threads(self):
+        """
+        The waiting requests are not limited by the threads of a worker process.
+        """
+        self.app.state.extensions['long_poll_slots'] = threading.BoundedSemaphore(0)
+        self.client.post('/api/v1/', json=JOB)
+        timer = threading.Timer(0.2, self.compute_mgr.set_status,
+                                ('chris-jid-1', JobStatus.started))
+        timer.start()
+        self.addCleanup(timer.cancel)
+        res = self.client.get('/api/v1/chris-jid-1/?wait=5&status=notstarted&logs=false')
+        self.assertEqual('started', res.json()['status'])
+        counters = self.app.state.extensions['counters']
+        self.assertEqual(0, counters.get('long_polls_rejected'))
+
+
+@unittest.skipIf(TestClient is None, 'requires the "async" extra dependencies')
+class AsgiDispatchQueueTests(AsgiAppTests):
+
+    def app_config(self) -> dict:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        return {'DISPATCH_QUEUE': True, 'STATE_DB': path, 'DISPATCH_WORKERS': 0}
+
+    def test_same_responses_as_flask_app(self):
+        self.skipTest('responses differ when jobs are queued')
+
+    def test_post_is_queued(self):
+        res = self.client.post('/api/v1/', json=JOB)
+        self.assertEqual(202, res.status_code)
+        self.assertEqual('notstarted', res.json()['status'])
+        self.assertEqual('queued', self.client.get('/api/v1/chris-jid-1/').json()['message'])
+        self.assertEqual(409, self.client.post('/api/v1/', json=JOB).status_code)
+        self.assertEqual(204, self.client.delete('/api/v1/chris-jid-1/').status_code)
+        self.assertEqual(404, self.client.get('/api/v1/chris-jid-1/').status_code)
+        self.assertEqual(['get_job'], self.compute_mgr.calls)
+
+    def test_logs(self):
+        self.client.post('/api/v1/', json=JOB)
+        self.assertEqual(b'', self.client.get('/api/v1/chris-jid-1/logs').content)
+
+    def test_wait_for_status_change(self):
+        self.skipTest('queued jobs are not submitted without dispatch workers')
+
+    def test_wait_without_threads(self):
+        self.skipTest('queued jobs are not submitted without dispatch workers')
+
+
+@unittest.skipIf(TestClient is None, 'requires the "async" extra dependencies')
+class AsgiTracingTests(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.WARNING)
+        env = patch.dict('os.environ', {'STORAGE_TYPE': 'host', 'STOREBASE': '/tmp',
+                                        'APPLICATION_MODE': 'dev'})
+        env.start()
+        self.addCleanup(env.stop)
+        self.app = create_asgi_app({'TESTING': True, 'TRACING': True},
+                                   compute_mgr=FakeManager())
+        self.spans = []
+        self.app.state.extensions['tracer'].exporter = self.spans.append
+        self.client = TestClient(self.app)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_request_spans(self):
+        self.client.post('/api/v1/', json=JOB)
+        self.spans.clear()
+        traceparent = '00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01'
+        res = self.client.get('/api/v1/chris-jid-1/', headers={'traceparent': traceparent})
+        self.assertEqual(200, res.status_code)
+        *children, request = self.spans
+        self.assertEqual('GET api.job', request.name)
+        self.assertEqual('00f067aa0ba902b7', request.parent_id)
+        self.assertEqual('chris-jid-1', request.attributes['job_id'])
+        self.assertEqual(['docker.get_job', 'docker.get_job_info', 'docker.get_job_logs'],
+                         [span.name for span in children])
+        for span in children:
+            self.assertEqual(request.span_id, span.parent_id)
+            self.assertEqual('chris-jid-1', span.attributes['job_id'])
@@ -0,0 +1,33 @@
+import unittest
+
+from pman import backends
+from pman.abstractmgr import AbstractManager
+from pman.asyncmgr import create_async_manager, AsyncManager
+from pman.simulatedmgr import SimulatedManager
+
+
+class BackendsTests(unittest.TestCase):
+
+    def test_every_backend_is_a_manager(self):
+        for container_env in backends.BACKENDS:
+            with self.subTest(container_env):
+                cls = backends.manager_class(container_env)
+                self.assertTrue(issubclass(cls, AbstractManager))
+        self.assertIsNone(backends.manager_class('bogus'))
+        self.assertIsNone(backends.manager_class(None))
+
+    def test_async_manager_class(self):
+        from pman.dockermgr import DockerManager
+        try:
+            from pman.aiodockermgr import AsyncDockerManager
+        except ImportError:
+            self.skipTest('requires the "async" extra dependencies')
+
+        class CustomDockerManager(DockerManager):
+            def __init__(self):
+                pass
+
+        self.assertIs(AsyncDockerManager, backends.async_manager_class(CustomDockerManager()))
+        mgr = SimulatedManager({'STATE_DB': ':memory:'})
+        self.assertIsNone(backends.async_manager_class(mgr))
+        self.assertIs(AsyncManager, type(create_async_manager(mgr, {})))
@@ -0,0 +1,66 @@
+import argparse
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from benchmarks import bench_startup, bench_statuscache, bench_suite
+
+
+class BenchmarkSuiteTests(unittest.TestCase):
+
+    def setUp(self):
+        env = patch.dict('os.environ', {'STORAGE_TYPE': 'host', 'STOREBASE': '/tmp',
+                                        'APPLICATION_MODE': 'dev'})
+        env.start()
+        self.addCleanup(env.stop)
+
+    def test_every_benchmark_runs(self):
+        for name, bench in bench_suite.BENCHMARKS.items():
+            with self.subTest(name):
+                result = bench_suite.measure(bench.setup(), duration=0)
+                self.assertEqual(bench_suite.MIN_ITERATIONS, result['iterations'])
+
+    def test_compare(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'results.json')
+            with patch('builtins.print'):
+                bench_suite.main(['--only', 'slurm.wdl_roundtrip', '--duration', '0',
+                            '--output', output])
+            with open(output) as f:
+                results = json.load(f)
+        self.assertEqual(['slurm.wdl_roundtrip'], list(results['results']))
+        faster = {'results': {'slurm.wdl_roundtrip': {'p50_us': 0.001}}}
+        slower = {'results': {'slurm.wdl_roundtrip': {'p50_us': 1e9}}}
+        with patch('builtins.print'):
+            self.assertEqual(['slurm.wdl_roundtrip'], bench_suite.compare(results, faster, 20))
+            self.assertEqual([], bench_suite.compare(results, slower, 20))
+
+
+class StartupTests(unittest.TestCase):
+
+    def test_only_configured_backend_is_imported(self):
+        docker = bench_startup.measure_backend('docker', repeat=1, top=5)
+        self.assertIn('docker', docker['packages'])
+        for package in ('kubernetes', 'openshift', 'cromwell_tools', 'serde'):
+            self.assertNotIn(package, docker['packages'])
+        self.assertEqual(5, len(docker['slowest']))
+        self.assertGreater(docker['max_rss_kb'], 0)
+
+        kubernetes = bench_startup.measure_backend('kubernetes', repeat=1, top=5)
+        self.assertIn('kubernetes', kubernetes['packages'])
+        self.assertNotIn('cromwell_tools', kubernetes['packages'])
+
+
+class StatusCacheBenchmarkTests(unittest.TestCase):
+
+    def test_shared_cache_makes_fewer_calls(self):
+        opts = argparse.Namespace(workers=2, clients=2, jobs=5, duration=0.3, poll_interval=0.01,
+                                  call_latency=0, max_age=5.0, refresh=0.1)
+        with patch.dict('os.environ', {'STORAGE_TYPE': 'host', 'STOREBASE': '/tmp',
+                                       'APPLICATION_MODE': 'dev'}):
+            per_worker = bench_statuscache.run(False, opts)
+            shared = bench_statuscache.run(True, opts)
+        self.assertEqual(2 * per_worker['requests'], per_worker['backend_calls'])
+        self.assertLess(shared['calls_per_request'], per_worker['calls_per_request'])
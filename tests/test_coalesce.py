@@ -0,0 +1,173 @@
+import asyncio
+import threading
+import unittest
+
+from pman.app import create_app
+from pman.coalesce import SingleFlight, coalesce_manager
+from pman.stats import Counters
+from tests.fakes import FakeManager, Clock
+from tests.test_app import AppTestCase
+
+
+class SlowCall:
+    """
+    A function which blocks until it is released, counting its calls.
+    """
+
+    def __init__(self, result='result'):
+        self.result = result
+        self.calls = 0
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, *args):
+        self.calls += 1
+        self.entered.set()
+        self.release.wait(5)
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+class SingleFlightTests(unittest.TestCase):
+
+    def setUp(self):
+        self.counters = Counters()
+        self.clock = Clock()
+
+    def call_concurrently(self, flight: SingleFlight, func: SlowCall, n: int) -> list:
+        results = [None] * n
+
+        def call(i):
+            try:
+                results[i] = flight.call('key', func)
+            except Exception as e:
+                results[i] = e
+
+        first = threading.Thread(target=call, args=(0,))
+        first.start()
+        func.entered.wait(5)
+        others = [threading.Thread(target=call, args=(i,)) for i in range(1, n)]
+        for t in others:
+            t.start()
+        while self.counters.get('coalesce_merged') < n - 1:
+            threading.Event().wait(0.001)
+        func.release.set()
+        for t in [first, *others]:
+            t.join(5)
+        return results
+
+    def test_concurrent_calls_are_merged(self):
+        flight = SingleFlight(self.counters)
+        func = SlowCall()
+        self.assertEqual(['result'] * 5, self.call_concurrently(flight, func, 5))
+        self.assertEqual(1, func.calls)
+        self.assertEqual(4, self.counters.get('coalesce_merged'))
+        self.assertEqual(0, len(flight))
+        flight.call('key', func)
+        self.assertEqual(2, func.calls)
+
+    def test_errors_are_shared_but_not_kept(self):
+        flight = SingleFlight(self.counters, ttl=10, clock=self.clock)
+        error = ValueError('backend is down')
+        results = self.call_concurrently(flight, SlowCall(error), 3)
+        self.assertEqual([error] * 3, results)
+        self.assertEqual(0, len(flight))
+
+    def test_ttl(self):
+        flight = SingleFlight(self.counters, ttl=1, clock=self.clock)
+        calls = []
+        flight.call('key', calls.append, 1)
+        self.clock.now += 1
+        flight.call('key', calls.append, 2)
+        self.assertEqual(1, self.counters.get('coalesce_hits'))
+        self.clock.now += 1.1
+        flight.call('key', calls.append, 3)
+        self.assertEqual([1, 3], calls)
+        flight.call('other', calls.append, 4)
+        self.clock.now += 5
+        flight.call('other', calls.append, 5)
+        # expired results are pruned
+        self.assertEqual(1, len(flight))
+
+    def test_async(self):
+        flight = SingleFlight(self.counters)
+        calls = []
+
+        async def get(name):
+            calls.append(name)
+            await asyncio.sleep(0.01)
+            return name.upper()
+
+        async def main():
+            return await asyncio.gather(*(flight.call_async(('get', 'a'), get, 'a')
+                                          for _ in range(3)),
+                                        flight.call_async(('get', 'b'), get, 'b'))
+
+        self.assertEqual(['A', 'A', 'A', 'B'], asyncio.run(main()))
+        self.assertEqual(['a', 'b'], calls)
+        self.assertEqual(2, self.counters.get('coalesce_merged'))
+        self.assertEqual(0, len(flight))
+
+
+class CoalesceManagerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.counters = Counters()
+        self.mgr = FakeManager()
+        self.mgr.schedule_job('fnndsc/pl-simpledsapp', ['simpledsapp'], 'chris-jid-1',
+                              {}, [], None, None, {})
+        self.mgr.calls.clear()
+        self.flight = SingleFlight(self.counters, ttl=60)
+        coalesce_manager(self.mgr, self.flight)
+
+    def test_methods_are_coalesced_by_arguments(self):
+        self.assertIsInstance(self.mgr, FakeManager)
+        job = self.mgr.get_job('chris-jid-1')
+        self.assertEqual(job, self.mgr.get_job('chris-jid-1'))
+        self.mgr.get_job_logs(job, 10)
+        self.mgr.get_job_logs(job, 10)
+        self.mgr.get_job_logs(job, 20)
+        self.assertEqual(['get_job', 'get_job_logs', 'get_job_logs'], self.mgr.calls)
+        self.assertEqual(2, self.counters.get('coalesce_hits'))
+
+    def test_writes_are_not_coalesced(self):
+        job = self.mgr.get_job('chris-jid-1')
+        self.mgr.remove_job(job)
+        self.assertNotIn('__coalesced__', vars(self.mgr.remove_job))
+
+    def test_unhashable_arguments(self):
+        job = {'name': 'chris-jid-1'}
+        calls = []
+        self.mgr.get_job_info = lambda j: calls.append(j)
+        coalesce_manager(self.mgr, self.flight)
+        self.mgr.get_job_info(job)
+        self.mgr.get_job_info(job)
+        self.mgr.get_job_info({'name': 'chris-jid-1'})
+        self.assertEqual(2, len(calls))
+
+    def test_wrapped_once(self):
+        method = self.mgr.get_job
+        coalesce_manager(self.mgr, self.flight)
+        self.assertIs(method, self.mgr.get_job)
+
+
+class CoalesceAppTests(AppTestCase):
+
+    def app_config(self) -> dict:
+        return {'COALESCE': True, 'COALESCE_TTL': 60}
+
+    def test_counters(self):
+        self.post_job('chris-jid-1')
+        url = self.url_for('api.job', job_id='chris-jid-1')
+        self.client.get(url)
+        self.client.get(url)
+        self.assertEqual(['schedule_job', 'get_job_info', 'get_job', 'get_job_logs'],
+                         self.compute_mgr.calls)
+        counters = self.client.get(self.url_for('api.joblist')).get_json()['stats']['counters']
+        # the status read after scheduling, then the three reads of the second GET
+        self.assertEqual(4, counters['coalesce_hits'])
+
+    def test_off_by_default(self):
+        app = create_app({'TESTING': True}, compute_mgr=FakeManager())
+        self.assertNotIn('coalesce', app.extensions)
@@ -0,0 +1,252 @@
+import copy
+import logging
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from kubernetes.client.rest import ApiException
+
+from pman.controller import Controller, ControllerHeartbeat, create_controller, create_lease
+from pman.leases import FileLease, KubernetesLease
+from tests.test_app import AppTestCase
+
+
+class FakeTask:
+    def __init__(self):
+        self.started = threading.Event()
+        self.stopped = threading.Event()
+
+    def start(self):
+        self.started.set()
+
+    def stop(self):
+        self.stopped.set()
+
+
+class ExpiringLease:
+    """
+    A lease which is lost after it was renewed ``renewals`` times.
+    """
+
+    def __init__(self, renewals: int):
+        self.renewals = renewals
+        self.held = False
+
+    def try_acquire(self) -> bool:
+        self.held = self.renewals > 0
+        self.renewals -= 1
+        return self.held
+
+    def release(self):
+        self.held = False
+
+
+class FailingLease(ExpiringLease):
+    """
+    A lease which cannot be renewed after it was renewed ``renewals`` times,
+    because of errors.
+    """
+
+    def try_acquire(self) -> bool:
+        if self.renewals <= 0:
+            raise ConnectionError('timed out')
+        return super().try_acquire()
+
+
+class ControllerTests(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'pman.db')
+
+    def controller(self, lease, task: FakeTask, identity: str,
+                   lease_seconds: float = 15.0) -> Controller:
+        return Controller(lease, [('fake', task)], ControllerHeartbeat(self.path), identity,
+                          renew_interval=0.01, lease_seconds=lease_seconds)
+
+    def run_in_thread(self, controller: Controller) -> threading.Thread:
+        thread = threading.Thread(target=controller.run, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        self.addCleanup(controller.stop)
+        return thread
+
+    def test_one_controller_runs_tasks(self):
+        lock = self.path + '.lock'
+        first_task, second_task = FakeTask(), FakeTask()
+        first = self.controller(FileLease(lock), first_task, 'first')
+        second = self.controller(FileLease(lock), second_task, 'second')
+        self.run_in_thread(first)
+        self.assertTrue(first_task.started.wait(5))
+        self.run_in_thread(second)
+        time.sleep(0.1)
+        self.assertFalse(second_task.started.is_set())
+        status = ControllerHeartbeat(self.path).status()
+        self.assertEqual('first', status['identity'])
+        self.assertEqual(['fake'], status['tasks'])
+
+        first.stop()
+        self.assertTrue(first_task.stopped.wait(5))
+        self.assertTrue(second_task.started.wait(5))
+
+    def test_lost_lease(self):
+        task = FakeTask()
+        controller = self.controller(ExpiringLease(renewals=3), task, 'controller')
+        self.assertEqual(1, controller.run())
+        self.assertTrue(task.started.is_set())
+        self.assertTrue(task.stopped.is_set())
+
+    def test_renewal_errors(self):
+        task = FakeTask()
+        controller = self.controller(FailingLease(renewals=3), task, 'controller',
+                                     lease_seconds=0.2)
+        logging.disable(logging.ERROR)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        start = time.monotonic()
+        self.assertEqual(1, controller.run())
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+        self.assertTrue(task.stopped.is_set())
+
+    def test_renewal_error_is_not_fatal(self):
+        task = FakeTask()
+        lease = FailingLease(renewals=1)
+        controller = self.controller(lease, task, 'controller')
+        logging.disable(logging.ERROR)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        self.run_in_thread(controller)
+        self.assertTrue(task.started.wait(5))
+        time.sleep(0.05)
+        lease.renewals = 1000
+        time.sleep(0.05)
+        self.assertTrue(controller.leading)
+        self.assertFalse(task.stopped.is_set())
+
+    def test_no_heartbeat(self):
+        self.assertIsNone(ControllerHeartbeat(self.path).status())
+
+
+class ControllerAppTests(AppTestCase):
+
+    def app_config(self) -> dict:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.state_db = os.path.join(tmp.name, 'pman.db')
+        return {'STATE_DB': self.state_db, 'CONTROLLER': True, 'DISPATCH_QUEUE': True,
+                'STATUS_CACHE': True, 'ADMISSION_CONTROL': True,
+                'ADMISSION_CPU_LIMIT': 10000, 'ADMISSION_MEMORY_LIMIT': 10000}
+
+    def test_controller_dispatches_jobs_queued_by_workers(self):
+        self.assertEqual(202, self.post_job('chris-jid-1').status_code)
+        time.sleep(0.1)
+        self.assertNotIn('schedule_job', self.compute_mgr.calls)
+        stats = self.client.get(self.url_for('api.joblist')).get_json()['stats']
+        self.assertIsNone(stats['controller'])
+
+        config = {**self.app.config, 'CONTROLLER_RENEW_SECONDS': 0.01,
+                  'STATUS_CACHE_REFRESH_SECONDS': 0.01}
+        controller = create_controller(config, self.compute_mgr,
+                                       lease=FileLease(self.state_db + '.controller.lock'))
+        self.assertEqual(['dispatch', 'status-cache', 'admission-reconcile'],
+                         controller.task_names)
+        thread = threading.Thread(target=controller.run, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        self.addCleanup(controller.stop)
+
+        url = self.url_for('api.job', job_id='chris-jid-1')
+        for _ in range(500):
+            if self.client.get(url).get_json()['message'] != 'queued':
+                break
+            time.sleep(0.01)
+        self.assertEqual('notstarted', self.client.get(url).get_json()['status'])
+        self.assertIn('schedule_job', self.compute_mgr.calls)
+        self.assertIn('list_job_statuses', self.compute_mgr.calls)
+        stats = self.client.get(self.url_for('api.joblist')).get_json()['stats']
+        self.assertEqual(controller.task_names, stats['controller']['tasks'])
+
+
+class FakeCoordinationApi:
+    """
+    Lease objects, which are rejected when replaced with an old ``resourceVersion``.
+    """
+
+    def __init__(self):
+        self.leases = {}
+
+    def read_namespaced_lease(self, name, namespace):
+        if name not in self.leases:
+            raise ApiException(status=404)
+        return copy.deepcopy(self.leases[name])
+
+    def create_namespaced_lease(self, namespace, body):
+        if body.metadata.name in self.leases:
+            raise ApiException(status=409)
+        body.metadata.resource_version = '1'
+        self.leases[body.metadata.name] = copy.deepcopy(body)
+
+    def replace_namespaced_lease(self, name, namespace, body):
+        current = self.leases[name]
+        if body.metadata.resource_version != current.metadata.resource_version:
+            raise ApiException(status=409)
+        body = copy.deepcopy(body)
+        body.metadata.resource_version = str(int(current.metadata.resource_version) + 1)
+        self.leases[name] = body
+
+
+class KubernetesLeaseTests(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.WARNING)
+        self.api = FakeCoordinationApi()
+        for p in (patch('kubernetes.config.load_incluster_config'),
+                  patch('kubernetes.client.CoordinationV1Api', return_value=self.api)):
+            p.start()
+            self.addCleanup(p.stop)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def lease(self, identity: str, duration: int = 15) -> KubernetesLease:
+        return KubernetesLease('pman-controller', 'chris', identity=identity, duration=duration)
+
+    def test_lease_per_replica(self):
+        config = {'CONTROLLER_LEASE': 'kubernetes', 'JOB_NAMESPACE': 'chris'}
+        with patch('socket.gethostname', return_value='pman-7d9f8c_X'):
+            self.assertEqual('pman-controller-pman-7d9f8c-x', create_lease(config).name)
+        shared = create_lease({**config, 'CONTROLLER_LEASE_NAME': 'pman-controller'})
+        self.assertEqual('pman-controller', shared.name)
+
+    def test_election(self):
+        first, second = self.lease('first'), self.lease('second')
+        self.assertTrue(first.try_acquire())
+        self.assertFalse(second.try_acquire())
+        self.assertTrue(first.try_acquire())
+        first.release()
+        self.assertIsNone(self.api.leases['pman-controller'].spec.holder_identity)
+        self.assertTrue(second.try_acquire())
+        self.assertEqual(1, self.api.leases['pman-controller'].spec.lease_transitions)
+
+    def test_expired(self):
+        first, second = self.lease('first', duration=0), self.lease('second')
+        self.assertTrue(first.try_acquire())
+        time.sleep(0.01)
+        self.assertTrue(second.try_acquire())
+        self.assertFalse(first.try_acquire())
+        self.assertFalse(first.held)
+
+    def test_concurrent_update(self):
+        first = self.lease('first', duration=0)
+        self.assertTrue(first.try_acquire())
+        read = self.api.read_namespaced_lease
+        # another replica takes the expired lease between the read and the update
+        def read_then_taken(name, namespace):
+            lease = read(name, namespace)
+            self.api.leases[name].metadata.resource_version = '99'
+            return lease
+        self.api.read_namespaced_lease = read_then_taken
+        self.assertFalse(self.lease('second').try_acquire())
+
@@ -0,0 +1,121 @@
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from pman.abstractmgr import ManagerException
+from pman.dispatch import DispatchQueue, QUEUED, DISPATCHING, FAILED
+
+
+def make_request(name: str) -> dict:
+    return {'image': 'fnndsc/pl-simpledsapp', 'command': ['simpledsapp', '/share/outgoing'],
+            'name': name, 'resources_dict': {}, 'env': [], 'uid': None, 'gid': None,
+            'mounts_dict': {}}
+
+
+class DispatchQueueTests(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'pman.db')
+        self.queue = DispatchQueue(self.path, lease_seconds=60)
+
+    def test_claim_in_order(self):
+        self.queue.enqueue('chris-jid-1', make_request('chris-jid-1'))
+        self.queue.enqueue('chris-jid-2', make_request('chris-jid-2'))
+
+        job = self.queue.claim()
+        self.assertEqual('chris-jid-1', job.jid)
+        self.assertEqual(DISPATCHING, job.state)
+        self.assertEqual(1, job.attempts)
+        self.assertEqual(make_request('chris-jid-1'), job.request)
+        self.assertEqual('chris-jid-2', self.queue.claim().jid)
+        self.assertIsNone(self.queue.claim())
+
+        self.queue.complete('chris-jid-1')
+        self.queue.fail('chris-jid-2', 'no such image')
+        self.assertIsNone(self.queue.get('chris-jid-1'))
+        self.assertEqual(FAILED, self.queue.get('chris-jid-2').state)
+        self.assertEqual({QUEUED: 0, DISPATCHING: 0, FAILED: 1}, self.queue.stats())
+
+    def test_replace_failed(self):
+        self.queue.enqueue('chris-jid-1', make_request('chris-jid-1'))
+        with self.assertRaises(ManagerException) as cm:
+            self.queue.enqueue('chris-jid-1', make_request('chris-jid-1'))
+        self.assertEqual(409, cm.exception.status_code)
+        self.queue.claim()
+        self.queue.fail('chris-jid-1', 'no such image')
+
+        job = self.queue.enqueue('chris-jid-1', make_request('chris-jid-1'), 'other')
+        self.assertEqual(job, self.queue.get('chris-jid-1'))
+        self.assertEqual(1, self.queue.claim().attempts)
+
+    def test_purge_failed(self):
+        queue = DispatchQueue(self.path, failed_retention=3600)
+        queue.enqueue('chris-jid-1', make_request('chris-jid-1'))
+        queue.enqueue('chris-jid-2', make_request('chris-jid-2'))
+        queue.claim()
+        queue.fail('chris-jid-1', 'no such image')
+        self.assertEqual(FAILED, queue.get('chris-jid-1').state)
+        with patch('pman.dispatch.time.time', return_value=time.time() + 3601):
+            queue.claim()
+            queue.fail('chris-jid-2', 'no such image')
+        # failed jobs which were queued more than an hour ago are forgotten
+        self.assertIsNone(queue.get('chris-jid-1'))
+        self.assertIsNone(queue.get('chris-jid-2'))
+        queue.enqueue('chris-jid-3', make_request('chris-jid-3'))
+        with patch('pman.dispatch.time.time', return_value=time.time() + 3601):
+            self.assertEqual(0, queue.purge_failed())
+        self.assertEqual(QUEUED, queue.get('chris-jid-3').state)
+
+    def test_queue_is_durable(self):
+        self.queue.enqueue('chris-jid-1', make_request('chris-jid-1'))
+        other = DispatchQueue(self.path)
+        self.assertEqual('chris-jid-1', other.claim().jid)
+        self.assertIsNone(self.queue.claim())
+
+    def test_expired_claim(self):
+        self.queue.enqueue('chris-jid-1', make_request('chris-jid-1'))
+        self.queue.claim()
+        self.assertFalse(self.queue.remove('chris-jid-1'))
+        with patch('pman.dispatch.time.time', return_value=1e12):
+            job = self.queue.claim()
+        self.assertEqual(2, job.attempts)
+
+    def test_claim_by_user(self):
+        self.queue.enqueue('chris-jid-1', make_request('chris-jid-1'), 'bulk')
+        self.queue.enqueue('chris-jid-2', make_request('chris-jid-2'), 'bulk')
+        self.queue.enqueue('chris-jid-3', make_request('chris-jid-3'), 'small')
+        self.assertEqual({'bulk', 'small'}, self.queue.waiting().keys())
+        self.assertEqual(2, self.queue.waiting()['bulk'][0])
+
+        job = self.queue.claim('small')
+        self.assertEqual(('chris-jid-3', 'small'), (job.jid, job.auid))
+        self.assertIsNone(self.queue.claim('small'))
+        self.queue.unclaim('chris-jid-3')
+        self.assertEqual(0, self.queue.get('chris-jid-3').attempts)
+        self.assertEqual('chris-jid-1', self.queue.claim().jid)
+
+
+class MigrationTests(unittest.TestCase):
+
+    def test_add_auid_column(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, 'pman.db')
+        with sqlite3.connect(path) as conn:
+            conn.execute('CREATE TABLE dispatch_queue (jid TEXT PRIMARY KEY, state TEXT NOT NULL, '
+                         'request TEXT NOT NULL, created REAL NOT NULL, claimed_by TEXT, '
+                         'claimed_at REAL, attempts INTEGER NOT NULL DEFAULT 0, error TEXT)')
+            conn.execute("INSERT INTO dispatch_queue (jid, state, request, created) "
+                         "VALUES ('chris-jid-1', 'queued', '{}', 0)")
+        conn.close()
+        queue = DispatchQueue(path)
+        self.assertEqual('', queue.get('chris-jid-1').auid)
+
+
+if __name__ == '__main__':
+    unittest.main()
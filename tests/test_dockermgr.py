@@ -0,0 +1,261 @@
+import queue
+import time
+import unittest
+from unittest.mock import Mock
+
+from docker.models.containers import Container
+
+from pman.abstractmgr import JobStatus
+from pman.docker_events import ContainerStateCache
+from pman.dockermgr import DockerManager
+from pman.logcursor import encode_cursor
+
+
+def container_summary(name: str, state: str) -> dict:
+    return {
+        'Id': name + '-id',
+        'Names': ['/' + name],
+        'Image': 'fnndsc/pl-simpledsapp',
+        'Command': 'simpledsapp /share/incoming /share/outgoing',
+        'State': state,
+        'Status': state,
+    }
+
+
+def container_inspect(name: str, exit_code: int, state: str = 'exited') -> dict:
+    finished = state == 'exited'
+    return {
+        'Id': name + '-id',
+        'Name': '/' + name,
+        'Config': {'Image': 'fnndsc/pl-simpledsapp',
+                   'Cmd': ['simpledsapp', '/share/incoming', '/share/outgoing']},
+        'State': {'Status': state, 'Running': state == 'running', 'Paused': False,
+                  'OOMKilled': False, 'Dead': False, 'ExitCode': exit_code,
+                  'StartedAt': '0001-01-01T00:00:00Z' if state == 'created' else '2024-01-01T00:00:00Z',
+                  'FinishedAt': '2024-01-01T00:01:00Z' if finished else '0001-01-01T00:00:00Z'}
+    }
+
+
+def listed_container(name: str, state: str, exit_code: int = 0) -> Container:
+    c = Container(attrs=container_summary(name, state))
+    c.reload = Mock(side_effect=lambda: c.attrs.update(container_inspect(name, exit_code, state)))
+    return c
+
+
+class DockerManagerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.docker_client = Mock()
+        self.manager = DockerManager({'JOB_LABELS': {'org.chrisproject.miniChRIS': 'plugininstance'},
+                                      'IGNORE_LIMITS': False},
+                                     docker_client=self.docker_client)
+
+    def test_get_jobs_info(self):
+        running = listed_container('chris-jid-1', 'running')
+        created = listed_container('chris-jid-2', 'created')
+        finished = listed_container('chris-jid-3', 'exited', exit_code=1)
+        unrelated = listed_container('unrelated', 'running')
+        self.docker_client.containers.list.return_value = [running, unrelated, created, finished]
+
+        names = ['chris-jid-1', 'chris-jid-2', 'chris-jid-3', 'chris-jid-4']
+        infos = self.manager.get_jobs_info(names)
+
+        self.docker_client.containers.list.assert_called_once_with(
+            all=True, filters={'label': ['org.chrisproject.miniChRIS=plugininstance']}, sparse=True
+        )
+        self.assertEqual({'chris-jid-1', 'chris-jid-2', 'chris-jid-3'}, set(infos.keys()))
+        self.assertEqual(JobStatus.started, infos['chris-jid-1'].status)
+        self.assertEqual(JobStatus.notstarted, infos['chris-jid-2'].status)
+        self.assertEqual(JobStatus.finishedWithError, infos['chris-jid-3'].status)
+        self.assertEqual('2024-01-01T00:01:00Z', infos['chris-jid-3'].timestamp)
+        # the same info as for a single job
+        for c in (running, created, finished):
+            self.assertEqual(self.manager.get_job_info(c), infos[c.name])
+        self.assertEqual('simpledsapp /share/incoming /share/outgoing', infos['chris-jid-1'].cmd)
+        self.assertEqual('2024-01-01T00:00:00Z', infos['chris-jid-1'].timestamp)
+        unrelated.reload.assert_not_called()
+
+        # containers are inspected again only when their state changed
+        self.docker_client.containers.list.return_value = [
+            listed_container('chris-jid-1', 'running'),
+            listed_container('chris-jid-2', 'running'),
+            listed_container('chris-jid-3', 'exited', exit_code=1),
+        ]
+        again = self.manager.get_jobs_info(names)
+        self.docker_client.containers.list.return_value[0].reload.assert_not_called()
+        self.docker_client.containers.list.return_value[1].reload.assert_called_once()
+        self.docker_client.containers.list.return_value[2].reload.assert_not_called()
+        self.assertEqual(JobStatus.started, again['chris-jid-2'].status)
+        self.assertEqual(infos['chris-jid-1'], again['chris-jid-1'])
+
+        # removed containers are forgotten
+        self.docker_client.containers.list.return_value = []
+        self.assertEqual({}, self.manager.get_jobs_info(names))
+        self.assertEqual(0, len(self.manager.inspected))
+
+    def test_get_jobs_info_by_name(self):
+        manager = DockerManager({'JOB_LABELS': {}, 'IGNORE_LIMITS': False},
+                                docker_client=self.docker_client)
+        self.docker_client.containers.list.return_value = []
+        manager.get_jobs_info(['chris-jid-1.a+b'])
+        self.docker_client.containers.list.assert_called_once_with(
+            all=True, filters={'name': [r'^/?chris\-jid\-1\.a\+b$']}, sparse=True
+        )
+
+    def test_list_job_statuses(self):
+        succeeded = container_summary('chris-jid-3', 'exited')
+        succeeded['Status'] = 'Exited (0) 2 minutes ago'
+        failed = container_summary('chris-jid-4', 'exited')
+        failed['Status'] = 'Exited (137) 5 seconds ago'
+        self.docker_client.containers.list.return_value = [
+            Container(attrs=container_summary('chris-jid-1', 'running')),
+            Container(attrs=container_summary('chris-jid-2', 'created')),
+            Container(attrs=succeeded),
+            Container(attrs=failed),
+        ]
+        self.assertEqual({'chris-jid-1': JobStatus.started,
+                          'chris-jid-2': JobStatus.notstarted,
+                          'chris-jid-3': JobStatus.finishedSuccessfully,
+                          'chris-jid-4': JobStatus.finishedWithError},
+                         self.manager.list_job_statuses())
+        self.docker_client.containers.list.assert_called_once_with(
+            all=True, filters={'label': ['org.chrisproject.miniChRIS=plugininstance']}, sparse=True
+        )
+
+    def test_stream_job_logs(self):
+        container = Mock()
+        stream = Mock()
+        stream.__iter__ = Mock(return_value=iter([b'one\n', b'two\n']))
+        container.logs.return_value = stream
+
+        chunks = list(self.manager.stream_job_logs(container, tail=None, follow=True))
+
+        self.assertEqual([b'one\n', b'two\n'], chunks)
+        container.logs.assert_called_once_with(stdout=True, stderr=True, stream=True,
+                                               follow=True, tail='all')
+        stream.close.assert_called_once()
+
+    def test_get_job_logs_since(self):
+        container = Mock()
+        container.logs.return_value = (b'2024-01-01T00:00:01.5Z first\n'
+                                       b'2024-01-01T00:00:02Z second\n')
+
+        res = self.manager.get_job_logs_since(container, None, 100)
+        self.assertEqual(b'first\nsecond\n', res.logs)
+        container.logs.assert_called_once_with(stdout=True, stderr=True, timestamps=True, tail=100)
+
+        container.logs.reset_mock()
+        cursor = encode_cursor(1704067201500000000)
+        res = self.manager.get_job_logs_since(container, cursor, 100)
+        self.assertEqual(b'second\n', res.logs)
+        self.assertEqual(encode_cursor(1704067202000000000), res.next_cursor)
+        container.logs.assert_called_once_with(stdout=True, stderr=True, timestamps=True,
+                                               tail='all', since=1704067201.5)
+
+
+def container_event(name: str, action: str, **attributes) -> dict:
+    return {
+        'Type': 'container',
+        'Action': action,
+        'Actor': {'ID': name + '-id', 'Attributes': {'name': name, **attributes}},
+        'time': 1704067260,
+        'timeNano': 1704067260123456789,
+    }
+
+
+class FakeEventStream:
+    """
+    Imitates the stream returned by ``DockerClient.events``: events put in it
+    are yielded until it is closed.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue()
+
+    def __iter__(self):
+        while (event := self.queue.get()) is not None:
+            yield event
+
+    def close(self):
+        self.queue.put(None)
+
+
+class ContainerStateCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.docker_client = Mock()
+        self.docker_client.containers.prepare_model.side_effect = lambda attrs: Container(attrs=attrs)
+        self.stream = FakeEventStream()
+        self.docker_client.events.side_effect = lambda **kwargs: self.stream
+        self.cache = ContainerStateCache(self.docker_client, {'org.chrisproject.miniChRIS': 'plugininstance'})
+        self.manager = DockerManager({'JOB_LABELS': {}, 'IGNORE_LIMITS': False},
+                                     docker_client=self.docker_client, state_cache=self.cache)
+
+    def tearDown(self):
+        self.cache.stop()
+
+    def connect(self):
+        self.cache.start()
+        self.assertTrue(self.cache.wait_for_connection(timeout=5))
+
+    def send(self, *events: dict):
+        expected = self.cache.events + len(events)
+        for event in events:
+            self.stream.queue.put(event)
+        deadline = time.monotonic() + 5
+        while self.cache.events < expected and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_served_from_cache(self):
+        running = container_inspect('chris-jid-1', 0)
+        running['State'].update(Status='running', Running=True, FinishedAt='0001-01-01T00:00:00Z')
+        self.docker_client.containers.get.return_value = Container(attrs=running)
+        self.connect()
+
+        job = self.manager.get_job('chris-jid-1')
+        self.assertEqual(JobStatus.started, self.manager.get_job_info(job).status)
+        self.send(container_event('chris-jid-1', 'oom'),
+                  container_event('chris-jid-1', 'die', exitCode='137'))
+
+        job = self.manager.get_job('chris-jid-1')
+        self.docker_client.containers.get.assert_called_once_with('chris-jid-1')
+        info = self.manager.get_job_info(job)
+        self.assertEqual(JobStatus.finishedWithError, info.status)
+        self.assertEqual('2024-01-01T00:01:00.123456789Z', info.timestamp)
+        stats = self.manager.get_stats()['events_cache']
+        self.assertEqual((1, 1, 2), (stats['hits'], stats['misses'], stats['events']))
+        self.docker_client.events.assert_called_once_with(
+            decode=True,
+            filters={'type': 'container', 'label': ['org.chrisproject.miniChRIS=plugininstance']}
+        )
+
+    def test_change_notifier(self):
+        self.connect()
+        with self.manager.change_notifier.subscribe('chris-jid-1') as subscription:
+            self.send(container_event('chris-jid-2', 'start'))
+            self.assertFalse(subscription.wait(0.01))
+            self.send(container_event('chris-jid-1', 'start'))
+            self.assertTrue(subscription.wait(5))
+
+    def test_not_cached_when_disconnected(self):
+        self.docker_client.containers.get.return_value = Container(attrs=container_inspect('chris-jid-1', 0))
+        self.manager.get_job('chris-jid-1')
+        self.manager.get_job('chris-jid-1')
+        self.assertEqual(2, self.docker_client.containers.get.call_count)
+
+    def test_outdated_inspect_not_cached(self):
+        self.connect()
+        seq = self.cache.sequence()
+        self.send(container_event('chris-jid-1', 'die', exitCode='0'))
+        self.cache.put(container_inspect('chris-jid-1', 0), seq)
+        self.assertIsNone(self.cache.get('chris-jid-1'))
+
+    def test_destroy(self):
+        self.connect()
+        self.cache.put(container_inspect('chris-jid-1', 0))
+        self.assertIsNotNone(self.cache.get('chris-jid-1'))
+        self.send(container_event('chris-jid-1', 'destroy'))
+        self.assertIsNone(self.cache.get('chris-jid-1'))
+
+if __name__ == '__main__':
+    unittest.main()
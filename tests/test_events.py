@@ -0,0 +1,142 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from pman.abstractmgr import JobStatus, JobName
+from pman.events import EventLog, ChangeDetector
+from pman.leases import FileLease
+from pman.longpoll import ChangeNotifier
+from tests.fakes import FakeManager
+
+
+class EventLogTests(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.db = os.path.join(tmp.name, 'pman.db')
+
+    def test_since(self):
+        log = EventLog(self.db, size=2)
+        start = log.last_id()
+        first = log.publish({'n': 1})
+        self.assertEqual(([first], True), log.since(start))
+        second = log.publish({'n': 2})
+        self.assertEqual(([second], True), log.since(first.id))
+        self.assertEqual(([], True), log.since(second.id))
+
+        third = log.publish({'n': 3})
+        self.assertEqual(([second, third], True), log.since(first.id))
+        # the first event fell out of the buffer
+        self.assertEqual(([second, third], False), log.since(start))
+
+    def test_unknown_id(self):
+        log = EventLog(self.db)
+        log.publish({'n': 1})
+        self.assertEqual(([], False), log.since('deadbeef-1'))
+        self.assertEqual(([], False), log.since(f'{log.epoch}-2'))
+        self.assertEqual(([], False), log.since('garbage'))
+
+    def test_wait(self):
+        log = EventLog(self.db)
+        last_id = log.last_id()
+        self.assertFalse(log.wait(last_id, 0))
+        log.publish({'n': 1})
+        self.assertTrue(log.wait(last_id, 0))
+
+    def test_shared(self):
+        """
+        Every worker process reads the events of the same database.
+        """
+        log = EventLog(self.db)
+        other = EventLog(self.db, poll_interval=0.01)
+        self.assertEqual(log.epoch, other.epoch)
+        last_id = other.last_id()
+        threading.Timer(0.05, log.publish, ({'n': 1},)).start()
+        self.assertTrue(other.wait(last_id, 5))
+        self.assertEqual(([log.since(last_id)[0][0]], True), other.since(last_id))
+
+    def test_new_database(self):
+        log = EventLog(self.db)
+        log.publish({'n': 1})
+        os.remove(self.db)
+        other = EventLog(self.db)
+        self.assertNotEqual(log.epoch, other.epoch)
+        self.assertEqual(([], False), other.since(log.last_id()))
+
+
+class ChangeDetectorTests(unittest.TestCase):
+
+    def setUp(self):
+        self.compute_mgr = FakeManager()
+        for name in ('chris-jid-1', 'chris-jid-2'):
+            self.compute_mgr.schedule_job('fnndsc/pl-simpledsapp', ['simpledsapp'], JobName(name),
+                                          {}, [], None, None, {})
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.db = os.path.join(tmp.name, 'pman.db')
+        self.log = EventLog(self.db)
+        self.start = self.log.last_id()
+
+    def published(self) -> list:
+        events, _ = self.log.since(self.start)
+        return [(e.data['jid'], e.data['status']) for e in events]
+
+    def test_poll(self):
+        detector = ChangeDetector(self.compute_mgr, self.log)
+        detector.sync()
+        detector.poll()
+        self.assertEqual([], self.published())
+
+        self.compute_mgr.set_status('chris-jid-1', JobStatus.started)
+        self.compute_mgr.calls.clear()
+        detector.poll()
+        self.assertEqual([('chris-jid-1', 'started')], self.published())
+        # only the changed job is read
+        self.assertEqual(['list_job_statuses', 'get_job', 'get_job_info'], self.compute_mgr.calls)
+
+        self.compute_mgr.remove_job(self.compute_mgr.get_job('chris-jid-2'))
+        detector.poll()
+        detector.poll()
+        self.assertEqual([('chris-jid-1', 'started')], self.published())
+
+    def test_notifications(self):
+        self.compute_mgr.change_notifier = ChangeNotifier()
+        detector = ChangeDetector(self.compute_mgr, self.log)
+        self.assertTrue(detector.watched)
+        detector.sync()
+        detector.start()
+        self.addCleanup(detector.stop)
+
+        self.compute_mgr.set_status('chris-jid-2', JobStatus.finishedSuccessfully)
+        self.compute_mgr.change_notifier.notify('chris-jid-2')
+        self.assertTrue(self.log.wait(self.start, 5))
+        data = self.log.since(self.start)[0][0].data
+        self.assertEqual({'jid': 'chris-jid-2', 'status': 'finishedSuccessfully',
+                          'message': 'finishedSuccessfully', 'timestamp': ''}, data)
+
+    def test_single_detector(self):
+        """
+        Only the holder of the lease detects changes.
+        """
+        detectors = [
+            ChangeDetector(self.compute_mgr, EventLog(self.db), poll_interval=0.01,
+                           lease=FileLease(f'{self.db}.events.lock'))
+            for _ in range(2)
+        ]
+        for detector in detectors:
+            detector.start()
+            self.addCleanup(detector.stop)
+        self.compute_mgr.set_status('chris-jid-1', JobStatus.started)
+        self.assertTrue(self.log.wait(self.start, 5))
+        detectors[1 if detectors[0].lease.held else 0].stop()
+        self.compute_mgr.set_status('chris-jid-1', JobStatus.finishedSuccessfully)
+        self.assertTrue(self.log.wait(self.log.last_id(), 5))
+        self.assertEqual([('chris-jid-1', 'started'), ('chris-jid-1', 'finishedSuccessfully')],
+                         self.published())
+        self.assertEqual(1, sum(detector.lease.held for detector in detectors))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+
+from pman.fairshare import FairShare
+
+
+class FairShareTests(unittest.TestCase):
+
+    capacity = {'cpu_limit': 10000, 'memory_limit': 1000}
+
+    def test_lowest_dominant_share_first(self):
+        fair_share = FairShare()
+        usage = {
+            'bulk': {'cpu_limit': 5000, 'memory_limit': 100, 'jobs': 5},  # share 0.5 (CPU)
+            'mem': {'cpu_limit': 1000, 'memory_limit': 600, 'jobs': 1},   # share 0.6 (memory)
+        }
+        waiting = {'bulk': 1.0, 'mem': 2.0, 'new': 3.0}
+        self.assertEqual(['new', 'bulk', 'mem'], fair_share.order(waiting, usage, self.capacity))
+
+    def test_weights(self):
+        fair_share = FairShare({'chris': 4})
+        usage = {'chris': {'cpu_limit': 4000, 'jobs': 4}, 'other': {'cpu_limit': 2000, 'jobs': 2}}
+        self.assertEqual(['chris', 'other'],
+                         fair_share.order({'chris': 1.0, 'other': 2.0}, usage, self.capacity))
+
+    def test_ties_by_oldest_job(self):
+        fair_share = FairShare()
+        self.assertEqual(['b', 'a'], fair_share.order({'a': 2.0, 'b': 1.0}, {}, self.capacity))
+
+    def test_max_jobs_per_user(self):
+        fair_share = FairShare(max_jobs_per_user=2)
+        usage = {'bulk': {'cpu_limit': 100, 'jobs': 2}}
+        self.assertEqual(['small'],
+                         fair_share.order({'bulk': 1.0, 'small': 2.0}, usage, self.capacity))
+
+    def test_without_capacity(self):
+        fair_share = FairShare()
+        usage = {'bulk': {'cpu_limit': 100, 'jobs': 3}, 'small': {'cpu_limit': 9000, 'jobs': 1}}
+        self.assertEqual(['small', 'bulk'], fair_share.order({'bulk': 1.0, 'small': 2.0}, usage, {}))
+
+    def test_stats(self):
+        fair_share = FairShare({'chris': 2})
+        stats = fair_share.stats({'chris': 3}, {'other': {'cpu_limit': 2500, 'jobs': 1}},
+                                 self.capacity)
+        self.assertEqual({'chris': {'queued': 3, 'jobs': 0, 'dominant_share': 0.0, 'weight': 2},
+                          'other': {'queued': 0, 'jobs': 1, 'dominant_share': 0.25, 'weight': 1.0}},
+                         stats)
+
+
+if __name__ == '__main__':
+    unittest.main()
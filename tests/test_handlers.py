@@ -0,0 +1,48 @@
+import asyncio
+import unittest
+
+from pman.abstractmgr import Image, JobName, ManagerException
+from pman.asyncmgr import AsyncManager
+from pman.handlers import Call, Run, run, run_async
+from tests.fakes import FakeManager
+
+
+def get_or_default(name: str):
+    """
+    A handler which gets a job, and handles the error if it does not exist.
+    """
+    try:
+        job = yield Call('get_job', JobName(name))
+    except ManagerException as e:
+        return (yield Run(str.upper, f'missing: {e.status_code}'))
+    return job.status.value
+
+
+class RunTests(unittest.TestCase):
+
+    def setUp(self):
+        self.mgr = FakeManager()
+        self.mgr.schedule_job(Image('fnndsc/pl-simpledsapp'), ['simpledsapp'],
+                              JobName('chris-jid-1'), {}, [], None, None, {})
+
+    def test_run(self):
+        self.assertEqual('notstarted', run(get_or_default('chris-jid-1'), self.mgr))
+        self.assertEqual('MISSING: 404', run(get_or_default('chris-jid-2'), self.mgr))
+
+    def test_run_async(self):
+        async_mgr = AsyncManager(self.mgr)
+        self.addCleanup(asyncio.run, async_mgr.aclose())
+        self.assertEqual('notstarted',
+                         asyncio.run(run_async(get_or_default('chris-jid-1'), async_mgr)))
+        self.assertEqual('MISSING: 404',
+                         asyncio.run(run_async(get_or_default('chris-jid-2'), async_mgr)))
+
+    def test_uncaught_error(self):
+        def remove(name: str):
+            job = yield Call('get_job', JobName(name))
+            yield Call('remove_job', job)
+
+        with self.assertRaises(ManagerException):
+            run(remove('chris-jid-2'), self.mgr)
+        run(remove('chris-jid-1'), self.mgr)
+        self.assertEqual({}, self.mgr.jobs)
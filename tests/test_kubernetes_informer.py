@@ -0,0 +1,233 @@
+import unittest
+from typing import List
+from unittest.mock import Mock, patch
+
+from kubernetes import client as k_client
+from kubernetes.client.rest import ApiException
+
+from pman.abstractmgr import JobStatus, ManagerException
+from pman.kubernetes_informer import KubernetesInformer, Reflector
+from pman.kubernetesmgr import KubernetesManager
+
+
+def make_job(name: str, resource_version: str, active=None, succeeded=None) -> k_client.V1Job:
+    container = k_client.V1Container(name=name, image='fnndsc/pl-simpledsapp',
+                                     command=['simpledsapp', '/share/outgoing'])
+    return k_client.V1Job(
+        metadata=k_client.V1ObjectMeta(name=name, resource_version=resource_version),
+        spec=k_client.V1JobSpec(template=k_client.V1PodTemplateSpec(
+            spec=k_client.V1PodSpec(containers=[container])
+        )),
+        status=k_client.V1JobStatus(active=active, succeeded=succeeded)
+    )
+
+
+def make_pod(name: str, job_name: str, resource_version: str) -> k_client.V1Pod:
+    return k_client.V1Pod(metadata=k_client.V1ObjectMeta(
+        name=name, resource_version=resource_version, labels={'job-name': job_name}
+    ))
+
+
+def list_of(items: list, resource_version: str) -> Mock:
+    return Mock(items=items, metadata=Mock(resource_version=resource_version))
+
+
+class FakeWatch:
+    """
+    Imitates :class:`kubernetes.watch.Watch`. Each call to :meth:`stream`
+    produces the next item of ``streams``, which is either a list of events
+    or an exception to raise.
+    """
+
+    def __init__(self, streams: list, on_exhausted=None):
+        self.streams = streams
+        self.calls: List[dict] = []
+        self.on_exhausted = on_exhausted
+
+    def __call__(self):
+        return self
+
+    def stream(self, func, *args, **kwargs):
+        self.calls.append(kwargs)
+        if not self.streams:
+            if self.on_exhausted is not None:
+                self.on_exhausted()
+            return
+        events = self.streams.pop(0)
+        if isinstance(events, Exception):
+            raise events
+        yield from events
+
+    def stop(self):
+        pass
+
+
+class ReflectorTests(unittest.TestCase):
+
+    def test_list_then_watch(self):
+        list_func = Mock(return_value=list_of([make_job('a', '10'), make_job('b', '11')], '11'))
+        fake_watch = FakeWatch([[
+            {'type': 'MODIFIED', 'object': make_job('a', '12', active=1)},
+            {'type': 'DELETED', 'object': make_job('b', '13')},
+            {'type': 'ADDED', 'object': make_job('c', '14')},
+            {'type': 'BOOKMARK', 'object': {}, 'raw_object': {'metadata': {'resourceVersion': '20'}}},
+        ]])
+        changes = []
+        reflector = Reflector('jobs', list_func, 'chris', label_selector='app=chris',
+                              on_change=lambda old, new: changes.append((old, new)),
+                              watch_factory=fake_watch)
+
+        reflector.list()
+        self.assertTrue(reflector.has_synced())
+        self.assertEqual('11', reflector.resource_version)
+        list_func.assert_called_once_with('chris', label_selector='app=chris')
+
+        reflector.watch()
+        self.assertEqual('11', fake_watch.calls[0]['resource_version'])
+        self.assertEqual(1, reflector.get('a').status.active)
+        self.assertIsNone(reflector.get('b'))
+        self.assertIsNotNone(reflector.get('c'))
+        self.assertEqual('20', reflector.resource_version)
+        self.assertEqual(5, len(changes))
+
+        stats = reflector.stats()
+        self.assertEqual(2, stats['objects'])
+        self.assertEqual(1, stats['lists'])
+        self.assertEqual(3, stats['events'])
+        self.assertIsNotNone(stats['seconds_since_update'])
+
+    def test_relist_after_gone(self):
+        list_func = Mock(side_effect=[list_of([make_job('a', '10')], '10'),
+                                      list_of([make_job('a', '30', succeeded=1)], '30'),
+                                      list_of([make_job('a', '30', succeeded=1)], '30')])
+        fake_watch = FakeWatch([ApiException(status=410, reason='Gone'), []])
+        reflector = Reflector('jobs', list_func, 'chris', label_selector=None,
+                              watch_factory=fake_watch)
+        fake_watch.on_exhausted = reflector.stop
+
+        reflector.run()
+
+        # listed again after 410 Gone, and again after the watch ended normally
+        self.assertEqual(3, list_func.call_count)
+        self.assertEqual('30', fake_watch.calls[1]['resource_version'])
+        self.assertEqual(1, reflector.get('a').status.succeeded)
+
+
+class KubernetesInformerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.batch_client = Mock()
+        self.batch_client.list_namespaced_job.return_value = list_of([make_job('chris-jid-1', '1', active=1)], '2')
+        self.core_client = Mock()
+        self.core_client.list_namespaced_pod.return_value = list_of(
+            [make_pod('chris-jid-1-abcde', 'chris-jid-1', '2')], '2'
+        )
+        self.informer = KubernetesInformer(self.batch_client, self.core_client, 'chris',
+                                           labels={'app': 'chris'}, watch_factory=FakeWatch([]))
+
+    def test_label_selectors(self):
+        self.informer.jobs.list()
+        self.informer.pods.list()
+        self.batch_client.list_namespaced_job.assert_called_once_with('chris', label_selector='app=chris')
+        self.core_client.list_namespaced_pod.assert_called_once_with(
+            'chris', label_selector='job-name,app=chris'
+        )
+
+    def test_pods_indexed_by_job(self):
+        fake_watch = FakeWatch([[
+            {'type': 'ADDED', 'object': make_pod('chris-jid-1-fghij', 'chris-jid-1', '3')},
+            {'type': 'DELETED', 'object': make_pod('chris-jid-1-abcde', 'chris-jid-1', '4')},
+            {'type': 'ADDED', 'object': make_pod('chris-jid-2-abcde', 'chris-jid-2', '5')},
+        ]])
+        informer = KubernetesInformer(self.batch_client, self.core_client, 'chris',
+                                      watch_factory=fake_watch)
+        informer.pods.list()
+        self.assertEqual(['chris-jid-1-abcde'],
+                         [p.metadata.name for p in informer.get_job_pods('chris-jid-1')])
+        informer.pods.watch()
+        self.assertEqual(['chris-jid-1-fghij'],
+                         [p.metadata.name for p in informer.get_job_pods('chris-jid-1')])
+        self.assertEqual(['chris-jid-2-abcde'],
+                         [p.metadata.name for p in informer.get_job_pods('chris-jid-2')])
+        self.assertEqual([], informer.get_job_pods('chris-jid-3'))
+
+    def test_listeners(self):
+        fake_watch = FakeWatch([[
+            {'type': 'MODIFIED', 'object': make_job('chris-jid-1', '3', succeeded=1)},
+        ], [
+            {'type': 'ADDED', 'object': make_pod('chris-jid-2-abcde', 'chris-jid-2', '4')},
+        ]])
+        informer = KubernetesInformer(self.batch_client, self.core_client, 'chris',
+                                      watch_factory=fake_watch)
+        changed = []
+        informer.add_listener(changed.append)
+        informer.jobs.watch()
+        informer.pods.watch()
+        self.assertEqual(['chris-jid-1', 'chris-jid-2'], changed)
+
+    @patch('pman.kubernetesmgr.k_config.load_incluster_config')
+    def test_manager_reads_from_informer(self, _):
+        manager = KubernetesManager({'JOB_NAMESPACE': 'chris', 'JOB_LABELS': {'app': 'chris'}},
+                                    informer=self.informer)
+        manager.kube_v1_batch_client = Mock()
+        manager.kube_client = Mock()
+        self.informer.jobs.list()
+        self.informer.pods.list()
+
+        job = manager.get_job('chris-jid-1')
+        self.assertEqual(JobStatus.started, manager.get_job_info(job).status)
+        self.assertEqual(1, len(manager.get_job_pods('chris-jid-1').items))
+        manager.kube_v1_batch_client.read_namespaced_job.assert_not_called()
+        manager.kube_client.list_namespaced_pod.assert_not_called()
+
+        # cache miss falls back to the API server
+        manager.get_job('chris-jid-2')
+        manager.kube_v1_batch_client.read_namespaced_job.assert_called_once_with('chris-jid-2', 'chris')
+
+        self.assertTrue(manager.get_stats()['informer']['jobs']['synced'])
+
+
+class KubernetesManagerListTests(unittest.TestCase):
+
+    @patch('pman.kubernetesmgr.k_config.load_incluster_config')
+    def setUp(self, _):
+        self.manager = KubernetesManager({'JOB_NAMESPACE': 'chris',
+                                          'JOB_LABELS': {'app': 'chris'}})
+        self.manager.kube_v1_batch_client = Mock()
+        self.manager.kube_client = Mock()
+        labeled = make_job('chris-jid-1', '1', active=1)
+        # created by an older version of pman, without the JOB_LABELS
+        self.unlabeled = make_job('chris-jid-2', '2', succeeded=1)
+        self.manager.kube_v1_batch_client.list_namespaced_job.return_value = list_of([labeled], '3')
+        self.manager.kube_client.list_namespaced_pod.return_value = list_of(
+            [make_pod('chris-jid-1-abcde', 'chris-jid-1', '4'),
+             make_pod('chris-jid-2-abcde', 'chris-jid-2', '5')], '6')
+
+        def read_namespaced_job(name, namespace):
+            if name == 'chris-jid-2':
+                return self.unlabeled
+            raise ApiException(status=404)
+        self.manager.kube_v1_batch_client.read_namespaced_job.side_effect = read_namespaced_job
+
+    def test_get_jobs_info_of_unlabeled_jobs(self):
+        infos = self.manager.get_jobs_info(['chris-jid-1', 'chris-jid-2', 'gone'])
+        self.assertEqual({'chris-jid-1', 'chris-jid-2'}, set(infos))
+        self.manager.kube_v1_batch_client.list_namespaced_job.assert_called_once_with(
+            'chris', label_selector='app=chris')
+
+    def test_list_job_statuses_of_unlabeled_jobs(self):
+        self.assertEqual(['chris-jid-1', 'chris-jid-2'], sorted(self.manager.list_job_statuses()))
+        self.manager.kube_client.list_namespaced_pod.assert_called_once_with(
+            'chris', label_selector='job-name,app=chris')
+        self.manager.kube_v1_batch_client.read_namespaced_job.assert_called_once_with(
+            'chris-jid-2', 'chris')
+
+    def test_api_errors(self):
+        self.manager.kube_client.list_node.side_effect = ApiException(status=500)
+        with self.assertRaises(ManagerException) as cm:
+            self.manager.get_capacity()
+        self.assertEqual(503, cm.exception.status_code)
+
+
+if __name__ == '__main__':
+    unittest.main()
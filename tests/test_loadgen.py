@@ -0,0 +1,91 @@
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import unittest
+from socketserver import ThreadingMixIn
+from unittest.mock import patch
+from wsgiref.simple_server import make_server, WSGIServer, WSGIRequestHandler
+
+from pman import loadgen
+from pman.app import create_app
+from pman.simulatedmgr import SimulatedManager
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class LoadgenTests(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.WARNING)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        env = patch.dict('os.environ', {'STORAGE_TYPE': 'host', 'STOREBASE': '/tmp',
+                                        'APPLICATION_MODE': 'dev'})
+        env.start()
+        self.addCleanup(env.stop)
+        mgr = SimulatedManager({'STATE_DB': os.path.join(self.tmp, 'pman.db'),
+                                'SIM_QUEUE_DELAY': 0.0, 'SIM_RUN_TIME': 0.1})
+        app = create_app({'TESTING': True}, compute_mgr=mgr)
+        self.server = make_server('127.0.0.1', 0, app, server_class=ThreadingWSGIServer,
+                                  handler_class=QuietHandler)
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def run_loadgen(self, *args) -> dict:
+        output = os.path.join(self.tmp, 'report.json')
+        with patch('sys.stdout', io.StringIO()):
+            loadgen.main([self.url, '--output', output, *args])
+        with open(output) as f:
+            return json.load(f)
+
+    def test_generate_record_and_replay(self):
+        recording = os.path.join(self.tmp, 'requests.jsonl')
+        report = self.run_loadgen('--clients', '2', '--ramp', '0.2', '--duration', '1.5',
+                                  '--burst', '2', '--poll-interval', '0.2',
+                                  '--think-time', '0.1', '--seed', '1', '--record', recording)
+        by_kind = report['by_kind']
+        self.assertEqual(0, report['total']['errors'])
+        self.assertGreaterEqual(by_kind['POST']['requests'], 4)
+        self.assertGreater(by_kind['GET']['requests'], 0)
+        self.assertGreater(by_kind['DELETE']['requests'], 0)
+        self.assertIn('p99_ms', report['total'])
+
+        with open(recording) as f:
+            recorded = [json.loads(line) for line in f]
+        self.assertEqual(report['total']['requests'], len(recorded))
+        self.assertIn(recorded[0]['json']['type'], ('ds', 'fs', 'ts'))
+
+        # jobs of the recording were deleted, only those still pending can be found
+        replayed = self.run_loadgen('--replay', recording, '--speed', '4', '--clients', '4')
+        self.assertEqual(len(recorded), replayed['total']['requests'])
+        self.assertEqual(by_kind['POST']['requests'], replayed['by_kind']['POST']['requests'])
+
+    def test_connection_errors(self):
+        self.server.shutdown()
+        self.server.server_close()
+        report = self.run_loadgen('--clients', '1', '--duration', '0.3', '--burst', '1',
+                                  '--think-time', '0.1')
+        self.assertGreater(report['total']['requests'], 0)
+        self.assertEqual(1.0, report['total']['error_rate'])
+
+    def test_parse_mix(self):
+        self.assertEqual({'ds': 1.0, 'ts': 0.5}, loadgen.parse_mix('ds=1,ts=0.5'))
+        with self.assertRaises(Exception):
+            loadgen.parse_mix('xs=1')
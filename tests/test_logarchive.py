@@ -0,0 +1,177 @@
+import gzip
+import os
+import unittest
+from unittest.mock import patch
+
+from pman.abstractmgr import Image, JobName, JobStatus
+from pman.config import Config
+from pman.leases import FileLease
+from pman.logarchive import LogArchive, LogArchiver, read_archive, read_index, write_archive
+from tests.fakes import FakeManager, temp_dir
+from tests.test_app import AppTestCase
+from tests import test_asgi
+
+
+LOGS = b''.join(b'line %d\n' % i for i in range(1000))
+
+
+class ArchiveFileTests(unittest.TestCase):
+
+    def setUp(self):
+        self.path = os.path.join(temp_dir(self), 'job', 'chris-jid-1.log.gz')
+
+    def test_read(self):
+        blocks = write_archive(self.path, [LOGS[i:i + 100] for i in range(0, len(LOGS), 100)],
+                               block_size=1000)
+        self.assertGreater(len(blocks), 5)
+        self.assertEqual(blocks, read_index(self.path))
+        self.assertEqual(LOGS, b''.join(read_archive(self.path)))
+        # the blocks are members of a single gzip file
+        with open(self.path, 'rb') as f:
+            self.assertEqual(LOGS, gzip.decompress(f.read()))
+        self.assertEqual(b'line 998\nline 999\n', b''.join(read_archive(self.path, tail=2)))
+        self.assertEqual(LOGS, b''.join(read_archive(self.path, tail=5000)))
+        self.assertEqual(b'', b''.join(read_archive(self.path, tail=0)))
+
+    def test_tail_reads_last_blocks(self):
+        write_archive(self.path, [LOGS], block_size=1000)
+        decompress = gzip.decompress
+        with patch('pman.logarchive.gzip.decompress', side_effect=decompress) as mock:
+            b''.join(read_archive(self.path, tail=10))
+        self.assertLessEqual(mock.call_count, 2)
+
+    def test_last_line_without_line_break(self):
+        write_archive(self.path, [b'first\nsecond\nlast'], block_size=6)
+        self.assertEqual(b'second\nlast', b''.join(read_archive(self.path, tail=2)))
+
+    def test_long_line(self):
+        logs = b'x' * 2500 + b'\nend\n'
+        write_archive(self.path, [logs], block_size=1000)
+        self.assertEqual(logs, b''.join(read_archive(self.path)))
+        self.assertEqual(b'end\n', b''.join(read_archive(self.path, tail=1)))
+
+    def test_empty(self):
+        write_archive(self.path, [])
+        self.assertEqual(b'', b''.join(read_archive(self.path)))
+        self.assertEqual(b'', b''.join(read_archive(self.path, tail=10)))
+
+    def test_missing(self):
+        self.assertIsNone(read_archive(self.path))
+
+
+class LogArchiveTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = temp_dir(self)
+        self.db = os.path.join(self.dir, 'pman.db')
+        self.mgr = FakeManager()
+        for jid in ('chris-jid-1', 'chris-jid-2'):
+            self.mgr.schedule_job(Image('fnndsc/pl-simpledsapp'), ['simpledsapp'], JobName(jid),
+                                  {}, [], None, None, {})
+            self.mgr.logs[JobName(jid)] = LOGS
+        self.mgr.set_status(JobName('chris-jid-1'), JobStatus.finishedSuccessfully)
+        self.mgr.calls.clear()
+
+    def test_next_to_output_dir(self):
+        archive = LogArchive(self.db)
+        archive.register(JobName('chris-jid-1'),
+                         os.path.join(self.dir, 'key-chris-jid-1', 'outgoing'))
+        archive.register(JobName('not-accessible'), None)
+        self.assertEqual(['chris-jid-1'],
+                         archive.unarchived(['chris-jid-1', 'not-accessible']))
+        self.assertTrue(archive.write(JobName('chris-jid-1'), [LOGS]))
+        self.assertFalse(archive.write(JobName('not-accessible'), [LOGS]))
+        self.assertTrue(os.path.isfile(os.path.join(self.dir, 'key-chris-jid-1',
+                                                    'chris-jid-1.log.gz')))
+        self.assertEqual(LOGS, b''.join(archive.read(JobName('chris-jid-1'))))
+        self.assertEqual(len(LOGS), archive.stats()['size'])
+
+        # a new job with the same name
+        archive.register(JobName('chris-jid-1'),
+                         os.path.join(self.dir, 'key-chris-jid-1', 'outgoing'))
+        self.assertIsNone(archive.read(JobName('chris-jid-1')))
+
+    def test_archiver(self):
+        archive = LogArchive(self.db, directory=os.path.join(self.dir, 'logs'))
+        for jid in ('chris-jid-1', 'chris-jid-2'):
+            archive.register(JobName(jid))
+        archiver = LogArchiver(archive, self.mgr, FileLease(self.db + '.archive.lock'))
+        self.addCleanup(archiver.lease.release)
+        self.assertEqual(1, archiver.archive_finished())
+        self.assertEqual(0, archiver.archive_finished())
+        self.assertEqual(b'line 999\n', b''.join(archive.read(JobName('chris-jid-1'), tail=1)))
+        self.assertIsNone(archive.read(JobName('chris-jid-2')))
+        self.assertEqual(['list_job_statuses', 'get_job', 'get_job_logs', 'list_job_statuses'],
+                         self.mgr.calls)
+
+
+class LogArchiveConfigTests(unittest.TestCase):
+
+    def test_directory_required_without_host_storage(self):
+        env = {'LOG_ARCHIVE': 'yes', 'CONTAINER_ENV': 'kubernetes',
+               'STORAGE_TYPE': 'kubernetes_pvc', 'VOLUME_NAME': 'storebase'}
+        with patch.dict('os.environ', env):
+            with self.assertRaises(ValueError):
+                Config()
+            with patch.dict('os.environ', {'LOG_ARCHIVE_DIR': '/var/log/pman'}):
+                self.assertEqual('/var/log/pman', Config().LOG_ARCHIVE_DIR)
+
+
+class LogArchiveAppTests(AppTestCase):
+
+    def app_config(self) -> dict:
+        self.storebase = temp_dir(self)
+        return {'LOG_ARCHIVE': True, 'STATE_DB': os.path.join(self.storebase, 'pman.db'),
+                'STOREBASE': self.storebase, 'LOG_ARCHIVE_INTERVAL_SECONDS': 3600,
+                'REMOVE_JOBS': True}
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(self.app.extensions['log_archiver'].stop)
+
+    def finish_job(self, jid: str):
+        self.assertEqual(201, self.post_job(jid).status_code)
+        self.compute_mgr.logs[JobName(jid)] = LOGS
+        self.compute_mgr.set_status(JobName(jid), JobStatus.finishedSuccessfully)
+
+    def test_archived_logs_are_served(self):
+        self.finish_job('chris-jid-1')
+        self.assertEqual(1, self.app.extensions['log_archiver'].archive_finished())
+        self.assertTrue(os.path.isfile(os.path.join(self.storebase, 'key-chris-jid-1',
+                                                    'chris-jid-1.log.gz')))
+        self.compute_mgr.calls.clear()
+
+        body = self.client.get(self.url_for('api.job', job_id='chris-jid-1')).get_json()
+        self.assertEqual(LOGS.decode(), body['logs'])
+        res = self.client.get(self.url_for('api.joblogs', job_id='chris-jid-1'),
+                              query_string={'tail': 3})
+        self.assertEqual(b'line 997\nline 998\nline 999\n', res.data)
+        # only the status is read from the backend
+        self.assertEqual(['get_job', 'get_job_info'], self.compute_mgr.calls)
+
+        stats = self.client.get(self.url_for('api.joblist')).get_json()['stats']
+        self.assertEqual(1, stats['log_archive']['jobs'])
+
+    def test_logs_are_archived_before_deletion(self):
+        self.finish_job('chris-jid-1')
+        url = self.url_for('api.job', job_id='chris-jid-1')
+        self.assertEqual(204, self.client.delete(url).status_code)
+        res = self.client.get(self.url_for('api.joblogs', job_id='chris-jid-1'))
+        self.assertEqual(LOGS, res.data)
+
+
+class AsgiLogArchiveTests(test_asgi.AsgiAppTests):
+
+    def app_config(self) -> dict:
+        self.storebase = temp_dir(self)
+        return {'LOG_ARCHIVE': True, 'STATE_DB': os.path.join(self.storebase, 'pman.db'),
+                'STOREBASE': self.storebase, 'LOG_ARCHIVE_INTERVAL_SECONDS': 3600,
+                'REMOVE_JOBS': True}
+
+    def test_logs_are_archived_before_deletion(self):
+        self.client.post('/api/v1/', json=test_asgi.JOB)
+        self.compute_mgr.logs[JobName('chris-jid-1')] = LOGS
+        self.compute_mgr.set_status(JobName('chris-jid-1'), JobStatus.finishedSuccessfully)
+        self.assertEqual(204, self.client.delete('/api/v1/chris-jid-1/').status_code)
+        self.assertEqual(b'line 999\n',
+                         self.client.get('/api/v1/chris-jid-1/logs?tail=1').content)
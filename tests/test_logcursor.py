@@ -0,0 +1,50 @@
+import pytest
+
+from pman.logcursor import (encode_cursor, decode_cursor, cursor_seconds,
+                            split_timestamp, filter_after)
+
+LOGS = (b'2024-01-01T00:00:01.5Z first\n'
+        b'2024-01-01T00:00:02.000000001Z second\n'
+        b'2024-01-01T00:00:03+00:00 third\n')
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(1704067202000000001)) == 1704067202000000001
+    assert cursor_seconds(encode_cursor(1704067201500000000)) == 1704067201.5
+
+
+@pytest.mark.parametrize('cursor', ['', 'not a cursor', 'dHM6LTE=', 'dHM6YWJj'])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+@pytest.mark.parametrize(
+    'line, expected',
+    [
+        (b'2024-01-01T00:00:01.5Z hello\n', (1704067201500000000, b'hello\n')),
+        (b'2024-01-01T00:00:01Z hello\n', (1704067201000000000, b'hello\n')),
+        (b'2024-01-01T01:00:01.000000007+01:00 hello', (1704067201000000007, b'hello')),
+        (b'hello\n', (None, b'hello\n')),
+    ]
+)
+def test_split_timestamp(line, expected):
+    assert split_timestamp(line) == expected
+
+
+def test_filter_after():
+    logs, cursor = filter_after([LOGS], None)
+    assert logs == b'first\nsecond\nthird\n'
+    assert decode_cursor(cursor) == 1704067203000000000
+
+    logs, cursor = filter_after([LOGS], encode_cursor(1704067202000000000))
+    assert logs == b'second\nthird\n'
+
+    logs, next_cursor = filter_after([LOGS], cursor)
+    assert logs == b''
+    assert next_cursor == cursor
+
+
+def test_filter_after_lines_split_across_chunks():
+    logs, _ = filter_after([LOGS[:10], LOGS[10:40], LOGS[40:]], None)
+    assert logs == b'first\nsecond\nthird\n'
@@ -0,0 +1,72 @@
+import threading
+import unittest
+from unittest.mock import patch
+
+from pman.abstractmgr import JobInfo, JobStatus, JobName, Image, TimeStamp
+from pman.longpoll import ChangeNotifier, wait_for_status_change
+
+
+def make_info(status: JobStatus) -> JobInfo:
+    return JobInfo(name=JobName('chris-jid-1'), image=Image('fnndsc/pl-simpledsapp'),
+                   cmd='simpledsapp /share/outgoing', timestamp=TimeStamp(''),
+                   message=status.value, status=status)
+
+
+class ChangeNotifierTests(unittest.TestCase):
+
+    def test_subscription(self):
+        notifier = ChangeNotifier()
+        notifier.notify('chris-jid-1')  # nobody is subscribed
+        with notifier.subscribe('chris-jid-1') as subscription:
+            self.assertEqual(1, notifier.waiting())
+            self.assertFalse(subscription.wait(0))
+            # changes before the wait are not missed
+            notifier.notify('chris-jid-1')
+            notifier.notify('chris-jid-2')
+            self.assertTrue(subscription.wait(0))
+            self.assertFalse(subscription.wait(0))
+        self.assertEqual(0, notifier.waiting())
+
+
+class WaitForStatusChangeTests(unittest.TestCase):
+
+    def test_polls_with_backoff(self):
+        statuses = [JobStatus.notstarted, JobStatus.notstarted, JobStatus.notstarted,
+                    JobStatus.started]
+        with patch('pman.longpoll.time.sleep') as sleep:
+            info = wait_for_status_change(lambda: make_info(statuses.pop(0)), 'chris-jid-1',
+                                          JobStatus.notstarted, timeout=30,
+                                          min_interval=0.5, max_interval=1.0)
+        self.assertEqual(JobStatus.started, info.status)
+        self.assertEqual([0.5, 1.0, 1.0], [c.args[0] for c in sleep.call_args_list])
+
+    def test_returns_immediately_when_changed(self):
+        info = wait_for_status_change(lambda: make_info(JobStatus.started), 'chris-jid-1',
+                                      JobStatus.notstarted, timeout=30)
+        self.assertEqual(JobStatus.started, info.status)
+
+    def test_timeout(self):
+        info = wait_for_status_change(lambda: make_info(JobStatus.started), 'chris-jid-1',
+                                      None, timeout=0.05, min_interval=0.01)
+        self.assertEqual(JobStatus.started, info.status)
+
+    def test_woken_by_notifier(self):
+        notifier = ChangeNotifier()
+        status = [JobStatus.started]
+
+        def finish():
+            while notifier.waiting() == 0:
+                pass
+            status[0] = JobStatus.finishedSuccessfully
+            notifier.notify('chris-jid-1')
+
+        t = threading.Thread(target=finish)
+        t.start()
+        info = wait_for_status_change(lambda: make_info(status[0]), 'chris-jid-1',
+                                      JobStatus.started, timeout=30, notifier=notifier)
+        t.join()
+        self.assertEqual(JobStatus.finishedSuccessfully, info.status)
+
+
+if __name__ == '__main__':
+    unittest.main()
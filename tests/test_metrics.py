@@ -0,0 +1,109 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from prometheus_client import REGISTRY
+
+from pman.abstractmgr import JobStatus, ManagerException
+from pman.metrics import MetricsExporter, instrument_manager, outcome_of
+from tests.fakes import FakeManager
+from tests.test_app import AppTestCase
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+class InstrumentManagerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.compute_mgr = instrument_manager(FakeManager(), 'fake')
+
+    def test_outcome_of(self):
+        self.assertEqual('ok', outcome_of(None))
+        self.assertEqual('404', outcome_of(ManagerException('not found', status_code=404)))
+        self.assertEqual('unsupported', outcome_of(NotImplementedError()))
+        self.assertEqual('error', outcome_of(KeyError()))
+
+    def test_counts_calls_by_outcome(self):
+        ok = sample('pman_backend_calls_total', backend='fake', method='get_job', outcome='ok')
+        not_found = sample('pman_backend_calls_total', backend='fake', method='get_job',
+                           outcome='404')
+        self.compute_mgr.schedule_job('fnndsc/pl-simpledsapp', ['simpledsapp'], 'chris-jid-1',
+                                      {}, [], None, None, {})
+        self.compute_mgr.get_job('chris-jid-1')
+        with self.assertRaises(ManagerException):
+            self.compute_mgr.get_job('chris-jid-2')
+        self.assertEqual(ok + 1, sample('pman_backend_calls_total', backend='fake',
+                                        method='get_job', outcome='ok'))
+        self.assertEqual(not_found + 1, sample('pman_backend_calls_total', backend='fake',
+                                               method='get_job', outcome='404'))
+        self.assertGreater(sample('pman_backend_call_duration_seconds_count', backend='fake',
+                                  method='schedule_job', outcome='ok'), 0)
+
+    def test_instrumented_once(self):
+        before = sample('pman_backend_calls_total', backend='fake', method='get_jobs_info',
+                        outcome='ok')
+        instrument_manager(self.compute_mgr, 'fake')
+        self.compute_mgr.get_jobs_info([])
+        self.assertEqual(before + 1, sample('pman_backend_calls_total', backend='fake',
+                                            method='get_jobs_info', outcome='ok'))
+        self.assertIsInstance(self.compute_mgr, FakeManager)
+
+    def test_jobs_by_status(self):
+        self.compute_mgr.schedule_job('fnndsc/pl-simpledsapp', ['simpledsapp'], 'chris-jid-1',
+                                      {}, [], None, None, {})
+        body, _ = MetricsExporter(self.compute_mgr).generate()
+        self.assertIn(b'pman_jobs{status="notstarted"} 1.0', body)
+        self.assertIn(b'pman_jobs{status="started"} 0.0', body)
+
+
+class MultiprocessDirTests(unittest.TestCase):
+
+    def test_directory_is_created(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'pman-metrics')
+            code = ("from pman.metrics import BACKEND_CALLS; "
+                    "BACKEND_CALLS.labels('docker', 'get_job', 'ok').inc()")
+            subprocess.run([sys.executable, '-c', code], check=True,
+                           env={**os.environ, 'PROMETHEUS_MULTIPROC_DIR': path})
+            self.assertTrue(os.listdir(path))
+
+
+class MetricsEndpointTests(AppTestCase):
+
+    def test_metrics(self):
+        self.post_job('chris-jid-1')
+        self.compute_mgr.set_status('chris-jid-1', JobStatus.started)
+        self.compute_mgr.logs['chris-jid-1'] = b'hello\n'
+        logged = sample('pman_log_bytes_served_total', endpoint='api.job')
+        self.client.get(self.url_for('api.job', job_id='chris-jid-1'))
+        self.assertEqual(logged + 6, sample('pman_log_bytes_served_total', endpoint='api.job'))
+        self.assertGreater(sample('pman_http_request_duration_seconds_count',
+                                  endpoint='api.job', method='GET', status='200'), 0)
+
+        res = self.client.get('/metrics')
+        self.assertEqual(200, res.status_code)
+        self.assertIn(b'pman_jobs{status="started"} 1.0', res.data)
+        self.assertIn(b'pman_backend_calls_total{backend="docker",method="schedule_job",'
+                      b'outcome="ok"}', res.data)
+
+    def test_counters(self):
+        self.post_job('chris-jid-1')
+        skipped = sample('pman_counts_total', counter='log_fetches_skipped')
+        self.client.get(self.url_for('api.job', job_id='chris-jid-1', logs='false'))
+        self.assertEqual(skipped + 1, sample('pman_counts_total', counter='log_fetches_skipped'))
+        stats = self.client.get(self.url_for('api.joblist')).json['stats']
+        self.assertEqual(os.getpid(), stats['counters_worker'])
+
+
+class DisabledMetricsTests(AppTestCase):
+
+    def app_config(self) -> dict:
+        return {'METRICS': False}
+
+    def test_no_metrics(self):
+        self.assertEqual(404, self.client.get('/metrics').status_code)
+        self.assertFalse(hasattr(self.compute_mgr.get_job, '__instrumented__'))
@@ -0,0 +1,88 @@
+import os
+import tempfile
+import unittest
+
+from pman.profiling import RequestProfiler
+from tests.test_app import AppTestCase
+
+
+def busy():
+    return sum(i * i for i in range(10000))
+
+
+class RequestProfilerTests(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+        self.profiler = RequestProfiler(self.directory, max_files=2)
+
+    def profile(self, endpoint: str):
+        profile = self.profiler.start()
+        self.assertIsNotNone(profile)
+        self.assertIsNone(self.profiler.start())
+        busy()
+        return self.profiler.stop(profile, endpoint)
+
+    def test_wants(self):
+        self.assertTrue(self.profiler.wants('1'))
+        self.assertFalse(self.profiler.wants('0'))
+        self.assertFalse(self.profiler.wants(None))
+        self.assertTrue(RequestProfiler(self.directory, sample_rate=1.0).wants(None))
+
+    def test_profiles_by_endpoint(self):
+        for _ in range(3):
+            self.profile('api.job')
+        self.profile('api.jobbatch')
+        self.assertEqual({'api.job': 2, 'api.jobbatch': 1}, self.profiler.endpoints())
+        self.assertFalse(any(name.endswith('.tmp') for name in os.listdir(self.directory)))
+
+        top = self.profiler.top('api.job', n=50, sort='tottime')
+        self.assertEqual(sorted((row['tottime'] for row in top), reverse=True),
+                         [row['tottime'] for row in top])
+        self.assertEqual(2, self.calls_of_busy(top))
+        self.assertEqual(3, self.calls_of_busy(self.profiler.top(n=50)))
+
+    @staticmethod
+    def calls_of_busy(top) -> int:
+        return next(row['ncalls'] for row in top if row['function'].endswith('(busy)'))
+
+    def test_bad_sort(self):
+        with self.assertRaises(ValueError):
+            self.profiler.top(sort='bogus')
+
+    def test_no_profiles(self):
+        self.assertEqual([], self.profiler.top('api.job'))
+
+
+class ProfilingAppTests(AppTestCase):
+
+    def app_config(self) -> dict:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        return {'PMAN_PROFILE': True, 'PROFILE_DIR': tmp.name}
+
+    def test_profile_requests_with_header(self):
+        self.post_job('chris-jid-1')
+        url = self.url_for('api.job', job_id='chris-jid-1')
+        self.client.get(url)
+        self.assertEqual({}, self.client.get('/admin/profile').get_json()['endpoints'])
+
+        self.assertEqual(200, self.client.get(url, headers={'X-Pman-Profile': '1'}).status_code)
+        res = self.client.get('/admin/profile?endpoint=api.job&top=5')
+        self.assertEqual(200, res.status_code)
+        self.assertEqual({'api.job': 1}, res.get_json()['endpoints'])
+        top = res.get_json()['top']
+        self.assertEqual(5, len(top))
+        self.assertTrue(any('get_job' in row['function'] for row in
+                            self.client.get('/admin/profile?top=500').get_json()['top']))
+
+    def test_bad_sort(self):
+        self.assertEqual(400, self.client.get('/admin/profile?sort=bogus').status_code)
+
+
+class ProfilingDisabledTests(AppTestCase):
+
+    def test_no_admin_endpoint(self):
+        self.assertEqual(404, self.client.get('/admin/profile').status_code)
@@ -0,0 +1,138 @@
+import unittest
+
+from pman.abstractmgr import JobName, JobStatus
+from pman.registry import JobRegistry
+from tests.fakes import Clock, info, temp_db
+from tests.test_app import AppTestCase
+from tests import test_asgi
+
+
+DONE = JobStatus.finishedSuccessfully
+
+
+class JobRegistryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.path = temp_db(self)
+        self.clock = Clock()
+        self.registry = JobRegistry(self.path, clock=self.clock)
+
+    def test_record(self):
+        self.assertIsNone(self.registry.get(JobName('chris-jid-1')))
+        self.registry.record(JobName('chris-jid-1'), info('chris-jid-1', DONE), 'done\n')
+        # a finished job does not change
+        self.registry.record(JobName('chris-jid-1'),
+                             info('chris-jid-1', JobStatus.finishedWithError), 'other\n')
+        finished = JobRegistry(self.path).get(JobName('chris-jid-1'))
+        self.assertEqual(info('chris-jid-1', DONE), finished.info)
+        self.assertEqual('done\n', finished.logs)
+        self.assertEqual({'entries': 1, 'log_chars': 5}, self.registry.stats())
+
+    def test_record_logs_later(self):
+        self.registry.record(JobName('chris-jid-1'), info('chris-jid-1', DONE))
+        self.assertIsNone(self.registry.get(JobName('chris-jid-1')).logs)
+        self.registry.record_logs(JobName('chris-jid-1'), 'done\n')
+        self.registry.record_logs(JobName('chris-jid-1'), 'other\n')
+        self.assertEqual('done\n', self.registry.get(JobName('chris-jid-1')).logs)
+
+    def test_only_finished_jobs(self):
+        with self.assertRaises(ValueError):
+            self.registry.record(JobName('chris-jid-1'), info('chris-jid-1', JobStatus.started), '')
+
+    def test_get_many(self):
+        names = [JobName(f'chris-jid-{i}') for i in range(1200)]
+        for name in names:
+            self.registry.record(name, info(name, DONE), '')
+        self.assertEqual(1200, len(self.registry.get_many(names + ['does-not-exist'])))
+
+    def test_retention(self):
+        registry = JobRegistry(self.path, retention=86400, clock=self.clock)
+        registry.record(JobName('old'), info('old', DONE), '')
+        self.clock.now += 86400 + 1
+        registry.record(JobName('new'), info('new', DONE), '')
+        self.assertEqual({'new'}, set(registry.get_many(['old', 'new'])))
+
+
+class JobRegistryAppTests(AppTestCase):
+
+    def app_config(self) -> dict:
+        return {'JOB_REGISTRY': True, 'STATE_DB': temp_db(self), 'REMOVE_JOBS': True}
+
+    def finish_job(self, jid: str):
+        self.assertEqual(201, self.post_job(jid).status_code)
+        self.compute_mgr.logs[JobName(jid)] = b'hello\nworld\n'
+        self.compute_mgr.set_status(JobName(jid), JobStatus.finishedSuccessfully)
+
+    def test_finished_job_is_served_after_removal(self):
+        self.finish_job('chris-jid-1')
+        url = self.url_for('api.job', job_id='chris-jid-1')
+        res = self.client.get(url, query_string={'logs': 'false'})
+        self.assertEqual('finishedSuccessfully', res.get_json()['status'])
+        self.assertEqual(204, self.client.delete(url).status_code)
+        self.assertNotIn(JobName('chris-jid-1'), self.compute_mgr.jobs)
+        self.compute_mgr.calls.clear()
+
+        body = self.client.get(url).get_json()
+        self.assertEqual('finishedSuccessfully', body['status'])
+        self.assertEqual('hello\nworld\n', body['logs'])
+        self.assertIsNone(self.client.get(url, query_string={'cursor': ''})
+                          .get_json()['next_cursor'])
+        res = self.client.get(self.url_for('api.joblist', jids='chris-jid-1,gone'))
+        self.assertEqual(['chris-jid-1'], [job['jid'] for job in res.get_json()['jobs']])
+        self.assertEqual(b'hello\nworld\n',
+                         self.client.get(self.url_for('api.joblogs', job_id='chris-jid-1')).data)
+        self.assertEqual(204, self.client.delete(url).status_code)
+        self.assertEqual(['get_job', 'get_job', 'get_job'], self.compute_mgr.calls)
+
+        stats = self.client.get(self.url_for('api.joblist')).get_json()['stats']
+        self.assertEqual(1, stats['job_registry']['entries'])
+        self.assertEqual(2, stats['counters']['job_registry_hits'])
+
+    def test_logs_are_recorded_when_requested(self):
+        self.finish_job('chris-jid-1')
+        url = self.url_for('api.job', job_id='chris-jid-1')
+        self.compute_mgr.calls.clear()
+        self.client.get(url, query_string={'logs': 'false'})
+        self.assertNotIn('get_job_logs', self.compute_mgr.calls)
+        self.compute_mgr.calls.clear()
+
+        for _ in range(2):
+            self.assertEqual('hello\nworld\n', self.client.get(url).get_json()['logs'])
+        self.assertEqual(['get_job', 'get_job_logs'], self.compute_mgr.calls)
+
+    def test_running_jobs_are_not_recorded(self):
+        self.assertEqual(201, self.post_job('chris-jid-1').status_code)
+        url = self.url_for('api.job', job_id='chris-jid-1')
+        self.assertEqual('notstarted', self.client.get(url).get_json()['status'])
+        stats = self.client.get(self.url_for('api.joblist')).get_json()['stats']
+        self.assertEqual(0, stats['job_registry']['entries'])
+
+    def test_new_job_with_same_name(self):
+        self.finish_job('chris-jid-1')
+        url = self.url_for('api.job', job_id='chris-jid-1')
+        self.client.get(url)
+        self.client.delete(url)
+        self.assertEqual(201, self.post_job('chris-jid-1').status_code)
+        self.assertEqual('notstarted', self.client.get(url).get_json()['status'])
+
+
+class AsgiJobRegistryTests(test_asgi.AsgiAppTests):
+
+    def app_config(self) -> dict:
+        return {'JOB_REGISTRY': True, 'STATE_DB': temp_db(self), 'REMOVE_JOBS': True}
+
+    def test_finished_job_is_served_after_removal(self):
+        self.client.post('/api/v1/', json=test_asgi.JOB)
+        self.compute_mgr.logs[JobName('chris-jid-1')] = b'hello\n'
+        self.compute_mgr.set_status(JobName('chris-jid-1'), JobStatus.finishedWithError)
+        self.assertEqual('finishedWithError',
+                         self.client.get('/api/v1/chris-jid-1/?logs=false').json()['status'])
+        self.assertEqual(204, self.client.delete('/api/v1/chris-jid-1/').status_code)
+        self.compute_mgr.calls.clear()
+
+        body = self.client.get('/api/v1/chris-jid-1/').json()
+        self.assertEqual(['finishedWithError', 'hello\n'], [body['status'], body['logs']])
+        res = self.client.get('/api/v1/?jids=chris-jid-1')
+        self.assertEqual(['chris-jid-1'], [job['jid'] for job in res.json()['jobs']])
+        self.assertEqual(b'hello\n', self.client.get('/api/v1/chris-jid-1/logs').content)
+        self.assertEqual(['get_job'], self.compute_mgr.calls)
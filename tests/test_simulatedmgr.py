@@ -0,0 +1,125 @@
+import unittest
+from unittest.mock import patch
+
+from pman.abstractmgr import JobStatus, ManagerException
+from pman.app import create_app
+from pman.simulatedmgr import SimulatedManager, LINE_BYTES
+from tests.fakes import Clock, temp_db
+from tests.test_app import AppTestCase
+
+
+class SimulatedManagerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.config = {'STATE_DB': temp_db(self), 'SIM_SEED': 1,
+                       'SIM_QUEUE_DELAY': 5.0, 'SIM_RUN_TIME': 60.0,
+                       'SIM_LOG_BYTES_PER_SECOND': LINE_BYTES, 'SIM_FAILURE_RATE': 0.0,
+                       'SIM_OOM_RATE': 0.0}
+        self.clock = Clock()
+        self.mgr = SimulatedManager(self.config, clock=self.clock)
+
+    def schedule(self, name: str, mgr=None):
+        return (mgr or self.mgr).schedule_job('fnndsc/pl-simpledsapp', ['simpledsapp', '/out'],
+                                              name, {}, [], None, None, {})
+
+    def test_lifecycle(self):
+        job = self.schedule('chris-jid-1')
+        self.assertEqual(JobStatus.notstarted, self.mgr.get_job_info(job).status)
+        self.assertEqual(b'', self.mgr.get_job_logs(job, 10))
+
+        self.clock.now = job.started + 10
+        info = self.mgr.get_job_info(self.mgr.get_job('chris-jid-1'))
+        self.assertEqual(JobStatus.started, info.status)
+        self.assertEqual('simpledsapp /out', info.cmd)
+        logs = self.mgr.get_job_logs(job, 0)
+        self.assertEqual(11, logs.count(b'\n'))
+        self.assertEqual(11 * LINE_BYTES, len(logs))
+        self.assertEqual(3, self.mgr.get_job_logs(job, 3).count(b'\n'))
+
+        self.clock.now = job.finished
+        info = self.mgr.get_job_info(job)
+        self.assertEqual(JobStatus.finishedSuccessfully, info.status)
+        self.assertNotEqual('', info.timestamp)
+
+        self.mgr.remove_job(job)
+        with self.assertRaises(ManagerException) as cm:
+            self.mgr.get_job('chris-jid-1')
+        self.assertEqual(404, cm.exception.status_code)
+
+    def test_already_exists(self):
+        self.schedule('chris-jid-1')
+        with self.assertRaises(ManagerException) as cm:
+            self.schedule('chris-jid-1')
+        self.assertEqual(409, cm.exception.status_code)
+
+    def test_shared_between_processes(self):
+        job = self.schedule('chris-jid-1')
+        other = SimulatedManager(self.config, clock=self.clock)
+        self.assertEqual(job, other.get_job('chris-jid-1'))
+
+    def test_logs_since(self):
+        job = self.schedule('chris-jid-1')
+        self.clock.now = job.started + 4
+        first = self.mgr.get_job_logs_since(job, None, 100)
+        self.assertEqual(5, first.logs.count(b'\n'))
+        self.clock.now = job.started + 6
+        second = self.mgr.get_job_logs_since(job, first.next_cursor, 100)
+        self.assertEqual(2, second.logs.count(b'\n'))
+        self.assertEqual(self.mgr.get_job_logs(job, 0), first.logs + second.logs)
+        # lines are not skipped however many came after the cursor
+        self.clock.now = job.started + 60
+        third = self.mgr.get_job_logs_since(job, second.next_cursor, 2)
+        self.assertEqual(self.mgr.get_job_logs(job, 0), first.logs + second.logs + third.logs)
+        with self.assertRaises(ValueError):
+            self.mgr.get_job_logs_since(job, 'bogus', 100)
+
+    def test_failures(self):
+        mgr = SimulatedManager({**self.config, 'SIM_FAILURE_RATE': 0.5, 'SIM_OOM_RATE': 0.5},
+                               clock=self.clock)
+        jobs = [self.schedule(f'chris-jid-{i}', mgr) for i in range(20)]
+        self.clock.now += 1e6
+        infos = mgr.get_jobs_info([job.name for job in jobs] + ['does-not-exist'])
+        self.assertEqual(20, len(infos))
+        self.assertEqual({JobStatus.finishedWithError}, {i.status for i in infos.values()})
+        self.assertEqual({'OOMKilled', 'Error: exit code 1'}, {i.message for i in infos.values()})
+
+    def test_many_jobs(self):
+        for i in range(2000):
+            self.schedule(f'chris-jid-{i}')
+        self.clock.now += 3
+        statuses = self.mgr.list_job_statuses()
+        self.assertEqual(2000, len(statuses))
+        self.assertEqual({JobStatus.notstarted, JobStatus.started}, set(statuses.values()))
+        self.assertEqual(2000, len(self.mgr.get_jobs_info(list(statuses))))
+
+    def test_capacity(self):
+        self.assertEqual({}, self.mgr.get_capacity())
+        mgr = SimulatedManager({**self.config, 'SIM_CPU_LIMIT': 4000})
+        self.assertEqual({'cpu_limit': 4000}, mgr.get_capacity())
+
+    def test_api_latency(self):
+        mgr = SimulatedManager({**self.config, 'SIM_API_LATENCY': 0.01})
+        with patch('pman.simulatedmgr.time.sleep') as sleep:
+            mgr.list_job_statuses()
+        sleep.assert_called_once()
+
+
+class SimulatedAppTests(AppTestCase):
+
+    def setUp(self):
+        env = patch.dict('os.environ', {'CONTAINER_ENV': 'simulated', 'SIM_QUEUE_DELAY': '0',
+                                        'STATE_DB': temp_db(self)})
+        env.start()
+        self.addCleanup(env.stop)
+        super().setUp()
+        self.app = create_app({'TESTING': True})
+        self.client = self.app.test_client()
+
+    def test_schedule_and_get(self):
+        self.assertIsInstance(self.app.extensions['compute_mgr'], SimulatedManager)
+        self.assertEqual(201, self.post_job('chris-jid-1').status_code)
+        res = self.client.get(self.url_for('api.job', job_id='chris-jid-1'))
+        self.assertEqual(200, res.status_code)
+        self.assertEqual('started', res.get_json()['status'])
+        self.assertEqual(1, self.client.get(self.url_for('api.joblist')).get_json()
+                         ['stats']['simulated_jobs'])
@@ -0,0 +1,138 @@
+import unittest
+
+from pman.abstractmgr import JobName, JobStatus, Image
+from pman.leases import FileLease
+from pman.statuscache import StatusCache, StatusRefresher, get_jobs_info_cached
+from tests.fakes import FakeManager, Clock, info, temp_db
+from tests.test_app import AppTestCase
+from tests import test_asgi
+
+
+class StatusCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.path = temp_db(self)
+        self.clock = Clock()
+        self.cache = StatusCache(self.path, max_age=5, clock=self.clock)
+
+    def test_max_age(self):
+        self.assertIsNone(self.cache.get(JobName('chris-jid-1')))
+        self.cache.put({JobName('chris-jid-1'): info('chris-jid-1')})
+        self.clock.now += 5
+        self.assertEqual(info('chris-jid-1'), self.cache.get(JobName('chris-jid-1')))
+        self.clock.now += 1
+        self.assertIsNone(self.cache.get(JobName('chris-jid-1')))
+
+    def test_shared_between_processes(self):
+        self.cache.put({JobName('chris-jid-1'): info('chris-jid-1')})
+        other = StatusCache(self.path, max_age=5, clock=self.clock)
+        self.assertEqual(info('chris-jid-1'), other.get(JobName('chris-jid-1')))
+        other.remove(JobName('chris-jid-1'))
+        self.assertIsNone(self.cache.get(JobName('chris-jid-1')))
+
+    def test_newer_info_is_kept(self):
+        finished = info('chris-jid-1', JobStatus.finishedSuccessfully)
+        self.cache.put({JobName('chris-jid-1'): finished})
+        self.cache.put({JobName('chris-jid-1'): info('chris-jid-1')}, fetched=self.clock.now - 1)
+        self.assertEqual(finished, self.cache.get(JobName('chris-jid-1')))
+
+    def test_replace_all(self):
+        self.cache.put({JobName('gone'): info('gone')}, fetched=self.clock.now - 2)
+        self.cache.put({JobName('scheduled-during-refresh'): info('scheduled-during-refresh')})
+        self.cache.replace_all({JobName('listed'): info('listed')}, fetched=self.clock.now - 1)
+        self.assertEqual({'listed', 'scheduled-during-refresh'},
+                         set(self.cache.get_many(['gone', 'listed', 'scheduled-during-refresh'])))
+        self.assertEqual(2, self.cache.stats()['entries'])
+
+    def test_get_many(self):
+        names = [JobName(f'chris-jid-{i}') for i in range(1200)]
+        self.cache.put({name: info(name) for name in names})
+        self.assertEqual(1200, len(self.cache.get_many(names + ['does-not-exist'])))
+
+    def test_get_jobs_info_cached(self):
+        mgr = FakeManager()
+        for name in ('chris-jid-1', 'chris-jid-2'):
+            mgr.schedule_job(Image('fnndsc/pl-simpledsapp'), ['simpledsapp'], JobName(name),
+                             {}, [], None, None, {})
+        mgr.calls.clear()
+        self.cache.put({JobName('chris-jid-1'): info('chris-jid-1')})
+        infos = get_jobs_info_cached(self.cache, mgr, ['chris-jid-1', 'chris-jid-2', 'gone'])
+        self.assertEqual({'chris-jid-1', 'chris-jid-2'}, set(infos))
+        self.assertEqual(['get_job', 'get_job_info', 'get_job'], mgr.calls)
+        self.assertIsNotNone(self.cache.get(JobName('chris-jid-2')))
+
+
+class StatusRefresherTests(unittest.TestCase):
+
+    def setUp(self):
+        self.path = temp_db(self)
+        self.mgr = FakeManager()
+        self.mgr.schedule_job(Image('fnndsc/pl-simpledsapp'), ['simpledsapp'],
+                              JobName('chris-jid-1'), {}, [], None, None, {})
+        self.mgr.calls.clear()
+
+    def refresher(self) -> StatusRefresher:
+        refresher = StatusRefresher(StatusCache(self.path), self.mgr,
+                                    FileLease(self.path + '.lock'))
+        self.addCleanup(refresher.lease.release)
+        return refresher
+
+    def test_one_process_refreshes(self):
+        first, second = self.refresher(), self.refresher()
+        self.assertTrue(first.lease.try_acquire())
+        self.assertFalse(second.lease.try_acquire())
+        self.assertTrue(first.leader)
+        self.assertFalse(second.leader)
+        first.lease.release()
+        self.assertTrue(second.lease.try_acquire())
+
+    def test_refresh(self):
+        refresher = self.refresher()
+        refresher.refresh()
+        self.assertEqual(['list_job_statuses', 'get_job', 'get_job_info'], self.mgr.calls)
+        self.assertEqual(JobStatus.notstarted,
+                         refresher.cache.get(JobName('chris-jid-1')).status)
+
+
+class StatusCacheAppTests(AppTestCase):
+
+    def app_config(self) -> dict:
+        return {'STATUS_CACHE': True, 'STATE_DB': temp_db(self),
+                'STATUS_CACHE_REFRESH_SECONDS': 0}
+
+    def test_status_is_served_from_cache(self):
+        self.assertEqual(201, self.post_job('chris-jid-1').status_code)
+        url = self.url_for('api.job', job_id='chris-jid-1')
+        for _ in range(3):
+            self.assertEqual('notstarted', self.client.get(url, query_string={'logs': 'false'})
+                             .get_json()['status'])
+        res = self.client.get(self.url_for('api.joblist', jids='chris-jid-1'))
+        self.assertEqual(['chris-jid-1'], [job['jid'] for job in res.get_json()['jobs']])
+        self.assertEqual(['schedule_job', 'get_job_info'], self.compute_mgr.calls)
+
+        # logs are still read from the backend
+        self.assertEqual(200, self.client.get(url).status_code)
+        self.assertEqual(['get_job', 'get_job_logs'], self.compute_mgr.calls[2:])
+
+        self.assertEqual(204, self.client.delete(url).status_code)
+        self.assertEqual(404, self.client.get(url).status_code)
+        stats = self.client.get(self.url_for('api.joblist')).get_json()['stats']
+        self.assertEqual(0, stats['status_cache']['entries'])
+
+
+class AsgiStatusCacheTests(test_asgi.AsgiAppTests):
+
+    def app_config(self) -> dict:
+        return {'STATUS_CACHE': True, 'STATE_DB': temp_db(self),
+                'STATUS_CACHE_REFRESH_SECONDS': 0}
+
+    def test_wait_for_status_change(self):
+        self.skipTest('the status is cached')
+
+    def test_status_is_served_from_cache(self):
+        self.client.post('/api/v1/', json=test_asgi.JOB)
+        self.compute_mgr.calls.clear()
+        for _ in range(3):
+            res = self.client.get('/api/v1/chris-jid-1/?logs=false')
+            self.assertEqual('notstarted', res.json()['status'])
+        self.assertEqual([], self.compute_mgr.calls)
@@ -0,0 +1,163 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import urllib3
+
+from pman.abstractmgr import ManagerException
+from pman.tracing import (Tracer, JsonlExporter, OtlpExporter, create_exporter,
+                          parse_traceparent, trace_backend_http, trace_manager)
+from tests.fakes import FakeManager
+from tests.test_app import AppTestCase
+
+TRACEPARENT = '00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01'
+
+
+class TracerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.spans = []
+        self.tracer = Tracer(self.spans.append)
+
+    def test_parse_traceparent(self):
+        self.assertEqual(('4bf92f3577b34da6a3ce929d0e0e4736', '00f067aa0ba902b7'),
+                         parse_traceparent(TRACEPARENT))
+        self.assertIsNone(parse_traceparent(None))
+        self.assertIsNone(parse_traceparent('00-4bf92f35-00f067aa0ba902b7-01'))
+        self.assertIsNone(parse_traceparent('00-00000000000000000000000000000000-00f067aa0ba902b7-01'))
+
+    def test_child_spans(self):
+        with self.tracer.span('parent') as parent:
+            with self.tracer.span('child'):
+                pass
+        with self.tracer.span('other'):
+            pass
+        child, parent, other = self.spans
+        self.assertEqual(parent.span_id, child.parent_id)
+        self.assertEqual(parent.trace_id, child.trace_id)
+        self.assertIsNone(parent.parent_id)
+        self.assertNotEqual(parent.trace_id, other.trace_id)
+
+    def test_traceparent(self):
+        span = self.tracer.start('request', kind='server', traceparent=TRACEPARENT)
+        self.assertEqual('4bf92f3577b34da6a3ce929d0e0e4736', span.trace_id)
+        self.assertEqual('00f067aa0ba902b7', span.parent_id)
+
+    def test_error(self):
+        with self.assertRaises(ValueError):
+            with self.tracer.span('failing'):
+                raise ValueError('oops')
+        self.assertEqual('ValueError: oops', self.spans[0].error)
+
+    def test_trace_manager(self):
+        compute_mgr = trace_manager(FakeManager(), self.tracer, 'fake')
+        compute_mgr.schedule_job('fnndsc/pl-simpledsapp', ['simpledsapp'], 'chris-jid-1',
+                                 {}, [], None, None, {})
+        compute_mgr.logs['chris-jid-1'] = b'hello\n'
+        with self.tracer.span('request', job_id='chris-jid-1'):
+            job = compute_mgr.get_job('chris-jid-1')
+            compute_mgr.get_job_logs(job, 10)
+        with self.assertRaises(ManagerException):
+            compute_mgr.get_job('chris-jid-2')
+
+        schedule, get_job, get_logs, request, not_found = self.spans
+        self.assertEqual('fake.schedule_job', schedule.name)
+        self.assertEqual('chris-jid-1', schedule.attributes['job_id'])
+        self.assertEqual(request.span_id, get_job.parent_id)
+        self.assertEqual({'backend': 'fake', 'job_id': 'chris-jid-1', 'payload_size': 6},
+                         get_logs.attributes)
+        self.assertIn('not found', not_found.error)
+
+    def test_trace_backend_http(self):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write(b'{}')
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.shutdown)
+        trace_backend_http(self.tracer)
+        trace_backend_http(self.tracer)
+        http = urllib3.PoolManager()
+        url = f'http://127.0.0.1:{server.server_port}/apis/batch/v1/jobs/chris-jid-1?pretty=1'
+        http.request('GET', url)
+        self.assertEqual([], self.spans)
+        with self.tracer.span('request', job_id='chris-jid-1'):
+            http.request('GET', url)
+        client, request = self.spans
+        self.assertEqual('GET /apis/batch/v1/jobs/chris-jid-1', client.name)
+        self.assertEqual(request.span_id, client.parent_id)
+        self.assertEqual(200, client.attributes['http.status_code'])
+        self.assertEqual(2, client.attributes['payload_size'])
+        self.assertEqual('chris-jid-1', client.attributes['job_id'])
+
+
+class ExporterTests(unittest.TestCase):
+
+    def test_jsonl(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'spans.jsonl')
+            tracer = Tracer(create_exporter({'TRACING_EXPORTER': 'jsonl', 'TRACING_FILE': path}))
+            with tracer.span('one', job_id='chris-jid-1'):
+                pass
+            with tracer.span('two'):
+                pass
+            with open(path) as f:
+                spans = [json.loads(line) for line in f]
+        self.assertEqual(['one', 'two'], [span['name'] for span in spans])
+        self.assertEqual({'job_id': 'chris-jid-1'}, spans[0]['attributes'])
+
+    def test_plugin(self):
+        exporter = create_exporter({'TRACING_EXPORTER': 'pman.tracing:JsonlExporter',
+                                    'TRACING_FILE': '/dev/null'})
+        self.assertIsInstance(exporter, JsonlExporter)
+
+    def test_otlp_encoding(self):
+        exporter = OtlpExporter('http://localhost:4318')
+        tracer = Tracer(lambda span: None)
+        span = tracer.start('GET api.job', kind='server', traceparent=TRACEPARENT,
+                            job_id='chris-jid-1', payload_size=10)
+        tracer.finish(span)
+        encoded = exporter.encode([span])['resourceSpans'][0]['scopeSpans'][0]['spans'][0]
+        self.assertEqual('00f067aa0ba902b7', encoded['parentSpanId'])
+        self.assertEqual(2, encoded['kind'])
+        self.assertIn({'key': 'payload_size', 'value': {'intValue': '10'}}, encoded['attributes'])
+
+
+class TracingAppTests(AppTestCase):
+
+    def app_config(self) -> dict:
+        return {'TRACING': True}
+
+    def setUp(self):
+        super().setUp()
+        self.spans = []
+        self.app.extensions['tracer'].exporter = self.spans.append
+
+    def test_request_spans(self):
+        self.post_job('chris-jid-1')
+        self.spans.clear()
+        res = self.client.get(self.url_for('api.job', job_id='chris-jid-1'),
+                              headers={'traceparent': TRACEPARENT})
+        self.assertEqual(200, res.status_code)
+        request = self.spans[-1]
+        self.assertEqual('GET api.job', request.name)
+        self.assertEqual('00f067aa0ba902b7', request.parent_id)
+        self.assertEqual(200, request.attributes['http.status_code'])
+        self.assertEqual('chris-jid-1', request.attributes['job_id'])
+        children = {span.name: span for span in self.spans[:-1]}
+        self.assertLessEqual({'docker.get_job', 'docker.get_job_info', 'docker.get_job_logs',
+                              'encode_json'}, children.keys())
+        for span in children.values():
+            self.assertEqual(request.trace_id, span.trace_id)
+            self.assertEqual(request.span_id, span.parent_id)
+        self.assertEqual('chris-jid-1', children['docker.get_job_info'].attributes['job_id'])